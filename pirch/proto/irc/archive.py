@@ -0,0 +1,786 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import array
+import bisect
+import marshal
+import os
+import struct
+import time
+
+from pirch.proto.irc import isupport
+from pirch.proto.irc import messages
+from pirch.proto.irc import search
+from pirch import util
+
+
+# Select the correct array conversion methods for the Python version
+if util.PY2:  # pragma: no cover
+    def _tobytes(arr):
+        return arr.tostring()
+
+    def _frombytes(arr, data):
+        arr.fromstring(data)
+else:  # pragma: no cover
+    def _tobytes(arr):
+        return arr.tobytes()
+
+    def _frombytes(arr, data):
+        arr.frombytes(data)
+
+
+# Each record in a log segment is a header giving the timestamp and
+# the length of the raw line, followed by the line itself
+_record = struct.Struct('!dI')
+
+# Index files carry a magic value and a version; anything else is
+# discarded and the index rebuilt from the segment
+_index_magic = b'PIRCHIDX'
+_index_version = 1
+
+# Likewise for the files holding the search index of each segment
+_search_magic = b'PIRCHSRC'
+_search_version = 1
+
+# Commands whose first argument is a comma-separated list of targets
+_target_commands = frozenset([
+    b'PRIVMSG', b'NOTICE', b'JOIN', b'PART', b'TOPIC', b'MODE', b'KICK',
+    b'INVITE',
+])
+
+
+def _set_bit(bitmap, bit):
+    """
+    Set a bit in a ``bytearray`` bitmap, growing it as required.
+
+    :param bitmap: The ``bytearray`` bitmap.
+    :param bit: The number of the bit to set.
+    """
+
+    byte = bit >> 3
+    if byte >= len(bitmap):
+        bitmap.extend(b'\0' * (byte + 1 - len(bitmap)))
+    bitmap[byte] |= 1 << (bit & 7)
+
+
+def _test_bit(bitmap, bit):
+    """
+    Test a bit in a ``bytearray`` bitmap.
+
+    :param bitmap: The ``bytearray`` bitmap.
+    :param bit: The number of the bit to test.
+
+    :returns: A ``True`` value if the bit is set, ``False`` otherwise.
+    """
+
+    byte = bit >> 3
+    return byte < len(bitmap) and bool(bitmap[byte] & (1 << (bit & 7)))
+
+
+def _iter_bits(bitmap, lo, hi):
+    """
+    Iterate over the set bits in a ``bytearray`` bitmap.
+
+    :param bitmap: The ``bytearray`` bitmap.
+    :param lo: The lowest bit number of interest.
+    :param hi: One more than the highest bit number of interest.
+
+    :returns: An iterator over the numbers of the set bits, in
+              ascending order.
+    """
+
+    for byte in range(lo >> 3, min(len(bitmap), (hi + 7) >> 3)):
+        value = bitmap[byte]
+        if not value:
+            continue
+
+        for i in range(8):
+            bit = (byte << 3) + i
+            if value & (1 << i) and lo <= bit < hi:
+                yield bit
+
+
+def _split_line(line):
+    """
+    Extract the fields of interest to the indexer from a raw line.
+    Only as much of the line as is required is split.
+
+    :param line: The raw IRC protocol message, in ``bytes``.
+
+    :returns: A tuple of the origin nickname, the command, and the
+              raw target argument.  Any of these may be ``None``.
+    """
+
+    parts = messages._argsplit(line)
+
+    first = next(parts, None)
+    if not first:
+        return None, None, None
+
+    # Determine the origin nickname, if any
+    origin = None
+    if first[:1] == b':':
+        origin = first[1:].split(b'!', 1)[0].split(b'@', 1)[0]
+        command = next(parts, None)
+    else:
+        command = first
+
+    # Only some commands carry targets
+    if command is None or command.upper() not in _target_commands:
+        return origin, command, None
+
+    return origin, command, next(parts, None)
+
+
+class ArchivedMessage(object):
+    """
+    A lazy view of a message retrieved from an ``Archive``.  The raw
+    line is only parsed into a ``Message`` when the ``message()``
+    method is called.
+    """
+
+    __slots__ = ('timestamp', 'raw', '_message')
+
+    def __init__(self, timestamp, raw):
+        """
+        Initialize an ``ArchivedMessage`` instance.
+
+        :param timestamp: The time at which the message was archived.
+        :param raw: The raw IRC protocol message, in ``bytes``.
+        """
+
+        self.timestamp = timestamp
+        self.raw = raw
+        self._message = None
+
+    def message(self, ctxt, conn):
+        """
+        Construct the ``Message`` object for the archived line.  The
+        result is cached.
+
+        :param ctxt: The current context.
+        :param conn: The connection the message is to be attributed
+                     to.
+
+        :returns: A ``pirch.proto.irc.messages.Message`` object, or
+                  ``None`` if the archived line was not a valid
+                  message.
+        """
+
+        if self._message is None:
+            self._message = messages.Message.from_bytes(ctxt, conn, self.raw)
+
+        return self._message
+
+
+class SegmentIndex(object):
+    """
+    The secondary indexes over a single log segment.  Records are
+    identified by their position in the segment.  The indexes consist
+    of the offset of each record; a sparse index mapping the
+    timestamp of every ``sparse_interval``-th record; postings lists
+    of record numbers, keyed by casemapped target and origin; and a
+    bitmap of record numbers for each command.
+    """
+
+    @classmethod
+    def load(cls, filename, size):
+        """
+        Load a ``SegmentIndex`` from an index file.
+
+        :param filename: The name of the index file.
+        :param size: The current size of the log segment.  If this
+                     does not match the size recorded in the index,
+                     the index is stale.
+
+        :returns: A ``SegmentIndex`` instance, or ``None`` if the
+                  index file is missing, corrupt, or stale.
+        """
+
+        try:
+            with open(filename, 'rb') as f:
+                data = marshal.load(f)
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            return None
+
+        if (not isinstance(data, tuple) or len(data) != 10 or
+                data[0] != _index_magic or data[1] != _index_version or
+                data[3] != size):
+            return None
+
+        idx = cls(data[2])
+        idx.size = size
+        _frombytes(idx.offsets, data[4])
+        _frombytes(idx.sparse, data[5])
+        idx.last_time = data[6]
+        for key, value in data[7].items():
+            idx.targets[key] = array.array('I')
+            _frombytes(idx.targets[key], value)
+        for key, value in data[8].items():
+            idx.origins[key] = array.array('I')
+            _frombytes(idx.origins[key], value)
+        idx.commands = {k: bytearray(v) for k, v in data[9].items()}
+
+        return idx
+
+    def __init__(self, sparse_interval):
+        """
+        Initialize a ``SegmentIndex`` instance.
+
+        :param sparse_interval: The number of records between entries
+                                in the sparse time index.
+        """
+
+        self.sparse_interval = sparse_interval
+        self.size = 0
+        self.offsets = array.array('I')
+        self.sparse = array.array('d')
+        self.last_time = None
+        self.targets = {}
+        self.origins = {}
+        self.commands = {}
+
+    def __len__(self):
+        """
+        Determine the number of records indexed.
+
+        :returns: The number of records.
+        """
+
+        return len(self.offsets)
+
+    def add(self, timestamp, line, mapper):
+        """
+        Add a record to the index.  The record is assumed to have been
+        appended to the end of the segment.
+
+        :param timestamp: The timestamp of the record.
+        :param line: The raw IRC protocol message, in ``bytes``.
+        :param mapper: The casemapping callable to apply to targets
+                       and origins.
+        """
+
+        recno = len(self.offsets)
+        self.offsets.append(self.size)
+        self.size += _record.size + len(line)
+        self.last_time = timestamp
+
+        # Maintain the sparse time index
+        if recno % self.sparse_interval == 0:
+            self.sparse.append(timestamp)
+
+        origin, command, target = _split_line(line)
+
+        if origin:
+            self.origins.setdefault(
+                mapper(origin), array.array('I')).append(recno)
+
+        if command:
+            _set_bit(self.commands.setdefault(command.upper(), bytearray()),
+                     recno)
+
+        if target:
+            for tgt in set(mapper(t) for t in target.split(b',') if t):
+                self.targets.setdefault(tgt, array.array('I')).append(recno)
+
+    def save(self, filename):
+        """
+        Save the index to an index file.  The file is replaced
+        atomically.
+
+        :param filename: The name of the index file.
+        """
+
+        data = (
+            _index_magic,
+            _index_version,
+            self.sparse_interval,
+            self.size,
+            _tobytes(self.offsets),
+            _tobytes(self.sparse),
+            self.last_time,
+            {k: _tobytes(v) for k, v in self.targets.items()},
+            {k: _tobytes(v) for k, v in self.origins.items()},
+            {k: bytes(v) for k, v in self.commands.items()},
+        )
+
+        tmpname = filename + '.tmp'
+        with open(tmpname, 'wb') as f:
+            marshal.dump(data, f)
+        os.rename(tmpname, filename)
+
+    def time_range(self, start, end):
+        """
+        Use the sparse time index to determine the range of records
+        which may fall within a time range.
+
+        :param start: The earliest time of interest, or ``None``.
+        :param end: The latest time of interest, or ``None``.
+
+        :returns: A tuple of the lowest record number and one more
+                  than the highest record number which may fall within
+                  the time range.
+        """
+
+        lo = 0
+        hi = len(self.offsets)
+
+        if start is not None:
+            lo = max(bisect.bisect_left(self.sparse, start) - 1, 0)
+            lo *= self.sparse_interval
+        if end is not None:
+            hi = min(bisect.bisect_right(self.sparse, end) *
+                     self.sparse_interval, hi)
+
+        return lo, hi
+
+    def candidates(self, command=None, target=None, origin=None,
+                   start=None, end=None):
+        """
+        Determine the record numbers which may match a query.  Time
+        bounds are only applied approximately; the caller must check
+        the timestamp of each record.
+
+        :param command: The command of interest, or ``None``.
+        :param target: The casemapped target of interest, or ``None``.
+        :param origin: The casemapped origin nickname of interest, or
+                       ``None``.
+        :param start: The earliest time of interest, or ``None``.
+        :param end: The latest time of interest, or ``None``.
+
+        :returns: An iterator over the candidate record numbers, in
+                  ascending order.
+        """
+
+        lo, hi = self.time_range(start, end)
+
+        bitmap = None
+        if command is not None:
+            bitmap = self.commands.get(command.upper())
+            if bitmap is None:
+                return iter(())
+
+        # Collect the postings lists to intersect
+        postings = []
+        for key, index in ((target, self.targets), (origin, self.origins)):
+            if key is None:
+                continue
+            if key not in index:
+                return iter(())
+            postings.append(index[key])
+
+        if not postings:
+            if bitmap is None:
+                return iter(range(lo, hi))
+            return _iter_bits(bitmap, lo, hi)
+
+        # Drive the intersection from the shortest postings list
+        postings.sort(key=len)
+        driver = postings[0]
+        others = postings[1:]
+
+        def generator():
+            for i in range(bisect.bisect_left(driver, lo),
+                           bisect.bisect_left(driver, hi)):
+                recno = driver[i]
+                if bitmap is not None and not _test_bit(bitmap, recno):
+                    continue
+                for other in others:
+                    j = bisect.bisect_left(other, recno)
+                    if j >= len(other) or other[j] != recno:
+                        break
+                else:
+                    yield recno
+
+        return generator()
+
+
+class Segment(object):
+    """
+    Represent a single log segment and its index.
+    """
+
+    def __init__(self, directory, number, sparse_interval, mapper):
+        """
+        Initialize a ``Segment`` instance.  The index will be loaded
+        from the index file if it is current; otherwise, it will be
+        rebuilt from the segment.
+
+        :param directory: The directory containing the segment.
+        :param number: The sequence number of the segment.
+        :param sparse_interval: The number of records between entries
+                                in the sparse time index.
+        :param mapper: The casemapping callable to apply to targets
+                       and origins.
+        """
+
+        self.number = number
+        self.filename = os.path.join(directory, '%08d.log' % number)
+        self.idxname = os.path.join(directory, '%08d.idx' % number)
+        self.srchname = os.path.join(directory, '%08d.srch' % number)
+
+        size = (os.path.getsize(self.filename)
+                if os.path.exists(self.filename) else 0)
+        self.index = SegmentIndex.load(self.idxname, size)
+        if self.index is None:
+            self.index = SegmentIndex(sparse_interval)
+            if size:
+                self._rebuild(mapper)
+
+    def _rebuild(self, mapper):
+        """
+        Rebuild the index by scanning the segment.  A truncated final
+        record is discarded.
+
+        :param mapper: The casemapping callable to apply to targets
+                       and origins.
+        """
+
+        with open(self.filename, 'rb') as f:
+            while True:
+                header = f.read(_record.size)
+                if len(header) < _record.size:
+                    break
+                timestamp, length = _record.unpack(header)
+                line = f.read(length)
+                if len(line) < length:
+                    break
+                self.index.add(timestamp, line, mapper)
+
+        # Drop any partial record from the end of the segment
+        if os.path.getsize(self.filename) != self.index.size:
+            with open(self.filename, 'r+b') as f:
+                f.truncate(self.index.size)
+
+    def read(self, f, recno):
+        """
+        Read a record from the segment.
+
+        :param f: A file object open on the segment.
+        :param recno: The number of the record to read.
+
+        :returns: A tuple of the timestamp and the raw line.
+        """
+
+        f.seek(self.index.offsets[recno])
+        timestamp, length = _record.unpack(f.read(_record.size))
+        return timestamp, f.read(length)
+
+    def _load_search(self, base):
+        """
+        Load the search index of the segment from its search file.
+
+        :param base: The position in the archive of the first record
+                     of the segment.
+
+        :returns: A ``pirch.proto.irc.search.Segment`` instance, or
+                  ``None`` if the search file is missing, corrupt, or
+                  stale.
+        """
+
+        try:
+            with open(self.srchname, 'rb') as f:
+                data = marshal.load(f)
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            return None
+
+        if (not isinstance(data, tuple) or len(data) != 7 or
+                data[0] != _search_magic or data[1] != _search_version or
+                data[2] != self.index.size or data[3] != base):
+            return None
+
+        return search.Segment({k: bytearray(v) for k, v in data[6].items()},
+                              data[4], data[5])
+
+    def search_segment(self, base):
+        """
+        Retrieve the search index of the segment.  It is loaded from
+        the search file if that is current; otherwise, the text of the
+        segment is indexed and the search file saved.  The file is
+        replaced atomically.
+
+        :param base: The position in the archive of the first record
+                     of the segment.
+
+        :returns: A ``pirch.proto.irc.search.Segment`` instance.
+        """
+
+        result = self._load_search(base)
+        if result is not None:
+            return result
+
+        def texts(f):
+            for recno in range(len(self.index)):
+                text = search.line_text(self.read(f, recno)[1])
+                if text is not None:
+                    yield base + recno, text
+
+        with open(self.filename, 'rb') as f:
+            result = search.build_segment(texts(f))
+
+        data = (
+            _search_magic,
+            _search_version,
+            self.index.size,
+            base,
+            result.docs,
+            result.last_doc,
+            {k: bytes(v) for k, v in result.postings.items()},
+        )
+
+        tmpname = self.srchname + '.tmp'
+        with open(tmpname, 'wb') as f:
+            marshal.dump(data, f)
+        os.rename(tmpname, self.srchname)
+
+        return result
+
+
+class Archive(object):
+    """
+    An append-only archive of raw IRC protocol messages, with
+    secondary indexes maintained incrementally as messages are
+    archived.  The archive is stored in a directory as a sequence of
+    log segments, each accompanied by an index file.
+
+    If given a ``pirch.proto.irc.search.SearchIndex``, the archive
+    also indexes the text of each message as it is archived, using
+    the message's position in the archive as its document identifier;
+    see ``search()``.  The search index is held in memory.  The text
+    of each closed segment is indexed once and the result saved
+    alongside the segment, so opening the archive only indexes the
+    text of the current segment afresh.
+    """
+
+    def __init__(self, directory, isup=None,
+                 segment_size=64 * 1024 * 1024, sparse_interval=128,
+                 index=None):
+        """
+        Initialize an ``Archive`` instance.  Existing segments in the
+        directory are opened, and any missing or stale index files are
+        rebuilt.
+
+        :param directory: The directory to contain the archive.  It
+                          will be created if necessary.
+        :param isup: The ``pirch.proto.irc.isupport.ISupport`` for the
+                     connection, whose casemapping is applied to
+                     targets and origins.  Defaults to the RFC 1459
+                     parameters.
+        :param segment_size: The size at which a segment is closed
+                             and a new one started.
+        :param sparse_interval: The number of records between entries
+                                in the sparse time index.
+        :param index: A ``pirch.proto.irc.search.SearchIndex`` to
+                      maintain, or ``None``.
+        """
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.directory = directory
+        self.isupport = isupport.ISupport() if isup is None else isup
+        self.segment_size = segment_size
+        self.sparse_interval = sparse_interval
+        self.index = index
+
+        # Open the existing segments
+        numbers = sorted(int(fname[:-4]) for fname in os.listdir(directory)
+                         if fname.endswith('.log') and fname[:-4].isdigit())
+        mapper = self.isupport.casemap
+        self.segments = [Segment(directory, n, sparse_interval, mapper)
+                         for n in numbers]
+        if not self.segments:
+            self.segments.append(
+                Segment(directory, 0, sparse_interval, mapper))
+
+        # The position in the archive of the first record of each
+        # segment
+        self._bases = [0]
+        for seg in self.segments[:-1]:
+            self._bases.append(self._bases[-1] + len(seg.index))
+
+        if index is not None:
+            for base, seg in zip(self._bases, self.segments[:-1]):
+                index.add_segment(seg.search_segment(base))
+
+            # The current segment is still growing, so its search
+            # index is not saved
+            seg = self.segments[-1]
+            if len(seg.index):
+                with open(seg.filename, 'rb') as f:
+                    for recno in range(len(seg.index)):
+                        index.index_line(self._bases[-1] + recno,
+                                         seg.read(f, recno)[1])
+
+        self._last_time = 0.0
+        for seg in reversed(self.segments):
+            if seg.index.last_time is not None:
+                self._last_time = seg.index.last_time
+                break
+
+        self._file = open(self.segments[-1].filename, 'ab')
+
+    def append(self, line, timestamp=None):
+        """
+        Archive a raw IRC protocol message.  The indexes are updated
+        immediately, but are only written to disk when the segment is
+        closed or ``flush()`` is called.
+
+        :param line: The raw IRC protocol message, in ``bytes``,
+                     without the line terminator.
+        :param timestamp: The time at which the message was received.
+                          Defaults to the current time.  Timestamps
+                          earlier than the last archived message are
+                          adjusted forward to keep the archive
+                          ordered.
+        """
+
+        if timestamp is None:
+            timestamp = time.time()
+        timestamp = max(timestamp, self._last_time)
+        self._last_time = timestamp
+
+        # Start a new segment if this one is full
+        seg = self.segments[-1]
+        if (seg.index.size and
+                seg.index.size + _record.size + len(line) >
+                self.segment_size):
+            self._roll()
+            seg = self.segments[-1]
+
+        self._file.write(_record.pack(timestamp, len(line)))
+        self._file.write(line)
+        seg.index.add(timestamp, line, self.isupport.casemap)
+
+        if self.index is not None:
+            self.index.index_line(self._bases[-1] + len(seg.index) - 1, line)
+
+    def _roll(self):
+        """
+        Close the current segment, saving its index, and start a new
+        one.
+        """
+
+        self.flush()
+        self._file.close()
+        self._bases.append(self._bases[-1] + len(self.segments[-1].index))
+
+        seg = Segment(self.directory, self.segments[-1].number + 1,
+                      self.sparse_interval, self.isupport.casemap)
+        self.segments.append(seg)
+        self._file = open(seg.filename, 'ab')
+
+    def flush(self):
+        """
+        Flush archived messages to disk and save the index of the
+        current segment.
+        """
+
+        self._file.flush()
+        seg = self.segments[-1]
+        seg.index.save(seg.idxname)
+
+    def close(self):
+        """
+        Flush and close the archive.
+        """
+
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def search(self, query):
+        """
+        Search the text of the archived messages.  The archive must
+        have been given a search index.
+
+        :param query: The query, in ``bytes``, as for
+                      ``pirch.proto.irc.search.SearchIndex.search()``.
+
+        :returns: An iterator over ``ArchivedMessage`` instances, in
+                  the order they were archived.
+        """
+
+        if self.index is None:
+            raise ValueError('archive has no search index')
+
+        # Make sure the reads will see everything archived so far
+        if self._file is not None:
+            self._file.flush()
+
+        f = None
+        current = None
+        try:
+            for doc in self.index.search(query):
+                i = bisect.bisect_right(self._bases, doc) - 1
+                if i != current:
+                    if f is not None:
+                        f.close()
+                    current = i
+                    f = open(self.segments[i].filename, 'rb')
+                timestamp, line = self.segments[i].read(
+                    f, doc - self._bases[i])
+                yield ArchivedMessage(timestamp, line)
+        finally:
+            if f is not None:
+                f.close()
+
+    def query(self, command=None, target=None, origin=None, start=None,
+              end=None):
+        """
+        Query the archive.  All criteria must match.
+
+        :param command: The command of interest, e.g. b"PRIVMSG".
+        :param target: The channel or nickname the message was
+                       directed to.
+        :param origin: The nickname the message came from.
+        :param start: The earliest time of interest.
+        :param end: The latest time of interest.
+
+        :returns: An iterator over ``ArchivedMessage`` instances, in
+                  the order they were archived.
+        """
+
+        if target is not None:
+            target = self.isupport.casemap(target)
+        if origin is not None:
+            origin = self.isupport.casemap(origin)
+
+        # Make sure the reads will see everything archived so far
+        if self._file is not None:
+            self._file.flush()
+
+        for seg in self.segments:
+            if not len(seg.index):
+                continue
+
+            # Skip segments entirely outside the time range
+            if start is not None and seg.index.last_time < start:
+                continue
+            if end is not None and seg.index.sparse[0] > end:
+                break
+
+            recnos = seg.index.candidates(command, target, origin,
+                                          start, end)
+            with open(seg.filename, 'rb') as f:
+                for recno in recnos:
+                    timestamp, line = seg.read(f, recno)
+                    if start is not None and timestamp < start:
+                        continue
+                    if end is not None and timestamp > end:
+                        break
+                    yield ArchivedMessage(timestamp, line)
@@ -0,0 +1,314 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+from pirch.proto.irc import isupport
+from pirch.proto.irc import modes
+
+
+# The arguments, beyond the first, which may hold nicknames, keyed by
+# command: a tuple of the index of the argument, the separator
+# between nicknames within it (``None`` if it holds a single
+# nickname), and whether the nicknames may carry membership prefixes.
+# The nicknames among the parameters of a MODE are located using the
+# mode string.
+_nick_args = {
+    b'KICK': (1, b',', False),
+    b'353': (3, b' ', True),
+}
+
+
+class RewritePlan(object):
+    """
+    A precomputed rewrite of the upstream nickname to a downstream
+    client's nickname.  The nickname is replaced in the prefix; in the
+    first argument, where it appears as the target of messages and
+    numerics; in the nicknames kicked by a KICK; in the parameters of
+    the membership modes, such as +o, of a MODE; and in the names of
+    an RPL_NAMREPLY.  Message tags and the rest of the line are
+    copied unexamined.
+    """
+
+    __slots__ = ('old', 'new', 'isupport')
+
+    def __init__(self, old, new, isup):
+        """
+        Initialize a ``RewritePlan`` instance.
+
+        :param old: The upstream nickname, in ``bytes``.
+        :param new: The downstream nickname, in ``bytes``.
+        :param isup: The ``pirch.proto.irc.isupport.ISupport`` for the
+                     upstream connection, which supplies the
+                     casemapping, the membership prefixes, and the
+                     channel mode types.
+        """
+
+        self.old = old
+        self.new = new
+        self.isupport = isup
+
+    def _rewrite(self, value, sep, prefixed, old):
+        """
+        Rewrite the nicknames in an argument.  Each nickname may be
+        followed by a user and host.
+
+        :param value: The argument, in ``bytes``.
+        :param sep: The separator between nicknames, or ``None`` if
+                    the argument holds a single nickname.
+        :param prefixed: If ``True``, each nickname may be preceded
+                         by membership prefixes.
+        :param old: The casemapped upstream nickname.
+
+        :returns: The rewritten argument, or ``None`` if no rewriting
+                  was needed.
+        """
+
+        mapper = self.isupport.casemap
+        symbols = self.isupport.symbols
+        items = [value] if sep is None else value.split(sep)
+        changed = False
+        for i, item in enumerate(items):
+            lead = 0
+            if prefixed:
+                while item[lead:lead + 1] in symbols:
+                    lead += 1
+            end = item.find(b'!')
+            if end < 0:
+                end = len(item)
+            if mapper(item[lead:end]) == old:
+                items[i] = item[:lead] + self.new + item[end:]
+                changed = True
+
+        if not changed:
+            return None
+        return items[0] if sep is None else sep.join(items)
+
+    def apply(self, line):
+        """
+        Rewrite a line.
+
+        :param line: The raw IRC protocol message, in ``bytes``.
+
+        :returns: The rewritten line.  If no rewriting was needed,
+                  this is the line itself.
+        """
+
+        mapper = self.isupport.casemap
+        old = mapper(self.old)
+        parts = []
+        pos = 0
+
+        # Skip the message tags
+        start = 0
+        if line[:1] == b'@':
+            start = line.find(b' ')
+            if start < 0:
+                return line
+            while line[start:start + 1] == b' ':
+                start += 1
+
+        # Rewrite the nickname in the prefix
+        if line[start:start + 1] == b':':
+            space = line.find(b' ', start)
+            if space < 0:
+                return line
+            nick_end = space
+            for sep in (b'!', b'@'):
+                idx = line.find(sep, start + 1, nick_end)
+                if idx >= 0:
+                    nick_end = idx
+            if mapper(line[start + 1:nick_end]) == old:
+                parts.append(line[:start + 1] + self.new)
+                pos = nick_end
+            while line[space:space + 1] == b' ':
+                space += 1
+            start = space
+
+        # Locate the command and the arguments
+        cmd_end = line.find(b' ', start)
+        if cmd_end < 0:
+            return line if not parts else b''.join(parts + [line[pos:]])
+        command = line[start:cmd_end].upper()
+
+        args = []
+        idx = cmd_end
+        while idx < len(line):
+            if line[idx:idx + 1] == b' ':
+                idx += 1
+            elif line[idx:idx + 1] == b':':
+                args.append((idx + 1, len(line), True))
+                break
+            else:
+                end = line.find(b' ', idx)
+                if end < 0:
+                    end = len(line)
+                args.append((idx, end, False))
+                idx = end
+
+        # Rewrite the arguments which hold nicknames; a trailing first
+        # argument is text, such as a PING token, not a target
+        targets = [] if args and args[0][2] else [(0, None, False)]
+        if command in _nick_args:
+            targets.append(_nick_args[command])
+        elif command == b'MODE' and len(args) > 2:
+            modestr = line[args[1][0]:args[1][1]]
+            modetypes = self.isupport.modetypes
+            for change in modes.parse_modes(self.isupport, modestr,
+                                            range(2, len(args))):
+                if (change.param is not None and
+                        modetypes.get(change.mode) == 'P'):
+                    targets.append((change.param, None, False))
+
+        for i, sep, prefixed in targets:
+            if i >= len(args):
+                continue
+            arg_start, arg_end, _trailing = args[i]
+            new = self._rewrite(line[arg_start:arg_end], sep, prefixed, old)
+            if new is not None:
+                parts.append(line[pos:arg_start])
+                parts.append(new)
+                pos = arg_end
+
+        if not parts:
+            return line
+        parts.append(line[pos:])
+        return b''.join(parts)
+
+
+class Multiplexer(object):
+    """
+    Relay the lines received from an upstream connection to any
+    number of downstream clients.  Downstream clients are grouped by
+    nickname, so each line is rewritten at most once per distinct
+    nickname; clients using the upstream nickname receive the
+    upstream bytes unchanged.  Lines are written to each downstream
+    transport with a single vectored ``writelines()`` call.
+    """
+
+    def __init__(self, nick, isup=None):
+        """
+        Initialize a ``Multiplexer`` instance.
+
+        :param nick: The upstream nickname, in ``bytes``.
+        :param isup: The ``pirch.proto.irc.isupport.ISupport`` for the
+                     upstream connection.  Defaults to the RFC 1459
+                     parameters.
+        """
+
+        self.nick = nick
+        self.isupport = isupport.ISupport() if isup is None else isup
+
+        # Maps a casemapped downstream nickname to a list of the
+        # nickname, the rewrite plan (``None`` if no rewriting is
+        # required), and the transports using that nickname
+        self._groups = {}
+        self._transports = {}
+
+    def __len__(self):
+        """
+        Determine the number of attached downstream clients.
+
+        :returns: The number of downstream clients.
+        """
+
+        return len(self._transports)
+
+    def _plan(self, nick):
+        """
+        Compute the rewrite plan for a downstream nickname.
+
+        :param nick: The downstream nickname, in ``bytes``.
+
+        :returns: A ``RewritePlan``, or ``None`` if no rewriting is
+                  required.
+        """
+
+        mapper = self.isupport.casemap
+        if mapper(nick) == mapper(self.nick):
+            return None
+        return RewritePlan(self.nick, nick, self.isupport)
+
+    def attach(self, transport, nick=None):
+        """
+        Attach a downstream client.
+
+        :param transport: The client's transport.
+        :param nick: The nickname the client knows itself by, in
+                     ``bytes``.  Defaults to the upstream nickname.
+        """
+
+        self.detach(transport)
+
+        if nick is None:
+            nick = self.nick
+        key = self.isupport.casemap(nick)
+        if key not in self._groups:
+            self._groups[key] = [nick, self._plan(nick), []]
+        self._groups[key][2].append(transport)
+        self._transports[transport] = key
+
+    def detach(self, transport):
+        """
+        Detach a downstream client.
+
+        :param transport: The client's transport.
+        """
+
+        key = self._transports.pop(transport, None)
+        if key is None:
+            return
+
+        group = self._groups[key]
+        group[2].remove(transport)
+        if not group[2]:
+            del self._groups[key]
+
+    def set_nick(self, nick):
+        """
+        Change the upstream nickname.  Rewrite plans are recomputed.
+
+        :param nick: The new upstream nickname, in ``bytes``.
+        """
+
+        self.nick = nick
+        for group in self._groups.values():
+            group[1] = self._plan(group[0])
+
+    def send(self, *msgs):
+        """
+        Relay messages to all downstream clients.
+
+        :param msgs: The ``pirch.proto.irc.messages.Message`` objects
+                     to relay.  Their cached ``bytes`` forms are used.
+        """
+
+        self.send_raw(*[msg.msg for msg in msgs])
+
+    def send_raw(self, *lines):
+        """
+        Relay raw lines to all downstream clients.
+
+        :param lines: The raw IRC protocol messages, in ``bytes``,
+                      without line terminators.
+        """
+
+        for _nick, plan, transports in self._groups.values():
+            chunks = []
+            for line in lines:
+                chunks.append(line if plan is None else plan.apply(line))
+                chunks.append(b'\r\n')
+
+            for transport in transports:
+                transport.writelines(chunks)
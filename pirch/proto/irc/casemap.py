@@ -16,14 +16,16 @@
 
 import string
 
-import six
+from pirch import util
 
 
 # Select the correct translation table maker for the Python version
-if six.PY2:  # pragma: no cover
+if util.PY2:  # pragma: no cover
     _maketrans = string.maketrans
+    _bytes_maketrans = string.maketrans
 else:  # pragma: no cover
     _maketrans = str.maketrans
+    _bytes_maketrans = bytes.maketrans
 
 
 # Need translation tables for ascii, rfc1459, and strict-rfc1459
@@ -36,6 +38,18 @@ _transtab = {
                                  string.ascii_lowercase + r'{|}'),
 }
 
+# Identical translation tables for use on ``bytes`` values
+_bytes_transtab = {
+    'ascii': _bytes_maketrans(string.ascii_uppercase.encode('ascii'),
+                              string.ascii_lowercase.encode('ascii')),
+    'rfc1459': _bytes_maketrans(
+        (string.ascii_uppercase + r'[\]^').encode('ascii'),
+        (string.ascii_lowercase + r'{|}~').encode('ascii')),
+    'strict-rfc1459': _bytes_maketrans(
+        (string.ascii_uppercase + r'[\]').encode('ascii'),
+        (string.ascii_lowercase + r'{|}').encode('ascii')),
+}
+
 
 def _make_mapper(mapping):
     """
@@ -50,5 +64,21 @@ def _make_mapper(mapping):
     return lambda x: x.translate(_transtab[mapping])
 
 
+def _make_bytes_mapper(mapping):
+    """
+    Construct a mapping callable for the designated mapping that
+    operates on ``bytes`` values, such as those found in the arguments
+    of a ``pirch.proto.irc.messages.Message``.
+
+    :param mapping: The name of the mapping.
+
+    :returns: A callable taking one ``bytes`` argument and returning
+              that argument converted to lower case.
+    """
+
+    return lambda x: x.translate(_bytes_transtab[mapping])
+
+
 # Construct the actual mappers
 mappers = {m: _make_mapper(m) for m in _transtab}
+bytes_mappers = {m: _make_bytes_mapper(m) for m in _bytes_transtab}
@@ -0,0 +1,508 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+"""
+Checkpoints of connection state, for warm restarts.
+
+A checkpoint file holds one record for each connection, each a
+``pirch.proto.irc.reconnect.Snapshot`` in a compact binary layout.  The
+file begins with an index::
+
+    magic (8 bytes) | count (u32)
+    count x [ name length (u16) | name | offset (u64) | length (u64) ]
+
+Each record is self-contained, so that an unchanged connection's record
+may be reused verbatim when the checkpoint is rewritten::
+
+    taken (f64)
+    strings: count (u32), count x [ length (u16) | bytes ]
+    tokens: count (u32), count x string id (u32)
+    channels: count (u32), count x [
+        name id (u32) | flags (u64)
+        params: count (u16), count x [ mode (1 byte) | string id (u32) ]
+        lists: count (u16), count x [ mode (1 byte) | count (u32),
+                                      count x string id (u32) ]
+        members: count (u32), count x [ nick id (u32) | bits (u32) ]
+    ]
+
+Every string, whether an ISUPPORT token, channel name, nickname, or
+mode parameter, is stored once in the record's string table and
+referred to by its integer id.  All integers are little-endian.
+"""
+
+import functools
+import mmap
+import os
+import struct
+
+try:
+    import asyncio
+except ImportError:  # pragma: no cover
+    import trollius as asyncio
+
+from pirch.proto.irc import isupport
+from pirch.proto.irc import modes
+from pirch.proto.irc import reconnect
+
+
+# Identifies a checkpoint file, and its format version
+MAGIC = b'PIRCHCK\x01'
+
+_u16 = struct.Struct('<H')
+_u32 = struct.Struct('<I')
+_f64 = struct.Struct('<d')
+_index = struct.Struct('<QQ')
+_param = struct.Struct('<cI')
+_member = struct.Struct('<II')
+_channel = struct.Struct('<IQ')
+
+
+class CheckpointError(Exception):
+    """
+    Raised when a checkpoint file cannot be read.
+    """
+
+    pass
+
+
+def encode(snapshot):
+    """
+    Encode a snapshot as a checkpoint record.
+
+    :param snapshot: The ``pirch.proto.irc.reconnect.Snapshot``.
+
+    :returns: The record, in ``bytes``.
+    """
+
+    strings = {}
+
+    def intern(value):
+        try:
+            return strings[value]
+        except KeyError:
+            strings[value] = len(strings)
+            return strings[value]
+
+    # Build the body first, interning strings as they are met
+    body = [_u32.pack(len(snapshot.tokens))]
+    body += [_u32.pack(intern(token)) for token in snapshot.tokens]
+
+    body.append(_u32.pack(len(snapshot.channels)))
+    for name, chan in snapshot.channels.items():
+        body.append(_channel.pack(intern(name), chan.flags))
+
+        params = chan.params or {}
+        body.append(_u16.pack(len(params)))
+        body += [_param.pack(mode, intern(value))
+                 for mode, value in sorted(params.items())]
+
+        lists = chan.lists or {}
+        body.append(_u16.pack(len(lists)))
+        for mode, entries in sorted(lists.items()):
+            body.append(_param.pack(mode, len(entries)))
+            body += [_u32.pack(intern(entry)) for entry in sorted(entries)]
+
+        body.append(_u32.pack(len(chan.members)))
+        body += [_member.pack(intern(nick), bits)
+                 for nick, bits in chan.members.items()]
+
+    table = [None] * len(strings)
+    for value, idx in strings.items():
+        table[idx] = value
+
+    head = [_f64.pack(snapshot.taken), _u32.pack(len(table))]
+    for value in table:
+        head += [_u16.pack(len(value)), value]
+
+    return b''.join(head + body)
+
+
+def decode(buf, offset=0):
+    """
+    Decode a checkpoint record.
+
+    :param buf: A buffer containing the record, e.g. a memory map of
+                the checkpoint file.
+    :param offset: The offset of the record in the buffer.
+
+    :returns: A ``pirch.proto.irc.reconnect.Snapshot``.
+    """
+
+    pos = offset
+    taken, = _f64.unpack_from(buf, pos)
+    count, = _u32.unpack_from(buf, pos + 8)
+    pos += 12
+
+    table = []
+    for _i in range(count):
+        length, = _u16.unpack_from(buf, pos)
+        pos += 2
+        table.append(buf[pos:pos + length])
+        pos += length
+
+    count, = _u32.unpack_from(buf, pos)
+    pos += 4
+    tokens = [table[idx] for idx in
+              struct.unpack_from('<%dI' % count, buf, pos)]
+    pos += 4 * count
+
+    channels = {}
+    count, = _u32.unpack_from(buf, pos)
+    pos += 4
+    for _i in range(count):
+        chan = modes.ChannelModes()
+        name, chan.flags = _channel.unpack_from(buf, pos)
+        pos += _channel.size
+
+        nparams, = _u16.unpack_from(buf, pos)
+        pos += 2
+        if nparams:
+            chan.params = {}
+            for _j in range(nparams):
+                mode, idx = _param.unpack_from(buf, pos)
+                pos += _param.size
+                chan.params[mode] = table[idx]
+
+        nlists, = _u16.unpack_from(buf, pos)
+        pos += 2
+        if nlists:
+            chan.lists = {}
+            for _j in range(nlists):
+                mode, nentries = _param.unpack_from(buf, pos)
+                pos += _param.size
+                chan.lists[mode] = set(
+                    table[idx] for idx in
+                    struct.unpack_from('<%dI' % nentries, buf, pos))
+                pos += 4 * nentries
+
+        nmembers, = _u32.unpack_from(buf, pos)
+        pos += 4
+        values = struct.unpack_from('<%dI' % (2 * nmembers), buf, pos)
+        pos += 8 * nmembers
+        chan.members = {table[values[j]]: values[j + 1]
+                        for j in range(0, len(values), 2)}
+
+        channels[table[name]] = chan
+
+    isup = isupport.ISupport()
+    isup.feed(tokens)
+    return reconnect.Snapshot(isup, channels, now=taken)
+
+
+def write(path, records):
+    """
+    Write a checkpoint file.  The file is replaced atomically, so a
+    crash while writing leaves the previous checkpoint intact.
+
+    :param path: The path of the checkpoint file.
+    :param records: A dictionary mapping connection names, in
+                    ``bytes``, to their encoded records.
+    """
+
+    names = sorted(records)
+    offset = 8 + 4 + sum(2 + len(name) + _index.size for name in names)
+
+    index = [MAGIC, _u32.pack(len(names))]
+    for name in names:
+        length = len(records[name])
+        index += [_u16.pack(len(name)), name, _index.pack(offset, length)]
+        offset += length
+
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.writelines(index)
+        f.writelines(records[name] for name in names)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(tmp, path)
+
+
+class Checkpoint(object):
+    """
+    A checkpoint file, mapped into memory.  Only the index is read
+    when the file is opened; each connection's record is decoded
+    when it is loaded.
+    """
+
+    def __init__(self, path):
+        """
+        Initialize a ``Checkpoint`` instance.
+
+        :param path: The path of the checkpoint file.
+        """
+
+        with open(path, 'rb') as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise CheckpointError('checkpoint %s is empty' % path)
+
+        try:
+            if self._mmap[:len(MAGIC)] != MAGIC:
+                raise CheckpointError('%s is not a checkpoint' % path)
+
+            self._index = {}
+            count, = _u32.unpack_from(self._mmap, len(MAGIC))
+            pos = len(MAGIC) + 4
+            for _i in range(count):
+                length, = _u16.unpack_from(self._mmap, pos)
+                name = self._mmap[pos + 2:pos + 2 + length]
+                pos += 2 + length
+                self._index[name] = _index.unpack_from(self._mmap, pos)
+                pos += _index.size
+        except struct.error:
+            self._mmap.close()
+            raise CheckpointError('checkpoint %s is truncated' % path)
+        except CheckpointError:
+            self._mmap.close()
+            raise
+
+    def __contains__(self, name):
+        """
+        Determine if the checkpoint has a record for a connection.
+
+        :param name: The connection name, in ``bytes``.
+
+        :returns: A ``True`` value if the connection is present.
+        """
+
+        return name in self._index
+
+    def names(self):
+        """
+        Retrieve the names of the connections in the checkpoint.
+
+        :returns: A list of the connection names, in ``bytes``.
+        """
+
+        return sorted(self._index)
+
+    def record(self, name):
+        """
+        Retrieve the encoded record for a connection.
+
+        :param name: The connection name, in ``bytes``.
+
+        :returns: The record, in ``bytes``.
+        """
+
+        offset, length = self._index[name]
+        return self._mmap[offset:offset + length]
+
+    def load(self, name):
+        """
+        Load the state of a connection.
+
+        :param name: The connection name, in ``bytes``.
+
+        :returns: A ``pirch.proto.irc.reconnect.Snapshot``.
+        """
+
+        offset, _length = self._index[name]
+        try:
+            return decode(self._mmap, offset)
+        except (struct.error, IndexError):
+            raise CheckpointError('record for %r is corrupt' % (name,))
+
+    def close(self):
+        """
+        Unmap the checkpoint file.
+        """
+
+        self._mmap.close()
+
+
+class CheckpointWriter(object):
+    """
+    Keep a checkpoint file up to date in the background.  Updated
+    connections are marked dirty, and the checkpoint is rewritten
+    after a short delay, so that a burst of updates is coalesced into
+    a single write.  Only the records of dirty connections are
+    re-encoded; encoding and writing happen in an executor.
+    """
+
+    def __init__(self, loop, path, delay=5.0, executor=None):
+        """
+        Initialize a ``CheckpointWriter`` instance.
+
+        :param loop: The event loop.
+        :param path: The path of the checkpoint file.
+        :param delay: The time, in seconds, to wait after an update
+                      before writing.
+        :param executor: The executor to write in.  Defaults to the
+                         loop's default executor.
+        """
+
+        self.loop = loop
+        self.path = path
+        self.delay = delay
+        self.executor = executor
+
+        self.writes = 0
+
+        # Maps connection names to their encoded records
+        self._records = {}
+
+        # Maps the names of dirty connections to their snapshots
+        self._dirty = {}
+
+        self._handle = None
+        self._writing = None
+
+    def seed(self, checkpoint):
+        """
+        Reuse the records of an existing checkpoint, e.g. the one
+        loaded at startup, so that they need not be re-encoded.
+
+        :param checkpoint: The ``Checkpoint``.
+        """
+
+        for name in checkpoint.names():
+            if name not in self._records and name not in self._dirty:
+                self._records[name] = checkpoint.record(name)
+
+    def update(self, name, snapshot):
+        """
+        Record the state of a connection.
+
+        :param name: The connection name, in ``bytes``.
+        :param snapshot: A ``pirch.proto.irc.reconnect.Snapshot`` of
+                         its state.  It must not be modified afterward.
+        """
+
+        self._dirty[name] = snapshot
+        self._schedule()
+
+    def remove(self, name):
+        """
+        Remove a connection from the checkpoint.
+
+        :param name: The connection name, in ``bytes``.
+        """
+
+        self._dirty[name] = None
+        self._schedule()
+
+    def flush(self):
+        """
+        Write the checkpoint now, if anything has changed.
+
+        :returns: A future which completes when the checkpoint has
+                  been written.
+        """
+
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+        # Serialize with any write in progress
+        if self._writing is not None:
+            fut = asyncio.Future(loop=self.loop)
+
+            def complete(done):
+                if fut.cancelled():
+                    return
+                elif done.exception() is not None:
+                    fut.set_exception(done.exception())
+                else:
+                    fut.set_result(None)
+
+            def chain(_prev):
+                if not fut.cancelled():
+                    self.flush().add_done_callback(complete)
+
+            self._writing.add_done_callback(chain)
+            return fut
+
+        if not self._dirty:
+            fut = asyncio.Future(loop=self.loop)
+            fut.set_result(None)
+            return fut
+
+        dirty = self._dirty
+        self._dirty = {}
+        records = dict(self._records)
+
+        self._writing = self.loop.run_in_executor(
+            self.executor, self._write, records, dirty)
+        self._writing.add_done_callback(
+            functools.partial(self._written, dirty))
+        return self._writing
+
+    def _schedule(self):
+        """
+        Schedule a write, if one is not already scheduled.
+        """
+
+        if self._handle is None:
+            self._handle = self.loop.call_later(self.delay, self._timer)
+
+    def _timer(self):
+        """
+        Called when the write delay has elapsed.
+        """
+
+        self._handle = None
+        self.flush()
+
+    def _write(self, records, dirty):
+        """
+        Encode the dirty connections and write the checkpoint.  Runs
+        in the executor.
+
+        :param records: A dictionary of the current encoded records.
+        :param dirty: A dictionary of the dirty snapshots, with
+                      ``None`` for removed connections.
+
+        :returns: The dictionary of encoded records written.
+        """
+
+        for name, snapshot in dirty.items():
+            if snapshot is None:
+                records.pop(name, None)
+            else:
+                records[name] = encode(snapshot)
+
+        write(self.path, records)
+        return records
+
+    def _written(self, dirty, fut):
+        """
+        Called when a write has completed.  If the write failed, the
+        connections it was to record are marked dirty again, unless
+        they have been updated since, and another write is scheduled.
+
+        :param dirty: The dictionary of dirty snapshots passed to
+                      ``_write()``.
+        :param fut: The completed future.
+        """
+
+        self._writing = None
+        if fut.cancelled() or fut.exception() is not None:
+            for name, snapshot in dirty.items():
+                self._dirty.setdefault(name, snapshot)
+            self._schedule()
+
+            if not fut.cancelled():
+                self.loop.call_exception_handler({
+                    'message': 'failed to write checkpoint %s' % self.path,
+                    'exception': fut.exception(),
+                    'future': fut,
+                })
+            return
+
+        self.writes += 1
+        self._records = fut.result()
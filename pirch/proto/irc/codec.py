@@ -0,0 +1,367 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import collections
+import re
+import socket
+import struct
+
+from pirch import util
+
+
+# Formatting attributes, as bits of ``Style.flags``
+BOLD = 0x01
+ITALIC = 0x02
+UNDERLINE = 0x04
+REVERSE = 0x08
+STRIKE = 0x10
+MONOSPACE = 0x20
+
+# The formatting codes that toggle an attribute
+_toggles = {
+    b'\x02': BOLD,
+    b'\x1d': ITALIC,
+    b'\x1f': UNDERLINE,
+    b'\x16': REVERSE,
+    b'\x1e': STRIKE,
+    b'\x11': MONOSPACE,
+}
+
+# Any byte that may begin a CTCP segment, a low-level quote, or a
+# formatting code
+_controls_re = re.compile(b'[\x01-\x04\x0f\x10\x11\x16\x1d-\x1f]')
+
+# A single token; colors consume their numeric or hex arguments, and
+# low-level quotes the quoted byte
+_token_re = re.compile(
+    br'\x03(?:(\d{1,2})(?:,(\d{1,2}))?)?'
+    br'|\x04(?:([0-9A-Fa-f]{6})(?:,([0-9A-Fa-f]{6}))?)?'
+    br'|\x10(.?)'
+    br'|[\x01\x02\x0f\x11\x16\x1d-\x1f]',
+    re.DOTALL)
+_ctcp_end_re = re.compile(b'\x01')
+
+# Low-level (M-QUOTE) and CTCP-level (X-QUOTE) quoting
+_mquote_re = re.compile(b'[\x00\n\r\x10]')
+_mquote = {
+    b'\x00': b'\x100',
+    b'\n': b'\x10n',
+    b'\r': b'\x10r',
+    b'\x10': b'\x10\x10',
+}
+_munquote_re = re.compile(b'\x10(.?)', re.DOTALL)
+_munquote = {value[1:]: key for key, value in _mquote.items()}
+_xquote_re = re.compile(b'[\x01\\\\]')
+_xquote = {
+    b'\x01': b'\\a',
+    b'\\': b'\\\\',
+}
+_xunquote_re = re.compile(b'\\\\(.?)', re.DOTALL)
+_xunquote = {value[1:]: key for key, value in _xquote.items()}
+
+
+# The formatting in effect for a span of text.  The colors are
+# integers for mIRC colors, or 6-digit hex ``bytes`` for hex colors,
+# or ``None`` for the default.
+Style = collections.namedtuple('Style', ['flags', 'fg', 'bg'])
+PLAIN = Style(0, None, None)
+
+# A span of text with uniform formatting
+Span = collections.namedtuple('Span', ['text', 'style'])
+
+# A CTCP message; the parameters are b"" if there are none
+CTCP = collections.namedtuple('CTCP', ['command', 'params'])
+
+# A DCC offer, as carried in a CTCP DCC message.  The kind is the
+# upper-case DCC type, e.g. b"SEND" or b"CHAT"; the argument is the
+# file name for SEND, or b"chat" for CHAT; the host is a text IP
+# address; the size is an integer, or ``None`` if not given; and the
+# token, used for passive (reverse) DCC, is ``bytes`` or ``None``.
+Offer = collections.namedtuple('Offer', ['kind', 'argument', 'host', 'port',
+                                         'size', 'token'])
+
+# The packed form of an IPv4 address, as sent in DCC offers
+_ipv4 = struct.Struct('!I')
+
+
+def _bytes(data):
+    """
+    Return the ``bytes`` for a ``bytes`` or ``memoryview`` object.  No
+    copy is made of ``bytes``.
+
+    :param data: The ``bytes`` or ``memoryview``.
+
+    :returns: The ``bytes``.
+    """
+
+    return data if isinstance(data, bytes) else data.tobytes()
+
+
+def _buffer(data):
+    """
+    Return an object the ``re`` module can search.  Only Python 2
+    requires a ``memoryview`` to be copied.
+
+    :param data: The ``bytes`` or ``memoryview``.
+
+    :returns: The searchable object.
+    """
+
+    if util.PY2 and isinstance(data, memoryview):  # pragma: no cover
+        return data.tobytes()
+    return data
+
+
+def has_controls(data):
+    """
+    Determine whether text contains any CTCP framing, low-level
+    quoting, or formatting codes.  This check allocates nothing, and
+    text for which it fails requires no further decoding.
+
+    :param data: The text, as ``bytes`` or ``memoryview``.
+
+    :returns: A ``True`` value if the text contains control bytes,
+              ``False`` otherwise.
+    """
+
+    return _controls_re.search(_buffer(data)) is not None
+
+
+def quote(data):
+    """
+    Apply CTCP-level and low-level quoting to a CTCP payload.
+
+    :param data: The payload, in ``bytes``.
+
+    :returns: The quoted payload.
+    """
+
+    data = _xquote_re.sub(lambda m: _xquote[m.group(0)], data)
+    return _mquote_re.sub(lambda m: _mquote[m.group(0)], data)
+
+
+def unquote(data):
+    """
+    Remove low-level and CTCP-level quoting from a CTCP payload.
+    Unrecognized quotes yield the quoted byte.
+
+    :param data: The payload, in ``bytes``.
+
+    :returns: The unquoted payload.
+    """
+
+    if b'\x10' in data:
+        data = _munquote_re.sub(
+            lambda m: _munquote.get(m.group(1), m.group(1)), data)
+    if b'\\' in data:
+        data = _xunquote_re.sub(
+            lambda m: _xunquote.get(m.group(1), m.group(1)), data)
+    return data
+
+
+def encode_ctcp(command, params=b''):
+    """
+    Encode a CTCP message for inclusion in the trailing argument of a
+    PRIVMSG or NOTICE.
+
+    :param command: The CTCP command, in ``bytes``, e.g. b"ACTION".
+    :param params: The parameters, in ``bytes``.
+
+    :returns: The framed and quoted CTCP message.
+    """
+
+    payload = command + b' ' + params if params else command
+    return b'\x01' + quote(payload) + b'\x01'
+
+
+def _style(style, match):
+    """
+    Compute the style in effect after a formatting code.
+
+    :param style: The ``Style`` in effect before the code.
+    :param match: The ``_token_re`` match for the code.
+
+    :returns: The new ``Style``.
+    """
+
+    code = match.group(0)[:1]
+    if code in _toggles:
+        return style._replace(flags=style.flags ^ _toggles[code])
+    elif code == b'\x0f':
+        return PLAIN
+
+    # A color code; with no arguments, it resets the colors
+    if code == b'\x03':
+        fg, bg = match.group(1, 2)
+        fg = None if fg is None else int(fg)
+        bg = None if bg is None else int(bg)
+    else:
+        fg, bg = match.group(3, 4)
+        fg = None if fg is None else fg.upper()
+        bg = None if bg is None else bg.upper()
+
+    if fg is None:
+        return style._replace(fg=None, bg=None)
+    return style._replace(fg=fg, bg=style.bg if bg is None else bg)
+
+
+def scan(data):
+    """
+    Decode the trailing argument of a PRIVMSG or NOTICE in a single
+    pass.  CTCP segments are extracted and unquoted, and the remaining
+    text is divided into spans of uniform formatting.  Text containing
+    no control bytes is returned as a single span without copying.
+
+    :param data: The text, as ``bytes`` or ``memoryview``.
+
+    :returns: A tuple of a list of ``Span`` instances and a list of
+              ``CTCP`` instances.
+    """
+
+    buf = _buffer(data)
+    if not has_controls(buf):
+        return ([Span(_bytes(buf), PLAIN)] if len(buf) else []), []
+
+    spans = []
+    ctcps = []
+    pieces = []
+    pieces_style = style = PLAIN
+    pos = 0
+    end = len(buf)
+
+    while pos < end:
+        match = _token_re.search(buf, pos)
+        stop = end if match is None else match.start()
+        text = _bytes(buf[pos:stop]) if stop > pos else None
+
+        if match is not None:
+            pos = match.end()
+            code = match.group(0)[:1]
+            if code == b'\x01':
+                # CTCP segment; an unterminated one runs to the end
+                close = _ctcp_end_re.search(buf, pos)
+                close = end if close is None else close.start()
+                command, _sep, params = unquote(
+                    _bytes(buf[pos:close])).partition(b' ')
+                ctcps.append(CTCP(command.upper(), params))
+                pos = close + 1
+            elif code == b'\x10':
+                quoted = match.group(5)
+                text = (text or b'') + _munquote.get(quoted, quoted)
+        else:
+            pos = end
+
+        # Spans are only broken where text actually changes style
+        if text:
+            if pieces and pieces_style != style:
+                spans.append(Span(b''.join(pieces), pieces_style))
+                pieces = []
+            pieces_style = style
+            pieces.append(text)
+
+        if match is not None and code not in (b'\x01', b'\x10'):
+            style = _style(style, match)
+
+    if pieces:
+        spans.append(Span(b''.join(pieces), pieces_style))
+
+    return spans, ctcps
+
+
+def strip(data):
+    """
+    Strip CTCP segments and formatting codes from text.  Text
+    containing no control bytes is returned without copying.
+
+    :param data: The text, as ``bytes`` or ``memoryview``.
+
+    :returns: The plain text, in ``bytes``.
+    """
+
+    spans, _ctcps = scan(data)
+    if len(spans) == 1:
+        return spans[0].text
+    return b''.join(span.text for span in spans)
+
+
+def parse_offer(text):
+    """
+    Parse a CTCP DCC offer from the trailing argument of a PRIVMSG.
+
+    :param text: The trailing argument, in ``bytes``.
+
+    :returns: An ``Offer``, or ``None`` if the text is not a DCC offer
+              of the form "DCC <type> <argument> <host> <port> [<size>]
+              [<token>]".
+    """
+
+    if text[:5] != b'\x01DCC ':
+        return None
+
+    payload = unquote(text[5:].rstrip(b'\x01'))
+    kind, _sep, rest = payload.lstrip(b' ').partition(b' ')
+    rest = rest.lstrip(b' ')
+
+    # The argument may be quoted if it contains spaces
+    if rest[:1] == b'"' and b'"' in rest[1:]:
+        argument, _sep, rest = rest[1:].partition(b'"')
+    else:
+        argument, _sep, rest = rest.partition(b' ')
+
+    params = rest.split()
+    if not argument or len(params) < 2:
+        return None
+
+    try:
+        host = params[0].decode('ascii')
+        if host.isdigit():
+            host = socket.inet_ntoa(_ipv4.pack(int(host)))
+        port = int(params[1])
+        size = int(params[2]) if len(params) > 2 else None
+    except (UnicodeDecodeError, ValueError, struct.error):
+        return None
+
+    return Offer(kind.upper(), argument, host, port, size,
+                 params[3] if len(params) > 3 else None)
+
+
+def format_offer(offer):
+    """
+    Format a DCC offer as a CTCP message.  IPv4 addresses are sent as
+    integers, as most clients expect.
+
+    :param offer: The ``Offer``.
+
+    :returns: The framed and quoted CTCP message, in ``bytes``.
+    """
+
+    try:
+        host = str(_ipv4.unpack(socket.inet_aton(offer.host))[0])
+    except (socket.error, OSError):
+        host = offer.host
+
+    argument = offer.argument
+    if b' ' in argument:
+        argument = b'"' + argument + b'"'
+
+    params = [offer.kind, argument, host.encode('ascii'),
+              str(offer.port).encode('ascii')]
+    if offer.size is not None or offer.token is not None:
+        params.append(str(offer.size or 0).encode('ascii'))
+    if offer.token is not None:
+        params.append(offer.token)
+
+    return encode_ctcp(b'DCC', b' '.join(params))
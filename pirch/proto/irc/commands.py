@@ -16,6 +16,8 @@
 
 import weakref
 
+from pirch.proto.irc import codec
+from pirch.proto.irc import modes
 from pirch import util
 
 
@@ -30,7 +32,10 @@ class Argument(object):
 
         :param name: The argument name.
         :param idx: The index it will appear in the command argument
-                    list.  May be negative.
+                    list.  May be negative.  May also be a ``slice``
+                    with a non-negative start, in which case the
+                    argument is variadic: ``from_bytes()`` receives
+                    and ``to_bytes()`` must return a list of values.
         :param default: An optional default value for the argument to
                         assume.  This may be passed to the
                         ``to_raw()`` method when creating a
@@ -114,6 +119,82 @@ class EntityArgument(Argument):
         return value.to_bytes()
 
 
+class DCCArgument(Argument):
+    """
+    Describe an argument carrying a CTCP DCC offer.  The value is a
+    ``pirch.proto.irc.codec.Offer``, or ``None`` if the argument is
+    not a DCC offer.
+    """
+
+    def from_bytes(self, ctxt, conn, value):
+        """
+        Given a ``bytes`` value, parse the DCC offer.
+
+        :param ctxt: The current context.
+        :param conn: The connection the argument was received from.
+        :param value: The raw ``bytes`` value.
+
+        :returns: A ``pirch.proto.irc.codec.Offer``, or ``None``.
+        """
+
+        return codec.parse_offer(value)
+
+    def to_bytes(self, ctxt, conn, value):
+        """
+        Given a DCC offer, generate the CTCP message.
+
+        :param ctxt: The current context.
+        :param conn: The connection the argument will be sent to.
+        :param value: The ``pirch.proto.irc.codec.Offer``.
+
+        :returns: The CTCP message, in ``bytes``.
+        """
+
+        return codec.format_offer(value)
+
+
+class ModeArgument(Argument):
+    """
+    Describe a variadic argument consisting of a mode string and its
+    parameters.  The argument index must be a ``slice``.  Parsing
+    requires the connection to have an ``isupport`` attribute
+    containing a ``pirch.proto.irc.isupport.ISupport``.
+    """
+
+    def from_bytes(self, ctxt, conn, value):
+        """
+        Given the raw values, parse the mode changes.
+
+        :param ctxt: The current context.
+        :param conn: The connection the argument was received from.
+        :param value: A list of the raw ``bytes`` values: the mode
+                      string, followed by its parameters.
+
+        :returns: A list of ``pirch.proto.irc.modes.ModeChange``
+                  instances.
+        """
+
+        return modes.parse_modes(
+            conn.isupport, value[0],
+            [v for v in value[1:] if v is not util.unset])
+
+    def to_bytes(self, ctxt, conn, value):
+        """
+        Given a list of mode changes, generate the raw values.
+
+        :param ctxt: The current context.
+        :param conn: The connection the argument will be sent to.
+        :param value: A sequence of
+                      ``pirch.proto.irc.modes.ModeChange``
+                      instances.
+
+        :returns: A list of ``bytes``: the mode string, followed by
+                  its parameters.
+        """
+
+        return modes.format_modes(value)
+
+
 class Command(object):
     """
     Represent an IRC command.
@@ -122,6 +203,10 @@ class Command(object):
     # A registry of recognized commands
     _registry = {}
 
+    # Commands declared but not yet constructed, mapping the command
+    # to its argument specifications
+    _declared = {}
+
     @classmethod
     def register(cls, command):
         """
@@ -132,12 +217,34 @@ class Command(object):
         """
 
         # Inhibit duplicate registrations
-        if command.cmd in cls._registry:
+        if command.cmd in cls._registry or command.cmd in cls._declared:
             raise ValueError('duplicate registration of command "%s"' %
                              command.cmd.decode('ascii'))
 
         cls._registry[command.cmd] = command
 
+    @classmethod
+    def declare(cls, cmd, *arguments):
+        """
+        Declare a command.  This is equivalent to registering it, but
+        the ``Command`` instance is only constructed when the command
+        is first looked up, so declaring large numbers of commands
+        costs little at import time.
+
+        :param cmd: The ``bytes`` for the command, e.g. b"PING", etc.
+        :param arguments: The argument specifications.  Each is a
+                          tuple of the argument name, its index, and
+                          optionally the ``Argument`` subclass to use
+                          and the default value.
+        """
+
+        # Inhibit duplicate registrations
+        if cmd in cls._registry or cmd in cls._declared:
+            raise ValueError('duplicate registration of command "%s"' %
+                             cmd.decode('ascii'))
+
+        cls._declared[cmd] = arguments
+
     @classmethod
     def lookup(cls, cmd):
         """
@@ -150,7 +257,19 @@ class Command(object):
 
         # Look up and return the command, throwing a KeyError if it
         # doesn't exist
-        return cls._registry[cmd]
+        try:
+            return cls._registry[cmd]
+        except KeyError:
+            arguments = cls._declared.pop(cmd)
+
+        # Construct the declared command
+        command = cls(cmd)
+        for spec in arguments:
+            argcls = spec[2] if len(spec) > 2 else Argument
+            command.add_argument(argcls(spec[0], spec[1], *spec[3:]))
+        cls._registry[cmd] = command
+
+        return command
 
     def __init__(self, cmd):
         """
@@ -299,15 +418,30 @@ class UnknownCommand(object):
         return self._command_cache
 
 
-# Register the basic keep-alive commands
-Command.register(
-    Command(b'PING')
-    .add_argument(Argument('token', 0))
-)
-Command.register(
-    Command(b'PONG')
-    .add_argument(Argument('token', 0))
-)
+# Declare the basic keep-alive commands
+Command.declare(b'PING', ('token', 0))
+Command.declare(b'PONG', ('token', 0))
+
+# Declare the basic messaging commands.  The ``offer`` argument of
+# PRIVMSG is the text, parsed as a CTCP DCC offer only when accessed.
+Command.declare(b'PRIVMSG', ('target', 0), ('text', 1),
+                ('offer', 1, DCCArgument))
+Command.declare(b'NOTICE', ('target', 0), ('text', 1))
+
+# Declare the mode-bearing commands
+Command.declare(b'MODE', ('target', 0),
+                ('changes', slice(1, None), ModeArgument))
+Command.declare(b'324', ('channel', 1),
+                ('changes', slice(2, None), ModeArgument))
+
+# Declare the query commands
+Command.declare(b'WHOIS', ('nick', 0))
+Command.declare(b'WHO', ('mask', 0))
+Command.declare(b'NAMES', ('channel', 0))
+
+# Declare the channel membership commands
+Command.declare(b'JOIN', ('channels', 0), ('keys', 1))
+Command.declare(b'PART', ('channels', 0), ('reason', 1))
 
 
 def get_command(cmd):
@@ -0,0 +1,351 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import bisect
+import collections
+
+from pirch.proto.irc import isupport
+from pirch.proto.irc import messages
+
+
+class CompletionIndex(object):
+    """
+    An index of the nicknames and channel names visible on a
+    connection, for tab completion.  Names are kept casemapped in a
+    sorted list, so the names beginning with a prefix are found by
+    bisection.  The most recently active names are also kept, in
+    order of activity, and are offered ahead of the others; a prefix
+    query therefore examines at most the recent names and the
+    requested number of matches, however many names are indexed.
+
+    A nickname remains in the index while it is seen in at least one
+    channel, and a channel while at least one member is seen in it.
+    The index may be registered directly as a handler on a
+    ``pirch.proto.irc.dispatch.Dispatcher`` for every message, and is
+    then kept up to date from JOIN, PART, KICK, NICK, and QUIT;
+    PRIVMSG and NOTICE count as activity.  When the client itself
+    leaves a channel, the channel is dropped along with its members;
+    when it quits, or the server reports an ERROR before closing the
+    connection, the index is cleared.
+    """
+
+    def __init__(self, isup=None, recent=256, me=None):
+        """
+        Initialize a ``CompletionIndex`` instance.
+
+        :param isup: The ``pirch.proto.irc.isupport.ISupport`` for the
+                     connection, whose casemapping is used to compare
+                     names.  Defaults to the RFC 1459 parameters.
+        :param recent: The number of recently active names to rank
+                       ahead of the others.
+        :param me: The client's own nickname, in ``bytes``, or a
+                   callable returning it.  A nickname is followed
+                   through the client's NICK changes.  If ``None``,
+                   the client's departures are not recognized.
+        """
+
+        self.isupport = isupport.ISupport() if isup is None else isup
+        self.recent = recent
+        self.me = me
+
+        # The sorted list of casemapped names
+        self.keys = []
+
+        # Maps casemapped names to their original forms
+        self._names = {}
+
+        # Map casemapped nicknames to the casemapped channels they are
+        # in, and casemapped channels to their casemapped members
+        self._nicks = {}
+        self._channels = {}
+
+        # The recently active names, least recent first
+        self._recent = collections.OrderedDict()
+
+    def __len__(self):
+        """
+        Determine the number of names in the index.
+
+        :returns: The number of names.
+        """
+
+        return len(self.keys)
+
+    def __contains__(self, name):
+        """
+        Determine if a name is in the index.
+
+        :param name: The nickname or channel name, in ``bytes``.
+
+        :returns: A ``True`` value if the name is present.
+        """
+
+        return self.isupport.casemap(name) in self._names
+
+    def __call__(self, msg):
+        """
+        Update the index from a message, for use as a dispatcher
+        handler.
+
+        :param msg: The ``pirch.proto.irc.messages.Message``.
+        """
+
+        self.feed(msg.msg)
+
+    def feed(self, line):
+        """
+        Update the index from a raw line.
+
+        :param line: The raw IRC protocol message, in ``bytes``.
+        """
+
+        if line[:1] == b'@':
+            line = line.partition(b' ')[2]
+
+        parts = list(messages._argsplit(line))
+        if parts and parts[0].upper() == b'ERROR':
+            # The server is closing the connection
+            self.clear()
+            return
+        if len(parts) < 2 or parts[0][:1] != b':':
+            return
+
+        nick = parts[0][1:].split(b'!', 1)[0].split(b'@', 1)[0]
+        command = parts[1].upper()
+        args = parts[2:]
+
+        if command == b'QUIT':
+            if self._is_me(nick):
+                self.clear()
+            else:
+                self.quit(nick)
+        elif not args:
+            return
+        elif command == b'JOIN':
+            for channel in args[0].split(b','):
+                self.join(nick, channel)
+        elif command == b'PART':
+            me = self._is_me(nick)
+            for channel in args[0].split(b','):
+                if me:
+                    self.drop(channel)
+                else:
+                    self.part(nick, channel)
+        elif command == b'KICK' and len(args) > 1:
+            for victim in args[1].split(b','):
+                if self._is_me(victim):
+                    self.drop(args[0])
+                else:
+                    self.part(victim, args[0])
+        elif command == b'NICK':
+            if self._is_me(nick) and not callable(self.me):
+                self.me = args[0]
+            self.rename(nick, args[0])
+        elif command in (b'PRIVMSG', b'NOTICE'):
+            self.touch(nick)
+            for target in args[0].split(b','):
+                self.touch(target)
+
+    def _is_me(self, nick):
+        """
+        Determine if a nickname is the client's own.
+
+        :param nick: The nickname, in ``bytes``.
+
+        :returns: A ``True`` value if the nickname is the client's.
+        """
+
+        me = self.me() if callable(self.me) else self.me
+        mapper = self.isupport.casemap
+        return me is not None and mapper(nick) == mapper(me)
+
+    def _insert(self, key, name):
+        """
+        Add a name to the index, if it is not already present.
+
+        :param key: The casemapped name.
+        :param name: The original name.
+        """
+
+        if key not in self._names:
+            bisect.insort(self.keys, key)
+        self._names[key] = name
+
+    def _remove(self, key):
+        """
+        Remove a name from the index.
+
+        :param key: The casemapped name.
+        """
+
+        del self.keys[bisect.bisect_left(self.keys, key)]
+        del self._names[key]
+        self._recent.pop(key, None)
+
+    def join(self, nick, channel):
+        """
+        Record that a nickname is in a channel, e.g. on JOIN or from a
+        NAMES reply.
+
+        :param nick: The nickname, in ``bytes``.
+        :param channel: The channel name, in ``bytes``.
+        """
+
+        nkey = self.isupport.casemap(nick)
+        ckey = self.isupport.casemap(channel)
+
+        self._insert(nkey, nick)
+        if ckey not in self._names:
+            self._insert(ckey, channel)
+
+        self._nicks.setdefault(nkey, set()).add(ckey)
+        self._channels.setdefault(ckey, set()).add(nkey)
+
+    def part(self, nick, channel):
+        """
+        Record that a nickname has left a channel.
+
+        :param nick: The nickname, in ``bytes``.
+        :param channel: The channel name, in ``bytes``.
+        """
+
+        nkey = self.isupport.casemap(nick)
+        ckey = self.isupport.casemap(channel)
+
+        chans = self._nicks.get(nkey)
+        if chans is None or ckey not in chans:
+            return
+
+        chans.discard(ckey)
+        if not chans:
+            del self._nicks[nkey]
+            self._remove(nkey)
+
+        members = self._channels[ckey]
+        members.discard(nkey)
+        if not members:
+            del self._channels[ckey]
+            self._remove(ckey)
+
+    def quit(self, nick):
+        """
+        Remove a nickname from every channel.
+
+        :param nick: The nickname, in ``bytes``.
+        """
+
+        nkey = self.isupport.casemap(nick)
+        for ckey in list(self._nicks.get(nkey, ())):
+            self.part(nick, self._names[ckey])
+
+    def drop(self, channel):
+        """
+        Remove a channel and its membership, e.g. when leaving it.
+
+        :param channel: The channel name, in ``bytes``.
+        """
+
+        ckey = self.isupport.casemap(channel)
+        for nkey in list(self._channels.get(ckey, ())):
+            self.part(self._names[nkey], channel)
+
+    def clear(self):
+        """
+        Remove every name, e.g. when the connection is lost.
+        """
+
+        self.keys = []
+        self._names.clear()
+        self._nicks.clear()
+        self._channels.clear()
+        self._recent.clear()
+
+    def rename(self, old, new):
+        """
+        Record a nickname change.  The new nickname keeps the
+        channels of the old, and counts as active.
+
+        :param old: The old nickname, in ``bytes``.
+        :param new: The new nickname, in ``bytes``.
+        """
+
+        okey = self.isupport.casemap(old)
+        nkey = self.isupport.casemap(new)
+        chans = self._nicks.pop(okey, None)
+        if chans is None:
+            return
+
+        self._remove(okey)
+        for ckey in chans:
+            members = self._channels[ckey]
+            members.discard(okey)
+            members.add(nkey)
+
+        self._nicks.setdefault(nkey, set()).update(chans)
+        self._insert(nkey, new)
+        self.touch(new)
+
+    def touch(self, name):
+        """
+        Record activity by or in a name, ranking it ahead of the
+        others.  Names not in the index are ignored.
+
+        :param name: The nickname or channel name, in ``bytes``.
+        """
+
+        key = self.isupport.casemap(name)
+        if key not in self._names:
+            return
+
+        recent = self._recent
+        recent.pop(key, None)
+        recent[key] = None
+        if len(recent) > self.recent:
+            recent.popitem(last=False)
+
+    def complete(self, prefix, limit=10):
+        """
+        Find the names beginning with a prefix.  Recently active names
+        are returned first, most recent first, followed by the others
+        in casemapped order.
+
+        :param prefix: The prefix, in ``bytes``.
+        :param limit: The maximum number of names to return.
+
+        :returns: A list of the matching names, in their original
+                  forms.
+        """
+
+        key = self.isupport.casemap(prefix)
+        result = []
+        seen = set()
+
+        for cand in reversed(self._recent):
+            if len(result) >= limit:
+                break
+            if cand.startswith(key):
+                result.append(cand)
+                seen.add(cand)
+
+        keys = self.keys
+        idx = bisect.bisect_left(keys, key)
+        while (len(result) < limit and idx < len(keys) and
+               keys[idx].startswith(key)):
+            if keys[idx] not in seen:
+                result.append(keys[idx])
+            idx += 1
+
+        return [self._names[cand] for cand in result]
@@ -0,0 +1,338 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import collections
+import itertools
+import time
+
+try:
+    import asyncio
+except ImportError:  # pragma: no cover
+    import trollius as asyncio
+
+from pirch.proto.irc import isupport
+
+
+# The numerics a query is answered with: those that make up the
+# reply, and those that end it.  Each numeric names the target of
+# the query in its second argument, unless ``targets`` gives another
+# index for it; an index of ``None`` means the numeric does not name
+# the target, and it is attributed to the oldest query of its kind.
+Query = collections.namedtuple('Query', ['replies', 'terminators',
+                                         'targets'])
+
+
+# The queries understood by the correlator, keyed by command
+queries = {
+    b'WHOIS': Query(
+        frozenset([b'276', b'301', b'307', b'311', b'312', b'313', b'317',
+                   b'319', b'320', b'330', b'338', b'378', b'379', b'401',
+                   b'402', b'671']),
+        frozenset([b'318']),
+        {b'402': None},
+    ),
+    b'WHO': Query(
+        frozenset([b'352', b'354']),
+        frozenset([b'315']),
+        {b'352': None, b'354': None},
+    ),
+    b'NAMES': Query(
+        frozenset([b'353']),
+        frozenset([b'366']),
+        {b'353': 2},
+    ),
+    b'MODE': Query(
+        frozenset(),
+        frozenset([b'221', b'324', b'403', b'442', b'477']),
+        {b'221': 0},
+    ),
+}
+
+
+class _Request(object):
+    """
+    An in-flight query.
+    """
+
+    __slots__ = ('seq', 'kind', 'key', 'replies', 'waiters', 'handle')
+
+    def __init__(self, seq, kind, key):
+        """
+        Initialize a ``_Request`` instance.
+
+        :param seq: The sequence number of the query.
+        :param kind: The command of the query, in ``bytes``.
+        :param key: The casemapped target of the query.
+        """
+
+        self.seq = seq
+        self.kind = kind
+        self.key = key
+        self.replies = []
+        self.waiters = []
+        self.handle = None
+
+
+class Correlator(object):
+    """
+    Correlate queries with their replies.  A query is sent with
+    ``query()``, which returns a future for the list of reply
+    messages; identical queries in flight at the same time are sent
+    only once, and completed replies are cached for a time.  The
+    ``Correlator`` must be registered as a handler for every message
+    on a ``pirch.proto.irc.dispatch.Dispatcher`` to receive the
+    replies.
+
+    Replies are attributed to the query in flight for the target they
+    name, so that replies sent unprompted, such as the NAMES reply
+    that follows a JOIN, are not mistaken for those of another query.
+    Replies which do not name their target are attributed to the
+    oldest query in flight that they could answer, since servers
+    answer queries in the order they are sent; for this to be
+    reliable, all queries of the kinds listed in ``queries`` should be
+    sent through the correlator.
+    """
+
+    def __init__(self, loop, send, isup=None, ttl=60.0,
+                 timeout=30.0, clock=time.time):
+        """
+        Initialize a ``Correlator`` instance.
+
+        :param loop: The event loop.
+        :param send: A callable taking a
+                     ``pirch.proto.irc.messages.Message``, which sends
+                     it to the server.
+        :param isup: The ``pirch.proto.irc.isupport.ISupport`` for the
+                     connection, whose casemapping is applied to
+                     query targets.  Defaults to the RFC 1459
+                     parameters.
+        :param ttl: The time, in seconds, for which completed replies
+                    are cached.
+        :param timeout: The time, in seconds, to wait for a query to
+                        complete before failing it with
+                        ``asyncio.TimeoutError``.
+        :param clock: A callable returning the current time.
+        """
+
+        self.loop = loop
+        self.send = send
+        self.isupport = isupport.ISupport() if isup is None else isup
+        self.ttl = ttl
+        self.timeout = timeout
+        self.clock = clock
+
+        self.sent = 0
+        self.coalesced = 0
+        self.hits = 0
+
+        # Maps (kind, key) to the in-flight _Request
+        self._pending = {}
+
+        # Maps the kind to a deque of in-flight _Request objects,
+        # oldest first
+        self._queues = collections.defaultdict(collections.deque)
+
+        # Maps (kind, key) to a tuple of the expiry time and replies,
+        # in order of expiry
+        self._cache = collections.OrderedDict()
+
+        # Maps a numeric to the kinds of query it may answer
+        self._routes = collections.defaultdict(list)
+        for kind, query in queries.items():
+            for numeric in query.replies | query.terminators:
+                self._routes[numeric].append(kind)
+
+        self._seq = itertools.count()
+
+    def query(self, msg):
+        """
+        Send a query, unless an identical query is already in flight
+        or its replies are cached.
+
+        :param msg: The ``pirch.proto.irc.messages.Message`` for the
+                    query, e.g. as built with ``Message.new()``.  Its
+                    command must be one of those in ``queries``, and
+                    its target must be its last argument.  A MODE
+                    message which changes modes is simply sent.
+                    Only a single target may be queried; the
+                    target may not be a comma-separated list.
+
+        :returns: A future whose result is the list of reply messages,
+                  ending with the terminator.
+        """
+
+        kind = msg.command.cmd
+        if kind not in queries:
+            raise ValueError('cannot correlate command "%s"' %
+                             kind.decode('ascii'))
+
+        fut = asyncio.Future(loop=self.loop)
+
+        # Mode changes have no reply to wait for
+        if kind == b'MODE' and len(msg.args) > 1:
+            self.send(msg)
+            fut.set_result([])
+            return fut
+
+        if b',' in msg.args[-1]:
+            raise ValueError('cannot correlate a query for several '
+                             'targets')
+
+        key = (kind, self.isupport.casemap(msg.args[-1]))
+
+        cached = self._cache.get(key)
+        if cached is not None:
+            if cached[0] > self.clock():
+                self.hits += 1
+                fut.set_result(list(cached[1]))
+                return fut
+            del self._cache[key]
+
+        req = self._pending.get(key)
+        if req is not None:
+            self.coalesced += 1
+        else:
+            req = _Request(next(self._seq), kind, key[1])
+            req.handle = self.loop.call_later(self.timeout, self._expire,
+                                              req)
+            self._pending[key] = req
+            self._queues[kind].append(req)
+            self.sent += 1
+            self.send(msg)
+
+        req.waiters.append(fut)
+        return fut
+
+    def invalidate(self, kind=None, target=None):
+        """
+        Discard cached replies.
+
+        :param kind: The command of the query to discard, in
+                     ``bytes``.  If ``None``, replies for all kinds of
+                     query are discarded.
+        :param target: The target of the query to discard, in
+                       ``bytes``.  If ``None``, replies for all targets
+                       are discarded.
+        """
+
+        if target is not None:
+            target = self.isupport.casemap(target)
+
+        for key in list(self._cache):
+            if ((kind is None or key[0] == kind) and
+                    (target is None or key[1] == target)):
+                del self._cache[key]
+
+    def cancel(self, exc=None):
+        """
+        Fail all in-flight queries, e.g. when the connection is lost.
+
+        :param exc: The exception to fail the queries with.  If
+                    ``None``, the futures are cancelled instead.
+        """
+
+        pending = list(self._pending.values())
+        self._pending.clear()
+        self._queues.clear()
+
+        for req in pending:
+            req.handle.cancel()
+            for fut in req.waiters:
+                if fut.done():
+                    continue
+                elif exc is None:
+                    fut.cancel()
+                else:
+                    fut.set_exception(exc)
+
+    def __call__(self, msg):
+        """
+        Process a message received from the server.
+
+        :param msg: The ``pirch.proto.irc.messages.Message``.
+        """
+
+        cmd = msg.command.cmd
+        kinds = self._routes.get(cmd)
+        if not kinds:
+            return
+
+        # Find the oldest query this numeric could answer
+        mapper = self.isupport.casemap
+        req = None
+        for kind in kinds:
+            idx = queries[kind].targets.get(cmd, 1)
+            if idx is None:
+                queue = self._queues.get(kind)
+                cand = queue[0] if queue else None
+            elif len(msg.args) > idx:
+                cand = self._pending.get((kind, mapper(msg.args[idx])))
+            else:
+                cand = None
+
+            if cand is not None and (req is None or cand.seq < req.seq):
+                req = cand
+        if req is None:
+            return
+
+        req.replies.append(msg)
+        if cmd in queries[req.kind].terminators:
+            self._finish(req)
+
+    def _remove(self, req):
+        """
+        Remove a query from the in-flight queries.
+
+        :param req: The ``_Request``.
+        """
+
+        del self._pending[(req.kind, req.key)]
+        self._queues[req.kind].remove(req)
+        req.handle.cancel()
+
+    def _finish(self, req):
+        """
+        Complete a query.
+
+        :param req: The ``_Request``.
+        """
+
+        self._remove(req)
+
+        # Cache the replies, discarding any that have expired
+        now = self.clock()
+        key = (req.kind, req.key)
+        self._cache.pop(key, None)
+        self._cache[key] = (now + self.ttl, req.replies)
+        while self._cache and next(iter(self._cache.values()))[0] <= now:
+            self._cache.popitem(last=False)
+
+        for fut in req.waiters:
+            if not fut.done():
+                fut.set_result(list(req.replies))
+
+    def _expire(self, req):
+        """
+        Fail a query which has not completed in time.
+
+        :param req: The ``_Request``.
+        """
+
+        self._remove(req)
+
+        for fut in req.waiters:
+            if not fut.done():
+                fut.set_exception(asyncio.TimeoutError())
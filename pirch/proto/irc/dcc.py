@@ -0,0 +1,362 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import errno
+import mmap
+import os
+import socket
+import struct
+
+try:
+    import asyncio
+except ImportError:  # pragma: no cover
+    import trollius as asyncio
+
+from pirch import util
+
+
+# Errors indicating a non-blocking socket operation would block
+_blocking = frozenset([errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR])
+
+# Errors indicating sendfile() cannot be used for the file or socket
+_no_sendfile = frozenset([errno.EINVAL, errno.ENOSYS, errno.ENOTSOCK,
+                          getattr(errno, 'EOPNOTSUPP', errno.EINVAL)])
+
+# The DCC acknowledgement: the number of bytes received, modulo 2**32
+_ack = struct.Struct('!I')
+
+
+def _would_block(exc):
+    """
+    Determine whether a socket error means the operation would block.
+
+    :param exc: The exception.
+
+    :returns: A ``True`` value if the operation should be retried
+              once the socket is ready.
+    """
+
+    return getattr(exc, 'errno', None) in _blocking
+
+
+class _Transfer(object):
+    """
+    The common machinery for DCC transfers, which drive a
+    non-blocking socket directly from the event loop.
+    """
+
+    def __init__(self, loop, sock):
+        """
+        Initialize a ``_Transfer`` instance.
+
+        :param loop: The event loop.
+        :param sock: The connected socket.  It is made non-blocking.
+        """
+
+        self.loop = loop
+        self.sock = sock
+        self.done = asyncio.Future(loop=loop)
+
+        self._mmap = None
+        self._reading = False
+        self._writing = False
+
+        sock.setblocking(False)
+
+    def cancel(self):
+        """
+        Abandon the transfer.  The socket is not closed.
+        """
+
+        if not self.done.done():
+            self._cleanup()
+            self.done.cancel()
+
+    def _cleanup(self):
+        """
+        Stop watching the socket and release the mapping.
+        """
+
+        if self._reading:
+            self.loop.remove_reader(self.sock.fileno())
+            self._reading = False
+        if self._writing:
+            self.loop.remove_writer(self.sock.fileno())
+            self._writing = False
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def _finish(self, result):
+        """
+        Complete the transfer.
+
+        :param result: The result for the ``done`` future.
+        """
+
+        self._cleanup()
+        if not self.done.done():
+            self.done.set_result(result)
+
+    def _fail(self, exc):
+        """
+        Fail the transfer.
+
+        :param exc: The exception.
+        """
+
+        self._cleanup()
+        if not self.done.done():
+            self.done.set_exception(exc)
+
+
+class Sender(_Transfer):
+    """
+    Send a file over a DCC connection.  The file is sent with
+    ``os.sendfile()`` where available, so its contents never enter
+    Python; otherwise, slices of a read-only memory map are sent.
+    Acknowledgements are read in bulk, and only the latest is
+    decoded.  The transfer completes when the final acknowledgement
+    is received, or when the receiver closes the connection after
+    the whole file has been sent.
+    """
+
+    def __init__(self, loop, sock, fileobj, size=None, offset=0,
+                 chunk_size=1024 * 1024, sendfile=True):
+        """
+        Initialize a ``Sender`` instance.
+
+        :param loop: The event loop.
+        :param sock: The connected socket.
+        :param fileobj: The file to send, opened for reading in binary
+                        mode.
+        :param size: The size of the file.  Defaults to the size of
+                     ``fileobj``.
+        :param offset: The position at which to begin, e.g. to resume
+                       a transfer.
+        :param chunk_size: The maximum number of bytes to send per
+                           system call.
+        :param sendfile: If ``False``, ``os.sendfile()`` is not used.
+        """
+
+        super(Sender, self).__init__(loop, sock)
+
+        self.fileobj = fileobj
+        self.size = (os.fstat(fileobj.fileno()).st_size if size is None
+                     else size)
+        self.sent = offset
+        self.acked = None
+        self.chunk_size = chunk_size
+
+        self._sendfile = getattr(os, 'sendfile', None) if sendfile else None
+        self._partial = b''
+
+    def start(self):
+        """
+        Start sending.
+
+        :returns: The ``done`` future, whose result is the number of
+                  bytes sent.
+        """
+
+        if self.sent >= self.size:
+            self._finish(self.sent)
+            return self.done
+
+        if self._sendfile is None:
+            self._map()
+
+        self.loop.add_writer(self.sock.fileno(), self._write)
+        self.loop.add_reader(self.sock.fileno(), self._read)
+        self._writing = True
+        self._reading = True
+
+        return self.done
+
+    def _map(self):
+        """
+        Map the file for sending without ``os.sendfile()``.
+        """
+
+        self._sendfile = None
+        self._mmap = mmap.mmap(self.fileobj.fileno(), 0,
+                               access=mmap.ACCESS_READ)
+
+    def _write(self):
+        """
+        Send as much of the file as the socket will take.
+        """
+
+        fd = self.sock.fileno()
+        while self.sent < self.size:
+            count = min(self.chunk_size, self.size - self.sent)
+            try:
+                if self._sendfile is not None:
+                    sent = self._sendfile(fd, self.fileobj.fileno(),
+                                          self.sent, count)
+                elif util.PY2:  # pragma: no cover
+                    sent = self.sock.send(
+                        buffer(self._mmap, self.sent, count))  # noqa
+                else:
+                    sent = self.sock.send(
+                        memoryview(self._mmap)[self.sent:self.sent + count])
+            except (OSError, IOError, socket.error) as exc:
+                if _would_block(exc):
+                    return
+                elif (self._sendfile is not None and
+                      getattr(exc, 'errno', None) in _no_sendfile):
+                    self._map()
+                    continue
+                self._fail(exc)
+                return
+
+            if not sent:
+                self._fail(EOFError('file shorter than %d bytes' %
+                                    self.size))
+                return
+            self.sent += sent
+
+        # Everything is sent; only acknowledgements remain
+        self.loop.remove_writer(fd)
+        self._writing = False
+        self._check()
+
+    def _read(self):
+        """
+        Read acknowledgements.
+        """
+
+        try:
+            data = self.sock.recv(65536)
+        except (OSError, IOError, socket.error) as exc:
+            if not _would_block(exc):
+                self._fail(exc)
+            return
+
+        if not data:
+            # The receiver closed the connection
+            if self.sent >= self.size:
+                self._finish(self.sent)
+            else:
+                self._fail(EOFError('connection closed after %d bytes' %
+                                    self.sent))
+            return
+
+        # Decode only the latest complete acknowledgement
+        data = self._partial + data
+        end = len(data) - len(data) % _ack.size
+        if end:
+            self.acked = _ack.unpack(data[end - _ack.size:end])[0]
+        self._partial = data[end:]
+
+        self._check()
+
+    def _check(self):
+        """
+        Complete the transfer if everything has been acknowledged.
+        """
+
+        if (self.sent >= self.size and
+                self.acked == self.size & 0xffffffff):
+            self._finish(self.sent)
+
+
+class Receiver(_Transfer):
+    """
+    Receive a file over a DCC connection.  The file is preallocated
+    and mapped into memory, and data is received directly into the
+    mapping.  One acknowledgement is sent for each read, however much
+    data it returns, rather than for each packet.
+    """
+
+    def __init__(self, loop, sock, fileobj, size, offset=0, ack=True):
+        """
+        Initialize a ``Receiver`` instance.
+
+        :param loop: The event loop.
+        :param sock: The connected socket.
+        :param fileobj: The file to receive into, opened for reading
+                        and writing in binary mode.
+        :param size: The size of the file, as given in the offer.
+        :param offset: The position at which to begin, e.g. to resume
+                       a transfer.
+        :param ack: If ``False``, no acknowledgements are sent, e.g.
+                    for "turbo" transfers.
+        """
+
+        super(Receiver, self).__init__(loop, sock)
+
+        self.fileobj = fileobj
+        self.size = size
+        self.received = offset
+        self.ack = ack
+
+    def start(self):
+        """
+        Start receiving.
+
+        :returns: The ``done`` future, whose result is the number of
+                  bytes received.
+        """
+
+        if self.received >= self.size:
+            self._finish(self.received)
+            return self.done
+
+        self.fileobj.truncate(self.size)
+        self._mmap = mmap.mmap(self.fileobj.fileno(), self.size,
+                               access=mmap.ACCESS_WRITE)
+
+        self.loop.add_reader(self.sock.fileno(), self._read)
+        self._reading = True
+
+        return self.done
+
+    def _read(self):
+        """
+        Receive data into the mapping.
+        """
+
+        pos = self.received
+        try:
+            if util.PY2:  # pragma: no cover
+                data = self.sock.recv(self.size - pos)
+                count = len(data)
+                self._mmap[pos:pos + count] = data
+            else:
+                count = self.sock.recv_into(memoryview(self._mmap)[pos:])
+        except (OSError, IOError, socket.error) as exc:
+            if not _would_block(exc):
+                self._fail(exc)
+            return
+
+        if not count:
+            self._fail(EOFError('connection closed after %d bytes' % pos))
+            return
+        self.received = pos + count
+
+        if self.ack:
+            try:
+                self.sock.send(_ack.pack(self.received & 0xffffffff))
+            except (OSError, IOError, socket.error) as exc:
+                # A later acknowledgement supersedes this one
+                if not _would_block(exc):
+                    self._fail(exc)
+                    return
+
+        if self.received >= self.size:
+            self._mmap.flush()
+            self._finish(self.received)
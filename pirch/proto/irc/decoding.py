@@ -0,0 +1,188 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import codecs
+import re
+
+try:
+    from collections.abc import Sequence
+except ImportError:  # pragma: no cover
+    from collections import Sequence
+
+from pirch.proto.irc import casemap
+from pirch import util
+
+
+# Matches any byte outside of 7-bit ASCII
+_nonascii_re = re.compile(b'[\x80-\xff]')
+
+
+def is_ascii(data):
+    """
+    Determine whether ``bytes`` consist entirely of 7-bit ASCII, and
+    so may be decoded without consulting a codec.
+
+    :param data: The ``bytes`` to check.
+
+    :returns: A ``True`` value if the data is ASCII, ``False``
+              otherwise.
+    """
+
+    return _nonascii_re.search(data) is None
+
+
+class Decoder(object):
+    """
+    Decode text received on a connection.  Text is decoded with the
+    primary encoding, normally UTF-8; text which is not valid in that
+    encoding is decoded with a fallback encoding, which may be
+    configured per target.
+    """
+
+    def __init__(self, encoding='utf-8', fallback='latin-1',
+                 mapper=casemap.bytes_mappers['rfc1459']):
+        """
+        Initialize a ``Decoder`` instance.
+
+        :param encoding: The primary encoding.
+        :param fallback: The default fallback encoding.
+        :param mapper: The casemapping callable to apply to ``bytes``
+                       target names.  This may be changed later, e.g.
+                       when the server advertises its CASEMAPPING.
+        """
+
+        # Look the codecs up now, so errors are reported early
+        self.encoding = codecs.lookup(encoding).name
+        self.fallback = codecs.lookup(fallback).name
+        self.mapper = mapper
+
+        self._fallbacks = {}
+
+    def set_fallback(self, target, encoding):
+        """
+        Set the fallback encoding for a target.
+
+        :param target: The name of the target, e.g. a channel, in
+                       ``bytes``.
+        :param encoding: The fallback encoding.  If ``None``, the
+                         default fallback encoding is restored.
+        """
+
+        key = self.mapper(target)
+        if encoding is None:
+            self._fallbacks.pop(key, None)
+        else:
+            self._fallbacks[key] = codecs.lookup(encoding).name
+
+    def fallback_for(self, target):
+        """
+        Determine the fallback encoding for a target.
+
+        :param target: The name of the target, in ``bytes``, or
+                       ``None``.
+
+        :returns: The name of the fallback encoding.
+        """
+
+        if target is None or not self._fallbacks:
+            return self.fallback
+        return self._fallbacks.get(self.mapper(target), self.fallback)
+
+    def decode(self, data, target=None):
+        """
+        Decode text.
+
+        :param data: The text, in ``bytes``.
+        :param target: The name of the target the text was sent to,
+                       in ``bytes``, or ``None``.  Selects the
+                       fallback encoding.
+
+        :returns: The decoded text.
+        """
+
+        if is_ascii(data):
+            return data.decode('ascii')
+
+        try:
+            return data.decode(self.encoding)
+        except UnicodeDecodeError:
+            return data.decode(self.fallback_for(target), 'replace')
+
+
+# The decoder used for connections that do not configure one
+default_decoder = Decoder()
+
+
+class DecodedArguments(Sequence):
+    """
+    A view of a ``pirch.proto.irc.messages.Arguments`` instance in
+    which each argument is decoded to text.  Each argument is decoded
+    at most once, when it is first accessed.
+    """
+
+    def __init__(self, args, decoder, target=None):
+        """
+        Initialize a ``DecodedArguments`` instance.
+
+        :param args: The ``pirch.proto.irc.messages.Arguments``.
+        :param decoder: The ``Decoder`` to use.
+        :param target: The name of the target the message was sent
+                       to, in ``bytes``, or ``None``.
+        """
+
+        self._args = args
+        self._decoder = decoder
+        self._target = target
+        self._cache = {}
+
+    def __len__(self):
+        """
+        Determine the length of a ``DecodedArguments`` instance.
+
+        :returns: The number of arguments.
+        """
+
+        return len(self._args)
+
+    def __getitem__(self, idx):
+        """
+        Retrieve a decoded argument.
+
+        :param idx: An integer or a ``slice`` object.
+
+        :returns: The decoded argument, or a list of decoded
+                  arguments.
+        """
+
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        elif not isinstance(idx, util.integer_types):
+            raise TypeError('%s indices must be integers, not %s' %
+                            (self.__class__.__name__,
+                             idx.__class__.__name__))
+
+        if idx < -len(self) or idx >= len(self):
+            raise IndexError('list index out of range')
+        elif idx < 0:
+            idx += len(self)
+
+        if idx not in self._cache:
+            value = self._args[idx]
+            if value is not util.unset:
+                value = self._decoder.decode(value, self._target)
+            self._cache[idx] = value
+
+        return self._cache[idx]
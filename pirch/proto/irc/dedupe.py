@@ -0,0 +1,286 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import re
+import time
+
+
+# Locates the msgid tag in an IRCv3 message tags section
+_msgid_re = re.compile(b'(?:^|;)msgid=([^;]+)')
+
+# Commands which may be recognized as duplicates by their content;
+# all others, such as PING, PONG, numerics, and commands which change
+# state, are only recognized by their msgid tags
+_content_commands = frozenset([b'PRIVMSG', b'NOTICE', b'TAGMSG'])
+
+
+def _parse(line, origin):
+    """
+    Extract the fields of interest to the deduplicator from a raw
+    line.
+
+    :param line: The raw IRC protocol message, in ``bytes``.
+    :param origin: The nickname to assume for a line without a
+                   prefix.
+
+    :returns: A tuple of the msgid tag value (or ``None``), the
+              origin nickname, the command, and the line with its
+              tags and prefix removed.
+    """
+
+    msgid = None
+    if line[:1] == b'@':
+        tags, _sep, line = line[1:].partition(b' ')
+        match = _msgid_re.search(tags)
+        if match:
+            msgid = match.group(1)
+        line = line.lstrip(b' ')
+
+    if line[:1] == b':':
+        prefix, _sep, line = line[1:].partition(b' ')
+        origin = prefix.split(b'!', 1)[0].split(b'@', 1)[0]
+        line = line.lstrip(b' ')
+
+    return msgid, origin, line.split(b' ', 1)[0].upper(), line
+
+
+def fingerprint(line, origin=b''):
+    """
+    Compute the fingerprint of a raw line.  If the line carries an
+    IRCv3 ``msgid`` tag, the fingerprint is derived from that alone.
+    Otherwise, only PRIVMSG, NOTICE, and TAGMSG lines have a
+    fingerprint, derived from the line with its volatile fields
+    removed: the message tags, and all of the prefix but the
+    nickname.  This allows a relayed or echoed copy of a line to be
+    recognized.
+
+    :param line: The raw IRC protocol message, in ``bytes``.
+    :param origin: The nickname to assume for a line without a
+                   prefix, e.g. our own nickname for a line we sent.
+
+    :returns: An integer fingerprint, or ``None`` if the line must
+              never be treated as a duplicate.
+    """
+
+    msgid, origin, command, line = _parse(line, origin)
+    if msgid is not None:
+        return hash((b'msgid', msgid))
+    elif command not in _content_commands:
+        return None
+
+    return hash((origin, line))
+
+
+class Deduper(object):
+    """
+    Recognize lines that have already been seen within a time window.
+    Fingerprints are kept in two sets, which are rotated when the
+    window elapses or the current set fills; a fingerprint is
+    therefore remembered for between one and two windows, and memory
+    is bounded by the maximum number of entries.
+
+    A line with a ``msgid`` tag is a duplicate if its msgid has been
+    seen.  A PRIVMSG, NOTICE, or TAGMSG without one is a duplicate
+    only if it echoes a line we sent, or if it arrives during a
+    replay window (see ``replay()``) and an identical line has been
+    seen; outside a replay window, a user may say the same thing
+    twice.  Other lines are never duplicates.
+
+    A ``Deduper`` may be added directly as a filter on a
+    ``pirch.proto.irc.dispatch.Dispatcher``.
+    """
+
+    def __init__(self, window=60.0, max_entries=65536):
+        """
+        Initialize a ``Deduper`` instance.
+
+        :param window: The minimum time, in seconds, for which a
+                       fingerprint is remembered, unless the cache
+                       fills sooner.
+        :param max_entries: The maximum number of fingerprints to
+                            remember.
+        """
+
+        self.window = window
+        self.max_entries = max_entries
+
+        self._current = set()
+        self._previous = set()
+        self._rotated = None
+
+        # Fingerprints of lines we sent, mapped to the number of
+        # echoes still expected
+        self._echoes = {}
+        self._previous_echoes = {}
+
+        self._replay_until = None
+
+    def __len__(self):
+        """
+        Determine the number of fingerprints remembered.
+
+        :returns: The number of fingerprints.
+        """
+
+        return len(self._current) + len(self._previous)
+
+    def __call__(self, msg):
+        """
+        Determine whether a message is a duplicate, for use as a
+        dispatcher filter.
+
+        :param msg: The ``pirch.proto.irc.messages.Message``.
+
+        :returns: A ``True`` value if the message is a duplicate,
+                  ``False`` otherwise.
+        """
+
+        return self.seen(msg.msg)
+
+    def _rotate(self, now):
+        """
+        Rotate the fingerprint sets, if necessary.
+
+        :param now: The current time.
+        """
+
+        if self._rotated is None:
+            self._rotated = now
+            return
+
+        elapsed = now - self._rotated
+        if elapsed >= 2 * self.window:
+            # Everything has expired
+            self._previous = set()
+            self._current = set()
+            self._previous_echoes = {}
+            self._echoes = {}
+            self._rotated = now
+        elif (elapsed >= self.window or
+              len(self._current) >= self.max_entries // 2):
+            self._previous = self._current
+            self._current = set()
+            self._previous_echoes = self._echoes
+            self._echoes = {}
+            self._rotated = now
+
+    def replay(self, duration=None, now=None):
+        """
+        Open a replay window, e.g. on reconnecting or while a bouncer
+        plays back its buffer.  During the window, PRIVMSG, NOTICE,
+        and TAGMSG lines without msgid tags are compared by content.
+
+        :param duration: The length of the window, in seconds.
+                         Defaults to the deduplication window.  A
+                         duration of 0 closes the window.
+        :param now: The current time.  Defaults to the value of
+                    ``time.time()``.
+        """
+
+        now = time.time() if now is None else now
+        self._replay_until = now + (self.window if duration is None
+                                    else duration)
+
+    def replaying(self, now=None):
+        """
+        Determine if a replay window is open.
+
+        :param now: The current time.  Defaults to the value of
+                    ``time.time()``.
+
+        :returns: A ``True`` value if a replay window is open.
+        """
+
+        now = time.time() if now is None else now
+        return self._replay_until is not None and now < self._replay_until
+
+    def sent(self, line, origin, now=None):
+        """
+        Remember a line we sent, so that its echo is suppressed.  Each
+        line sent suppresses a single echo.
+
+        :param line: The raw IRC protocol message, in ``bytes``.
+        :param origin: Our nickname.
+        :param now: The current time.  Defaults to the value of
+                    ``time.time()``.
+        """
+
+        self._rotate(time.time() if now is None else now)
+
+        key = fingerprint(line, origin)
+        if key is not None:
+            self._echoes[key] = self._echoes.get(key, 0) + 1
+
+    def _echoed(self, key):
+        """
+        Consume an expected echo.
+
+        :param key: The fingerprint.
+
+        :returns: A ``True`` value if an echo was expected.
+        """
+
+        for echoes in (self._previous_echoes, self._echoes):
+            count = echoes.get(key)
+            if count:
+                if count > 1:
+                    echoes[key] = count - 1
+                else:
+                    del echoes[key]
+                return True
+
+        return False
+
+    def seen(self, line, origin=b'', now=None):
+        """
+        Determine whether a line is a duplicate, remembering it if it
+        is not.
+
+        :param line: The raw IRC protocol message, in ``bytes``.
+        :param origin: The nickname to assume for a line without a
+                       prefix.
+        :param now: The current time.  Defaults to the value of
+                    ``time.time()``.
+
+        :returns: A ``True`` value if the line is a duplicate,
+                  ``False`` otherwise.
+        """
+
+        now = time.time() if now is None else now
+        self._rotate(now)
+
+        msgid, origin, command, rest = _parse(line, origin)
+        if command in _content_commands:
+            content = hash((origin, rest))
+            if self._echoed(content):
+                return True
+
+        if msgid is not None:
+            key = hash((b'msgid', msgid))
+        elif command in _content_commands:
+            key = content
+            if not self.replaying(now):
+                # Remember it, in case it is replayed later
+                self._current.add(key)
+                return False
+        else:
+            return False
+
+        if key in self._current or key in self._previous:
+            return True
+
+        self._current.add(key)
+        return False
@@ -0,0 +1,98 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+
+class Dispatcher(object):
+    """
+    Dispatch messages to the handlers registered for their commands.
+    Handlers are callables taking a single argument, the
+    ``pirch.proto.irc.messages.Message`` being dispatched.  Filters
+    are callables taking the same argument, and may suppress a
+    message before any handler sees it.
+    """
+
+    def __init__(self):
+        """
+        Initialize a ``Dispatcher`` instance.
+        """
+
+        self._handlers = {}
+        self._filters = []
+
+    def register(self, cmd, handler):
+        """
+        Register a handler.
+
+        :param cmd: The ``bytes`` for the command the handler is
+                    interested in, e.g. b"PRIVMSG", etc.  If ``None``,
+                    the handler will be called for every message.
+        :param handler: The handler callable.
+        """
+
+        self._handlers.setdefault(cmd, []).append(handler)
+
+    def unregister(self, cmd, handler):
+        """
+        Unregister a handler.
+
+        :param cmd: The ``bytes`` for the command the handler was
+                    registered for, or ``None``.
+        :param handler: The handler callable.
+        """
+
+        handlers = self._handlers.get(cmd, [])
+        if handler in handlers:
+            handlers.remove(handler)
+
+    def add_filter(self, func):
+        """
+        Add a filter.
+
+        :param func: The filter callable.  If it returns a ``True``
+                     value, the message is suppressed.
+        """
+
+        self._filters.append(func)
+
+    def remove_filter(self, func):
+        """
+        Remove a filter.
+
+        :param func: The filter callable.
+        """
+
+        if func in self._filters:
+            self._filters.remove(func)
+
+    def dispatch(self, msg):
+        """
+        Dispatch a message.  The filters are consulted first; unless
+        one suppresses the message, the handlers registered for the
+        command are called, followed by those registered for every
+        message.
+
+        :param msg: The ``pirch.proto.irc.messages.Message`` to
+                    dispatch.
+        """
+
+        for func in self._filters:
+            if func(msg):
+                return
+
+        for handler in self._handlers.get(msg.command.cmd, ()):
+            handler(msg)
+        for handler in self._handlers.get(None, ()):
+            handler(msg)
@@ -0,0 +1,276 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import collections
+
+from pirch.proto.irc import isupport
+from pirch import util
+
+
+# Commands whose text argument is scanned
+_scanned_commands = frozenset([b'PRIVMSG', b'NOTICE'])
+
+# Bytes which are part of a word, for word-boundary matching: ASCII
+# alphanumerics, the underscore, and non-ASCII bytes, the latter so
+# that UTF-8 encoded words are kept intact
+_word_bytes = frozenset(bytearray(
+    b'0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz') +
+    bytearray(range(0x80, 0x100)))
+
+
+# A single match.  ``start`` and ``end`` are offsets into the text;
+# ``pattern`` and ``value`` are as passed to ``Matcher.add()``.
+Match = collections.namedtuple('Match', ['start', 'end', 'pattern', 'value'])
+
+
+class Matcher(object):
+    """
+    Match many patterns against text at once.  The patterns are
+    compiled into a single Aho-Corasick automaton over casemapped
+    bytes, so all the matches in a text are found in one pass over
+    it, at a cost which depends on the length of the text and the
+    number of matches but not on the number of patterns.
+
+    Adding a pattern extends the trie in place; the failure links are
+    recomputed, in a single pass over the trie, before the next
+    search.  Removing a pattern leaves its trie states in place, and
+    the trie is rebuilt only once as many patterns have been removed
+    as remain.  The trie is also rebuilt if the connection's
+    casemapping changes.
+    """
+
+    def __init__(self, isup=None):
+        """
+        Initialize a ``Matcher`` instance.
+
+        :param isup: The ``pirch.proto.irc.isupport.ISupport`` for the
+                     connection, whose casemapping is used to compare
+                     the patterns with the text.  Defaults to the RFC
+                     1459 parameters.
+        """
+
+        self.isupport = isupport.ISupport() if isup is None else isup
+
+        # The casemapping the trie was built with
+        self._mapper = self.isupport.casemap
+
+        # Maps casemapped patterns to a tuple of the pattern, its
+        # value, and whether it must match whole words
+        self._patterns = {}
+
+        # The trie: the transitions from each state, and the
+        # casemapped pattern ending at each state, if any
+        self._goto = [{}]
+        self._own = [None]
+
+        # The failure links, and the casemapped patterns matched at
+        # each state; computed by _compile()
+        self._fail = None
+        self._out = None
+
+        self._removed = 0
+
+    def __len__(self):
+        """
+        Determine the number of patterns.
+
+        :returns: The number of patterns.
+        """
+
+        self._casemap()
+        return len(self._patterns)
+
+    def __contains__(self, pattern):
+        """
+        Determine if a pattern is present.
+
+        :param pattern: The pattern, in ``bytes``.
+
+        :returns: A ``True`` value if the pattern is present.
+        """
+
+        return self._casemap()(pattern) in self._patterns
+
+    def add(self, pattern, value=None, word=False):
+        """
+        Add a pattern, replacing any pattern which is the same under
+        the casemapping.
+
+        :param pattern: The pattern, in ``bytes``.
+        :param value: A value to return with matches of the pattern,
+                      e.g. whether it is a highlight or a spam phrase.
+        :param word: If ``True``, the pattern matches only where it is
+                     not preceded or followed by a word character.
+        """
+
+        if not pattern:
+            raise ValueError('patterns must not be empty')
+
+        key = self._casemap()(pattern)
+        self._patterns[key] = (pattern, value, word)
+
+        state = 0
+        for byte in bytearray(key):
+            nxt = self._goto[state].get(byte)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][byte] = nxt
+                self._goto.append({})
+                self._own.append(None)
+            state = nxt
+
+        if self._own[state] is None:
+            self._own[state] = key
+            self._fail = None
+
+    def remove(self, pattern):
+        """
+        Remove a pattern.
+
+        :param pattern: The pattern, in ``bytes``.
+        """
+
+        key = self._casemap()(pattern)
+        if self._patterns.pop(key, None) is None:
+            return
+
+        state = 0
+        for byte in bytearray(key):
+            state = self._goto[state][byte]
+        self._own[state] = None
+
+        self._removed += 1
+        self._fail = None
+
+    def _casemap(self):
+        """
+        Retrieve the connection's casemapping, rebuilding the trie if
+        it has changed since the trie was built.
+
+        :returns: The casemapping callable.
+        """
+
+        mapper = self.isupport.casemap
+        if mapper is not self._mapper:
+            self._mapper = mapper
+            self._rebuild()
+        return mapper
+
+    def _rebuild(self):
+        """
+        Rebuild the trie from the current patterns, discarding the
+        states left behind by removed patterns.
+        """
+
+        patterns = self._patterns
+        self._patterns = {}
+        self._goto = [{}]
+        self._own = [None]
+        self._fail = None
+        self._removed = 0
+
+        for pattern, value, word in patterns.values():
+            self.add(pattern, value, word)
+
+    def _compile(self):
+        """
+        Compute the failure links and the patterns matched at each
+        state, by a breadth-first walk of the trie.
+        """
+
+        if self._removed > len(self._patterns):
+            self._rebuild()
+
+        goto = self._goto
+        own = self._own
+        fail = [0] * len(goto)
+        out = [()] * len(goto)
+
+        queue = collections.deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            out[state] = ((own[state],) if own[state] is not None
+                          else ()) + out[fail[state]]
+
+            for byte, nxt in goto[state].items():
+                if state:
+                    link = fail[state]
+                    while link and byte not in goto[link]:
+                        link = fail[link]
+                    fail[nxt] = goto[link].get(byte, 0)
+                queue.append(nxt)
+
+        self._fail = fail
+        self._out = out
+
+    def search(self, text):
+        """
+        Find every match of the patterns in a text.  Overlapping
+        matches are all returned.
+
+        :param text: The text, in ``bytes``.
+
+        :returns: A list of ``Match`` tuples, in order of their end
+                  offsets.
+        """
+
+        mapper = self._casemap()
+        if self._fail is None:
+            self._compile()
+
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        patterns = self._patterns
+
+        data = bytearray(mapper(text))
+        result = []
+        state = 0
+        for i, byte in enumerate(data):
+            while state and byte not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(byte, 0)
+
+            for key in out[state]:
+                pattern, value, word = patterns[key]
+                start = i + 1 - len(key)
+                if word and ((start and data[start - 1] in _word_bytes) or
+                             (i + 1 < len(data) and
+                              data[i + 1] in _word_bytes)):
+                    continue
+                result.append(Match(start, i + 1, pattern, value))
+
+        return result
+
+    def search_message(self, msg):
+        """
+        Find every match of the patterns in a message.  Only the text
+        argument of PRIVMSG and NOTICE messages is searched.
+
+        :param msg: The ``pirch.proto.irc.messages.Message``.
+
+        :returns: A list of ``Match`` tuples, in order of their end
+                  offsets.
+        """
+
+        if msg.command.cmd not in _scanned_commands or len(msg.args) < 2:
+            return []
+
+        text = msg.args[1]
+        if text is util.unset:
+            return []
+
+        return self.search(text)
@@ -0,0 +1,127 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import argparse
+import subprocess
+import sys
+
+
+# The modules a minimal client imports
+_default_modules = ['pirch.proto.irc.messages']
+
+# Measures the import time of a module in a fresh interpreter
+_timer = ('import time; start = time.time(); import %s; '
+          'print(repr(time.time() - start))')
+
+
+def measure(module, repeat=5, python=sys.executable):
+    """
+    Measure the time taken to import a module.  Each measurement is
+    made in a fresh interpreter, so nothing is already imported.
+
+    :param module: The name of the module.
+    :param repeat: The number of measurements to make.
+    :param python: The Python interpreter to use.
+
+    :returns: A sorted list of the import times, in seconds.
+    """
+
+    return sorted(
+        float(subprocess.check_output([python, '-c', _timer % module]))
+        for _i in range(repeat))
+
+
+def breakdown(module, python=sys.executable):
+    """
+    Break the import time of a module down by the modules it imports,
+    using the "-X importtime" option of Python 3.7 and later.
+
+    :param module: The name of the module.
+    :param python: The Python interpreter to use.
+
+    :returns: A list of tuples of the cumulative time, in
+              microseconds, and the name of each module imported,
+              slowest first.
+    """
+
+    proc = subprocess.Popen([python, '-X', 'importtime', '-c',
+                             'import %s' % module],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _out, err = proc.communicate()
+
+    result = []
+    for line in err.decode('utf-8', 'replace').splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            result.append((int(fields[1]), fields[2].strip()))
+        except (IndexError, ValueError):
+            # The header line
+            continue
+
+    return sorted(result, reverse=True)
+
+
+def main(argv=None):
+    """
+    Report the import time of modules.
+
+    :param argv: The command line arguments.  Defaults to
+                 ``sys.argv[1:]``.
+
+    :returns: The exit status.
+    """
+
+    parser = argparse.ArgumentParser(
+        description='Measure the time taken to import pirch modules.',
+    )
+    parser.add_argument(
+        'modules',
+        nargs='*',
+        default=_default_modules,
+        help='The modules to import.  Defaults to %s.' %
+        ', '.join(_default_modules),
+    )
+    parser.add_argument(
+        '--repeat', '-r',
+        type=int,
+        default=5,
+        help='The number of times to import each module.',
+    )
+    parser.add_argument(
+        '--top', '-t',
+        type=int,
+        default=10,
+        help='The number of slowest imports to list, where supported.',
+    )
+    args = parser.parse_args(argv)
+
+    for module in args.modules:
+        times = measure(module, args.repeat)
+        print('%s: min %.1f ms, median %.1f ms, max %.1f ms' %
+              (module, times[0] * 1000, times[len(times) // 2] * 1000,
+               times[-1] * 1000))
+
+        if args.top and sys.version_info >= (3, 7):
+            for usec, name in breakdown(module)[:args.top]:
+                print('  %8.1f ms  %s' % (usec / 1000.0, name))
+
+    return 0
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main())
@@ -0,0 +1,366 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import re
+
+from pirch.proto.irc import casemap
+from pirch import util
+
+
+# Escapes permitted in ISUPPORT values
+_escape_re = re.compile(b'\\\\x([0-9A-Fa-f]{2})')
+
+# Bytes which must be escaped in ISUPPORT values: the backslash, the
+# equals sign, the space, and the control characters
+_unsafe_re = re.compile(b'[\\x00-\\x20\\x3d\\x5c\\x7f]')
+
+# Tokens with integer values, mapped to the attribute to set and its
+# default value.  A token given without a value means "no limit",
+# represented by ``None``.
+_int_tokens = {
+    b'NICKLEN': ('nicklen', 9),
+    b'CHANNELLEN': ('channellen', 200),
+    b'TOPICLEN': ('topiclen', None),
+    b'KICKLEN': ('kicklen', None),
+    b'AWAYLEN': ('awaylen', None),
+    b'MODES': ('modes', 3),
+    b'MAXTARGETS': ('maxtargets', None),
+    b'LINELEN': ('linelen', 512),
+    b'MONITOR': ('monitor', None),
+}
+
+# Integer tokens for which "no limit" is meaningless; given without a
+# value, these take their default
+_limited_tokens = frozenset([b'LINELEN'])
+
+# Defaults for the structured tokens
+_default_casemapping = b'rfc1459'
+_default_chantypes = b'#&'
+_default_prefix = b'(ov)@+'
+_default_chanmodes = b'b,k,l,imnpst'
+
+
+def _unescape(value):
+    """
+    Interpret the "\\xHH" escapes in an ISUPPORT value.
+
+    :param value: The raw value, in ``bytes``.
+
+    :returns: The unescaped value.
+    """
+
+    if b'\\' not in value:
+        return value
+
+    return _escape_re.sub(
+        lambda m: bytes(bytearray([int(m.group(1), 16)])), value)
+
+
+def _escape(value):
+    """
+    Escape the bytes in an ISUPPORT value which may not appear in it
+    literally, as "\\xHH".  This is the inverse of ``_unescape()``.
+
+    :param value: The value, in ``bytes``.
+
+    :returns: The escaped value.
+    """
+
+    return _unsafe_re.sub(
+        lambda m: ('\\x%02X' % ord(m.group(0))).encode('ascii'), value)
+
+
+class ISupport(object):
+    """
+    The ISUPPORT parameters advertised by a server in its 005
+    numerics.  Each parameter is parsed once, when it is received,
+    into a precomputed structure exposed as an attribute:
+
+    ``casemapping``
+        The name of the casemapping, as ``bytes``.
+
+    ``casemap``
+        The casemapping callable to apply to ``bytes`` nicknames and
+        channel names.
+
+    ``chantypes``
+        A ``frozenset`` of the channel prefix characters, each a
+        one-byte ``bytes``.
+
+    ``prefix``
+        A dictionary mapping channel membership modes to their
+        symbols, e.g. b"o" to b"@".
+
+    ``symbols``
+        A dictionary mapping membership symbols to their modes.
+
+    ``prefix_order``
+        A dictionary mapping membership modes to their rank, with 0
+        for the most powerful.
+
+    ``chanmodes``
+        A tuple of four ``frozenset`` instances containing the type A,
+        B, C, and D channel modes.
+
+    ``modetypes``
+        A dictionary mapping each channel mode to its type: one of
+        "A", "B", "C", or "D", or "P" for membership modes.
+
+    ``targmax``
+        A dictionary mapping upper-case commands to the maximum
+        number of targets they accept, or ``None`` for no limit.
+
+    ``serial``
+        A counter incremented each time the parameters are updated,
+        so that values derived from them may be cached.
+
+    In addition, the integer-valued parameters NICKLEN, CHANNELLEN,
+    TOPICLEN, KICKLEN, AWAYLEN, MODES, MAXTARGETS, LINELEN, and
+    MONITOR are exposed as lower-case attributes.  The raw values of
+    all parameters are available via indexing.
+    """
+
+    def __init__(self):
+        """
+        Initialize an ``ISupport`` instance.  All parameters take
+        their RFC 1459 defaults.
+        """
+
+        self._tokens = {}
+
+        # Incremented on every update, so that consumers may cache
+        # values derived from the parameters
+        self.serial = 0
+        self._token_list = ()
+
+        for attr, default in _int_tokens.values():
+            setattr(self, attr, default)
+        self.targmax = {}
+
+        self._set_casemapping(_default_casemapping)
+        self._set_chantypes(_default_chantypes)
+        self._set_prefix(_default_prefix)
+        self._set_chanmodes(_default_chanmodes)
+        self._set_modetypes()
+
+    def __contains__(self, name):
+        """
+        Determine if a parameter has been advertised.
+
+        :param name: The name of the parameter, in ``bytes``.
+
+        :returns: A ``True`` value if the parameter has been
+                  advertised, ``False`` otherwise.
+        """
+
+        return name in self._tokens
+
+    def __getitem__(self, name):
+        """
+        Retrieve the raw value of a parameter.
+
+        :param name: The name of the parameter, in ``bytes``.
+
+        :returns: The unescaped value of the parameter, in ``bytes``.
+                  Parameters advertised without a value have the
+                  value b"".
+        """
+
+        return self._tokens[name]
+
+    def tokens(self):
+        """
+        Retrieve the advertised parameters as tokens.  Feeding the
+        tokens to a new ``ISupport`` reproduces this one.
+
+        :returns: A tuple of tokens, in ``bytes``, e.g. b"NICKLEN=30".
+        """
+
+        if self._token_list is None:
+            self._token_list = tuple(
+                name + b'=' + _escape(value) if value else name
+                for name, value in self._tokens.items())
+        return self._token_list
+
+    def update(self, msg):
+        """
+        Update the parameters from an RPL_ISUPPORT (005) message.  The
+        first argument (the client's nickname) and the last argument
+        (the human-readable trailer) are ignored.
+
+        :param msg: The ``pirch.proto.irc.messages.Message``.
+        """
+
+        self.feed(arg for arg in msg.args[1:-1] if arg is not util.unset)
+
+    def feed(self, tokens):
+        """
+        Update the parameters from a sequence of tokens.
+
+        :param tokens: An iterable of raw tokens, in ``bytes``, e.g.
+                       b"NICKLEN=30" or b"-EXCEPTS".
+        """
+
+        for token in tokens:
+            if token[:1] == b'-':
+                # Parameter negated; restore its default
+                name = token[1:]
+                self._tokens.pop(name, None)
+                value = None
+            else:
+                name, _sep, value = token.partition(b'=')
+                value = _unescape(value)
+                self._tokens[name] = value
+
+            self._apply(name, value)
+            self.serial += 1
+            self._token_list = None
+
+    def _apply(self, name, value):
+        """
+        Recompute the structure for a parameter.
+
+        :param name: The name of the parameter.
+        :param value: The new value, or ``None`` to restore the
+                      default.
+        """
+
+        if name in _int_tokens:
+            attr, default = _int_tokens[name]
+            if value is None or (not value and name in _limited_tokens):
+                setattr(self, attr, default)
+            else:
+                try:
+                    setattr(self, attr, int(value) if value else None)
+                except ValueError:
+                    pass
+        elif name == b'CASEMAPPING':
+            self._set_casemapping(value or _default_casemapping)
+        elif name == b'CHANTYPES':
+            self._set_chantypes(_default_chantypes if value is None
+                                else value)
+        elif name == b'PREFIX':
+            self._set_prefix(_default_prefix if value is None else value)
+            self._set_modetypes()
+        elif name == b'CHANMODES':
+            self._set_chanmodes(value or _default_chanmodes)
+            self._set_modetypes()
+        elif name == b'TARGMAX':
+            self._set_targmax(value or b'')
+
+    def _set_casemapping(self, value):
+        """
+        Select the casemapping.  Unrecognized casemappings leave the
+        current casemapping in effect.
+
+        :param value: The name of the casemapping.
+        """
+
+        mapper = casemap.bytes_mappers.get(value.decode('ascii', 'replace'))
+        if mapper is not None:
+            self.casemapping = value
+            self.casemap = mapper
+
+    def _set_chantypes(self, value):
+        """
+        Build the channel prefix lookup table.
+
+        :param value: The channel prefix characters.
+        """
+
+        self.chantypes = frozenset(value[i:i + 1] for i in range(len(value)))
+
+    def _set_prefix(self, value):
+        """
+        Build the membership mode tables.
+
+        :param value: The PREFIX value, e.g. b"(ov)@+".
+        """
+
+        modes, _sep, symbols = value[1:].partition(b')')
+        modes = [modes[i:i + 1] for i in range(len(modes))]
+        symbols = [symbols[i:i + 1] for i in range(len(symbols))]
+
+        self.prefix = dict(zip(modes, symbols))
+        self.symbols = dict(zip(symbols, modes))
+        self.prefix_order = {mode: i for i, mode in enumerate(modes)}
+
+    def _set_chanmodes(self, value):
+        """
+        Build the channel mode category tables.
+
+        :param value: The CHANMODES value, e.g. b"b,k,l,imnpst".
+        """
+
+        groups = (value.split(b',') + [b''] * 4)[:4]
+        self.chanmodes = tuple(
+            frozenset(group[i:i + 1] for i in range(len(group)))
+            for group in groups)
+
+    def _set_modetypes(self):
+        """
+        Build the table mapping each channel mode to its type.
+        """
+
+        modetypes = {}
+        for modetype, group in zip('ABCD', self.chanmodes):
+            modetypes.update((mode, modetype) for mode in group)
+        modetypes.update((mode, 'P') for mode in self.prefix)
+
+        self.modetypes = modetypes
+
+    def _set_targmax(self, value):
+        """
+        Build the target limit table.
+
+        :param value: The TARGMAX value, e.g. b"PRIVMSG:4,JOIN:".
+        """
+
+        targmax = {}
+        for item in value.split(b','):
+            cmd, _sep, limit = item.partition(b':')
+            if not cmd:
+                continue
+            try:
+                targmax[cmd.upper()] = int(limit) if limit else None
+            except ValueError:
+                continue
+
+        self.targmax = targmax
+
+    def is_channel(self, name):
+        """
+        Determine if a name is a channel name.
+
+        :param name: The name, in ``bytes``.
+
+        :returns: A ``True`` value if the name begins with a channel
+                  prefix, ``False`` otherwise.
+        """
+
+        return name[:1] in self.chantypes
+
+    def max_targets(self, cmd):
+        """
+        Determine the maximum number of targets a command accepts.
+
+        :param cmd: The ``bytes`` for the command.
+
+        :returns: The maximum number of targets, or ``None`` for no
+                  limit.
+        """
+
+        return self.targmax.get(cmd.upper(), self.maxtargets)
@@ -0,0 +1,208 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+from pirch.proto.irc import commands
+from pirch.proto.irc import messages
+from pirch.proto.irc import splitter
+
+
+def _pack(cmd, channels, keys, reserved, max_targets, linelen):
+    """
+    Pack channels into as few comma-separated lists as possible.
+
+    :param cmd: The ``bytes`` for the command.
+    :param channels: A list of the channel names, in ``bytes``.
+    :param keys: A dictionary mapping channel names to their keys,
+                 in ``bytes``.
+    :param reserved: The number of bytes in each line needed for
+                     anything following the channels other than keys.
+    :param max_targets: The maximum number of channels per line, or
+                        ``None`` for no limit.
+    :param linelen: The maximum length of a protocol line, including
+                    the CR LF.
+
+    :returns: A list of argument lists: the comma-separated channels,
+              followed by the comma-separated keys if any are needed.
+    """
+
+    budget = linelen - len(cmd) - len(b' \r\n') - reserved
+
+    # Keyed channels go first, so that the keys line up with them
+    ordered = ([name for name in channels if keys.get(name)] +
+               [name for name in channels if not keys.get(name)])
+
+    result = []
+    names = []
+    chan_keys = []
+    size = 0
+    for name in ordered:
+        key = keys.get(name)
+
+        # The channel, and its key with the key's separator; the
+        # channel's own separating comma is added if needed
+        cost = len(name) + (len(key) + 1 if key else 0)
+        if names:
+            if (size + cost + 1 > budget or
+                    (max_targets and len(names) >= max_targets)):
+                result.append(_args(names, chan_keys))
+                names = []
+                chan_keys = []
+                size = 0
+            else:
+                cost += 1
+
+        names.append(name)
+        if key:
+            chan_keys.append(key)
+        size += cost
+
+    if names:
+        result.append(_args(names, chan_keys))
+
+    return result
+
+
+def _args(names, keys):
+    """
+    Construct the arguments for a packed line.
+
+    :param names: A list of the channel names.
+    :param keys: A list of the keys for the leading channels.
+
+    :returns: A list of the arguments, in ``bytes``.
+    """
+
+    args = [b','.join(names)]
+    if keys:
+        args.append(b','.join(keys))
+    return args
+
+
+def join_lines(channels, keys=None, max_targets=None,
+               linelen=splitter.LINELEN):
+    """
+    Pack channels into as few JOIN lines as possible.  Channels with
+    keys are joined first, so that each line's key list lines up with
+    its leading channels.
+
+    :param channels: An iterable of the channel names, in ``bytes``.
+    :param keys: A dictionary mapping channel names to their keys,
+                 in ``bytes``.
+    :param max_targets: The maximum number of channels per line, as
+                        advertised by TARGMAX, or ``None`` for no
+                        limit.
+    :param linelen: The maximum length of a protocol line, including
+                    the CR LF.
+
+    :returns: A list of raw protocol lines, without line endings.
+    """
+
+    return [b'JOIN ' + b' '.join(args) for args in
+            _pack(b'JOIN', list(channels), keys or {}, 0, max_targets,
+                  linelen)]
+
+
+def part_lines(channels, reason=None, max_targets=None,
+               linelen=splitter.LINELEN):
+    """
+    Pack channels into as few PART lines as possible.
+
+    :param channels: An iterable of the channel names, in ``bytes``.
+    :param reason: The parting message, in ``bytes``, if any.
+    :param max_targets: The maximum number of channels per line, as
+                        advertised by TARGMAX, or ``None`` for no
+                        limit.
+    :param linelen: The maximum length of a protocol line, including
+                    the CR LF.
+
+    :returns: A list of raw protocol lines, without line endings.
+    """
+
+    tail = b' :' + reason if reason else b''
+    return [b'PART ' + args[0] + tail for args in
+            _pack(b'PART', list(channels), {}, len(tail), max_targets,
+                  linelen)]
+
+
+def _messages(ctxt, conn, cmd, channels, keys, trailer):
+    """
+    Pack channels into ``Message`` objects, using the limits
+    advertised by the server.
+
+    :param ctxt: The current context.
+    :param conn: The connection the messages will be sent to.
+    :param cmd: The ``bytes`` for the command.
+    :param channels: An iterable of the channel names, in ``bytes``.
+    :param keys: A dictionary mapping channel names to their keys.
+    :param trailer: The trailing argument, in ``bytes``, or ``None``.
+
+    :returns: A list of ``pirch.proto.irc.messages.Message`` objects.
+    """
+
+    isup = getattr(conn, 'isupport', None)
+    max_targets = isup.max_targets(cmd) if isup is not None else None
+    linelen = isup.linelen if isup is not None else splitter.LINELEN
+    tail = b' :' + trailer if trailer else b''
+
+    command = commands.get_command(cmd)
+    result = []
+    for args in _pack(cmd, list(channels), keys, len(tail), max_targets,
+                      linelen):
+        raw = cmd + b' ' + b' '.join(args) + tail
+        if trailer:
+            args.append(trailer)
+        msg = messages.Message(ctxt, conn, conn.me, command,
+                               messages.Arguments(ctxt, conn, args, command))
+        msg._msg = raw
+        result.append(msg)
+
+    return result
+
+
+def join_messages(ctxt, conn, channels, keys=None):
+    """
+    Pack channels into as few JOIN messages as possible, within the
+    line length and TARGMAX limits advertised by the server.  The
+    cached ``bytes`` form of each message is primed, so they are not
+    serialized again.
+
+    :param ctxt: The current context.
+    :param conn: The connection the messages will be sent to.
+    :param channels: An iterable of the channel names, in ``bytes``.
+    :param keys: A dictionary mapping channel names to their keys,
+                 in ``bytes``.
+
+    :returns: A list of ``pirch.proto.irc.messages.Message`` objects.
+    """
+
+    return _messages(ctxt, conn, b'JOIN', channels, keys or {}, None)
+
+
+def part_messages(ctxt, conn, channels, reason=None):
+    """
+    Pack channels into as few PART messages as possible, within the
+    line length and TARGMAX limits advertised by the server.  The
+    cached ``bytes`` form of each message is primed.
+
+    :param ctxt: The current context.
+    :param conn: The connection the messages will be sent to.
+    :param channels: An iterable of the channel names, in ``bytes``.
+    :param reason: The parting message, in ``bytes``, if any.
+
+    :returns: A list of ``pirch.proto.irc.messages.Message`` objects.
+    """
+
+    return _messages(ctxt, conn, b'PART', channels, {}, reason)
@@ -14,11 +14,13 @@
 # along with this program.  If not, see
 # <http://www.gnu.org/licenses/>.
 
-import collections
-
-import six
+try:
+    from collections.abc import Sequence
+except ImportError:  # pragma: no cover
+    from collections import Sequence
 
 from pirch.proto.irc import commands
+from pirch.proto.irc import decoding
 from pirch import util
 
 
@@ -42,9 +44,9 @@ def _argsplit(msg):
     for i in range(len(msg)):
         # Are we skipping spaces?
         if prev is None:
-            if msg[i] == b' ':
+            if msg[i:i + 1] == b' ':
                 continue
-            elif msg[i] == b':':
+            elif msg[i:i + 1] == b':':
                 # Hit the last argument; yield it and get out of here
                 yield msg[i + 1:]
                 break
@@ -53,7 +55,7 @@ def _argsplit(msg):
                 prev = i
         else:
             # Have we hit a space?
-            if msg[i] == b' ':
+            if msg[i:i + 1] == b' ':
                 yield msg[prev:i]
                 prev = None
     else:
@@ -62,7 +64,7 @@ def _argsplit(msg):
             yield msg[prev:]
 
 
-class Arguments(collections.Sequence):
+class Arguments(Sequence):
     """
     Represent the command arguments from an IRC protocol message.  Raw
     values may be accessed via indexing, as for a sequence, but
@@ -96,7 +98,7 @@ class Arguments(collections.Sequence):
 
         # Work through the dictionary values
         for arg, val in value.items():
-            if isinstance(arg, six.integer_types):
+            if isinstance(arg, util.integer_types):
                 # Direct mapping
                 if arg >= 0:
                     head[arg] = val
@@ -117,7 +119,12 @@ class Arguments(collections.Sequence):
             val = desc.to_bytes(ctxt, conn, val)
 
             # Save it
-            if desc.idx >= 0:
+            if isinstance(desc.idx, slice):
+                # Variadic argument; splice in the values
+                for idx, item in enumerate(val, desc.idx.start or 0):
+                    head[idx] = item
+                    highest_idx = max(highest_idx, idx)
+            elif desc.idx >= 0:
                 head[desc.idx] = val
                 if desc.idx > highest_idx:  # pragma: no branch
                     highest_idx = desc.idx
@@ -134,7 +141,11 @@ class Arguments(collections.Sequence):
 
             # Save the default
             val = desc.to_bytes(ctxt, conn, desc.default)
-            if desc.idx >= 0:
+            if isinstance(desc.idx, slice):
+                for idx, item in enumerate(val, desc.idx.start or 0):
+                    head[idx] = item
+                    highest_idx = max(highest_idx, idx)
+            elif desc.idx >= 0:
                 head[desc.idx] = val
                 if desc.idx > highest_idx:  # pragma: no branch
                     highest_idx = desc.idx
@@ -161,7 +172,7 @@ class Arguments(collections.Sequence):
 
         # Now we prime the attribute cache
         args._attr_cache = {k: v for k, v in value.items()
-                            if not isinstance(k, six.integer_types)}
+                            if not isinstance(k, util.integer_types)}
 
         return args
 
@@ -186,6 +197,7 @@ class Arguments(collections.Sequence):
         # Initialize the caches
         self._attr_cache = {}
         self._seq_len = None
+        self._decoded = None
 
     def __len__(self):
         """
@@ -218,7 +230,7 @@ class Arguments(collections.Sequence):
         """
 
         # Properly interpret integer indices
-        if isinstance(idx, six.integer_types):
+        if isinstance(idx, util.integer_types):
             if idx < -len(self) or idx >= len(self):
                 raise IndexError('list index out of range')
             elif idx < 0:
@@ -235,6 +247,27 @@ class Arguments(collections.Sequence):
         raise TypeError('list indices must be integers, not %s' %
                         idx.__class__.__name__)
 
+    @property
+    def decoded(self):
+        """
+        A sequence view of the arguments decoded to text.  The
+        decoder is the ``decoder`` attribute of the connection, if it
+        has one, and the first argument is taken to be the target for
+        selecting the fallback encoding.  Each argument is decoded at
+        most once, and the view is shared by all users of the
+        message.
+        """
+
+        if self._decoded is None:
+            decoder = (getattr(self._conn, 'decoder', None) or
+                       decoding.default_decoder)
+            target = self._value[0] if self._value else None
+            if target is util.unset:
+                target = None
+            self._decoded = decoding.DecodedArguments(self, decoder, target)
+
+        return self._decoded
+
     def __getattr__(self, attr):
         """
         Retrieve an argument by name.
@@ -260,8 +293,12 @@ class Arguments(collections.Sequence):
                 # Identical to "unset"
                 value = util.unset
             else:
-                # We have it, so convert from bytes
-                value = desc.from_bytes(self._ctxt, self._conn, value)
+                if isinstance(desc.idx, slice) and not value:
+                    # An empty variadic argument is also "unset"
+                    value = util.unset
+                else:
+                    # We have it, so convert from bytes
+                    value = desc.from_bytes(self._ctxt, self._conn, value)
 
             # If the value is unset, use the argument default
             if value is util.unset:
@@ -273,6 +310,34 @@ class Arguments(collections.Sequence):
         return self._attr_cache[attr]
 
 
+class RawEntity(object):
+    """
+    A minimal entity, which is known only by its ``bytes`` form.
+    Used by connections, such as those replaying or reparsing
+    captured traffic, which do not track the entities they see.
+    """
+
+    __slots__ = ('_raw',)
+
+    def __init__(self, raw):
+        """
+        Initialize a ``RawEntity`` instance.
+
+        :param raw: The ``bytes`` form of the entity.
+        """
+
+        self._raw = raw
+
+    def to_bytes(self):
+        """
+        Retrieve the ``bytes`` form of the entity.
+
+        :returns: The ``bytes`` form of the entity.
+        """
+
+        return self._raw
+
+
 class Message(object):
     """
     Represent a single IRC protocol message.  Object attributes
@@ -326,7 +391,7 @@ class Message(object):
             return None
 
         # Determine the message origin
-        if parts[idx][0] == b':':
+        if parts[idx][:1] == b':':
             origin = conn.get_entity(parts[idx][1:])
             idx += 1
         else:
@@ -426,7 +491,7 @@ class Message(object):
                     continue
 
                 # Do we need the sentinel?
-                if arg[0] == b':' or b' ' in arg:
+                if arg[:1] == b':' or b' ' in arg:
                     if sentinel:
                         raise ValueError('multiple trailing arguments')
                     parts.append(b':' + arg)
@@ -0,0 +1,356 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import collections
+import string
+
+
+# A single mode change.  The mode is a one-byte ``bytes``; the
+# parameter is ``None`` if the mode takes none.
+ModeChange = collections.namedtuple('ModeChange', ['adding', 'mode', 'param'])
+
+# The bit representing each mode letter in a flags bitset
+_mode_bits = {c.encode('ascii'): 1 << i
+              for i, c in enumerate(string.ascii_letters)}
+
+
+def parse_modes(isupport, modestr, params):
+    """
+    Parse a mode string and its parameters in a single pass.  Whether
+    each mode consumes a parameter is determined by the CHANMODES and
+    PREFIX categories; unrecognized modes are assumed to take none.
+
+    :param isupport: The ``pirch.proto.irc.isupport.ISupport`` for
+                     the connection.
+    :param modestr: The mode string, e.g. b"+ovb-l".
+    :param params: A sequence of the parameters following the mode
+                   string.
+
+    :returns: A list of ``ModeChange`` instances.
+    """
+
+    modetypes = isupport.modetypes
+    params = iter(params)
+    adding = True
+    changes = []
+
+    for i in range(len(modestr)):
+        mode = modestr[i:i + 1]
+        if mode == b'+':
+            adding = True
+            continue
+        elif mode == b'-':
+            adding = False
+            continue
+
+        # Type A, B, and membership modes always take a parameter;
+        # type C modes take one only when set
+        modetype = modetypes.get(mode, 'D')
+        if modetype in 'ABP' or (modetype == 'C' and adding):
+            param = next(params, None)
+        else:
+            param = None
+
+        changes.append(ModeChange(adding, mode, param))
+
+    return changes
+
+
+def format_modes(changes):
+    """
+    Format a list of mode changes.
+
+    :param changes: A sequence of ``ModeChange`` instances.
+
+    :returns: A list of ``bytes``: the mode string, followed by the
+              parameters.
+    """
+
+    modestr = []
+    params = []
+    adding = None
+
+    for change in changes:
+        if change.adding is not adding:
+            adding = change.adding
+            modestr.append(b'+' if adding else b'-')
+        modestr.append(change.mode)
+        if change.param is not None:
+            params.append(change.param)
+
+    return [b''.join(modestr)] + params
+
+
+def parse_names(isupport, names):
+    """
+    Parse the names list from an RPL_NAMREPLY (353) message.  Multiple
+    membership prefixes on a name are supported.
+
+    :param isupport: The ``pirch.proto.irc.isupport.ISupport`` for
+                     the connection.
+    :param names: The space-separated names list, in ``bytes``.
+
+    :returns: A list of tuples of nickname and membership prefix
+              bitset.
+    """
+
+    symbols = isupport.symbols
+    order = isupport.prefix_order
+    result = []
+
+    for name in names.split():
+        bits = 0
+        start = 0
+        while name[start:start + 1] in symbols:
+            bits |= 1 << order[symbols[name[start:start + 1]]]
+            start += 1
+        result.append((name[start:] if start else name, bits))
+
+    return result
+
+
+class ChannelModes(object):
+    """
+    A compact representation of the modes of a channel.  Simple modes
+    are kept in an integer bitset, with one bit per mode letter;
+    parameterized modes (types B and C) and list modes (type A) are
+    kept in small dictionaries, allocated only when needed.  Members
+    are kept in a dictionary mapping casemapped nicknames to an
+    integer bitset of their membership modes, with bit 0 for the most
+    powerful.
+    """
+
+    __slots__ = ('flags', 'params', 'lists', 'members')
+
+    def __init__(self):
+        """
+        Initialize a ``ChannelModes`` instance.
+        """
+
+        self.flags = 0
+        self.params = None
+        self.lists = None
+        self.members = {}
+
+    def __contains__(self, mode):
+        """
+        Determine if a channel mode is set.
+
+        :param mode: The mode, a one-byte ``bytes``.
+
+        :returns: A ``True`` value if the mode is set, ``False``
+                  otherwise.
+        """
+
+        return bool(self.flags & _mode_bits.get(mode, 0))
+
+    def param(self, mode):
+        """
+        Retrieve the parameter of a set channel mode.
+
+        :param mode: The mode, a one-byte ``bytes``.
+
+        :returns: The parameter, or ``None``.
+        """
+
+        return self.params.get(mode) if self.params else None
+
+    def entries(self, mode):
+        """
+        Retrieve the entries of a list mode.
+
+        :param mode: The mode, a one-byte ``bytes``, e.g. b"b".
+
+        :returns: A ``frozenset`` of the entries.
+        """
+
+        if not self.lists or mode not in self.lists:
+            return frozenset()
+        return frozenset(self.lists[mode])
+
+    def apply(self, isupport, changes):
+        """
+        Apply mode changes to the channel.
+
+        :param isupport: The ``pirch.proto.irc.isupport.ISupport`` for
+                         the connection.
+        :param changes: A sequence of ``ModeChange`` instances.
+        """
+
+        modetypes = isupport.modetypes
+
+        for adding, mode, param in changes:
+            modetype = modetypes.get(mode, 'D')
+
+            if modetype == 'P':
+                key = isupport.casemap(param) if param else None
+                if key not in self.members:
+                    continue
+                bit = 1 << isupport.prefix_order[mode]
+                if adding:
+                    self.members[key] |= bit
+                else:
+                    self.members[key] &= ~bit
+
+            elif modetype == 'A':
+                # A list mode without a parameter is a list query
+                if param is None:
+                    continue
+                if adding:
+                    if self.lists is None:
+                        self.lists = {}
+                    self.lists.setdefault(mode, set()).add(param)
+                elif self.lists and mode in self.lists:
+                    self.lists[mode].discard(param)
+                    if not self.lists[mode]:
+                        del self.lists[mode]
+
+            else:
+                bit = _mode_bits.get(mode, 0)
+                if adding:
+                    self.flags |= bit
+                    if param is not None:
+                        if self.params is None:
+                            self.params = {}
+                        self.params[mode] = param
+                else:
+                    self.flags &= ~bit
+                    if self.params and mode in self.params:
+                        del self.params[mode]
+
+    def modestring(self):
+        """
+        Generate the mode string for the channel's simple and
+        parameterized modes, as for RPL_CHANNELMODEIS.
+
+        :returns: A list of ``bytes``: the mode string, followed by
+                  the parameters.
+        """
+
+        changes = [ModeChange(True, mode, self.param(mode))
+                   for mode in sorted(_mode_bits) if mode in self]
+        return format_modes(changes) if changes else [b'+']
+
+    def copy(self):
+        """
+        Copy the channel modes.
+
+        :returns: A new ``ChannelModes`` instance.
+        """
+
+        new = self.__class__()
+        new.flags = self.flags
+        new.params = dict(self.params) if self.params else None
+        new.lists = ({mode: set(entries)
+                      for mode, entries in self.lists.items()}
+                     if self.lists else None)
+        new.members = dict(self.members)
+        return new
+
+    def diff(self, other):
+        """
+        Compute the changes to the channel's simple and parameterized
+        modes which would make them match another's.  List modes and
+        members are not considered.
+
+        :param other: The other ``ChannelModes`` instance.
+
+        :returns: A list of ``ModeChange`` instances, suitable for
+                  passing to ``apply()``.
+        """
+
+        changes = []
+        for mode in sorted(_mode_bits):
+            if mode in other:
+                param = other.param(mode)
+                if mode not in self or self.param(mode) != param:
+                    changes.append(ModeChange(True, mode, param))
+            elif mode in self:
+                changes.append(ModeChange(False, mode, None))
+        return changes
+
+    def join(self, isupport, nick, bits=0):
+        """
+        Add a member to the channel.
+
+        :param isupport: The ``pirch.proto.irc.isupport.ISupport`` for
+                         the connection.
+        :param nick: The nickname of the member.
+        :param bits: The membership prefix bitset.
+        """
+
+        self.members[isupport.casemap(nick)] = bits
+
+    def part(self, isupport, nick):
+        """
+        Remove a member from the channel.
+
+        :param isupport: The ``pirch.proto.irc.isupport.ISupport`` for
+                         the connection.
+        :param nick: The nickname of the member.
+        """
+
+        self.members.pop(isupport.casemap(nick), None)
+
+    def rename(self, isupport, old, new):
+        """
+        Handle a change of nickname by a member.
+
+        :param isupport: The ``pirch.proto.irc.isupport.ISupport`` for
+                         the connection.
+        :param old: The old nickname.
+        :param new: The new nickname.
+        """
+
+        bits = self.members.pop(isupport.casemap(old), None)
+        if bits is not None:
+            self.members[isupport.casemap(new)] = bits
+
+    def names(self, isupport, names):
+        """
+        Add the members listed in an RPL_NAMREPLY (353) message.
+
+        :param isupport: The ``pirch.proto.irc.isupport.ISupport`` for
+                         the connection.
+        :param names: The space-separated names list, in ``bytes``.
+        """
+
+        casemap = isupport.casemap
+        self.members.update((casemap(nick), bits)
+                            for nick, bits in parse_names(isupport, names))
+
+    def prefix(self, isupport, nick):
+        """
+        Determine the membership prefix symbol of a member.
+
+        :param isupport: The ``pirch.proto.irc.isupport.ISupport`` for
+                         the connection.
+        :param nick: The nickname of the member.
+
+        :returns: The symbol of the member's most powerful membership
+                  mode, or b"" if the member has none.
+        """
+
+        bits = self.members.get(isupport.casemap(nick), 0)
+        if not bits:
+            return b''
+
+        # Isolate the lowest set bit, which is the most powerful mode
+        rank = (bits & -bits).bit_length() - 1
+        for mode, order in isupport.prefix_order.items():
+            if order == rank:
+                return isupport.prefix[mode]
+        return b''
@@ -0,0 +1,299 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import collections
+import re
+
+from pirch.proto.irc import isupport
+
+
+# A QUIT reason naming the two servers on either side of a netsplit,
+# e.g. b"hub.example.net leaf.example.net", or b"*.net *.split" on
+# networks which hide their server names
+_split_re = re.compile(br'^([A-Za-z0-9*-]+(?:\.[A-Za-z0-9*-]+)+) '
+                       br'([A-Za-z0-9*-]+(?:\.[A-Za-z0-9*-]+)+)$')
+
+
+# The aggregated events.  ``servers`` is the pair of server names from
+# the QUIT reason; ``nicks`` is the set of nicknames which quit;
+# ``channels`` maps each channel name to the set of nicknames which
+# rejoined it.
+Netsplit = collections.namedtuple('Netsplit', ['servers', 'nicks'])
+Netjoin = collections.namedtuple('Netjoin', ['servers', 'channels'])
+
+
+def split_servers(reason):
+    """
+    Determine if a QUIT reason is that of a netsplit.
+
+    :param reason: The QUIT reason, in ``bytes``.
+
+    :returns: A tuple of the two server names, in ``bytes``, or
+              ``None`` if the reason is not that of a netsplit.
+    """
+
+    match = _split_re.match(reason)
+    if not match or match.group(1) == match.group(2):
+        return None
+    return match.groups()
+
+
+def _parse(frame):
+    """
+    Split a raw line into the parts needed to recognize a netsplit or
+    netjoin, without the cost of constructing a ``Message``.
+
+    :param frame: The raw IRC protocol message, in ``bytes``.
+
+    :returns: A tuple of the nickname, the command, and the
+              unsplit parameters, all in ``bytes``, or ``None`` if the
+              line has no prefix.
+    """
+
+    if frame[:1] == b'@':
+        frame = frame.partition(b' ')[2].lstrip(b' ')
+    if frame[:1] != b':':
+        return None
+
+    prefix, _sep, rest = frame[1:].partition(b' ')
+    cmd, _sep, params = rest.lstrip(b' ').partition(b' ')
+    return prefix.split(b'!', 1)[0], cmd.upper(), params
+
+
+class BurstCollapser(object):
+    """
+    Collapse the bursts of QUIT and JOIN messages caused by a netsplit
+    and the subsequent netjoin into single aggregated events.  A QUIT
+    whose reason names two servers is absorbed, and its nickname added
+    to the ``Netsplit`` for that pair of servers; once no such QUIT
+    has arrived for the window, the event is delivered.  A JOIN from
+    a nickname which recently quit in a netsplit is likewise absorbed
+    into a ``Netjoin``; once that has been delivered, the nickname's
+    later JOINs are passed through.
+
+    A ``BurstCollapser`` may be added directly as a filter on a
+    ``pirch.proto.irc.dispatch.Dispatcher``, but it is cheaper to
+    pass it as the ``prefilter`` of a
+    ``pirch.proto.irc.scheduler.ReadScheduler`` registration, so that
+    absorbed lines are never parsed.
+    """
+
+    def __init__(self, loop, callback, isup=None, window=1.0,
+                 rejoin_window=600.0):
+        """
+        Initialize a ``BurstCollapser`` instance.
+
+        :param loop: The event loop.
+        :param callback: A callable taking each ``Netsplit`` or
+                         ``Netjoin`` event.
+        :param isup: The ``pirch.proto.irc.isupport.ISupport`` for the
+                     connection, whose casemapping is used to compare
+                     nicknames.  Defaults to the RFC 1459 parameters.
+        :param window: The time, in seconds, without a further line
+                       after which a burst is considered complete.
+        :param rejoin_window: The time, in seconds, after a netsplit
+                              during which JOINs from the nicknames
+                              which quit are considered part of a
+                              netjoin.
+        """
+
+        self.loop = loop
+        self.callback = callback
+        self.isupport = isupport.ISupport() if isup is None else isup
+        self.window = window
+        self.rejoin_window = rejoin_window
+
+        self.absorbed = 0
+
+        # Maps server pairs to a list of the time of the last line and
+        # the set of nicknames which quit
+        self._splits = {}
+
+        # Maps server pairs to a list of the time of the last line and
+        # a dictionary mapping channel names to sets of nicknames
+        self._joins = {}
+
+        # Maps casemapped nicknames which quit in a netsplit to a
+        # tuple of the server pair and the time of the split
+        self._split_nicks = {}
+
+        self._handle = None
+
+    def __call__(self, msg):
+        """
+        Absorb a message which is part of a burst, for use as a
+        dispatcher filter.
+
+        :param msg: The ``pirch.proto.irc.messages.Message``.
+
+        :returns: A ``True`` value if the message was absorbed.
+        """
+
+        return self.feed(msg.msg)
+
+    def feed(self, frame):
+        """
+        Absorb a raw line which is part of a burst.
+
+        :param frame: The raw IRC protocol message, in ``bytes``.
+
+        :returns: A ``True`` value if the line was absorbed, in which
+                  case it should not be dispatched.
+        """
+
+        parts = _parse(frame)
+        if parts is None:
+            return False
+        nick, cmd, params = parts
+
+        if cmd == b'QUIT':
+            servers = split_servers(params[1:] if params[:1] == b':'
+                                    else params)
+            if servers is None:
+                return False
+
+            now = self.loop.time()
+            burst = self._splits.setdefault(servers, [now, set()])
+            burst[0] = now
+            burst[1].add(nick)
+            self._split_nicks[self.isupport.casemap(nick)] = (servers, now)
+        elif cmd == b'JOIN':
+            split = self._split_nicks.get(self.isupport.casemap(nick))
+            if split is None:
+                return False
+
+            now = self.loop.time()
+            if now - split[1] > self.rejoin_window:
+                del self._split_nicks[self.isupport.casemap(nick)]
+                return False
+
+            if params[:1] == b':':
+                params = params[1:]
+            burst = self._joins.setdefault(split[0], [now, {}])
+            burst[0] = now
+            for name in params.split(b' ', 1)[0].split(b','):
+                burst[1].setdefault(name, set()).add(nick)
+        else:
+            return False
+
+        self.absorbed += 1
+        if self._handle is None:
+            self._handle = self.loop.call_later(self.window, self._expire)
+        return True
+
+    def flush(self):
+        """
+        Deliver all pending events immediately.
+        """
+
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self._deliver(None)
+
+    def _deliver(self, before):
+        """
+        Deliver the pending events whose bursts are complete.
+
+        :param before: Deliver the bursts whose last line arrived
+                       before this time, or ``None`` for all.
+
+        :returns: The time of the last line of the oldest burst still
+                  pending, or ``None``.
+        """
+
+        pending = []
+        for bursts, event in ((self._splits, Netsplit),
+                              (self._joins, Netjoin)):
+            for servers in sorted(bursts):
+                last, value = bursts[servers]
+                if before is None or last <= before:
+                    del bursts[servers]
+                    if event is Netjoin:
+                        self._rejoined(value)
+                    self.callback(event(servers, value))
+                else:
+                    pending.append(last)
+
+        return min(pending) if pending else None
+
+    def _rejoined(self, channels):
+        """
+        Forget the nicknames which have rejoined after a netsplit, so
+        that their later JOINs are not absorbed.
+
+        :param channels: The dictionary mapping channel names to sets
+                         of the nicknames which rejoined them.
+        """
+
+        for nicks in channels.values():
+            for nick in nicks:
+                self._split_nicks.pop(self.isupport.casemap(nick), None)
+
+    def _expire(self):
+        """
+        Deliver the events for bursts which are complete, and forget
+        old netsplits.
+        """
+
+        self._handle = None
+        now = self.loop.time()
+
+        oldest = self._deliver(now - self.window)
+        if oldest is not None:
+            self._handle = self.loop.call_later(
+                oldest + self.window - now, self._expire)
+
+        for nick, (_servers, when) in list(self._split_nicks.items()):
+            if now - when > self.rejoin_window:
+                del self._split_nicks[nick]
+
+
+def apply(event, channels, isup=None):
+    """
+    Apply an aggregated event to channel state in bulk.
+
+    :param event: The ``Netsplit`` or ``Netjoin``.
+    :param channels: A dictionary mapping channel names to
+                     ``pirch.proto.irc.modes.ChannelModes`` objects.
+                     Members are added to or removed from these.
+    :param isup: The ``pirch.proto.irc.isupport.ISupport`` for the
+                 connection, whose casemapping is used to compare
+                 nicknames and channel names.  Defaults to the RFC
+                 1459 parameters.
+    """
+
+    mapper = (isupport.ISupport() if isup is None else isup).casemap
+
+    if isinstance(event, Netsplit):
+        gone = set(mapper(nick) for nick in event.nicks)
+        for chan in channels.values():
+            members = chan.members
+            if len(members) < len(gone):
+                for nick in [nick for nick in members if nick in gone]:
+                    del members[nick]
+            else:
+                for nick in gone:
+                    members.pop(nick, None)
+        return
+
+    index = {mapper(name): chan for name, chan in channels.items()}
+    for name, nicks in event.channels.items():
+        chan = index.get(mapper(name))
+        if chan is None:
+            continue
+        for nick in nicks:
+            chan.members.setdefault(mapper(nick), 0)
@@ -0,0 +1,362 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import collections
+import weakref
+
+from pirch.proto.irc import isupport
+from pirch.proto.irc import messages
+
+
+class WorkerConnection(object):
+    """
+    The stand-in connection, rebuilt in a worker from the metadata
+    of the real one, against which offloaded messages are parsed.
+    Attributes ``me``, ``peer``, and ``isupport`` are provided.
+    """
+
+    def __init__(self, meta):
+        """
+        Initialize a ``WorkerConnection`` instance.
+
+        :param meta: The connection metadata, as returned by
+                     ``metadata()``.
+        """
+
+        self.me = messages.RawEntity(meta['me'])
+        self.peer = messages.RawEntity(meta['peer'])
+        self.isupport = isupport.ISupport()
+        self.isupport.feed(meta['isupport'])
+
+    def get_entity(self, raw):
+        """
+        Retrieve an entity.
+
+        :param raw: The ``bytes`` form of the entity.
+
+        :returns: An entity object.
+        """
+
+        return messages.RawEntity(raw)
+
+
+def metadata(conn):
+    """
+    Extract the metadata needed to rebuild a connection in a worker.
+    The result is composed entirely of simple types, so it may be
+    pickled cheaply.
+
+    :param conn: The connection.
+
+    :returns: A dictionary of connection metadata.
+    """
+
+    isup = getattr(conn, 'isupport', None)
+    return {
+        'me': conn.me.to_bytes(),
+        'peer': conn.peer.to_bytes(),
+        'isupport': isup.tokens() if isup is not None else (),
+    }
+
+
+# The most recently rebuilt connection in this worker, as a tuple of
+# its metadata key and the ``WorkerConnection``; successive messages
+# usually come from the same connection, so this saves reparsing the
+# ISUPPORT tokens for each
+_last_conn = (None, None)
+
+
+def _connection(meta):
+    """
+    Rebuild a connection in a worker, reusing the last one if the
+    metadata is unchanged.
+
+    :param meta: The connection metadata.
+
+    :returns: A ``WorkerConnection``.
+    """
+
+    global _last_conn
+
+    key = (meta['me'], meta['peer'], tuple(meta['isupport']))
+    last = _last_conn
+    if last[0] == key:
+        return last[1]
+
+    conn = WorkerConnection(meta)
+    _last_conn = (key, conn)
+    return conn
+
+
+def _run(func, raw, meta):
+    """
+    Run an offloaded handler.  This is the function executed in the
+    worker.
+
+    :param func: The handler.
+    :param raw: The raw IRC protocol message, in ``bytes``.
+    :param meta: The connection metadata.
+
+    :returns: A list of the raw reply lines, in ``bytes``.
+    """
+
+    conn = _connection(meta)
+    msg = messages.Message.from_bytes(None, conn, raw)
+    if msg is None:
+        return []
+
+    return [line if isinstance(line, bytes) else line.msg
+            for line in func(msg) or ()]
+
+
+class WorkerPool(object):
+    """
+    Run handlers in an executor, such as a
+    ``concurrent.futures.ProcessPoolExecutor``.  Only the raw message
+    bytes and simple connection metadata cross to the worker, where
+    the message is rebuilt; replies return as raw lines.  When the
+    number of messages accepted but not yet completed, whether queued
+    or running, reaches a limit, or when any handler's backlog fills,
+    the ``pause`` callback is called, e.g. to pause reading from the
+    server; ``resume`` is called once the messages drain to half the
+    limit and the backlogs to half their size.
+    """
+
+    def __init__(self, loop, executor, max_pending=256, pause=None,
+                 resume=None):
+        """
+        Initialize a ``WorkerPool`` instance.
+
+        :param loop: The event loop.
+        :param executor: The executor to run handlers in.
+        :param max_pending: The number of outstanding messages at
+                            which to apply backpressure.
+        :param pause: A callable to call to apply backpressure.
+        :param resume: A callable to call to release backpressure.
+        """
+
+        self.loop = loop
+        self.executor = executor
+        self.max_pending = max_pending
+        self.pause = pause
+        self.resume = resume
+
+        self.pending = 0
+        self.paused = False
+
+        # The handlers whose backlogs are full
+        self._congested = set()
+
+        # Maps connections to a tuple of a key identifying their
+        # state and their cached metadata
+        self._meta = weakref.WeakKeyDictionary()
+
+    def offload(self, func, sink, concurrency=1, backlog=64):
+        """
+        Construct a dispatcher handler which offloads a handler to
+        the pool.
+
+        :param func: The handler to offload.  It is called in a
+                     worker with a ``Message``, and returns an
+                     iterable of replies, either ``Message`` objects
+                     or raw lines in ``bytes``.  For a process pool,
+                     it must be picklable, e.g. a module-level
+                     function.
+        :param sink: A callable to receive the list of raw reply
+                     lines, e.g. to write them to the connection.  It
+                     is called in the event loop.
+        :param concurrency: The maximum number of messages to run
+                            this handler on at once.
+        :param backlog: The number of messages queued for this
+                        handler, when at its concurrency limit, at
+                        which to apply backpressure.  Messages are
+                        never dropped.
+
+        :returns: An ``OffloadedHandler``, which may be registered
+                  with a ``pirch.proto.irc.dispatch.Dispatcher``.
+        """
+
+        return OffloadedHandler(self, func, sink, concurrency, backlog)
+
+    def _metadata(self, conn):
+        """
+        Retrieve the metadata for a connection, rebuilding it only
+        when the connection's identity or ISUPPORT parameters have
+        changed.
+
+        :param conn: The connection.
+
+        :returns: A dictionary of connection metadata.
+        """
+
+        isup = getattr(conn, 'isupport', None)
+        key = (conn.me.to_bytes(), conn.peer.to_bytes(),
+               isup.serial if isup is not None else None)
+
+        cached = self._meta.get(conn)
+        if cached is None or cached[0] != key:
+            cached = (key, metadata(conn))
+            self._meta[conn] = cached
+
+        return cached[1]
+
+    def _submit(self, func, raw, meta):
+        """
+        Submit a message to the executor.
+
+        :param func: The handler.
+        :param raw: The raw IRC protocol message, in ``bytes``.
+        :param meta: The connection metadata.
+
+        :returns: A future for the reply lines.
+        """
+
+        return self.loop.run_in_executor(self.executor, _run, func, raw,
+                                         meta)
+
+    def _accept(self):
+        """
+        Account for an accepted message.
+        """
+
+        self.pending += 1
+        self._check()
+
+    def _complete(self):
+        """
+        Account for a completed message.
+        """
+
+        self.pending -= 1
+        self._check()
+
+    def _congest(self, handler, congested):
+        """
+        Record whether a handler's backlog is full.
+
+        :param handler: The ``OffloadedHandler``.
+        :param congested: A ``True`` value if the backlog is full.
+        """
+
+        if congested:
+            self._congested.add(handler)
+        else:
+            self._congested.discard(handler)
+        self._check()
+
+    def _check(self):
+        """
+        Apply or release backpressure as needed.
+        """
+
+        if not self.paused:
+            if self.pending >= self.max_pending or self._congested:
+                self.paused = True
+                if self.pause:
+                    self.pause()
+        elif self.pending <= self.max_pending // 2 and not self._congested:
+            self.paused = False
+            if self.resume:
+                self.resume()
+
+
+class OffloadedHandler(object):
+    """
+    A dispatcher handler that runs a handler in a ``WorkerPool``,
+    subject to a concurrency limit.  Messages arriving while it is at
+    that limit are queued; when the queue reaches the backlog size,
+    the pool applies backpressure until it drains to half that size.
+    """
+
+    def __init__(self, pool, func, sink, concurrency, backlog):
+        """
+        Initialize an ``OffloadedHandler`` instance.
+
+        :param pool: The ``WorkerPool``.
+        :param func: The handler to offload.
+        :param sink: A callable to receive the raw reply lines.
+        :param concurrency: The maximum number of messages to run the
+                            handler on at once.
+        :param backlog: The number of queued messages at which to
+                        apply backpressure.
+        """
+
+        self.pool = pool
+        self.func = func
+        self.sink = sink
+        self.concurrency = concurrency
+        self.backlog = backlog
+
+        self.running = 0
+        self.congested = False
+        self._queue = collections.deque()
+
+    def __call__(self, msg):
+        """
+        Offload the handling of a message.
+
+        :param msg: The ``pirch.proto.irc.messages.Message``.
+        """
+
+        item = (msg.msg, self.pool._metadata(msg.conn))
+        self.pool._accept()
+        if self.running < self.concurrency:
+            self._start(item)
+        else:
+            self._queue.append(item)
+            if not self.congested and len(self._queue) >= self.backlog:
+                self.congested = True
+                self.pool._congest(self, True)
+
+    def _start(self, item):
+        """
+        Start running the handler on a message.
+
+        :param item: A tuple of the raw message and connection
+                     metadata.
+        """
+
+        self.running += 1
+        fut = self.pool._submit(self.func, item[0], item[1])
+        fut.add_done_callback(self._done)
+
+    def _done(self, fut):
+        """
+        Called when the handler has completed.
+
+        :param fut: The completed future.
+        """
+
+        self.running -= 1
+        if self._queue:
+            self._start(self._queue.popleft())
+            if self.congested and len(self._queue) <= self.backlog // 2:
+                self.congested = False
+                self.pool._congest(self, False)
+        self.pool._complete()
+
+        if fut.cancelled():
+            return
+        elif fut.exception() is not None:
+            self.pool.loop.call_exception_handler({
+                'message': 'offloaded handler %r failed' % (self.func,),
+                'exception': fut.exception(),
+                'future': fut,
+            })
+        else:
+            lines = fut.result()
+            if lines:
+                self.sink(lines)
@@ -0,0 +1,194 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import itertools
+
+try:
+    import asyncio
+except ImportError:  # pragma: no cover
+    import trollius as asyncio
+
+
+# Source of unique batch reference tags
+_batch_ids = itertools.count(1)
+
+
+def _tag(line, ref):
+    """
+    Add a batch tag to a raw line.
+
+    :param line: The raw IRC protocol message, in ``bytes``.
+    :param ref: The batch reference tag, in ``bytes``.
+
+    :returns: The tagged line.
+    """
+
+    if line[:1] == b'@':
+        return b'@batch=' + ref + b';' + line[1:]
+    return b'@batch=' + ref + b' ' + line
+
+
+class Playback(object):
+    """
+    Stream stored lines to a client in chunks.  Each chunk is limited
+    to a byte budget and written with a single ``writelines()`` call,
+    and the event loop is yielded to between chunks so that live
+    traffic is not starved.  Playback stops while the transport is
+    paused; the protocol owning the transport must forward its
+    ``pause_writing()`` and ``resume_writing()`` calls.  Optionally,
+    the lines are framed in an IRCv3 batch.
+    """
+
+    def __init__(self, loop, transport, lines, chunk_size=16 * 1024,
+                 batch=False, source=b'pirch', batch_type=b'chathistory',
+                 target=None):
+        """
+        Initialize a ``Playback`` instance.
+
+        :param loop: The event loop.
+        :param transport: The client's transport.
+        :param lines: An iterable of the raw IRC protocol messages to
+                      play back, in ``bytes``, without line
+                      terminators.  It is consumed incrementally.
+        :param chunk_size: The approximate number of bytes to write
+                           per loop iteration.
+        :param batch: If ``True``, the lines are framed in a batch;
+                      the client must support the IRCv3 "batch"
+                      capability.
+        :param source: The prefix to use for the BATCH commands.
+        :param batch_type: The type of the batch.
+        :param target: The target the lines are from, in ``bytes``,
+                       added as a batch parameter if given.
+        """
+
+        self.loop = loop
+        self.transport = transport
+        self.chunk_size = chunk_size
+        self.batch = batch
+        self.source = source
+        self.batch_type = batch_type
+        self.target = target
+
+        self.paused = False
+        self.lines_sent = 0
+        self.done = asyncio.Future(loop=loop)
+
+        self._lines = iter(lines)
+        self._ref = None
+        self._scheduled = False
+
+    def start(self):
+        """
+        Start playback.
+
+        :returns: The ``done`` future, whose result is the number of
+                  lines played back.
+        """
+
+        self._schedule()
+        return self.done
+
+    def pause_writing(self):
+        """
+        Stop playback until ``resume_writing()`` is called.
+        """
+
+        self.paused = True
+
+    def resume_writing(self):
+        """
+        Resume playback.
+        """
+
+        self.paused = False
+        self._schedule()
+
+    def cancel(self):
+        """
+        Abandon playback, closing any open batch.
+        """
+
+        if self.done.done():
+            return
+
+        if self._ref is not None:
+            self.transport.writelines([self._batch_line(b'-'), b'\r\n'])
+        self.done.cancel()
+
+    def _schedule(self):
+        """
+        Schedule the next chunk, if one is not already scheduled.
+        """
+
+        if not self._scheduled and not self.done.done():
+            self._scheduled = True
+            self.loop.call_soon(self._step)
+
+    def _batch_line(self, sign):
+        """
+        Construct a BATCH line.
+
+        :param sign: Either b"+" to open or b"-" to close the batch.
+
+        :returns: The raw line.
+        """
+
+        parts = [b':' + self.source, b'BATCH', sign + self._ref]
+        if sign == b'+':
+            parts.append(self.batch_type)
+            if self.target is not None:
+                parts.append(self.target)
+        return b' '.join(parts)
+
+    def _step(self):
+        """
+        Write a chunk of lines.
+        """
+
+        self._scheduled = False
+        if self.paused or self.done.done():
+            return
+
+        chunks = []
+        size = 0
+        finished = False
+
+        if self.batch and self._ref is None:
+            self._ref = b'pb' + str(next(_batch_ids)).encode('ascii')
+            chunks += [self._batch_line(b'+'), b'\r\n']
+
+        while size < self.chunk_size:
+            line = next(self._lines, None)
+            if line is None:
+                finished = True
+                break
+
+            if self._ref is not None:
+                line = _tag(line, self._ref)
+            chunks += [line, b'\r\n']
+            size += len(line) + 2
+            self.lines_sent += 1
+
+        if finished and self._ref is not None:
+            chunks += [self._batch_line(b'-'), b'\r\n']
+
+        if chunks:
+            self.transport.writelines(chunks)
+
+        if finished:
+            self.done.set_result(self.lines_sent)
+        else:
+            self._schedule()
@@ -0,0 +1,330 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import collections
+
+from pirch.proto.irc import isupport
+
+
+# Room to leave in an ISON line for the server's reply, which carries
+# the server name and our nickname ahead of the online nicknames
+_reply_overhead = 100
+
+
+def _pack(head, sep, names, budget):
+    """
+    Pack names into as few lines as possible.
+
+    :param head: The start of each line, in ``bytes``, e.g. b"MONITOR + ".
+    :param sep: The separator between names, in ``bytes``.
+    :param names: An iterable of the names, in ``bytes``.
+    :param budget: The maximum length of each line.
+
+    :returns: A list of raw lines, in ``bytes``.
+    """
+
+    result = []
+    batch = []
+    size = len(head)
+    for name in names:
+        if batch and size + len(sep) + len(name) > budget:
+            result.append(head + sep.join(batch))
+            batch = []
+            size = len(head)
+        size += len(name) + (len(sep) if batch else 0)
+        batch.append(name)
+
+    if batch:
+        result.append(head + sep.join(batch))
+
+    return result
+
+
+class Presence(object):
+    """
+    Track whether watched nicknames are online.  MONITOR is used when
+    the server supports it, up to the server's limit; other
+    nicknames are polled with ISON queries, each packed to the line
+    length, sent one at a time on a schedule that rotates through the
+    nicknames.  Changes are reported to a callback as sets of the
+    nicknames that came online and went offline.
+
+    Nicknames are kept once, keyed by their casemapped form, and
+    states as sets of those keys.  The ``Presence`` must be registered
+    as a handler for every message on a
+    ``pirch.proto.irc.dispatch.Dispatcher`` to receive the replies.
+    """
+
+    def __init__(self, loop, send, callback, isup=None, interval=10.0):
+        """
+        Initialize a ``Presence`` instance.
+
+        :param loop: The event loop.
+        :param send: A callable taking a list of raw lines, in
+                     ``bytes``, which sends them to the server.
+        :param callback: A callable taking two sets of nicknames: the
+                         nicknames that came online, and those that
+                         went offline.
+        :param isup: The ``pirch.proto.irc.isupport.ISupport`` for the
+                     connection, which supplies the casemapping
+                     applied to nicknames, the line length, and the
+                     MONITOR limit.  Defaults to the RFC 1459
+                     parameters until ``start()`` is called.
+        :param interval: The time, in seconds, between ISON queries.
+        """
+
+        self.loop = loop
+        self.send = send
+        self.callback = callback
+        self.isupport = isupport.ISupport() if isup is None else isup
+        self.interval = interval
+
+        # Maps casemapped nicknames to the nicknames as given
+        self.watched = {}
+
+        # The casemapped nicknames currently online
+        self.online = set()
+
+        # The MONITOR limit; None if MONITOR is not in use, or -1 if
+        # unlimited
+        self.limit = None
+
+        # The casemapped nicknames being monitored
+        self._monitored = set()
+
+        # The casemapped nicknames to poll, in rotation order, and
+        # the position of the next to poll.  Nicknames no longer
+        # polled are dropped lazily.
+        self._poll = []
+        self._cursor = 0
+
+        # The casemapped nicknames in each outstanding ISON query
+        self._queries = collections.deque()
+
+        self.running = False
+        self._handle = None
+
+    def start(self, isup=None):
+        """
+        Start tracking, e.g. once registration is complete.
+
+        :param isup: The ``pirch.proto.irc.isupport.ISupport`` for the
+                     connection, replacing the one given to the
+                     constructor.  Its MONITOR token determines
+                     whether MONITOR is used.
+        """
+
+        self.stop()
+        self.running = True
+
+        if isup is not None:
+            # Rekey the nicknames under the connection's casemapping
+            self.isupport = isup
+            mapper = isup.casemap
+            online = set(self.watched[key] for key in self.online)
+            self.watched = {mapper(nick): nick
+                            for nick in self.watched.values()}
+            self.online = set(mapper(nick) for nick in online)
+        isup = self.isupport
+
+        self._monitored = set()
+        self._poll = []
+        self._cursor = 0
+
+        if b'MONITOR' in isup:
+            self.limit = -1 if isup.monitor is None else isup.monitor
+            self.send([b'MONITOR C'])
+        else:
+            self.limit = None
+
+        self._add(sorted(self.watched))
+
+    def stop(self):
+        """
+        Stop polling, e.g. when the connection is lost.
+        """
+
+        self.running = False
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self._queries.clear()
+
+    def watch(self, *nicks):
+        """
+        Watch nicknames.
+
+        :param nicks: The nicknames, in ``bytes``.
+        """
+
+        keys = []
+        for nick in nicks:
+            key = self.isupport.casemap(nick)
+            if key not in self.watched:
+                self.watched[key] = nick
+                keys.append(key)
+
+        self._add(keys)
+
+    def unwatch(self, *nicks):
+        """
+        Stop watching nicknames.  No change is reported for them.
+
+        :param nicks: The nicknames, in ``bytes``.
+        """
+
+        unmonitor = []
+        for nick in nicks:
+            key = self.isupport.casemap(nick)
+            if self.watched.pop(key, None) is None:
+                continue
+
+            self.online.discard(key)
+            if key in self._monitored:
+                self._monitored.remove(key)
+                unmonitor.append(nick)
+
+        if unmonitor:
+            self.send(_pack(b'MONITOR - ', b',', unmonitor,
+                            self.isupport.linelen - 2))
+
+    def _add(self, keys):
+        """
+        Begin tracking nicknames, monitoring them while there is room
+        and polling the rest.
+
+        :param keys: A list of the casemapped nicknames.
+        """
+
+        if not self.running:
+            return
+
+        if self.limit is not None:
+            room = (len(keys) if self.limit < 0 else
+                    max(self.limit - len(self._monitored), 0))
+            monitor = keys[:room]
+            keys = keys[room:]
+
+            if monitor:
+                self._monitored.update(monitor)
+                self.send(_pack(b'MONITOR + ', b',',
+                                [self.watched[key] for key in monitor],
+                                self.isupport.linelen - 2))
+
+        self._poll.extend(keys)
+        if self._poll and self._handle is None:
+            self._handle = self.loop.call_soon(self._tick)
+
+    def _tick(self):
+        """
+        Send the next ISON query.
+        """
+
+        self._handle = None
+
+        # Drop the nicknames no longer polled, and any duplicates
+        if self._cursor >= len(self._poll):
+            seen = set(self._monitored)
+            poll = []
+            for key in self._poll:
+                if key in self.watched and key not in seen:
+                    seen.add(key)
+                    poll.append(key)
+            self._poll = poll
+            self._cursor = 0
+            if not self._poll:
+                return
+
+        budget = self.isupport.linelen - 2 - _reply_overhead
+        size = len(b'ISON')
+        batch = []
+        while self._cursor < len(self._poll):
+            key = self._poll[self._cursor]
+            nick = self.watched.get(key)
+            if nick is not None and key not in self._monitored:
+                if batch and size + 1 + len(nick) > budget:
+                    break
+                size += 1 + len(nick)
+                batch.append(key)
+            self._cursor += 1
+
+        # Only stale nicknames remained; start over
+        if not batch:
+            self._tick()
+            return
+
+        self._queries.append(batch)
+        self.send([b'ISON ' + b' '.join(self.watched[key] for key in batch)])
+
+        self._handle = self.loop.call_later(self.interval, self._tick)
+
+    def _update(self, up, checked):
+        """
+        Record the state of nicknames, reporting any changes.
+
+        :param up: A set of the casemapped nicknames which are online.
+        :param checked: A set of the casemapped nicknames whose state
+                        is known; those not in ``up`` are offline.
+        """
+
+        came = (up - self.online).intersection(self.watched)
+        went = (checked - up) & self.online
+        if not came and not went:
+            return
+
+        self.online |= came
+        self.online -= went
+        self.callback(set(self.watched[key] for key in came),
+                      set(self.watched[key] for key in went))
+
+    def __call__(self, msg):
+        """
+        Process a message received from the server.
+
+        :param msg: The ``pirch.proto.irc.messages.Message``.
+        """
+
+        mapper = self.isupport.casemap
+        cmd = msg.command.cmd
+        if cmd == b'303':
+            # RPL_ISON
+            if not self._queries:
+                return
+            checked = set(self._queries.popleft())
+            up = set(mapper(nick) for nick in msg.args[-1].split())
+            self._update(up & checked, checked)
+
+        elif cmd == b'730':
+            # RPL_MONONLINE; each target is a full prefix
+            up = set(mapper(target.split(b'!', 1)[0])
+                     for target in msg.args[-1].split(b','))
+            self._update(up, up)
+
+        elif cmd == b'731':
+            # RPL_MONOFFLINE
+            down = set(mapper(target)
+                       for target in msg.args[-1].split(b','))
+            self._update(set(), down)
+
+        elif cmd == b'734':
+            # ERR_MONLISTFULL; poll the targets instead
+            keys = [mapper(target)
+                    for target in msg.args[2].split(b',')]
+            keys = [key for key in keys
+                    if key in self._monitored and key in self.watched]
+            self._monitored.difference_update(keys)
+            self.limit = len(self._monitored)
+            self._add(keys)
@@ -0,0 +1,376 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import collections
+import random
+import time
+
+try:
+    import asyncio
+except ImportError:  # pragma: no cover
+    import trollius as asyncio
+
+from pirch.proto.irc import isupport
+
+
+# The member changes found when reconciling a channel: dictionaries
+# mapping casemapped nicknames to membership bitsets for the members
+# that joined and whose membership modes changed, and a set of the
+# casemapped nicknames of the members that left.
+MemberDiff = collections.namedtuple('MemberDiff',
+                                    ['joined', 'parted', 'changed'])
+
+
+class Backoff(object):
+    """
+    Compute reconnection delays.  The delay doubles with each
+    attempt, up to a cap, and is jittered so that many clients
+    disconnected at once do not reconnect in lockstep: each delay is
+    chosen at random between half and all of the nominal delay.
+    """
+
+    def __init__(self, base=1.0, cap=300.0, factor=2.0, rand=random.random):
+        """
+        Initialize a ``Backoff`` instance.
+
+        :param base: The nominal delay before the first attempt, in
+                     seconds.
+        :param cap: The maximum nominal delay, in seconds.
+        :param factor: The factor by which the nominal delay grows
+                       with each attempt.
+        :param rand: A callable returning a random ``float`` in the
+                     range [0.0, 1.0).
+        """
+
+        self.base = base
+        self.cap = cap
+        self.factor = factor
+        self.rand = rand
+
+        self.attempts = 0
+
+    def delay(self):
+        """
+        Compute the delay before the next attempt.
+
+        :returns: The delay, in seconds.
+        """
+
+        nominal = self.base * self.factor ** self.attempts
+        if nominal >= self.cap:
+            # Once at the cap, stop growing the exponent, which would
+            # otherwise eventually overflow
+            nominal = self.cap
+        else:
+            self.attempts += 1
+        return nominal / 2 + self.rand() * nominal / 2
+
+    def reset(self):
+        """
+        Reset the backoff, e.g. after a successful connection.
+        """
+
+        self.attempts = 0
+
+
+def registration(nick, user, realname, password=None, caps=True):
+    """
+    Construct the lines needed to register a connection.  The lines
+    may be written together, without waiting for the server to
+    respond to each.
+
+    :param nick: The nickname, in ``bytes``.
+    :param user: The user name, in ``bytes``.
+    :param realname: The real name, in ``bytes``.
+    :param password: The connection password, in ``bytes``, if any.
+    :param caps: If ``True``, capability negotiation is started with
+                 "CAP LS 302"; registration is then held by the
+                 server until the client sends "CAP END".
+
+    :returns: A list of the raw lines, in ``bytes``, without line
+              terminators.
+    """
+
+    lines = []
+    if caps:
+        lines.append(b'CAP LS 302')
+    if password is not None:
+        lines.append(b'PASS ' + password)
+    lines += [
+        b'NICK ' + nick,
+        b'USER ' + user + b' 0 * :' + realname,
+    ]
+    return lines
+
+
+def register(transport, nick, user, realname, password=None, caps=True):
+    """
+    Write the registration lines for a connection in a single batch.
+
+    :param transport: The connection's transport.
+    :param nick: The nickname, in ``bytes``.
+    :param user: The user name, in ``bytes``.
+    :param realname: The real name, in ``bytes``.
+    :param password: The connection password, in ``bytes``, if any.
+    :param caps: If ``True``, capability negotiation is started.
+    """
+
+    chunks = []
+    for line in registration(nick, user, realname, password, caps):
+        chunks += [line, b'\r\n']
+    transport.writelines(chunks)
+
+
+class Reconnector(object):
+    """
+    Keep a connection open, reconnecting with a jittered backoff when
+    it is lost or cannot be established.
+    """
+
+    def __init__(self, loop, connect, backoff=None):
+        """
+        Initialize a ``Reconnector`` instance.
+
+        :param loop: The event loop.
+        :param connect: A callable of no arguments which starts a
+                        connection attempt and returns a future or
+                        coroutine, e.g. a ``functools.partial()`` of
+                        ``loop.create_connection()``.  An exception
+                        indicates that the attempt failed.
+        :param backoff: A ``Backoff`` instance.  If not given, one
+                        with the default parameters is used.
+        """
+
+        self.loop = loop
+        self.connect = connect
+        self.backoff = backoff or Backoff()
+
+        self.running = False
+        self._handle = None
+        self._attempt = None
+
+    def start(self):
+        """
+        Start connecting immediately.
+        """
+
+        self.running = True
+        self._try()
+
+    def stop(self):
+        """
+        Stop reconnecting.  An established connection is not closed.
+        """
+
+        self.running = False
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._attempt is not None:
+            self._attempt.cancel()
+            self._attempt = None
+
+    def connected(self):
+        """
+        Called once the connection is fully established, e.g. on
+        RPL_WELCOME (001).  Resets the backoff.
+        """
+
+        self.backoff.reset()
+
+    def connection_lost(self):
+        """
+        Called when the connection is lost.  Schedules a reconnection
+        attempt.
+        """
+
+        self._schedule()
+
+    def _schedule(self):
+        """
+        Schedule a connection attempt after the backoff delay.
+        """
+
+        if self.running and self._handle is None and self._attempt is None:
+            self._handle = self.loop.call_later(self.backoff.delay(),
+                                                self._try)
+
+    def _try(self):
+        """
+        Make a connection attempt.
+        """
+
+        self._handle = None
+        if not self.running:
+            return
+
+        self._attempt = asyncio.ensure_future(self.connect(), loop=self.loop)
+        self._attempt.add_done_callback(self._done)
+
+    def _done(self, fut):
+        """
+        Called when a connection attempt has completed.
+
+        :param fut: The completed future.
+        """
+
+        if fut is not self._attempt:
+            return
+        self._attempt = None
+
+        if fut.cancelled():
+            return
+        elif fut.exception() is not None:
+            self._schedule()
+
+
+class Snapshot(object):
+    """
+    The session state cached across a reconnection: the ISUPPORT
+    parameters and the state of each joined channel.  The cached
+    state is usable as soon as the connection is re-established, and
+    the state received in the new session's burst is reconciled with
+    it, yielding only what changed, rather than rebuilding it.
+    """
+
+    def __init__(self, isup, channels, now=None):
+        """
+        Initialize a ``Snapshot`` instance.
+
+        :param isup: The ``pirch.proto.irc.isupport.ISupport`` for the
+                     connection.
+        :param channels: A dictionary mapping channel names, in
+                         ``bytes``, to their
+                         ``pirch.proto.irc.modes.ChannelModes``.  The
+                         channel modes are copied.
+        :param now: The time the snapshot was taken.  Defaults to the
+                    current time.
+        """
+
+        self.tokens = isup.tokens()
+        self.casemap = isup.casemap
+        self.channels = {name: modes.copy()
+                         for name, modes in channels.items()}
+        self.taken = time.time() if now is None else now
+
+        self._index = {self.casemap(name): name for name in self.channels}
+
+    def age(self, now=None):
+        """
+        Determine the age of the snapshot.
+
+        :param now: The current time.  Defaults to the current time.
+
+        :returns: The age of the snapshot, in seconds.
+        """
+
+        return (time.time() if now is None else now) - self.taken
+
+    def isupport(self):
+        """
+        Reconstruct the cached ISUPPORT parameters.
+
+        :returns: A new ``pirch.proto.irc.isupport.ISupport``.
+        """
+
+        result = isupport.ISupport()
+        result.feed(self.tokens)
+        return result
+
+    def isupport_diff(self, tokens):
+        """
+        Compute the ISUPPORT tokens which would update the cached
+        parameters to match those advertised in the new session.
+
+        :param tokens: A list of the tokens advertised in the new
+                       session, in ``bytes``.
+
+        :returns: A list of tokens, in ``bytes``, suitable for feeding
+                  to the ``ISupport`` returned by ``isupport()``:
+                  parameters which were added or changed, followed by
+                  the negations of those which were withdrawn.
+        """
+
+        old = set(self.tokens)
+        names = set(token.partition(b'=')[0] for token in tokens)
+
+        result = [token for token in tokens if token not in old]
+        result += sorted(b'-' + name for name in
+                         (token.partition(b'=')[0] for token in old)
+                         if name not in names)
+        return result
+
+    def channel(self, name):
+        """
+        Retrieve the cached state of a channel.
+
+        :param name: The channel name, in ``bytes``.
+
+        :returns: The ``pirch.proto.irc.modes.ChannelModes``, or
+                  ``None`` if the channel was not joined.
+        """
+
+        name = self._index.get(self.casemap(name))
+        return None if name is None else self.channels[name]
+
+    def reconcile(self, isup, name, fresh, modes=True):
+        """
+        Reconcile the state of a channel received in the new
+        session's burst with the cached state, updating the cached
+        state in place.
+
+        :param isup: The ``pirch.proto.irc.isupport.ISupport`` for the
+                     new session.
+        :param name: The channel name, in ``bytes``.
+        :param fresh: A ``pirch.proto.irc.modes.ChannelModes``
+                      populated from the burst, e.g. from RPL_NAMREPLY
+                      (353) and RPL_CHANNELMODEIS (324).
+        :param modes: If ``False``, the channel modes were not
+                      received in the burst, and the cached modes are
+                      kept.  List modes are always kept.
+
+        :returns: A tuple of the reconciled
+                  ``pirch.proto.irc.modes.ChannelModes``, a list of
+                  the ``pirch.proto.irc.modes.ModeChange`` instances
+                  applied, and a ``MemberDiff``.  If the channel was
+                  not cached, ``fresh`` is returned, with ``None`` in
+                  place of the changes.
+        """
+
+        cached = self.channel(name)
+        if cached is None:
+            return fresh, None, None
+
+        changes = []
+        if modes:
+            changes = cached.diff(fresh)
+            cached.apply(isup, changes)
+
+        old = cached.members
+        new = fresh.members
+        diff = MemberDiff(
+            {nick: bits for nick, bits in new.items() if nick not in old},
+            set(nick for nick in old if nick not in new),
+            {nick: bits for nick, bits in new.items()
+             if nick in old and old[nick] != bits},
+        )
+
+        for nick in diff.parted:
+            del old[nick]
+        old.update(diff.joined)
+        old.update(diff.changed)
+
+        return cached, changes, diff
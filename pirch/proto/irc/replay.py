@@ -0,0 +1,477 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+"""
+Replay captured IRC traffic through the parser and dispatcher.
+
+A captured session is fed, at a controllable rate, from a local
+stand-in server over a socket pair to a client connection which frames
+it with ``framer``, parses each line with ``Message.from_bytes()``,
+and dispatches it.  Throughput, dispatch latency, and memory growth
+are reported.  Nothing leaves the local process.
+
+The capture may be a ``pirch.proto.irc.archive`` directory, or a text
+file containing one raw line per line, each optionally preceded by a
+floating point timestamp.  The timestamp must contain a decimal
+point, e.g. "1443902400.0", so that it is not mistaken for the
+command of a numeric reply sent without a prefix.
+"""
+
+import argparse
+import array
+import os
+import re
+import socket
+import sys
+import time
+
+try:
+    import asyncio
+except ImportError:  # pragma: no cover
+    import trollius as asyncio
+
+import framer
+
+from pirch.proto.irc import archive
+from pirch.proto.irc import dispatch
+from pirch.proto.irc import messages
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+
+# The number of lines to write per loop iteration when not pacing
+_burst = 64
+
+# A leading timestamp in a text log; the decimal point distinguishes
+# it from a numeric command, e.g. b"001"
+_timestamp_re = re.compile(br'^[0-9]+\.[0-9]*$')
+
+
+def read_log(filename):
+    """
+    Read a captured session log.
+
+    :param filename: The name of an archive directory or of a text
+                     log file.
+
+    :returns: An iterator over tuples of timestamp and raw line.  The
+              timestamp will be ``None`` if the log does not contain
+              one.
+    """
+
+    if os.path.isdir(filename):
+        arch = archive.Archive(filename)
+        try:
+            for msg in arch.query():
+                yield msg.timestamp, msg.raw
+        finally:
+            arch.close()
+        return
+
+    with open(filename, 'rb') as f:
+        for line in f:
+            line = line.rstrip(b'\r\n')
+            if not line:
+                continue
+
+            # Look for a leading timestamp
+            timestamp = None
+            head, sep, tail = line.partition(b' ')
+            if sep and _timestamp_re.match(head):
+                timestamp = float(head)
+                line = tail
+
+            yield timestamp, line
+
+
+def percentile(values, fraction):
+    """
+    Compute a percentile of a sorted sequence of values, using the
+    nearest rank.
+
+    :param values: The sorted values.
+    :param fraction: The percentile, as a fraction between 0 and 1.
+
+    :returns: The value at the percentile, or ``None`` if there are no
+              values.
+    """
+
+    if not values:
+        return None
+
+    return values[int(round(fraction * (len(values) - 1)))]
+
+
+class Report(object):
+    """
+    The results of a replay.
+    """
+
+    def __init__(self, lines, messages, elapsed, latencies, memory_growth,
+                 memory_units):
+        """
+        Initialize a ``Report`` instance.
+
+        :param lines: The number of lines received.
+        :param messages: The number of messages dispatched.
+        :param elapsed: The elapsed wall-clock time, in seconds.
+        :param latencies: A sorted sequence of per-line parse and
+                          dispatch latencies, in seconds.
+        :param memory_growth: The growth in memory use over the
+                              replay, or ``None`` if it could not be
+                              measured.
+        :param memory_units: A string describing how memory growth
+                             was measured.
+        """
+
+        self.lines = lines
+        self.messages = messages
+        self.elapsed = elapsed
+        self.throughput = lines / elapsed if elapsed else 0.0
+        self.p50 = percentile(latencies, 0.5)
+        self.p99 = percentile(latencies, 0.99)
+        self.memory_growth = memory_growth
+        self.memory_units = memory_units
+
+    def __str__(self):
+        """
+        Format the report for display.
+
+        :returns: A multi-line string describing the results.
+        """
+
+        def usec(value):
+            return 'n/a' if value is None else '%.1f us' % (value * 1e6)
+
+        return '\n'.join([
+            'lines:          %d' % self.lines,
+            'messages:       %d' % self.messages,
+            'elapsed:        %.3f s' % self.elapsed,
+            'throughput:     %.1f lines/s' % self.throughput,
+            'p50 latency:    %s' % usec(self.p50),
+            'p99 latency:    %s' % usec(self.p99),
+            'memory growth:  %s' % (
+                'n/a' if self.memory_growth is None else
+                '%d %s' % (self.memory_growth, self.memory_units)),
+        ])
+
+
+class _ServerProtocol(asyncio.Protocol):
+    """
+    The stand-in server side of the replay.  Lines are written
+    according to their timestamps, scaled by the replay speed.
+    """
+
+    def __init__(self, replay):
+        """
+        Initialize a ``_ServerProtocol`` instance.
+
+        :param replay: The ``Replay`` driving the server.
+        """
+
+        self.replay = replay
+        self.transport = None
+        self.paused = False
+        self._lines = iter(replay.lines)
+        self._pending = None
+        self._base = None
+
+    def connection_made(self, transport):
+        """
+        Called when the connection is made.
+
+        :param transport: The transport.
+        """
+
+        self.transport = transport
+        self.replay.loop.call_soon(self.pump)
+
+    def pause_writing(self):
+        """
+        Called when the transport's buffer goes over the high-water
+        mark.
+        """
+
+        self.paused = True
+
+    def resume_writing(self):
+        """
+        Called when the transport's buffer drains below the low-water
+        mark.
+        """
+
+        self.paused = False
+        self.replay.loop.call_soon(self.pump)
+
+    def pump(self):
+        """
+        Write as many lines as are due, rescheduling as necessary.
+        """
+
+        loop = self.replay.loop
+        speed = self.replay.speed
+
+        for _i in range(_burst):
+            if self.paused:
+                return
+
+            if self._pending is None:
+                self._pending = next(self._lines, None)
+                if self._pending is None:
+                    # All done; signal the end of the capture
+                    self.transport.write_eof()
+                    return
+
+            timestamp, line = self._pending
+
+            # Pace the lines if requested
+            if speed and timestamp is not None:
+                now = time.time()
+                if self._base is None:
+                    self._base = (timestamp, now)
+                due = self._base[1] + (timestamp - self._base[0]) / speed
+                if due > now:
+                    loop.call_later(due - now, self.pump)
+                    return
+
+            self._pending = None
+            self.transport.write(line + b'\r\n')
+
+        loop.call_soon(self.pump)
+
+
+class _ClientProtocol(framer.FramedProtocol):
+    """
+    The client side of the replay.  Doubles as the connection object
+    passed to ``Message.from_bytes()``.
+    """
+
+    def __init__(self, replay):
+        """
+        Initialize a ``_ClientProtocol`` instance.
+
+        :param replay: The ``Replay`` driving the client.
+        """
+
+        self.replay = replay
+        self.peer = messages.RawEntity(b'replay.server')
+        self.me = messages.RawEntity(b'replay')
+
+    def get_entity(self, raw):
+        """
+        Look up an entity.
+
+        :param raw: The ``bytes`` form of the entity.
+
+        :returns: An entity object.
+        """
+
+        return messages.RawEntity(raw)
+
+    def frame_received(self, frame):
+        """
+        Called when a frame is received.
+
+        :param frame: The raw line.
+        """
+
+        self.replay._received(self, frame)
+
+    def eof_received(self):
+        """
+        Called when the stand-in server has sent the whole capture.
+        """
+
+        self.replay._finished()
+
+
+class Replay(object):
+    """
+    Replay captured traffic through the framer, parser, and
+    dispatcher.
+    """
+
+    def __init__(self, lines, dispatcher=None, speed=None,
+                 trace_memory=False, loop=None):
+        """
+        Initialize a ``Replay`` instance.
+
+        :param lines: An iterable of tuples of timestamp and raw line,
+                      as returned by ``read_log()``.
+        :param dispatcher: An object with a ``dispatch()`` method,
+                           such as a
+                           ``pirch.proto.irc.dispatch.Dispatcher``.
+                           Defaults to a dispatcher with no handlers,
+                           which measures the parser alone.
+        :param speed: The replay speed relative to the original
+                      timestamps, e.g. 1.0 for real time or 10.0 for
+                      ten times as fast.  If ``None`` or 0, lines are
+                      replayed as fast as possible.
+        :param trace_memory: If ``True`` and ``tracemalloc`` is
+                             available, measure memory growth as
+                             traced allocations.  This is precise but
+                             slows the replay; otherwise, growth in
+                             maximum resident set size is reported.
+        :param loop: The event loop to use.  Defaults to a new loop.
+        """
+
+        self.lines = lines
+        self.dispatcher = dispatcher or dispatch.Dispatcher()
+        self.speed = speed
+        self.trace_memory = trace_memory and tracemalloc is not None
+        self.loop = loop or asyncio.new_event_loop()
+
+        self._count = 0
+        self._messages = 0
+        self._latencies = array.array('d')
+        self._done = None
+
+    def _received(self, conn, frame):
+        """
+        Parse and dispatch a received line.
+
+        :param conn: The client connection.
+        :param frame: The raw line.
+        """
+
+        start = time.time()
+        msg = messages.Message.from_bytes(None, conn, frame)
+        if msg is not None:
+            self.dispatcher.dispatch(msg)
+            self._messages += 1
+        self._latencies.append(time.time() - start)
+        self._count += 1
+
+    def _finished(self):
+        """
+        Called when the capture has been received in full.
+        """
+
+        if not self._done.done():
+            self._done.set_result(None)
+
+    def _memory(self):
+        """
+        Measure current memory use.
+
+        :returns: The memory use, in bytes, or ``None`` if it cannot
+                  be measured.
+        """
+
+        if self.trace_memory:
+            return tracemalloc.get_traced_memory()[0]
+        elif resource is not None:
+            # The maximum resident set size is reported in bytes on
+            # Mac OS X, but in kilobytes elsewhere
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return maxrss if sys.platform == 'darwin' else maxrss * 1024
+        return None
+
+    def run(self):
+        """
+        Run the replay.
+
+        :returns: A ``Report`` describing the results.
+        """
+
+        server_sock, client_sock = socket.socketpair()
+        self._done = asyncio.Future(loop=self.loop)
+
+        if self.trace_memory:
+            tracemalloc.start()
+        mem_start = self._memory()
+        start = time.time()
+
+        try:
+            client_factory = framer.FramerAdaptor.factory(
+                lambda: _ClientProtocol(self), framer.LineFramer())
+            client_transport, _proto = self.loop.run_until_complete(
+                self.loop.create_connection(client_factory,
+                                            sock=client_sock))
+            server_transport, _proto = self.loop.run_until_complete(
+                self.loop.create_connection(lambda: _ServerProtocol(self),
+                                            sock=server_sock))
+            self.loop.run_until_complete(self._done)
+            elapsed = time.time() - start
+
+            mem_end = self._memory()
+            client_transport.close()
+            server_transport.close()
+        finally:
+            if self.trace_memory:
+                tracemalloc.stop()
+
+        return Report(
+            self._count, self._messages, elapsed, sorted(self._latencies),
+            None if mem_start is None else mem_end - mem_start,
+            'bytes traced' if self.trace_memory else 'bytes max RSS')
+
+
+def main(argv=None):
+    """
+    Replay a captured session log and report the results.
+
+    :param argv: The command line arguments.  Defaults to
+                 ``sys.argv[1:]``.
+
+    :returns: The exit status.
+    """
+
+    parser = argparse.ArgumentParser(
+        description='Replay captured IRC traffic through the pirch '
+        'parser and dispatcher.',
+    )
+    parser.add_argument(
+        'log',
+        help='An archive directory or a text log of raw lines, each '
+        'optionally preceded by a timestamp.',
+    )
+    parser.add_argument(
+        '--speed', '-s',
+        type=float,
+        default=0.0,
+        help='Replay speed relative to the captured timestamps; 1 for '
+        'real time, 10 for ten times as fast.  The default, 0, replays '
+        'as fast as possible.',
+    )
+    parser.add_argument(
+        '--trace-memory', '-m',
+        action='store_true',
+        help='Measure memory growth with tracemalloc.  Slows the replay.',
+    )
+    args = parser.parse_args(argv)
+
+    replay = Replay(read_log(args.log), speed=args.speed,
+                    trace_memory=args.trace_memory)
+    try:
+        report = replay.run()
+    finally:
+        replay.loop.close()
+    print(report)
+
+    return 0
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main())
@@ -0,0 +1,286 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import collections
+
+from pirch.proto.irc import messages
+
+
+class ReadQueue(object):
+    """
+    The queue of framed lines received on one connection and awaiting
+    parsing and dispatch.  Attributes ``depth``, ``high_water``,
+    ``processed``, ``dropped``, ``absorbed``, and ``paused`` are
+    available as metrics.
+    """
+
+    def __init__(self, scheduler, conn, dispatch, transport, weight, ctxt,
+                 prefilter=None):
+        """
+        Initialize a ``ReadQueue`` instance.
+
+        :param scheduler: The ``ReadScheduler``.
+        :param conn: The connection, passed to
+                     ``Message.from_bytes()``.
+        :param dispatch: A callable taking each parsed
+                         ``pirch.proto.irc.messages.Message``, e.g.
+                         ``Dispatcher.dispatch``.
+        :param transport: The transport to pause when the queue backs
+                          up, or ``None``.
+        :param weight: The connection's share of each service pass.
+        :param ctxt: The context to pass to ``Message.from_bytes()``.
+        :param prefilter: A callable taking each raw line before it is
+                          parsed, and returning a ``True`` value if it
+                          has consumed the line, or ``None``.
+        """
+
+        self.scheduler = scheduler
+        self.conn = conn
+        self.dispatch = dispatch
+        self.transport = transport
+        self.weight = weight
+        self.ctxt = ctxt
+        self.prefilter = prefilter
+
+        self.high_water = 0
+        self.processed = 0
+        self.dropped = 0
+        self.absorbed = 0
+        self.paused = False
+
+        self._lines = collections.deque()
+        self._active = False
+
+    @property
+    def depth(self):
+        """
+        The number of lines waiting.
+        """
+
+        return len(self._lines)
+
+    def feed(self, frame):
+        """
+        Queue a framed line.  Call this from the protocol's
+        ``frame_received()``.
+
+        :param frame: The raw line, in ``bytes``.
+        """
+
+        sched = self.scheduler
+        lines = self._lines
+        if len(lines) >= sched.max_queue:
+            self.dropped += 1
+            return
+
+        lines.append(frame)
+        depth = len(lines)
+        if depth > self.high_water:
+            self.high_water = depth
+
+        if (depth >= sched.pause_at and not self.paused and
+                self.transport is not None):
+            self.paused = True
+            self.transport.pause_reading()
+
+        if not self._active:
+            self._active = True
+            sched._activate(self)
+
+    def _service(self, lines_quota, bytes_quota):
+        """
+        Parse and dispatch queued lines, up to a quota.
+
+        :param lines_quota: The maximum number of lines to process.
+        :param bytes_quota: The maximum number of bytes to process,
+                            or ``None`` for no limit.
+
+        :returns: A ``True`` value if lines remain queued.
+        """
+
+        lines = self._lines
+        count = 0
+        size = 0
+        while lines and count < lines_quota:
+            if bytes_quota is not None and size >= bytes_quota:
+                break
+
+            frame = lines.popleft()
+            count += 1
+            size += len(frame)
+
+            try:
+                if self.prefilter is not None and self.prefilter(frame):
+                    self.absorbed += 1
+                    continue
+
+                msg = messages.Message.from_bytes(self.ctxt, self.conn,
+                                                  frame)
+                if msg is not None:
+                    self.dispatch(msg)
+            except Exception as exc:
+                self.scheduler.loop.call_exception_handler({
+                    'message': 'error dispatching line %r' % (frame,),
+                    'exception': exc,
+                })
+
+        self.processed += count
+
+        if (self.paused and len(lines) <= self.scheduler.resume_at and
+                self.transport is not None):
+            self.paused = False
+            self.transport.resume_reading()
+
+        self._active = bool(lines)
+        return self._active
+
+
+class ReadScheduler(object):
+    """
+    Share the parser and dispatcher fairly among connections.  Framed
+    lines are queued per connection, and the queues are serviced by
+    weighted round-robin: in each pass, which runs once per event
+    loop iteration, each connection may have up to its weight times
+    the budget of lines (and, optionally, bytes) processed before the
+    next connection is serviced.  A connection whose queue backs up
+    has its transport's reading paused until the queue drains.
+
+    Each connection's protocol passes its framed lines to
+    ``ReadQueue.feed()`` in place of parsing and dispatching them.
+    """
+
+    def __init__(self, loop, budget=64, budget_bytes=None, max_queue=8192,
+                 pause_at=1024, resume_at=None):
+        """
+        Initialize a ``ReadScheduler`` instance.
+
+        :param loop: The event loop.
+        :param budget: The number of lines per unit of weight to
+                       process for each connection in each pass.
+        :param budget_bytes: The number of bytes per unit of weight to
+                             process for each connection in each
+                             pass, or ``None`` for no limit.
+        :param max_queue: The maximum number of lines to queue for a
+                          connection.  Lines beyond this, which can
+                          only arrive when a single read carries many
+                          lines, are dropped.
+        :param pause_at: The queue depth at which to pause reading.
+        :param resume_at: The queue depth at which to resume reading.
+                          Defaults to half of ``pause_at``.
+        """
+
+        self.loop = loop
+        self.budget = budget
+        self.budget_bytes = budget_bytes
+        self.max_queue = max_queue
+        self.pause_at = pause_at
+        self.resume_at = pause_at // 2 if resume_at is None else resume_at
+
+        self.queues = []
+
+        self._active = collections.deque()
+        self._scheduled = False
+
+    def register(self, conn, dispatch, transport=None, weight=1, ctxt=None,
+                 prefilter=None):
+        """
+        Register a connection.
+
+        :param conn: The connection, passed to
+                     ``Message.from_bytes()``.
+        :param dispatch: A callable taking each parsed
+                         ``pirch.proto.irc.messages.Message``.
+        :param transport: The transport to pause when the queue backs
+                          up.
+        :param weight: The connection's share of each pass, relative
+                       to the other connections.
+        :param ctxt: The context to pass to ``Message.from_bytes()``.
+        :param prefilter: A callable taking each raw line before it is
+                          parsed, and returning a ``True`` value if it
+                          has consumed the line, e.g.
+                          ``pirch.proto.irc.netsplit.BurstCollapser``'s
+                          ``feed()``.
+
+        :returns: The ``ReadQueue`` for the connection.
+        """
+
+        queue = ReadQueue(self, conn, dispatch, transport, weight, ctxt,
+                          prefilter)
+        self.queues.append(queue)
+        return queue
+
+    def unregister(self, queue):
+        """
+        Unregister a connection, discarding any queued lines.
+
+        :param queue: The connection's ``ReadQueue``.
+        """
+
+        if queue in self.queues:
+            self.queues.remove(queue)
+        queue._lines.clear()
+        if queue in self._active:
+            self._active.remove(queue)
+        queue._active = False
+
+    def depths(self):
+        """
+        Report the queue depths.
+
+        :returns: A dictionary mapping each connection to the number
+                  of lines queued for it.
+        """
+
+        return {queue.conn: queue.depth for queue in self.queues}
+
+    @property
+    def backlog(self):
+        """
+        The total number of lines queued.
+        """
+
+        return sum(queue.depth for queue in self._active)
+
+    def _activate(self, queue):
+        """
+        Add a queue to the rotation.
+
+        :param queue: The ``ReadQueue``, which has lines waiting.
+        """
+
+        self._active.append(queue)
+        if not self._scheduled:
+            self._scheduled = True
+            self.loop.call_soon(self._run)
+
+    def _run(self):
+        """
+        Make one pass over the queues with lines waiting.
+        """
+
+        self._scheduled = False
+
+        active = self._active
+        for _i in range(len(active)):
+            queue = active.popleft()
+            bytes_quota = (None if self.budget_bytes is None
+                           else self.budget_bytes * queue.weight)
+            if queue._service(self.budget * queue.weight, bytes_quota):
+                active.append(queue)
+
+        if active and not self._scheduled:
+            self._scheduled = True
+            self.loop.call_soon(self._run)
@@ -0,0 +1,281 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import array
+import collections
+import time
+
+from pirch.proto.irc import archive
+from pirch.proto.irc import isupport
+
+
+# The bytes of bookkeeping kept for each line slot: a timestamp, a
+# start offset, and a length
+_slot_size = (array.array('d').itemsize + 2 * array.array('I').itemsize)
+
+
+class Ring(object):
+    """
+    A fixed-capacity ring of raw lines and their timestamps.  Line
+    data is kept in a single preallocated ``bytearray``, and the
+    timestamp, offset, and length of each line in preallocated arrays;
+    when either fills, the oldest lines are overwritten.  A ``Ring``
+    holds no references to connections or contexts.
+    """
+
+    __slots__ = ('capacity', '_data', '_times', '_starts', '_lengths',
+                 '_first', '_count', '_used')
+
+    def __init__(self, capacity, max_lines):
+        """
+        Initialize a ``Ring`` instance.
+
+        :param capacity: The number of bytes of line data to retain.
+        :param max_lines: The maximum number of lines to retain.
+        """
+
+        self.capacity = capacity
+        self._data = bytearray(capacity)
+        self._times = array.array('d', [0.0]) * max_lines
+        self._starts = array.array('I', [0]) * max_lines
+        self._lengths = array.array('I', [0]) * max_lines
+
+        self._first = 0
+        self._count = 0
+        self._used = 0
+
+    def __len__(self):
+        """
+        Determine the number of lines in the ring.
+
+        :returns: The number of lines.
+        """
+
+        return self._count
+
+    @property
+    def size(self):
+        """
+        The total memory, in bytes, preallocated for the ring.
+        """
+
+        return self.capacity + len(self._times) * _slot_size
+
+    def append(self, timestamp, raw):
+        """
+        Add a line to the ring, overwriting the oldest lines as
+        required.  Lines longer than the capacity are truncated.
+
+        :param timestamp: The time at which the line was received.
+        :param raw: The raw line, in ``bytes``.
+        """
+
+        capacity = self.capacity
+        slots = len(self._times)
+        if len(raw) > capacity:
+            raw = raw[:capacity]
+        length = len(raw)
+
+        # Make room
+        while self._count and (self._count == slots or
+                               self._used + length > capacity):
+            self._used -= self._lengths[self._first]
+            self._first = (self._first + 1) % slots
+            self._count -= 1
+
+        # Find where the line goes
+        if self._count:
+            last = (self._first + self._count - 1) % slots
+            pos = (self._starts[last] + self._lengths[last]) % capacity
+        else:
+            self._first = 0
+            pos = 0
+
+        # Copy it in, wrapping around the end of the buffer
+        end = pos + length
+        if end <= capacity:
+            self._data[pos:end] = raw
+        else:
+            split = capacity - pos
+            self._data[pos:] = raw[:split]
+            self._data[:end - capacity] = raw[split:]
+
+        slot = (self._first + self._count) % slots
+        self._times[slot] = timestamp
+        self._starts[slot] = pos
+        self._lengths[slot] = length
+        self._count += 1
+        self._used += length
+
+    def _read(self, slot):
+        """
+        Retrieve the line in a slot.
+
+        :param slot: The slot number.
+
+        :returns: The raw line, in ``bytes``.
+        """
+
+        pos = self._starts[slot]
+        end = pos + self._lengths[slot]
+        if end <= self.capacity:
+            return bytes(self._data[pos:end])
+        return bytes(self._data[pos:] + self._data[:end - self.capacity])
+
+    def lines(self, count=None):
+        """
+        Retrieve lines from the ring.
+
+        :param count: The number of most recent lines to retrieve.  If
+                      ``None``, all lines are retrieved.
+
+        :returns: A list of ``pirch.proto.irc.archive.ArchivedMessage``
+                  objects, oldest first.  Each constructs its
+                  ``Message`` only when required.
+        """
+
+        skip = 0 if count is None else max(self._count - count, 0)
+        slots = len(self._times)
+
+        result = []
+        for i in range(skip, self._count):
+            slot = (self._first + i) % slots
+            result.append(archive.ArchivedMessage(self._times[slot],
+                                                  self._read(slot)))
+
+        return result
+
+
+class Scrollback(object):
+    """
+    Scrollback for the targets of a connection, keyed by casemapped
+    target name.  Each target's lines are kept in a ``Ring``; when the
+    memory preallocated for all rings exceeds the budget, the rings
+    of the least recently used targets are discarded.
+    """
+
+    def __init__(self, isup=None, capacity=16 * 1024,
+                 max_lines=256, budget=64 * 1024 * 1024):
+        """
+        Initialize a ``Scrollback`` instance.
+
+        :param isup: The ``pirch.proto.irc.isupport.ISupport`` for the
+                     connection, whose casemapping is applied to
+                     target names.  Defaults to the RFC 1459
+                     parameters.
+        :param capacity: The number of bytes of line data to retain
+                         for each target.
+        :param max_lines: The maximum number of lines to retain for
+                          each target.
+        :param budget: The maximum total memory, in bytes, to
+                       allocate for all targets.  The most recently
+                       used target is always retained.
+        """
+
+        self.isupport = isupport.ISupport() if isup is None else isup
+        self.capacity = capacity
+        self.max_lines = max_lines
+        self.budget = budget
+        self.size = 0
+
+        # Ordered from least to most recently used
+        self._rings = collections.OrderedDict()
+
+    def __len__(self):
+        """
+        Determine the number of targets with scrollback.
+
+        :returns: The number of targets.
+        """
+
+        return len(self._rings)
+
+    def __contains__(self, target):
+        """
+        Determine whether a target has scrollback.
+
+        :param target: The target name, in ``bytes``.
+
+        :returns: A ``True`` value if the target has scrollback,
+                  ``False`` otherwise.
+        """
+
+        return self.isupport.casemap(target) in self._rings
+
+    def _touch(self, key):
+        """
+        Mark a target as most recently used.
+
+        :param key: The casemapped target name.
+
+        :returns: The target's ``Ring``, or ``None``.
+        """
+
+        ring = self._rings.pop(key, None)
+        if ring is not None:
+            self._rings[key] = ring
+        return ring
+
+    def append(self, target, raw, timestamp=None):
+        """
+        Add a line to the scrollback of a target.
+
+        :param target: The target name, in ``bytes``.
+        :param raw: The raw IRC protocol message, in ``bytes``,
+                    without the line terminator.
+        :param timestamp: The time at which the message was received.
+                          Defaults to the current time.
+        """
+
+        key = self.isupport.casemap(target)
+        ring = self._touch(key)
+        if ring is None:
+            ring = Ring(self.capacity, self.max_lines)
+            self._rings[key] = ring
+            self.size += ring.size
+
+            # Discard idle targets to stay within the budget
+            while self.size > self.budget and len(self._rings) > 1:
+                _key, old = self._rings.popitem(last=False)
+                self.size -= old.size
+
+        ring.append(time.time() if timestamp is None else timestamp, raw)
+
+    def lines(self, target, count=None):
+        """
+        Retrieve the scrollback of a target.
+
+        :param target: The target name, in ``bytes``.
+        :param count: The number of most recent lines to retrieve.  If
+                      ``None``, all lines are retrieved.
+
+        :returns: A list of ``pirch.proto.irc.archive.ArchivedMessage``
+                  objects, oldest first.
+        """
+
+        ring = self._touch(self.isupport.casemap(target))
+        return [] if ring is None else ring.lines(count)
+
+    def discard(self, target):
+        """
+        Discard the scrollback of a target, e.g. on leaving a channel.
+
+        :param target: The target name, in ``bytes``.
+        """
+
+        ring = self._rings.pop(self.isupport.casemap(target), None)
+        if ring is not None:
+            self.size -= ring.size
@@ -0,0 +1,531 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import bisect
+import re
+
+from pirch.proto.irc import messages
+from pirch import util
+
+
+# Commands whose text argument, the second, is indexed
+_indexed_commands = frozenset([b'PRIVMSG', b'NOTICE', b'TOPIC'])
+
+# Tokens are runs of ASCII alphanumerics or non-ASCII bytes; the
+# latter keeps UTF-8 encoded words intact
+_token_re = re.compile(b'[0-9A-Za-z\x80-\xff]+')
+
+# Query clauses are either quoted phrases or bare words
+_clause_re = re.compile(b'"([^"]*)"|(\\S+)')
+
+
+def tokenize(text):
+    """
+    Split text into tokens.  Tokens are folded to lower case.
+
+    :param text: The text to tokenize, in ``bytes``.
+
+    :returns: A list of the tokens, in order.
+    """
+
+    return _token_re.findall(text.lower())
+
+
+def _encode_varint(value, buf):
+    """
+    Append a variable-length encoding of a non-negative integer to a
+    buffer.  Seven bits are encoded per byte, least significant
+    first, with the high bit set on all but the last byte.
+
+    :param value: The integer to encode.
+    :param buf: The ``bytearray`` to append to.
+    """
+
+    while value >= 0x80:
+        buf.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def _decode_varints(data):
+    """
+    Decode a sequence of variable-length integers.
+
+    :param data: The ``bytearray`` containing the encoded integers.
+
+    :returns: An iterator over the decoded integers.
+    """
+
+    value = 0
+    shift = 0
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            yield value
+            value = 0
+            shift = 0
+
+
+def _encode_postings(postings):
+    """
+    Compress a postings list.  Document identifiers and positions are
+    delta-encoded, then written as variable-length integers.
+
+    :param postings: A list of tuples of document identifier and
+                     list of positions, in ascending document order.
+
+    :returns: The compressed postings, as a ``bytearray``.
+    """
+
+    buf = bytearray()
+    last_doc = 0
+    for doc, positions in postings:
+        _encode_varint(doc - last_doc, buf)
+        _encode_varint(len(positions), buf)
+        last_pos = 0
+        for pos in positions:
+            _encode_varint(pos - last_pos, buf)
+            last_pos = pos
+        last_doc = doc
+
+    return buf
+
+
+def _decode_postings(data):
+    """
+    Decompress a postings list.
+
+    :param data: The compressed postings, as produced by
+                 ``_encode_postings()``.
+
+    :returns: An iterator over tuples of document identifier and list
+              of positions.
+    """
+
+    values = _decode_varints(data)
+    doc = 0
+    for delta in values:
+        doc += delta
+        positions = []
+        pos = 0
+        for _i in range(next(values)):
+            pos += next(values)
+            positions.append(pos)
+        yield doc, positions
+
+
+def _add_postings(buf, doc, text):
+    """
+    Tokenize a document and add its postings to a buffer.
+
+    :param buf: A dictionary mapping each term to a list of tuples of
+                document identifier and list of positions.
+    :param doc: The integer document identifier.
+    :param text: The text of the document, in ``bytes``.
+    """
+
+    positions = {}
+    for pos, token in enumerate(tokenize(text)):
+        positions.setdefault(token, []).append(pos)
+
+    for token, token_pos in positions.items():
+        buf.setdefault(token, []).append((doc, token_pos))
+
+
+def line_text(line):
+    """
+    Extract the indexed text from a raw line.  Only the text argument
+    of PRIVMSG, NOTICE, and TOPIC messages is indexed.
+
+    :param line: The raw IRC protocol message, in ``bytes``.
+
+    :returns: The text, in ``bytes``, or ``None`` if the line is not
+              indexed.
+    """
+
+    if line[:1] == b'@':
+        line = line.partition(b' ')[2]
+
+    parts = list(messages._argsplit(line))
+    if parts and parts[0][:1] == b':':
+        del parts[0]
+
+    if len(parts) < 3 or parts[0].upper() not in _indexed_commands:
+        return None
+
+    return parts[2]
+
+
+def build_segment(docs):
+    """
+    Build a segment directly from a sequence of documents, without
+    going through a ``SearchIndex``.  The result may be added to an
+    index with ``SearchIndex.add_segment()``.
+
+    :param docs: An iterable of tuples of integer document identifier
+                 and text, in ``bytes``, in ascending document order.
+
+    :returns: A ``Segment`` instance.
+    """
+
+    buf = {}
+    count = 0
+    last_doc = None
+    for doc, text in docs:
+        _add_postings(buf, doc, text)
+        count += 1
+        last_doc = doc
+
+    return Segment({term: _encode_postings(postings)
+                    for term, postings in buf.items()}, count, last_doc)
+
+
+class Segment(object):
+    """
+    An immutable segment of the inverted index.  Postings lists are
+    stored compressed, and the sorted term list supports prefix
+    queries.
+    """
+
+    def __init__(self, postings, docs, last_doc=None):
+        """
+        Initialize a ``Segment`` instance.
+
+        :param postings: A dictionary mapping each term to its
+                         compressed postings list.
+        :param docs: The number of documents in the segment.
+        :param last_doc: The identifier of the last document in the
+                         segment, or ``None`` if it is empty.
+        """
+
+        self.postings = postings
+        self.terms = sorted(postings)
+        self.docs = docs
+        self.last_doc = last_doc
+
+    def lookup(self, term):
+        """
+        Look up the postings for a term.
+
+        :param term: The term to look up.
+
+        :returns: An iterator over tuples of document identifier and
+                  list of positions.
+        """
+
+        data = self.postings.get(term)
+        return _decode_postings(data) if data is not None else iter(())
+
+    def expand(self, prefix):
+        """
+        Find the terms beginning with a prefix.
+
+        :param prefix: The prefix.
+
+        :returns: A list of the matching terms.
+        """
+
+        start = bisect.bisect_left(self.terms, prefix)
+        end = start
+        while end < len(self.terms) and self.terms[end].startswith(prefix):
+            end += 1
+
+        return self.terms[start:end]
+
+
+class SearchIndex(object):
+    """
+    A tokenizing inverted index over the trailing arguments of
+    messages.  Documents are added to an in-memory buffer, which is
+    frozen into a compressed ``Segment`` once it reaches
+    ``buffer_docs`` documents.  Whenever ``merge_factor`` segments of
+    similar size accumulate, they are merged into one, keeping the
+    number of segments logarithmic in the number of documents.
+
+    Queries consist of bare words, which must all be present; quoted
+    phrases, whose words must appear consecutively; and words ending
+    in "*", which match any word with that prefix.
+    """
+
+    def __init__(self, buffer_docs=1024, merge_factor=4):
+        """
+        Initialize a ``SearchIndex`` instance.
+
+        :param buffer_docs: The number of documents to accumulate in
+                            memory before freezing a segment.
+        :param merge_factor: The number of similarly-sized segments
+                             which trigger a merge.
+        """
+
+        self.buffer_docs = buffer_docs
+        self.merge_factor = merge_factor
+        self.segments = []
+
+        self._buffer = {}
+        self._buffer_docs = 0
+        self._last_doc = -1
+
+    def add(self, doc, text):
+        """
+        Add a document to the index.
+
+        :param doc: The integer document identifier.  Identifiers must
+                    be added in ascending order.
+        :param text: The text of the document, in ``bytes``.
+        """
+
+        if doc <= self._last_doc:
+            raise ValueError('document identifiers must be ascending')
+        self._last_doc = doc
+
+        _add_postings(self._buffer, doc, text)
+
+        self._buffer_docs += 1
+        if self._buffer_docs >= self.buffer_docs:
+            self.flush()
+
+    def index_message(self, doc, msg):
+        """
+        Add a message to the index.  Only the text argument of
+        PRIVMSG, NOTICE, and TOPIC messages is indexed; it is taken
+        from the already-split message arguments.  A message without
+        text, such as a TOPIC query, is not indexed.
+
+        :param doc: The integer document identifier.
+        :param msg: The ``pirch.proto.irc.messages.Message`` to
+                    index.
+
+        :returns: A ``True`` value if the message was indexed,
+                  ``False`` otherwise.
+        """
+
+        if (msg.command.cmd.upper() not in _indexed_commands or
+                len(msg.args) < 2):
+            return False
+
+        text = msg.args[1]
+        if text is util.unset:
+            return False
+
+        self.add(doc, text)
+        return True
+
+    def index_line(self, doc, line):
+        """
+        Add a raw line to the index, under the same rules as
+        ``index_message()``, without constructing a ``Message``.
+
+        :param doc: The integer document identifier.
+        :param line: The raw IRC protocol message, in ``bytes``.
+
+        :returns: A ``True`` value if the line was indexed, ``False``
+                  otherwise.
+        """
+
+        text = line_text(line)
+        if text is None:
+            return False
+
+        self.add(doc, text)
+        return True
+
+    def add_segment(self, segment):
+        """
+        Add a segment built by ``build_segment()``, e.g. one loaded
+        from disk, to the index.  The in-memory buffer is flushed
+        first.  The segment is not merged with the others.
+
+        :param segment: The ``Segment``.  Its documents must follow
+                        those already in the index.
+        """
+
+        if not segment.docs:
+            return
+        if segment.last_doc <= self._last_doc:
+            raise ValueError('document identifiers must be ascending')
+
+        self.flush()
+        self.segments.append(segment)
+        self._last_doc = segment.last_doc
+
+    def flush(self):
+        """
+        Freeze the in-memory buffer into a segment, merging segments
+        as required.
+        """
+
+        if not self._buffer_docs:
+            return
+
+        self.segments.append(Segment(
+            {term: _encode_postings(postings)
+             for term, postings in self._buffer.items()},
+            self._buffer_docs, self._last_doc))
+        self._buffer = {}
+        self._buffer_docs = 0
+
+        self._maybe_merge()
+
+    def _tier(self, segment):
+        """
+        Compute the size tier of a segment.
+
+        :param segment: The ``Segment``.
+
+        :returns: The tier; segments in the same tier are within a
+                  factor of ``merge_factor`` of each other in size.
+        """
+
+        tier = 0
+        docs = segment.docs // self.buffer_docs
+        while docs >= self.merge_factor:
+            docs //= self.merge_factor
+            tier += 1
+
+        return tier
+
+    def _maybe_merge(self):
+        """
+        Merge the most recent segments while the last
+        ``merge_factor`` segments share a tier.  Merging always
+        combines adjacent segments, so documents stay in order.
+        """
+
+        while len(self.segments) >= self.merge_factor:
+            tail = self.segments[-self.merge_factor:]
+            tier = self._tier(tail[0])
+            if any(self._tier(seg) != tier for seg in tail[1:]):
+                break
+
+            self.segments[-self.merge_factor:] = [self._merge(tail)]
+
+    def _merge(self, segments):
+        """
+        Merge several segments into one.
+
+        :param segments: A list of ``Segment`` instances, in document
+                         order.
+
+        :returns: The merged ``Segment``.
+        """
+
+        terms = set()
+        for seg in segments:
+            terms.update(seg.terms)
+
+        postings = {}
+        for term in terms:
+            merged = []
+            for seg in segments:
+                merged.extend(seg.lookup(term))
+            postings[term] = _encode_postings(merged)
+
+        return Segment(postings, sum(seg.docs for seg in segments),
+                       segments[-1].last_doc)
+
+    def _term_postings(self, term):
+        """
+        Gather the postings for a term across the index.
+
+        :param term: The term.
+
+        :returns: A dictionary mapping document identifiers to lists
+                  of positions.
+        """
+
+        result = {}
+        for seg in self.segments:
+            result.update(seg.lookup(term))
+        result.update(self._buffer.get(term, ()))
+
+        return result
+
+    def _prefix_docs(self, prefix):
+        """
+        Find the documents containing a word with a given prefix.
+
+        :param prefix: The prefix.
+
+        :returns: A set of document identifiers.
+        """
+
+        terms = set()
+        for seg in self.segments:
+            terms.update(seg.expand(prefix))
+        terms.update(t for t in self._buffer if t.startswith(prefix))
+
+        result = set()
+        for term in terms:
+            result.update(self._term_postings(term))
+
+        return result
+
+    def _phrase_docs(self, words):
+        """
+        Find the documents containing a phrase.
+
+        :param words: The list of words in the phrase.
+
+        :returns: A set of document identifiers.
+        """
+
+        postings = [self._term_postings(word) for word in words]
+        docs = set(postings[0])
+        for post in postings[1:]:
+            docs.intersection_update(post)
+
+        result = set()
+        for doc in docs:
+            starts = set(postings[0][doc])
+            for offset, post in enumerate(postings[1:], 1):
+                starts.intersection_update(p - offset for p in post[doc])
+                if not starts:
+                    break
+            else:
+                result.add(doc)
+
+        return result
+
+    def search(self, query):
+        """
+        Search the index.
+
+        :param query: The query, in ``bytes``.
+
+        :returns: A sorted list of the identifiers of the matching
+                  documents.
+        """
+
+        result = None
+        for phrase, word in _clause_re.findall(query):
+            if word.endswith(b'*'):
+                prefix = tokenize(word[:-1])
+                if len(prefix) != 1:
+                    continue
+                docs = self._prefix_docs(prefix[0])
+            else:
+                words = tokenize(phrase or word)
+                if not words:
+                    continue
+                docs = self._phrase_docs(words)
+
+            result = docs if result is None else result & docs
+            if not result:
+                break
+
+        return sorted(result or ())
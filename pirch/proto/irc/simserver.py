@@ -0,0 +1,658 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+"""
+A minimal stand-in IRC server for throughput and soak testing.
+
+The ``SimServer`` accepts client connections on the local host,
+handles enough of registration, JOIN, PART, PRIVMSG, NOTICE, PING,
+and QUIT to look like a server to a client, and enforces the
+traditional flood penalty.  It also populates its channels with
+simulated users, which can be made to chatter, split from and rejoin
+the network, and trigger numeric bursts.  All lines are encoded using
+``pirch.proto.irc.messages.Message``.
+"""
+
+import random
+import time
+
+try:
+    import asyncio
+except ImportError:  # pragma: no cover
+    import trollius as asyncio
+
+import framer
+
+from pirch.proto.irc import casemap
+from pirch.proto.irc import commands
+from pirch.proto.irc import messages
+
+
+# The server's casemapping, matching the advertised CASEMAPPING
+_lower = casemap.bytes_mappers['rfc1459']
+
+
+# The ISUPPORT tokens advertised by the server
+_isupport = [
+    b'CASEMAPPING=rfc1459',
+    b'CHANTYPES=#&',
+    b'PREFIX=(ov)@+',
+    b'CHANMODES=b,k,l,imnpst',
+    b'NICKLEN=30',
+    b'MODES=4',
+    b'TARGMAX=JOIN:,PART:,PRIVMSG:4,NOTICE:4,WHOIS:1',
+    b'MONITOR=100',
+]
+
+
+class Source(object):
+    """
+    The origin of a line sent by the server: the server itself, a
+    connected client, or a simulated user.
+    """
+
+    __slots__ = ('nick', 'user', 'host')
+
+    def __init__(self, nick, user=None, host=None):
+        """
+        Initialize a ``Source`` instance.
+
+        :param nick: The nickname, or the server name.
+        :param user: The user name.  If ``None``, the source is a
+                     server.
+        :param host: The host name.
+        """
+
+        self.nick = nick
+        self.user = user
+        self.host = host
+
+    def to_bytes(self):
+        """
+        Generate the ``bytes`` form of the source, for use as a message
+        prefix.
+
+        :returns: The ``bytes`` form of the source.
+        """
+
+        if self.user is None:
+            return self.nick
+        return b''.join([self.nick, b'!', self.user, b'@', self.host])
+
+
+class SimClient(framer.FramedProtocol):
+    """
+    The server side of a client connection.  Also serves as the
+    connection object when parsing the lines the client sends.
+    """
+
+    def __init__(self, server):
+        """
+        Initialize a ``SimClient`` instance.
+
+        :param server: The ``SimServer``.
+        """
+
+        self.server = server
+        self.transport = None
+        self.raw_transport = None
+        self.source = None
+        self.seen_user = False
+        self.registered = False
+        self.channels = set()
+
+        # Flood control state
+        self.flood_timer = 0.0
+        self.throttled = 0
+
+    def connection_made(self, transport):
+        """
+        Called when a client connects.
+
+        :param transport: The framed transport.
+        """
+
+        self.transport = transport
+        self.raw_transport = transport.get_extra_info('transport')
+        self.source = Source(None, b'user', b'127.0.0.1')
+        self.server.clients.add(self)
+
+    def connection_lost(self, exc):
+        """
+        Called when the client disconnects.
+
+        :param exc: The exception which caused the disconnect, if any.
+        """
+
+        self.server._disconnect(self)
+
+    def frame_received(self, frame):
+        """
+        Called when a line is received.  Each line adds the flood
+        penalty to the client's message timer; if the timer gets too
+        far ahead of the current time, reading is paused until it
+        catches up.
+
+        :param frame: The raw line.
+        """
+
+        server = self.server
+        now = time.time()
+        self.flood_timer = max(self.flood_timer, now) + server.flood_penalty
+
+        msg = messages.Message.from_bytes(None, self, frame)
+        if msg is not None:
+            server._handle(self, msg)
+
+        excess = self.flood_timer - now - server.flood_burst
+        if excess > 0 and self.transport is not None:
+            self.throttled += 1
+            self.transport.pause_reading()
+            server.loop.call_later(excess, self._unthrottle)
+
+    def _unthrottle(self):
+        """
+        Resume reading once the message timer has caught up.
+        """
+
+        if self.transport is not None and self.server.running:
+            self.transport.resume_reading()
+
+    def get_entity(self, raw):
+        """
+        Look up an entity named in a client message.
+
+        :param raw: The ``bytes`` form of the entity.
+
+        :returns: A ``Source`` instance.
+        """
+
+        return Source(raw.split(b'!', 1)[0])
+
+    @property
+    def peer(self):
+        """
+        The origin of lines sent by the client without a prefix.
+        """
+
+        return self.source
+
+    def write(self, data):
+        """
+        Write pre-encoded data to the client.
+
+        :param data: The ``bytes`` to write, including line endings.
+        """
+
+        if self.raw_transport is not None:
+            self.raw_transport.write(data)
+
+
+class SimServer(object):
+    """
+    A minimal stand-in IRC server.  Also serves as the connection
+    object for the ``Message`` instances it encodes.
+    """
+
+    # The server never omits the prefix
+    me = None
+
+    def __init__(self, loop, name=b'sim.server', channels=10,
+                 users_per_channel=20, flood_penalty=2.0, flood_burst=10.0,
+                 seed=None):
+        """
+        Initialize a ``SimServer`` instance.
+
+        :param loop: The event loop.
+        :param name: The server name.
+        :param channels: The number of channels to populate with
+                         simulated users.
+        :param users_per_channel: The number of simulated users per
+                                  channel.
+        :param flood_penalty: The number of seconds added to a client's
+                              message timer for each line it sends.
+                              Set to 0 to disable flood control.
+        :param flood_burst: The number of seconds the message timer
+                            may run ahead of the current time before
+                            the client is throttled.
+        :param seed: An optional seed for the random number generator
+                     driving the simulation.
+        """
+
+        self.loop = loop
+        self.source = Source(name)
+        self.flood_penalty = flood_penalty
+        self.flood_burst = flood_burst
+        self.random = random.Random(seed)
+        self.running = False
+        self.server = None
+
+        self.clients = set()
+        self.nicks = {}
+        self.members = {}
+        self.simulated = {}
+        self.split = {}
+
+        for i in range(channels):
+            chan = b'#sim' + str(i).encode('ascii')
+            users = [Source(b'u' + str(i).encode('ascii') + b'_' +
+                            str(j).encode('ascii'), b'sim', b'sim.host')
+                     for j in range(users_per_channel)]
+            self.members[chan] = set()
+            self.simulated[chan] = users
+
+        self._chatter = None
+
+    def start(self, host='127.0.0.1', port=0):
+        """
+        Start listening for connections.  Must be called while the
+        event loop is not running.
+
+        :param host: The address to listen on.
+        :param port: The port to listen on.  Defaults to an ephemeral
+                     port.
+
+        :returns: A tuple of the address and port being listened on.
+        """
+
+        self.server = self.loop.run_until_complete(self.loop.create_server(
+            framer.FramerAdaptor.factory(lambda: SimClient(self),
+                                         framer.LineFramer()),
+            host, port))
+        self.running = True
+
+        return self.server.sockets[0].getsockname()[:2]
+
+    def stop(self):
+        """
+        Stop the server and disconnect all clients.
+        """
+
+        self.running = False
+        self.chatter(0)
+        if self.server is not None:
+            self.server.close()
+        for client in list(self.clients):
+            if client.transport is not None:
+                client.transport.close()
+
+    def encode(self, source, cmd, *args):
+        """
+        Encode a line.
+
+        :param source: The ``Source`` of the line.
+        :param cmd: The ``bytes`` for the command.
+        :param args: The ``bytes`` arguments.
+
+        :returns: The encoded line, including the line ending.
+        """
+
+        command = commands.get_command(cmd)
+        msg = messages.Message(
+            None, self, source, command,
+            messages.Arguments(None, None, list(args), command))
+
+        return msg.msg + b'\r\n'
+
+    def send(self, client, cmd, *args):
+        """
+        Send a line from the server to a client.
+
+        :param client: The ``SimClient``.
+        :param cmd: The ``bytes`` for the command.
+        :param args: The ``bytes`` arguments.
+        """
+
+        client.write(self.encode(self.source, cmd, *args))
+
+    def broadcast(self, chan, data, exclude=None):
+        """
+        Send an encoded line to the clients in a channel.
+
+        :param chan: The channel name.
+        :param data: The encoded line.
+        :param exclude: An optional client not to send the line to.
+        """
+
+        for client in self.members.get(chan, ()):
+            if client is not exclude:
+                client.write(data)
+
+    def _handle(self, client, msg):
+        """
+        Handle a message from a client.
+
+        :param client: The ``SimClient``.
+        :param msg: The ``pirch.proto.irc.messages.Message``.
+        """
+
+        handler = getattr(self, '_cmd_' + msg.command.cmd.decode(
+            'ascii', 'replace').upper(), None)
+        if handler is not None:
+            handler(client, list(msg.args))
+        elif client.registered:
+            self.send(client, b'421', client.source.nick, msg.command.cmd,
+                      b'Unknown command')
+
+    def _cmd_NICK(self, client, args):
+        """
+        Handle the NICK command.
+
+        :param client: The ``SimClient``.
+        :param args: The list of arguments.
+        """
+
+        if not args:
+            return
+        nick = args[0]
+        key = _lower(nick)
+        if key in self.nicks and self.nicks[key] is not client:
+            self.send(client, b'433', client.source.nick or b'*', nick,
+                      b'Nickname is already in use')
+            return
+
+        old = client.source.nick
+        if old is not None:
+            del self.nicks[_lower(old)]
+        self.nicks[key] = client
+
+        if client.registered:
+            data = self.encode(client.source, b'NICK', nick)
+            client.write(data)
+            for chan in client.channels:
+                self.broadcast(chan, data, client)
+        client.source.nick = nick
+        self._maybe_register(client)
+
+    def _cmd_USER(self, client, args):
+        """
+        Handle the USER command.
+
+        :param client: The ``SimClient``.
+        :param args: The list of arguments.
+        """
+
+        if args:
+            client.source.user = args[0]
+        client.seen_user = True
+        self._maybe_register(client)
+
+    def _maybe_register(self, client):
+        """
+        Complete registration once both NICK and USER have been
+        received, sending the welcome numeric burst.
+
+        :param client: The ``SimClient``.
+        """
+
+        if (client.registered or client.source.nick is None or
+                not client.seen_user):
+            return
+
+        client.registered = True
+        nick = client.source.nick
+        name = self.source.nick
+        self.send(client, b'001', nick, b'Welcome to the simulated network')
+        self.send(client, b'002', nick, b'Your host is ' + name)
+        self.send(client, b'003', nick, b'This server was created today')
+        self.send(client, b'004', nick, name, b'sim-1.0', b'iow',
+                  b'biklmnopstv')
+        self.send(client, b'005', nick, *(_isupport +
+                                          [b'are supported by this server']))
+        self.send(client, b'375', nick, b'- ' + name + b' Message of the day')
+        self.send(client, b'372', nick, b'- Simulated server')
+        self.send(client, b'376', nick, b'End of MOTD command')
+
+    def _cmd_PING(self, client, args):
+        """
+        Handle the PING command.
+
+        :param client: The ``SimClient``.
+        :param args: The list of arguments.
+        """
+
+        self.send(client, b'PONG', self.source.nick, *args[:1])
+
+    def _cmd_JOIN(self, client, args):
+        """
+        Handle the JOIN command.
+
+        :param client: The ``SimClient``.
+        :param args: The list of arguments.
+        """
+
+        if not client.registered or not args:
+            return
+
+        for chan in args[0].split(b','):
+            chan = _lower(chan)
+            if chan in client.channels:
+                continue
+
+            members = self.members.setdefault(chan, set())
+            members.add(client)
+            client.channels.add(chan)
+            self.broadcast(chan, self.encode(client.source, b'JOIN', chan))
+            self._names(client, chan)
+
+    def _names(self, client, chan):
+        """
+        Send the names list for a channel.
+
+        :param client: The ``SimClient``.
+        :param chan: The channel name.
+        """
+
+        nick = client.source.nick
+        names = [c.source.nick for c in self.members.get(chan, ())]
+        names.extend(u.nick for u in self.simulated.get(chan, ()))
+
+        # Pack the names into lines of reasonable length
+        line = []
+        length = 0
+        for name in names:
+            if length + len(name) > 400:
+                self.send(client, b'353', nick, b'=', chan, b' '.join(line))
+                line = []
+                length = 0
+            line.append(name)
+            length += len(name) + 1
+        if line:
+            self.send(client, b'353', nick, b'=', chan, b' '.join(line))
+        self.send(client, b'366', nick, chan, b'End of NAMES list')
+
+    def _cmd_PART(self, client, args):
+        """
+        Handle the PART command.
+
+        :param client: The ``SimClient``.
+        :param args: The list of arguments.
+        """
+
+        if not args:
+            return
+
+        for chan in args[0].split(b','):
+            chan = _lower(chan)
+            if chan not in client.channels:
+                continue
+
+            self.broadcast(chan, self.encode(client.source, b'PART', chan))
+            client.channels.discard(chan)
+            self.members[chan].discard(client)
+
+    def _cmd_PRIVMSG(self, client, args, cmd=b'PRIVMSG'):
+        """
+        Handle the PRIVMSG command.
+
+        :param client: The ``SimClient``.
+        :param args: The list of arguments.
+        :param cmd: The command being relayed.
+        """
+
+        if not client.registered or len(args) < 2:
+            return
+
+        for target in args[0].split(b','):
+            data = self.encode(client.source, cmd, target, args[1])
+            key = _lower(target)
+            if key in self.members:
+                self.broadcast(key, data, client)
+            elif key in self.nicks:
+                self.nicks[key].write(data)
+            elif cmd == b'PRIVMSG':
+                self.send(client, b'401', client.source.nick, target,
+                          b'No such nick/channel')
+
+    def _cmd_NOTICE(self, client, args):
+        """
+        Handle the NOTICE command.
+
+        :param client: The ``SimClient``.
+        :param args: The list of arguments.
+        """
+
+        self._cmd_PRIVMSG(client, args, b'NOTICE')
+
+    def _cmd_QUIT(self, client, args):
+        """
+        Handle the QUIT command.
+
+        :param client: The ``SimClient``.
+        :param args: The list of arguments.
+        """
+
+        client.write(self.encode(self.source, b'ERROR',
+                                 b'Closing link: ' +
+                                 (args[0] if args else b'Client Quit')))
+        if client.transport is not None:
+            client.transport.close()
+
+    def _disconnect(self, client):
+        """
+        Remove a disconnected client.
+
+        :param client: The ``SimClient``.
+        """
+
+        self.clients.discard(client)
+        if client.source is not None and client.source.nick is not None:
+            key = _lower(client.source.nick)
+            if self.nicks.get(key) is client:
+                del self.nicks[key]
+
+            data = self.encode(client.source, b'QUIT', b'Connection closed')
+            for chan in client.channels:
+                self.members[chan].discard(client)
+                self.broadcast(chan, data)
+        client.channels.clear()
+        client.transport = None
+        client.raw_transport = None
+
+    def chatter(self, rate):
+        """
+        Start or stop simulated channel chatter.
+
+        :param rate: The number of simulated lines per second, spread
+                     randomly over the channels.  Set to 0 to stop.
+        """
+
+        if self._chatter is not None:
+            self._chatter.cancel()
+            self._chatter = None
+
+        if rate > 0:
+            self._chatter = self.loop.call_later(1.0 / rate, self._chat,
+                                                 rate)
+
+    def _chat(self, rate):
+        """
+        Emit one line of simulated chatter.
+
+        :param rate: The chatter rate.
+        """
+
+        self._chatter = None
+        chan = self.random.choice(sorted(self.simulated))
+        if self.simulated[chan]:
+            user = self.random.choice(self.simulated[chan])
+            self.broadcast(chan, self.encode(
+                user, b'PRIVMSG', chan,
+                b'chatter ' + str(self.random.random()).encode('ascii')))
+        self.chatter(rate)
+
+    def numeric_burst(self, count, numeric=b'352'):
+        """
+        Send a burst of numerics, such as a large WHO reply, to every
+        registered client.
+
+        :param count: The number of numerics to send to each client.
+        :param numeric: The numeric to send.
+        """
+
+        for client in list(self.clients):
+            if not client.registered:
+                continue
+
+            nick = client.source.nick
+            client.write(b''.join(
+                self.encode(self.source, numeric, nick, b'#sim',
+                            b'sim', b'sim.host', self.source.nick,
+                            b'u' + str(i).encode('ascii'), b'H',
+                            b'0 Simulated user')
+                for i in range(count)))
+
+    def netsplit(self, fraction=0.5, servers=(b'hub.sim', b'leaf.sim')):
+        """
+        Simulate a netsplit.  A fraction of the simulated users in
+        each channel quit with the conventional netsplit reason.
+
+        :param fraction: The fraction of simulated users to split.
+        :param servers: The names of the servers on either side of the
+                        split.
+
+        :returns: The number of simulated users which split.
+        """
+
+        reason = b' '.join(servers)
+        count = 0
+        for chan, users in self.simulated.items():
+            cut = int(len(users) * fraction)
+            gone, self.simulated[chan] = users[:cut], users[cut:]
+            self.split.setdefault(chan, []).extend(gone)
+            for user in gone:
+                self.broadcast(chan, self.encode(user, b'QUIT', reason))
+            count += len(gone)
+
+        return count
+
+    def rejoin(self):
+        """
+        Simulate the end of a netsplit, flooding the channels with
+        JOINs from the split users.
+
+        :returns: The number of simulated users which rejoined.
+        """
+
+        count = 0
+        for chan, users in self.split.items():
+            for user in users:
+                self.broadcast(chan, self.encode(user, b'JOIN', chan))
+            self.simulated[chan].extend(users)
+            count += len(users)
+        self.split = {}
+
+        return count
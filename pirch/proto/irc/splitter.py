@@ -0,0 +1,172 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+from pirch.proto.irc import messages
+
+
+# The maximum length of a protocol line, including the CR LF
+LINELEN = 512
+
+
+def split_text(text, budget):
+    """
+    Split text into chunks no longer than a byte budget.  Chunks are
+    broken at spaces where possible, which are then dropped; otherwise
+    they are broken so as not to divide a UTF-8 character.  Line
+    breaks in the text always start a new chunk, and blank lines are
+    dropped.
+
+    :param text: The text to split, in ``bytes``.
+    :param budget: The maximum length of each chunk, in bytes.
+
+    :returns: A list of ``bytes`` chunks.
+    """
+
+    if budget <= 0:
+        raise ValueError('no room in the line for any text')
+
+    chunks = []
+    for line in text.split(b'\n'):
+        if line[-1:] == b'\r':
+            line = line[:-1]
+
+        pos = 0
+        length = len(line)
+        while length - pos > budget:
+            end = pos + budget
+
+            # Prefer to break at a space, which may sit just past the
+            # end of the chunk
+            cut = line.rfind(b' ', pos + 1, end + 1)
+            if cut > pos:
+                chunks.append(line[pos:cut])
+                pos = cut + 1
+                continue
+
+            # Back up over UTF-8 continuation bytes
+            cut = end
+            while cut > pos and b'\x80' <= line[cut:cut + 1] < b'\xc0':
+                cut -= 1
+            if cut == pos:
+                # Not UTF-8 after all; just break it
+                cut = end
+
+            chunks.append(line[pos:cut])
+            pos = cut
+
+        if pos < length:
+            chunks.append(line[pos:] if pos else line)
+
+    return chunks
+
+
+class Splitter(object):
+    """
+    Split long outbound text into as many lines as necessary.  The
+    byte budget available for text is computed once for each
+    combination of source, command, and target, accounting for the
+    prefix the server will add when relaying the line.
+    """
+
+    def __init__(self, linelen=LINELEN, cache_size=4096):
+        """
+        Initialize a ``Splitter`` instance.
+
+        :param linelen: The maximum length of a protocol line,
+                        including the CR LF.
+        :param cache_size: The maximum number of budgets to cache.
+                           The cache is cleared when it fills.
+        """
+
+        self.linelen = linelen
+        self.cache_size = cache_size
+        self._budgets = {}
+
+    def budget(self, source, cmd, target):
+        """
+        Determine the number of bytes available for text in a line.
+
+        :param source: The ``bytes`` form of the full prefix the
+                       server will add when relaying the line, e.g.
+                       b"nick!user@host".
+        :param cmd: The ``bytes`` for the command, e.g. b"PRIVMSG".
+        :param target: The ``bytes`` for the target.
+
+        :returns: The number of bytes available for text.
+        """
+
+        key = (source, cmd, target)
+        try:
+            return self._budgets[key]
+        except KeyError:
+            pass
+
+        # Account for ":<source> <cmd> <target> :<text>\r\n"
+        budget = (self.linelen - len(source) - len(cmd) - len(target) -
+                  len(b':   :\r\n'))
+
+        if len(self._budgets) >= self.cache_size:
+            self._budgets.clear()
+        self._budgets[key] = budget
+
+        return budget
+
+    def lines(self, source, cmd, target, text):
+        """
+        Split text into raw protocol lines.
+
+        :param source: The ``bytes`` form of the full prefix the
+                       server will add when relaying the lines.
+        :param cmd: The ``bytes`` for the command, e.g. b"PRIVMSG".
+        :param target: The ``bytes`` for the target.
+        :param text: The text to send, in ``bytes``.
+
+        :returns: A list of raw protocol lines, without line endings.
+        """
+
+        head = cmd + b' ' + target + b' :'
+        return [head + chunk for chunk in
+                split_text(text, self.budget(source, cmd, target))]
+
+    def messages(self, ctxt, conn, source, command, target, text):
+        """
+        Split text into ``Message`` objects.  The cached ``bytes`` form
+        of each message is primed, so they are not serialized again.
+
+        :param ctxt: The current context.
+        :param conn: The connection the messages will be sent to.
+        :param source: The ``bytes`` form of the full prefix the
+                       server will add when relaying the messages.
+        :param command: The ``pirch.proto.irc.commands.Command`` for
+                        the command, e.g. PRIVMSG.
+        :param target: The ``bytes`` for the target.
+        :param text: The text to send, in ``bytes``.
+
+        :returns: A list of ``pirch.proto.irc.messages.Message``
+                  objects.
+        """
+
+        head = command.cmd + b' ' + target + b' :'
+        result = []
+        for chunk in split_text(text, self.budget(source, command.cmd,
+                                                  target)):
+            msg = messages.Message(
+                ctxt, conn, conn.me, command,
+                messages.Arguments(ctxt, conn, [target, chunk], command))
+            msg._msg = head + chunk
+            result.append(msg)
+
+        return result
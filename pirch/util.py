@@ -14,6 +14,16 @@
 # along with this program.  If not, see
 # <http://www.gnu.org/licenses/>.
 
+import sys
+
+
+# Python version compatibility
+PY2 = sys.version_info[0] == 2
+if PY2:  # pragma: no cover
+    integer_types = (int, long)  # noqa
+else:  # pragma: no cover
+    integer_types = (int,)
+
 
 class UnsetType(object):
     """
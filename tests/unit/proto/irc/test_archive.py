@@ -0,0 +1,268 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from pirch.proto.irc import archive
+from pirch.proto.irc import isupport
+from pirch.proto.irc import search
+
+
+LINES = [
+    (100.0, b':Alice!a@host PRIVMSG #Chan :hello there'),
+    (101.0, b':bob!b@host PRIVMSG #chan :hi alice'),
+    (102.0, b':alice!a@host JOIN #other'),
+    (103.0, b':alice!a@host PRIVMSG #other,Bob :multi'),
+    (104.0, b'PING :server'),
+    (105.0, b':ALICE!a@host NOTICE #chan :later'),
+]
+
+
+class BitmapTest(unittest.TestCase):
+    def test_set_test(self):
+        bitmap = bytearray()
+
+        archive._set_bit(bitmap, 3)
+        archive._set_bit(bitmap, 17)
+
+        self.assertEqual(len(bitmap), 3)
+        self.assertTrue(archive._test_bit(bitmap, 3))
+        self.assertTrue(archive._test_bit(bitmap, 17))
+        self.assertFalse(archive._test_bit(bitmap, 4))
+        self.assertFalse(archive._test_bit(bitmap, 100))
+
+    def test_iter_bits(self):
+        bitmap = bytearray()
+        for bit in (0, 5, 9, 30):
+            archive._set_bit(bitmap, bit)
+
+        self.assertEqual(list(archive._iter_bits(bitmap, 0, 100)),
+                         [0, 5, 9, 30])
+        self.assertEqual(list(archive._iter_bits(bitmap, 1, 30)), [5, 9])
+
+
+class SplitLineTest(unittest.TestCase):
+    def test_origin_target(self):
+        result = archive._split_line(b':nick!user@host PRIVMSG #a,#b :x y')
+
+        self.assertEqual(result, (b'nick', b'PRIVMSG', b'#a,#b'))
+
+    def test_no_origin(self):
+        result = archive._split_line(b'PRIVMSG #a :x y')
+
+        self.assertEqual(result, (None, b'PRIVMSG', b'#a'))
+
+    def test_untargeted(self):
+        result = archive._split_line(b':server.name PING :token')
+
+        self.assertEqual(result, (b'server.name', b'PING', None))
+
+    def test_empty(self):
+        self.assertEqual(archive._split_line(b''), (None, None, None))
+
+
+class ArchivedMessageTest(unittest.TestCase):
+    @mock.patch('pirch.proto.irc.messages.Message.from_bytes',
+                return_value='message')
+    def test_message(self, mock_from_bytes):
+        msg = archive.ArchivedMessage(100.0, b'raw')
+
+        self.assertEqual(msg.message('ctxt', 'conn'), 'message')
+        self.assertEqual(msg.message('ctxt', 'conn'), 'message')
+        mock_from_bytes.assert_called_once_with('ctxt', 'conn', b'raw')
+
+
+class ArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make_archive(self, **kwargs):
+        kwargs.setdefault('sparse_interval', 2)
+        arch = archive.Archive(self.directory, **kwargs)
+        for timestamp, line in LINES:
+            arch.append(line, timestamp)
+        return arch
+
+    def query(self, arch, **kwargs):
+        return [(m.timestamp, m.raw) for m in arch.query(**kwargs)]
+
+    def test_query_all(self):
+        arch = self.make_archive()
+
+        self.assertEqual(self.query(arch), LINES)
+
+    def test_query_command(self):
+        arch = self.make_archive()
+
+        self.assertEqual(self.query(arch, command=b'privmsg'),
+                         [LINES[0], LINES[1], LINES[3]])
+
+    def test_query_target(self):
+        arch = self.make_archive()
+
+        self.assertEqual(self.query(arch, target=b'#CHAN'),
+                         [LINES[0], LINES[1], LINES[5]])
+        self.assertEqual(self.query(arch, target=b'bob'), [LINES[3]])
+        self.assertEqual(self.query(arch, target=b'#missing'), [])
+
+    def test_query_combined(self):
+        arch = self.make_archive()
+
+        self.assertEqual(
+            self.query(arch, command=b'PRIVMSG', target=b'#chan',
+                       origin=b'alice'),
+            [LINES[0]])
+
+    def test_query_time(self):
+        arch = self.make_archive()
+
+        self.assertEqual(self.query(arch, start=101.5, end=104.0),
+                         LINES[2:5])
+        self.assertEqual(self.query(arch, origin=b'alice', start=102.5),
+                         [LINES[3], LINES[5]])
+
+    def test_monotonic(self):
+        arch = archive.Archive(self.directory)
+        arch.append(b'PING :a', 100.0)
+        arch.append(b'PING :b', 99.0)
+
+        self.assertEqual(self.query(arch),
+                         [(100.0, b'PING :a'), (100.0, b'PING :b')])
+
+    def test_segments(self):
+        arch = self.make_archive(segment_size=100)
+
+        self.assertTrue(len(arch.segments) > 1)
+        self.assertEqual(self.query(arch), LINES)
+        self.assertEqual(self.query(arch, target=b'#chan', start=101.0),
+                         [LINES[1], LINES[5]])
+
+    def test_reopen(self):
+        arch = self.make_archive(segment_size=100)
+        arch.close()
+
+        arch = archive.Archive(self.directory)
+        arch.append(b':carol!c@host PRIVMSG #chan :new', 106.0)
+
+        self.assertEqual(self.query(arch, target=b'#chan'),
+                         [LINES[0], LINES[1], LINES[5],
+                          (106.0, b':carol!c@host PRIVMSG #chan :new')])
+
+    def test_rebuild(self):
+        arch = self.make_archive()
+        arch.close()
+        idxname = arch.segments[0].idxname
+        os.remove(idxname)
+
+        # Simulate a torn write at the end of the segment
+        with open(arch.segments[0].filename, 'ab') as f:
+            f.write(b'\0\0\0')
+
+        arch = archive.Archive(self.directory, sparse_interval=2)
+
+        self.assertEqual(self.query(arch, command=b'PRIVMSG',
+                                    origin=b'alice'),
+                         [LINES[0], LINES[3]])
+
+    def test_stale_index(self):
+        arch = self.make_archive()
+        arch.flush()
+        arch.append(b':dave!d@host PRIVMSG #chan :unflushed', 107.0)
+        arch._file.close()
+        arch._file = None
+
+        arch = archive.Archive(self.directory)
+
+        self.assertEqual(self.query(arch, origin=b'dave'),
+                         [(107.0, b':dave!d@host PRIVMSG #chan :unflushed')])
+
+    def test_casemapping(self):
+        isup = isupport.ISupport()
+        isup.feed([b'CASEMAPPING=ascii'])
+        arch = archive.Archive(self.directory, isup)
+        arch.append(b':Nick[1]!n@host PRIVMSG #Chan[a] :one', 100.0)
+        arch.append(b':nick{1}!n@host PRIVMSG #chan{a} :two', 101.0)
+
+        self.assertEqual(self.query(arch, target=b'#CHAN[A]'),
+                         [(100.0, b':Nick[1]!n@host PRIVMSG #Chan[a] :one')])
+        self.assertEqual(self.query(arch, origin=b'NICK{1}'),
+                         [(101.0, b':nick{1}!n@host PRIVMSG #chan{a} :two')])
+
+    def test_search(self):
+        idx = search.SearchIndex()
+        arch = self.make_archive(segment_size=100, index=idx)
+
+        self.assertTrue(len(arch.segments) > 1)
+        self.assertEqual([(m.timestamp, m.raw) for m in arch.search(b'hi')],
+                         [LINES[1]])
+        self.assertEqual([m.raw for m in arch.search(b'hello later')],
+                         [])
+        self.assertEqual([m.raw for m in arch.search(b'h*')],
+                         [LINES[0][1], LINES[1][1]])
+        self.assertEqual(list(arch.search(b'server')), [])
+
+    def test_search_reopen(self):
+        self.make_archive(segment_size=100).close()
+
+        arch = archive.Archive(self.directory, index=search.SearchIndex())
+        arch.append(b':carol!c@host PRIVMSG #chan :later still', 106.0)
+
+        self.assertEqual([m.timestamp for m in arch.search(b'later')],
+                         [105.0, 106.0])
+
+    def test_search_saved(self):
+        self.make_archive(segment_size=100).close()
+        arch = archive.Archive(self.directory, index=search.SearchIndex())
+        arch.close()
+
+        self.assertTrue(os.path.exists(arch.segments[0].srchname))
+        self.assertFalse(os.path.exists(arch.segments[-1].srchname))
+
+        # Reopening loads the saved search indexes
+        with mock.patch.object(search, 'build_segment') as mock_build:
+            arch = archive.Archive(self.directory,
+                                   index=search.SearchIndex())
+
+            self.assertFalse(mock_build.called)
+            self.assertEqual([m.timestamp for m in arch.search(b'h*')],
+                             [100.0, 101.0])
+            self.assertEqual([m.timestamp for m in arch.search(b'later')],
+                             [105.0])
+
+    def test_search_stale(self):
+        self.make_archive(segment_size=100).close()
+        arch = archive.Archive(self.directory, index=search.SearchIndex())
+        arch.close()
+        with open(arch.segments[0].srchname, 'wb') as f:
+            f.write(b'garbage')
+
+        arch = archive.Archive(self.directory, index=search.SearchIndex())
+
+        self.assertEqual([m.timestamp for m in arch.search(b'hello')],
+                         [100.0])
+
+    def test_search_no_index(self):
+        arch = self.make_archive()
+
+        self.assertRaises(ValueError, list, arch.search(b'hello'))
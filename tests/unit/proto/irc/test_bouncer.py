@@ -0,0 +1,197 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import mock
+
+from pirch.proto.irc import bouncer
+from pirch.proto.irc import isupport
+
+
+class RewritePlanTest(unittest.TestCase):
+    def setUp(self):
+        self.isupport = isupport.ISupport()
+        self.isupport.feed([b'PREFIX=(ov)@+', b'CHANMODES=b,k,l,imnst'])
+        self.plan = bouncer.RewritePlan(b'Up[1]', b'down', self.isupport)
+
+    def test_prefix(self):
+        self.assertEqual(self.plan.apply(b':up{1}!u@h JOIN #chan'),
+                         b':down!u@h JOIN #chan')
+        self.assertEqual(self.plan.apply(b':UP[1]@h JOIN #chan'),
+                         b':down@h JOIN #chan')
+        self.assertEqual(self.plan.apply(b':up[1] NICK other'),
+                         b':down NICK other')
+
+    def test_target(self):
+        self.assertEqual(self.plan.apply(b':srv 001 up[1] :Welcome'),
+                         b':srv 001 down :Welcome')
+        self.assertEqual(self.plan.apply(b':n!u@h PRIVMSG UP[1] :hi up[1]'),
+                         b':n!u@h PRIVMSG down :hi up[1]')
+        self.assertEqual(self.plan.apply(b'PING up[1]'), b'PING down')
+
+    def test_both(self):
+        self.assertEqual(self.plan.apply(b':up[1]!u@h  MODE up[1] +i'),
+                         b':down!u@h  MODE down +i')
+
+    def test_tagged(self):
+        self.assertEqual(
+            self.plan.apply(b'@time=x;a=b :up[1]!u@h PRIVMSG up[1] :hi'),
+            b'@time=x;a=b :down!u@h PRIVMSG down :hi')
+        self.assertEqual(self.plan.apply(b'@time=x  :srv 001 up[1] :hi'),
+                         b'@time=x  :srv 001 down :hi')
+
+    def test_kick(self):
+        self.assertEqual(self.plan.apply(b':op!u@h KICK #c up[1] :bye'),
+                         b':op!u@h KICK #c down :bye')
+        self.assertEqual(self.plan.apply(b':op!u@h KICK #c a,UP{1},b'),
+                         b':op!u@h KICK #c a,down,b')
+
+    def test_mode(self):
+        self.assertEqual(self.plan.apply(b':op!u@h MODE #c +ov-b up[1] x '
+                                         b':up[1]'),
+                         b':op!u@h MODE #c +ov-b down x :up[1]')
+        self.assertEqual(self.plan.apply(b':op!u@h MODE #c +kv up[1] '
+                                         b'UP{1}'),
+                         b':op!u@h MODE #c +kv up[1] down')
+
+    def test_mode_prefix(self):
+        self.isupport.feed([b'PREFIX=(qo)~@'])
+
+        self.assertEqual(self.plan.apply(b':op!u@h MODE #c +oq x up[1]'),
+                         b':op!u@h MODE #c +oq x down')
+        self.assertEqual(
+            self.plan.apply(b':srv 353 x = #c :~up[1] +up[1]'),
+            b':srv 353 x = #c :~down +up[1]')
+
+    def test_casemapping(self):
+        self.isupport.feed([b'CASEMAPPING=ascii'])
+
+        self.assertEqual(self.plan.apply(b':srv 001 UP[1] :Welcome'),
+                         b':srv 001 down :Welcome')
+        self.assertEqual(self.plan.apply(b':srv 001 up{1} :Welcome'),
+                         b':srv 001 up{1} :Welcome')
+
+    def test_names(self):
+        self.assertEqual(
+            self.plan.apply(b':srv 353 up[1] = #c :@op +up[1] x'),
+            b':srv 353 down = #c :@op +down x')
+        self.assertEqual(
+            self.plan.apply(b':srv 353 x = #c :@up[1]!u@h y!u@h'),
+            b':srv 353 x = #c :@down!u@h y!u@h')
+
+    def test_unchanged(self):
+        for line in (b':n!u@h PRIVMSG #chan :up[1]', b':srv', b'PING',
+                     b'PING :up[1]', b':srv 001 up[1]x :Welcome',
+                     b'@time=x', b':op KICK #c other :up[1]',
+                     b':srv 353 x = #c :up[1]x', b':n!u@h JOIN &up[1]',
+                     b':n!u@h PRIVMSG &up[1] :hi', b':op KICK #c +up[1]',
+                     b':op MODE #c +b up[1]', b':op MODE #c +k :up[1]'):
+            self.assertIs(self.plan.apply(line), line)
+
+
+class MultiplexerTest(unittest.TestCase):
+    def test_attach(self):
+        mux = bouncer.Multiplexer(b'nick')
+
+        mux.attach('t1')
+        mux.attach('t2', b'NICK')
+        mux.attach('t3', b'other')
+
+        self.assertEqual(len(mux), 3)
+        self.assertEqual(sorted(mux._groups), [b'nick', b'other'])
+        self.assertEqual(mux._groups[b'nick'], [b'nick', None, ['t1', 't2']])
+        plan = mux._groups[b'other'][1]
+        self.assertEqual((plan.old, plan.new), (b'nick', b'other'))
+
+    def test_attach_again(self):
+        mux = bouncer.Multiplexer(b'nick')
+        mux.attach('t1')
+
+        mux.attach('t1', b'other')
+
+        self.assertEqual(len(mux), 1)
+        self.assertEqual(list(mux._groups), [b'other'])
+
+    def test_detach(self):
+        mux = bouncer.Multiplexer(b'nick')
+        mux.attach('t1')
+        mux.attach('t2')
+
+        mux.detach('t1')
+        mux.detach('missing')
+
+        self.assertEqual(mux._groups, {b'nick': [b'nick', None, ['t2']]})
+
+        mux.detach('t2')
+
+        self.assertEqual(mux._groups, {})
+        self.assertEqual(len(mux), 0)
+
+    def test_set_nick(self):
+        mux = bouncer.Multiplexer(b'nick')
+        mux.attach('t1')
+        mux.attach('t2', b'other')
+
+        mux.set_nick(b'other')
+
+        self.assertIsNone(mux._groups[b'other'][1])
+        plan = mux._groups[b'nick'][1]
+        self.assertEqual((plan.old, plan.new), (b'other', b'nick'))
+
+    def test_send_raw(self):
+        mux = bouncer.Multiplexer(b'nick')
+        same = [mock.Mock(), mock.Mock()]
+        other = mock.Mock()
+        for transport in same:
+            mux.attach(transport)
+        mux.attach(other, b'other')
+        line1 = b':nick!u@h PRIVMSG #chan :hi'
+        line2 = b':srv 001 nick :Welcome'
+
+        mux.send_raw(line1, line2)
+
+        for transport in same:
+            transport.writelines.assert_called_once_with(
+                [line1, b'\r\n', line2, b'\r\n'])
+        self.assertIs(same[0].writelines.call_args[0][0][0], line1)
+        other.writelines.assert_called_once_with([
+            b':other!u@h PRIVMSG #chan :hi', b'\r\n',
+            b':srv 001 other :Welcome', b'\r\n',
+        ])
+
+    def test_isupport(self):
+        isup = isupport.ISupport()
+        isup.feed([b'CASEMAPPING=ascii'])
+        mux = bouncer.Multiplexer(b'nick[1]', isup)
+
+        mux.attach('t1', b'NICK{1}')
+        mux.attach('t2', b'Nick[1]')
+
+        self.assertEqual(sorted(mux._groups), [b'nick[1]', b'nick{1}'])
+        self.assertIsNone(mux._groups[b'nick[1]'][1])
+        self.assertIs(mux._groups[b'nick{1}'][1].isupport, isup)
+
+    def test_send(self):
+        mux = bouncer.Multiplexer(b'nick')
+        transport = mock.Mock()
+        mux.attach(transport)
+        msgs = [mock.Mock(msg=b'PING :a'), mock.Mock(msg=b'PING :b')]
+
+        mux.send(*msgs)
+
+        transport.writelines.assert_called_once_with(
+            [b'PING :a', b'\r\n', b'PING :b', b'\r\n'])
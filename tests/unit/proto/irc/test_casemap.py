@@ -39,3 +39,25 @@ class MappersTest(unittest.TestCase):
         self.assert_mapper('strict-rfc1459',
                            'This IS a TeSt [\\]^',
                            'this is a test {|}^')
+
+
+class BytesMappersTest(unittest.TestCase):
+    def assert_mapper(self, mapper, exemplar, expected):
+        actual = casemap.bytes_mappers[mapper](exemplar)
+
+        self.assertEqual(expected, actual)
+
+    def test_ascii(self):
+        self.assert_mapper('ascii',
+                           b'This IS a TeSt [\\]^',
+                           b'this is a test [\\]^')
+
+    def test_rfc1459(self):
+        self.assert_mapper('rfc1459',
+                           b'This IS a TeSt [\\]^',
+                           b'this is a test {|}~')
+
+    def test_strict_rfc1459(self):
+        self.assert_mapper('strict-rfc1459',
+                           b'This IS a TeSt [\\]^',
+                           b'this is a test {|}^')
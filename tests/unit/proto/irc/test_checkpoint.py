@@ -0,0 +1,253 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import asyncio
+except ImportError:  # pragma: no cover
+    import trollius as asyncio
+
+import mock
+
+from pirch.proto.irc import checkpoint
+from pirch.proto.irc import isupport
+from pirch.proto.irc import modes
+from pirch.proto.irc import reconnect
+
+
+def make_snapshot(now=1000.0):
+    isup = isupport.ISupport()
+    isup.feed([b'CHANMODES=b,k,l,imnt', b'PREFIX=(ov)@+', b'NETWORK=Test'])
+
+    chan = modes.ChannelModes()
+    chan.flags = 5
+    chan.params = {b'k': b'secret', b'l': b'10'}
+    chan.lists = {b'b': set([b'*!*@spam', b'*!*@eggs'])}
+    chan.members = {b'alice': 1, b'bob': 0, b'carol': 3}
+
+    empty = modes.ChannelModes()
+    empty.members = {b'alice': 0}
+
+    return reconnect.Snapshot(isup, {b'#Test': chan, b'#empty': empty},
+                              now=now)
+
+
+class EncodeTest(unittest.TestCase):
+    def assertSnapshotEqual(self, result, expected):
+        self.assertEqual(result.taken, expected.taken)
+        self.assertEqual(sorted(result.tokens), sorted(expected.tokens))
+        self.assertEqual(sorted(result.channels), sorted(expected.channels))
+        for name, chan in expected.channels.items():
+            other = result.channels[name]
+            self.assertEqual(other.flags, chan.flags)
+            self.assertEqual(other.params, chan.params)
+            self.assertEqual(other.lists, chan.lists)
+            self.assertEqual(other.members, chan.members)
+
+    def test_round_trip(self):
+        snapshot = make_snapshot()
+
+        record = checkpoint.encode(snapshot)
+        result = checkpoint.decode(b'xx' + record, 2)
+
+        self.assertSnapshotEqual(result, snapshot)
+        self.assertEqual(result.channel(b'#test').members[b'carol'], 3)
+        self.assertTrue(b'NETWORK=Test' in result.isupport().tokens())
+
+    def test_interned(self):
+        snapshot = make_snapshot()
+        for chan in snapshot.channels.values():
+            chan.members = {b'somebody-with-a-long-nickname': 0}
+
+        record = checkpoint.encode(snapshot)
+
+        self.assertEqual(record.count(b'somebody-with-a-long-nickname'), 1)
+
+
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'state.ckpt')
+
+    def test_write_load(self):
+        snapshot = make_snapshot()
+        record = checkpoint.encode(snapshot)
+        checkpoint.write(self.path, {b'net1': record, b'net2': b''})
+
+        ckpt = checkpoint.Checkpoint(self.path)
+        self.addCleanup(ckpt.close)
+
+        self.assertEqual(ckpt.names(), [b'net1', b'net2'])
+        self.assertTrue(b'net1' in ckpt)
+        self.assertFalse(b'net3' in ckpt)
+        self.assertEqual(ckpt.record(b'net1'), record)
+        self.assertEqual(ckpt.load(b'net1').channels[b'#Test'].members,
+                         snapshot.channels[b'#Test'].members)
+        self.assertRaises(checkpoint.CheckpointError, ckpt.load, b'net2')
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+
+    def test_empty(self):
+        open(self.path, 'wb').close()
+
+        self.assertRaises(checkpoint.CheckpointError,
+                          checkpoint.Checkpoint, self.path)
+
+    def test_bad_magic(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'NOTACHECKPOINT')
+
+        self.assertRaises(checkpoint.CheckpointError,
+                          checkpoint.Checkpoint, self.path)
+
+    def test_truncated(self):
+        checkpoint.write(self.path, {b'net1': b'record'})
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        with open(self.path, 'wb') as f:
+            f.write(data[:15])
+
+        self.assertRaises(checkpoint.CheckpointError,
+                          checkpoint.Checkpoint, self.path)
+
+
+class CheckpointWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'state.ckpt')
+
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def test_coalesced(self):
+        writer = checkpoint.CheckpointWriter(self.loop, self.path, delay=0.01)
+
+        writer.update(b'net1', make_snapshot(1.0))
+        writer.update(b'net1', make_snapshot(2.0))
+        writer.update(b'net2', make_snapshot(3.0))
+        self.loop.call_later(0.05, self.loop.stop)
+        self.loop.run_forever()
+        if writer._writing is not None:
+            self.loop.run_until_complete(writer._writing)
+
+        self.assertEqual(writer.writes, 1)
+        ckpt = checkpoint.Checkpoint(self.path)
+        self.addCleanup(ckpt.close)
+        self.assertEqual(ckpt.names(), [b'net1', b'net2'])
+        self.assertEqual(ckpt.load(b'net1').taken, 2.0)
+
+    def test_incremental(self):
+        writer = checkpoint.CheckpointWriter(self.loop, self.path)
+        writer.update(b'net1', make_snapshot(1.0))
+        writer.update(b'net2', make_snapshot(2.0))
+        self.loop.run_until_complete(writer.flush())
+
+        with mock.patch.object(checkpoint, 'encode',
+                               wraps=checkpoint.encode) as mock_encode:
+            writer.update(b'net2', make_snapshot(4.0))
+            writer.remove(b'net3')
+            self.loop.run_until_complete(writer.flush())
+
+        self.assertEqual(mock_encode.call_count, 1)
+        self.assertEqual(writer.writes, 2)
+        ckpt = checkpoint.Checkpoint(self.path)
+        self.addCleanup(ckpt.close)
+        self.assertEqual(ckpt.load(b'net1').taken, 1.0)
+        self.assertEqual(ckpt.load(b'net2').taken, 4.0)
+
+    def test_seed_remove(self):
+        checkpoint.write(self.path, {
+            b'net1': checkpoint.encode(make_snapshot(1.0)),
+            b'net2': checkpoint.encode(make_snapshot(2.0)),
+        })
+        old = checkpoint.Checkpoint(self.path)
+        self.addCleanup(old.close)
+        writer = checkpoint.CheckpointWriter(self.loop, self.path)
+        writer.seed(old)
+
+        writer.remove(b'net2')
+        self.loop.run_until_complete(writer.flush())
+
+        ckpt = checkpoint.Checkpoint(self.path)
+        self.addCleanup(ckpt.close)
+        self.assertEqual(ckpt.names(), [b'net1'])
+        self.assertEqual(ckpt.load(b'net1').taken, 1.0)
+
+    def test_flush_clean(self):
+        writer = checkpoint.CheckpointWriter(self.loop, self.path)
+
+        self.loop.run_until_complete(writer.flush())
+
+        self.assertEqual(writer.writes, 0)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_flush_during_write(self):
+        writer = checkpoint.CheckpointWriter(self.loop, self.path)
+        writer.update(b'net1', make_snapshot(1.0))
+        first = writer.flush()
+        writer.update(b'net1', make_snapshot(2.0))
+        second = writer.flush()
+
+        self.loop.run_until_complete(first)
+        self.loop.run_until_complete(second)
+
+        self.assertEqual(writer.writes, 2)
+        ckpt = checkpoint.Checkpoint(self.path)
+        self.addCleanup(ckpt.close)
+        self.assertEqual(ckpt.load(b'net1').taken, 2.0)
+
+    def test_error(self):
+        handler = mock.Mock()
+        self.loop.set_exception_handler(handler)
+        writer = checkpoint.CheckpointWriter(
+            self.loop, os.path.join(self.dir, 'missing', 'state.ckpt'))
+        writer.update(b'net1', make_snapshot())
+
+        self.assertRaises(EnvironmentError, self.loop.run_until_complete,
+                          writer.flush())
+
+        self.assertEqual(handler.call_count, 1)
+        self.assertEqual(writer.writes, 0)
+        self.assertEqual(list(writer._dirty), [b'net1'])
+        self.assertIsNotNone(writer._handle)
+
+    def test_error_retried(self):
+        self.loop.set_exception_handler(mock.Mock())
+        writer = checkpoint.CheckpointWriter(self.loop, self.path)
+        writer.update(b'net1', make_snapshot(1.0))
+        writer.update(b'net2', make_snapshot(2.0))
+
+        with mock.patch.object(checkpoint, 'write',
+                               side_effect=IOError('disk full')):
+            fut = writer.flush()
+            writer.update(b'net2', make_snapshot(3.0))
+            self.assertRaises(IOError, self.loop.run_until_complete, fut)
+
+        self.assertEqual(sorted(writer._dirty), [b'net1', b'net2'])
+        self.assertEqual(writer._dirty[b'net2'].taken, 3.0)
+
+        self.loop.run_until_complete(writer.flush())
+
+        self.assertEqual(writer._dirty, {})
+        ckpt = checkpoint.Checkpoint(self.path)
+        self.addCleanup(ckpt.close)
+        self.assertEqual(ckpt.load(b'net1').taken, 1.0)
+        self.assertEqual(ckpt.load(b'net2').taken, 3.0)
@@ -0,0 +1,187 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from pirch.proto.irc import codec
+
+
+class HasControlsTest(unittest.TestCase):
+    def test_plain(self):
+        self.assertFalse(codec.has_controls(b'just some text'))
+        self.assertFalse(codec.has_controls(memoryview(b'just text')))
+
+    def test_controls(self):
+        for code in bytearray(b'\x01\x02\x03\x04\x0f\x10\x11\x16\x1d\x1e\x1f'):
+            data = b'a' + bytes(bytearray([code])) + b'b'
+            self.assertTrue(codec.has_controls(data))
+
+        self.assertTrue(codec.has_controls(memoryview(b'a\x02b')))
+
+
+class QuoteTest(unittest.TestCase):
+    def test_quote(self):
+        result = codec.quote(b'a\x01b\\c\nd\x10e\x00f\rg')
+
+        self.assertEqual(result,
+                         b'a\\ab\\\\c\x10nd\x10\x10e\x100f\x10rg')
+
+    def test_unquote(self):
+        result = codec.unquote(
+            b'a\\ab\\\\c\x10nd\x10\x10e\x100f\x10rg\\zh\x10')
+
+        self.assertEqual(result, b'a\x01b\\c\nd\x10e\x00f\rgzh')
+
+    def test_unquote_plain(self):
+        data = b'nothing to see'
+
+        self.assertIs(codec.unquote(data), data)
+
+    def test_encode_ctcp(self):
+        self.assertEqual(codec.encode_ctcp(b'VERSION'), b'\x01VERSION\x01')
+        self.assertEqual(codec.encode_ctcp(b'ACTION', b'waves \\o/'),
+                         b'\x01ACTION waves \\\\o/\x01')
+
+
+class ScanTest(unittest.TestCase):
+    def test_plain(self):
+        data = b'hello world'
+
+        spans, ctcps = codec.scan(data)
+
+        self.assertEqual(spans, [codec.Span(b'hello world', codec.PLAIN)])
+        self.assertIs(spans[0].text, data)
+        self.assertEqual(ctcps, [])
+
+    def test_empty(self):
+        self.assertEqual(codec.scan(b''), ([], []))
+
+    def test_memoryview(self):
+        spans, ctcps = codec.scan(memoryview(b'xx\x02bold\x02 plain')[2:])
+
+        self.assertEqual(spans, [
+            codec.Span(b'bold', codec.Style(codec.BOLD, None, None)),
+            codec.Span(b' plain', codec.PLAIN),
+        ])
+
+    def test_toggles(self):
+        spans, ctcps = codec.scan(
+            b'a\x02b\x1dc\x1fd\x16e\x1ef\x11g\x0fh\x02\x02i')
+
+        self.assertEqual([(s.text, s.style.flags) for s in spans], [
+            (b'a', 0),
+            (b'b', 0x01),
+            (b'c', 0x03),
+            (b'd', 0x07),
+            (b'e', 0x0f),
+            (b'f', 0x1f),
+            (b'g', 0x3f),
+            (b'hi', 0),
+        ])
+
+    def test_colors(self):
+        spans, ctcps = codec.scan(
+            b'\x034red\x0312,1blue\x035,x\x03,plain'
+            b'\x04ff0000,00FF00hex\x03x')
+
+        self.assertEqual(spans, [
+            codec.Span(b'red', codec.Style(0, 4, None)),
+            codec.Span(b'blue', codec.Style(0, 12, 1)),
+            codec.Span(b',x', codec.Style(0, 5, 1)),
+            codec.Span(b',plain', codec.PLAIN),
+            codec.Span(b'hex', codec.Style(0, b'FF0000', b'00FF00')),
+            codec.Span(b'x', codec.PLAIN),
+        ])
+
+    def test_ctcp(self):
+        spans, ctcps = codec.scan(
+            b'\x01action waves \\\\o/\x01 and \x01VERSION\x01\x01PING 1')
+
+        self.assertEqual(spans, [codec.Span(b' and ', codec.PLAIN)])
+        self.assertEqual(ctcps, [
+            codec.CTCP(b'ACTION', b'waves \\o/'),
+            codec.CTCP(b'VERSION', b''),
+            codec.CTCP(b'PING', b'1'),
+        ])
+
+    def test_low_level_quote(self):
+        spans, ctcps = codec.scan(b'a\x10nb\x10\x10c\x10')
+
+        self.assertEqual(spans, [codec.Span(b'a\nb\x10c', codec.PLAIN)])
+
+
+class StripTest(unittest.TestCase):
+    def test_plain(self):
+        data = b'hello world'
+
+        self.assertIs(codec.strip(data), data)
+
+    def test_empty(self):
+        self.assertEqual(codec.strip(b''), b'')
+
+    def test_formatted(self):
+        result = codec.strip(b'\x02bold\x02 \x0304red\x03 \x01PING 1\x01x')
+
+        self.assertEqual(result, b'bold red x')
+
+
+class ParseOfferTest(unittest.TestCase):
+    def test_send(self):
+        result = codec.parse_offer(
+            b'\x01DCC SEND file.txt 2130706433 5000 1234\x01')
+
+        self.assertEqual(result, codec.Offer(b'SEND', b'file.txt',
+                                             '127.0.0.1', 5000, 1234, None))
+
+    def test_quoted_passive(self):
+        result = codec.parse_offer(
+            b'\x01DCC send "my file.txt" ::1 0 99 tok\x01')
+
+        self.assertEqual(result, codec.Offer(b'SEND', b'my file.txt', '::1',
+                                             0, 99, b'tok'))
+
+    def test_chat(self):
+        result = codec.parse_offer(b'\x01DCC CHAT chat 2130706433 5000\x01')
+
+        self.assertEqual(result, codec.Offer(b'CHAT', b'chat', '127.0.0.1',
+                                             5000, None, None))
+
+    def test_not_offer(self):
+        for text in (b'hello', b'\x01ACTION waves\x01',
+                     b'\x01DCC SEND file.txt\x01',
+                     b'\x01DCC SEND f 2130706433 port\x01',
+                     b'\x01DCC SEND f 99999999999 1\x01'):
+            self.assertIsNone(codec.parse_offer(text))
+
+
+class FormatOfferTest(unittest.TestCase):
+    def test_send(self):
+        result = codec.format_offer(codec.Offer(
+            b'SEND', b'my file', '127.0.0.1', 5000, 1234, None))
+
+        self.assertEqual(result,
+                         b'\x01DCC SEND "my file" 2130706433 5000 1234\x01')
+
+    def test_ipv6_token(self):
+        result = codec.format_offer(codec.Offer(b'SEND', b'f', '::1', 0,
+                                                None, b'tok'))
+
+        self.assertEqual(result, b'\x01DCC SEND f ::1 0 0 tok\x01')
+
+    def test_chat(self):
+        offer = codec.Offer(b'CHAT', b'chat', '10.0.0.1', 1, None, None)
+
+        self.assertEqual(codec.parse_offer(codec.format_offer(offer)), offer)
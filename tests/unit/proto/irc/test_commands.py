@@ -18,10 +18,20 @@ import unittest
 
 import mock
 
+from pirch.proto.irc import codec
 from pirch.proto.irc import commands
+from pirch.proto.irc import isupport
+from pirch.proto.irc import messages
+from pirch.proto.irc import modes
 from pirch import util
 
 
+def make_isupport():
+    result = isupport.ISupport()
+    result.feed([b'PREFIX=(qov)~@+', b'CHANMODES=beI,k,l,imnpst'])
+    return result
+
+
 class ArgumentTest(unittest.TestCase):
     def test_init_internal(self):
         self.assertRaises(ValueError, commands.Argument, '_internal', 0)
@@ -73,7 +83,74 @@ class EntityArgumentTest(unittest.TestCase):
         self.assertEqual(result, 'bytes')
 
 
+class DCCArgumentTest(unittest.TestCase):
+    def test_from_bytes(self):
+        arg = commands.DCCArgument('offer', 1)
+
+        result = arg.from_bytes(None, None, b'\x01DCC SEND f 1 2 3\x01')
+
+        self.assertEqual(result,
+                         codec.Offer(b'SEND', b'f', '0.0.0.1', 2, 3, None))
+        self.assertIsNone(arg.from_bytes(None, None, b'hello'))
+
+    def test_to_bytes(self):
+        arg = commands.DCCArgument('offer', 1)
+        offer = codec.Offer(b'SEND', b'f', '0.0.0.1', 2, 3, None)
+
+        self.assertEqual(arg.to_bytes(None, None, offer),
+                         b'\x01DCC SEND f 1 2 3\x01')
+
+
+class ModeArgumentTest(unittest.TestCase):
+    def test_from_bytes(self):
+        arg = commands.ModeArgument('changes', slice(1, None))
+        conn = mock.Mock(isupport=make_isupport())
+
+        result = arg.from_bytes('ctxt', conn,
+                                [b'+ol', b'alice', util.unset, b'5'])
+
+        self.assertEqual(result, [
+            modes.ModeChange(True, b'o', b'alice'),
+            modes.ModeChange(True, b'l', b'5'),
+        ])
+
+    def test_to_bytes(self):
+        arg = commands.ModeArgument('changes', slice(1, None))
+
+        result = arg.to_bytes('ctxt', 'conn', [
+            modes.ModeChange(False, b'o', b'alice'),
+        ])
+
+        self.assertEqual(result, [b'-o', b'alice'])
+
+    def test_registered(self):
+        conn = mock.Mock(isupport=make_isupport())
+
+        msg = messages.Message.from_bytes(
+            'ctxt', conn, b':srv MODE #chan +ov alice bob')
+
+        self.assertIs(msg.command, commands.get_command(b'MODE'))
+        self.assertEqual(msg.args.target, b'#chan')
+        self.assertEqual(msg.args.changes, [
+            modes.ModeChange(True, b'o', b'alice'),
+            modes.ModeChange(True, b'v', b'bob'),
+        ])
+
+    def test_registered_new(self):
+        conn = mock.Mock(isupport=make_isupport())
+
+        msg = messages.Message.new(
+            'ctxt', conn, commands.get_command(b'MODE'), target=b'#chan',
+            changes=[
+                modes.ModeChange(True, b'l', b'5'),
+                modes.ModeChange(False, b'i', None),
+            ])
+
+        self.assertEqual(list(msg.args), [b'#chan', b'+l-i', b'5'])
+
+
 class CommandTest(unittest.TestCase):
+    @mock.patch.dict(commands.Command._declared, clear=True)
     @mock.patch.dict(commands.Command._registry, clear=True)
     def test_register_base(self):
         command = mock.Mock(cmd=b'PING')
@@ -82,6 +159,7 @@ class CommandTest(unittest.TestCase):
 
         self.assertEqual(commands.Command._registry, {b'PING': command})
 
+    @mock.patch.dict(commands.Command._declared, clear=True)
     @mock.patch.dict(commands.Command._registry, clear=True)
     def test_register_duplicate(self):
         commands.Command._registry[b'PING'] = 'fake'
@@ -90,10 +168,107 @@ class CommandTest(unittest.TestCase):
         self.assertRaises(ValueError, commands.Command.register, command)
         self.assertEqual(commands.Command._registry, {b'PING': 'fake'})
 
+    @mock.patch.dict(commands.Command._declared, clear=True)
+    @mock.patch.dict(commands.Command._registry, clear=True)
+    def test_register_declared(self):
+        commands.Command._declared[b'PING'] = ()
+        command = mock.Mock(cmd=b'PING')
+
+        self.assertRaises(ValueError, commands.Command.register, command)
+        self.assertEqual(commands.Command._registry, {})
+
+    @mock.patch.dict(commands.Command._declared, clear=True)
+    @mock.patch.dict(commands.Command._registry, clear=True)
+    def test_declare_base(self):
+        commands.Command.declare(b'PING', ('token', 0))
+
+        self.assertEqual(commands.Command._declared,
+                         {b'PING': (('token', 0),)})
+        self.assertEqual(commands.Command._registry, {})
+
+    @mock.patch.dict(commands.Command._declared, clear=True)
+    @mock.patch.dict(commands.Command._registry, clear=True)
+    def test_declare_duplicate(self):
+        commands.Command._registry[b'PING'] = 'fake'
+        commands.Command._declared[b'PONG'] = ()
+
+        self.assertRaises(ValueError, commands.Command.declare, b'PING')
+        self.assertRaises(ValueError, commands.Command.declare, b'PONG')
+        self.assertEqual(commands.Command._declared, {b'PONG': ()})
+
+    @mock.patch.dict(commands.Command._declared, clear=True)
+    @mock.patch.dict(commands.Command._registry, clear=True)
+    def test_lookup_declared(self):
+        commands.Command.declare(
+            b'PRIVMSG',
+            ('target', 0, commands.EntityArgument),
+            ('text', 1, commands.Argument, b'default'),
+        )
+
+        result = commands.Command.lookup(b'PRIVMSG')
+
+        self.assertIsInstance(result, commands.Command)
+        self.assertEqual(result.cmd, b'PRIVMSG')
+        self.assertEqual(result.arguments, set(['target', 'text']))
+        self.assertIsInstance(result['target'], commands.EntityArgument)
+        self.assertEqual(result['target'].idx, 0)
+        self.assertEqual(result['text'].idx, 1)
+        self.assertEqual(result['text'].default, b'default')
+        self.assertEqual(commands.Command._declared, {})
+        self.assertIs(commands.Command.lookup(b'PRIVMSG'), result)
+
+    @mock.patch.dict(commands.Command._declared)
+    @mock.patch.dict(commands.Command._registry)
+    def test_messaging_declared(self):
+        privmsg = commands.Command.lookup(b'PRIVMSG')
+        notice = commands.Command.lookup(b'NOTICE')
+
+        self.assertEqual(privmsg.arguments, set(['target', 'text', 'offer']))
+        self.assertEqual(privmsg['text'].idx, 1)
+        self.assertIsInstance(privmsg['offer'], commands.DCCArgument)
+        self.assertEqual(privmsg['offer'].idx, 1)
+        self.assertEqual(notice.arguments, set(['target', 'text']))
+        self.assertEqual(notice['text'].idx, 1)
+
+    @mock.patch.dict(commands.Command._declared)
+    @mock.patch.dict(commands.Command._registry)
+    def test_query_declared(self):
+        for cmd, name in ((b'WHOIS', 'nick'), (b'WHO', 'mask'),
+                          (b'NAMES', 'channel')):
+            self.assertTrue(name in commands.Command.lookup(cmd))
+
+    @mock.patch.dict(commands.Command._declared)
+    @mock.patch.dict(commands.Command._registry)
+    def test_membership_declared(self):
+        join = commands.Command.lookup(b'JOIN')
+        part = commands.Command.lookup(b'PART')
+
+        self.assertEqual(join.arguments, set(['channels', 'keys']))
+        self.assertEqual(part.arguments, set(['channels', 'reason']))
+
+    def test_privmsg_offer(self):
+        conn = mock.Mock()
+        offer = codec.Offer(b'SEND', b'f', '0.0.0.1', 2, 3, None)
+
+        received = messages.Message.from_bytes(
+            None, conn, b':n!u@h PRIVMSG me :\x01DCC SEND f 1 2 3\x01')
+        plain = messages.Message.from_bytes(
+            None, conn, b':n!u@h PRIVMSG me :hello')
+        sent = messages.Message.new(None, conn,
+                                    commands.get_command(b'PRIVMSG'),
+                                    target=b'nick', offer=offer)
+
+        self.assertEqual(received.args.offer, offer)
+        self.assertEqual(received.args.text, b'\x01DCC SEND f 1 2 3\x01')
+        self.assertIsNone(plain.args.offer)
+        self.assertEqual(sent.msg, b'PRIVMSG nick :\x01DCC SEND f 1 2 3\x01')
+
+    @mock.patch.dict(commands.Command._declared, clear=True)
     @mock.patch.dict(commands.Command._registry, clear=True)
     def test_lookup_missing(self):
         self.assertRaises(KeyError, commands.Command.lookup, b'PING')
 
+    @mock.patch.dict(commands.Command._declared, clear=True)
     @mock.patch.dict(commands.Command._registry, clear=True)
     def test_lookup_base(self):
         commands.Command._registry[b'PING'] = 'fake'
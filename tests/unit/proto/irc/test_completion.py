@@ -0,0 +1,173 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import mock
+
+from pirch.proto.irc import completion
+from pirch.proto.irc import isupport
+
+
+class CompletionIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = completion.CompletionIndex(recent=2)
+        for nick in (b'Alice', b'alfred', b'Al[x]', b'bob'):
+            self.index.join(nick, b'#Test')
+        self.index.join(b'alice', b'#other')
+
+    def test_complete(self):
+        index = self.index
+
+        self.assertEqual(len(index), 6)
+        self.assertEqual(index.keys, [b'#other', b'#test', b'alfred',
+                                      b'alice', b'al{x}', b'bob'])
+        self.assertEqual(index.complete(b'AL'),
+                         [b'alfred', b'alice', b'Al[x]'])
+        self.assertEqual(index.complete(b'al', limit=2),
+                         [b'alfred', b'alice'])
+        self.assertEqual(index.complete(b'#'), [b'#other', b'#Test'])
+        self.assertEqual(index.complete(b'z'), [])
+        self.assertTrue(b'AL{X}' in index)
+
+    def test_recent(self):
+        index = self.index
+        index.touch(b'ALICE')
+        index.touch(b'alfred')
+        index.touch(b'carol')
+
+        self.assertEqual(index.complete(b'al'),
+                         [b'alfred', b'alice', b'Al[x]'])
+
+        index.touch(b'bob')
+        index.touch(b'alice')
+
+        self.assertEqual(index.complete(b'al'),
+                         [b'alice', b'alfred', b'Al[x]'])
+        self.assertEqual(index.complete(b'', limit=1), [b'alice'])
+
+    def test_part_quit(self):
+        index = self.index
+        index.part(b'alice', b'#test')
+        index.part(b'carol', b'#test')
+
+        self.assertTrue(b'alice' in index)
+
+        index.quit(b'ALICE')
+        index.part(b'bob', b'#test')
+
+        self.assertFalse(b'alice' in index)
+        self.assertFalse(b'#other' in index)
+        self.assertFalse(b'bob' in index)
+        self.assertEqual(index.keys, [b'#test', b'alfred', b'al{x}'])
+
+        index.drop(b'#TEST')
+
+        self.assertEqual(index.keys, [])
+        self.assertEqual(index._nicks, {})
+        self.assertEqual(index._channels, {})
+
+    def test_rename(self):
+        index = self.index
+        index.rename(b'alice', b'Zed')
+        index.rename(b'nobody', b'somebody')
+
+        self.assertFalse(b'alice' in index)
+        self.assertEqual(index.complete(b'z'), [b'Zed'])
+        self.assertEqual(index.complete(b''), [b'Zed', b'#other', b'#Test',
+                                               b'alfred', b'Al[x]', b'bob'])
+
+        index.quit(b'zed')
+
+        self.assertFalse(b'#other' in index)
+
+    def test_casemapping(self):
+        isup = isupport.ISupport()
+        isup.feed([b'CASEMAPPING=ascii'])
+        index = completion.CompletionIndex(isup)
+        index.join(b'Nick[a]', b'#A')
+
+        self.assertTrue(b'nick[a]' in index)
+        self.assertFalse(b'nick{a}' in index)
+        self.assertEqual(index.complete(b'NICK['), [b'Nick[a]'])
+
+    def test_feed(self):
+        index = completion.CompletionIndex()
+        index.feed(b'@time=x :alice!u@h JOIN :#a,#b')
+        index.feed(b':bob!u@h JOIN #a acct :Bob')
+        index.feed(b':carol JOIN #b')
+        index.feed(b':bob!u@h PRIVMSG #a :hi')
+        index.feed(b':alice!u@h NICK :alicia')
+        index.feed(b':op!u@h KICK #b carol :bye')
+        index.feed(b':bob!u@h PART #a')
+        index.feed(b'PING :x')
+        index.feed(b':server 001')
+
+        self.assertEqual(index.keys, [b'#a', b'#b', b'alicia'])
+        self.assertEqual(index.complete(b''), [b'alicia', b'#a', b'#b'])
+
+        index(mock.Mock(msg=b':alicia!u@h QUIT :bye'))
+
+        self.assertEqual(len(index), 0)
+
+    def test_feed_me_part(self):
+        index = completion.CompletionIndex(me=b'Me')
+        for line in (b':me!u@h JOIN #a', b':alice!u@h JOIN #a',
+                     b':bob!u@h JOIN #a', b':me!u@h JOIN #b',
+                     b':alice!u@h JOIN #b'):
+            index.feed(line)
+
+        index.feed(b':ME!u@h PART #a :bye')
+
+        self.assertEqual(index.keys, [b'#b', b'alice', b'me'])
+        self.assertEqual(sorted(index._channels), [b'#b'])
+
+    def test_feed_me_kick(self):
+        me = mock.Mock(return_value=b'me')
+        index = completion.CompletionIndex(me=me)
+        for line in (b':me!u@h JOIN #a', b':alice!u@h JOIN #a',
+                     b':me!u@h JOIN #b', b':bob!u@h JOIN #b'):
+            index.feed(line)
+
+        index.feed(b':op!u@h KICK #a me :out')
+
+        self.assertEqual(index.keys, [b'#b', b'bob', b'me'])
+
+    def test_feed_me_nick(self):
+        index = completion.CompletionIndex(me=b'me')
+        index.feed(b':me!u@h JOIN #a')
+        index.feed(b':alice!u@h JOIN #a')
+
+        index.feed(b':me!u@h NICK :newme')
+        index.feed(b':newme!u@h PART #a')
+
+        self.assertEqual(index.me, b'newme')
+        self.assertEqual(index.keys, [])
+
+    def test_feed_disconnect(self):
+        for last in (b':me!u@h QUIT :bye', b'ERROR :Closing link'):
+            index = completion.CompletionIndex(me=b'me')
+            index.feed(b':me!u@h JOIN #a')
+            index.feed(b':alice!u@h JOIN #a')
+            index.touch(b'alice')
+
+            index.feed(last)
+
+            self.assertEqual(len(index), 0)
+            self.assertEqual(index._names, {})
+            self.assertEqual(index._nicks, {})
+            self.assertEqual(index._channels, {})
+            self.assertEqual(list(index._recent), [])
@@ -0,0 +1,255 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import unittest
+
+try:
+    import asyncio
+except ImportError:  # pragma: no cover
+    import trollius as asyncio
+
+from pirch.proto.irc import commands
+from pirch.proto.irc import correlate
+from pirch.proto.irc import isupport
+from pirch.proto.irc import messages
+from pirch.proto.irc import modes
+
+
+class FakeEntity(object):
+    def __init__(self, raw):
+        self.raw = raw
+
+    def to_bytes(self):
+        return self.raw
+
+
+class FakeConn(object):
+    def __init__(self):
+        self.me = FakeEntity(b'me')
+        self.peer = FakeEntity(b'server')
+
+    def get_entity(self, raw):
+        return FakeEntity(raw)
+
+
+class CorrelatorTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.conn = FakeConn()
+        self.sent = []
+        self.now = 1000.0
+        self.corr = correlate.Correlator(self.loop, self.sent.append,
+                                         clock=lambda: self.now)
+
+    def query(self, cmd, **kwargs):
+        return messages.Message.new(None, self.conn,
+                                    commands.get_command(cmd), **kwargs)
+
+    def reply(self, line):
+        self.corr(messages.Message.from_bytes(None, self.conn, line))
+
+    def whois(self, nick):
+        return self.corr.query(self.query(b'WHOIS', nick=nick))
+
+    def test_whois(self):
+        fut = self.whois(b'Alice')
+
+        self.assertEqual([msg.msg for msg in self.sent], [b'WHOIS Alice'])
+        self.reply(b':server 311 me Alice a host * :Alice A')
+        self.reply(b':server 319 me Alice :#c')
+        self.assertFalse(fut.done())
+        self.reply(b':server 318 me alice :End of WHOIS')
+
+        self.assertEqual([msg.command.cmd for msg in fut.result()],
+                         [b'311', b'319', b'318'])
+        self.assertEqual(self.corr._pending, {})
+
+    def test_casemapping(self):
+        isup = isupport.ISupport()
+        isup.feed([b'CASEMAPPING=ascii'])
+        corr = correlate.Correlator(self.loop, self.sent.append, isup)
+        fut = corr.query(self.query(b'WHOIS', nick=b'Al[x]'))
+
+        corr(messages.Message.from_bytes(
+            None, self.conn, b':server 318 me al{x} :End of WHOIS'))
+        self.assertFalse(fut.done())
+        corr(messages.Message.from_bytes(
+            None, self.conn, b':server 318 me AL[X] :End of WHOIS'))
+
+        self.assertEqual(len(fut.result()), 1)
+
+    def test_coalesce(self):
+        first = self.whois(b'Alice')
+        second = self.whois(b'ALICE')
+        other = self.whois(b'bob')
+
+        self.assertEqual(len(self.sent), 2)
+        self.assertEqual(self.corr.sent, 2)
+        self.assertEqual(self.corr.coalesced, 1)
+
+        self.reply(b':server 311 me Alice a host * :Alice A')
+        self.reply(b':server 318 me Alice :End of WHOIS')
+        self.reply(b':server 401 me bob :No such nick')
+        self.reply(b':server 318 me bob :End of WHOIS')
+
+        self.assertEqual(len(first.result()), 2)
+        self.assertEqual(len(second.result()), 2)
+        self.assertIsNot(first.result(), second.result())
+        self.assertEqual([msg.command.cmd for msg in other.result()],
+                         [b'401', b'318'])
+
+    def test_cache(self):
+        self.whois(b'Alice')
+        self.reply(b':server 318 me Alice :End of WHOIS')
+
+        cached = self.whois(b'alice')
+
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(self.corr.hits, 1)
+        self.assertEqual(len(cached.result()), 1)
+
+        self.now += 61
+        self.whois(b'alice')
+
+        self.assertEqual(len(self.sent), 2)
+
+    def test_cache_prune(self):
+        self.whois(b'alice')
+        self.reply(b':server 318 me alice :End of WHOIS')
+        self.now += 61
+        self.whois(b'bob')
+        self.reply(b':server 318 me bob :End of WHOIS')
+
+        self.assertEqual(list(self.corr._cache), [(b'WHOIS', b'bob')])
+
+    def test_invalidate(self):
+        self.whois(b'alice')
+        self.reply(b':server 318 me alice :End of WHOIS')
+        self.corr.query(self.query(b'NAMES', channel=b'#c'))
+        self.reply(b':server 366 me #c :End of NAMES')
+
+        self.corr.invalidate(target=b'ALICE')
+
+        self.assertEqual(list(self.corr._cache), [(b'NAMES', b'#c')])
+        self.corr.invalidate()
+        self.assertEqual(len(self.corr._cache), 0)
+
+    def test_interleaved(self):
+        whois = self.whois(b'alice')
+        mode = self.corr.query(self.query(b'MODE', target=b'#c'))
+
+        self.reply(b':server 318 me alice :End of WHOIS')
+        self.reply(b':server 324 me #c +nt')
+
+        self.assertEqual(len(whois.result()), 1)
+        self.assertEqual(mode.result()[0].command.cmd, b'324')
+
+    def test_mode_change(self):
+        fut = self.corr.query(self.query(b'MODE', target=b'#c',
+                                         changes=[modes.ModeChange(
+                                             True, b'n', None)]))
+
+        self.assertEqual(fut.result(), [])
+        self.assertEqual(self.corr.sent, 0)
+        self.assertEqual(len(self.sent), 1)
+
+    def test_foreign_terminator(self):
+        fut = self.whois(b'alice')
+
+        self.reply(b':server 318 me bob :End of WHOIS')
+        self.reply(b':server 352 me #c u h s n H :0 R')
+
+        self.assertFalse(fut.done())
+
+    def test_unsolicited_names(self):
+        fut = self.corr.query(self.query(b'NAMES', channel=b'#a'))
+
+        self.reply(b':server 353 me = #other :x y')
+        self.reply(b':server 366 me #other :End of NAMES')
+        self.assertFalse(fut.done())
+        self.reply(b':server 353 me = #A :alice @bob')
+        self.reply(b':server 366 me #a :End of NAMES')
+
+        self.assertEqual([msg.msg for msg in fut.result()], [
+            b':server 353 me = #A :alice @bob',
+            b':server 366 me #a :End of NAMES'])
+
+    def test_out_of_order_targets(self):
+        alice = self.whois(b'alice')
+        bob = self.whois(b'bob')
+
+        self.reply(b':server 311 me bob b host * :Bob')
+        self.reply(b':server 318 me bob :End of WHOIS')
+        self.reply(b':server 318 me alice :End of WHOIS')
+
+        self.assertEqual(len(bob.result()), 2)
+        self.assertEqual(len(alice.result()), 1)
+
+    def test_who(self):
+        fut = self.corr.query(self.query(b'WHO', mask=b'*.example'))
+
+        self.reply(b':server 352 me #c u h s n H :0 R')
+        self.reply(b':server 315 me *.example :End of WHO')
+
+        self.assertEqual(len(fut.result()), 2)
+
+    def test_user_mode(self):
+        fut = self.corr.query(self.query(b'MODE', target=b'Me'))
+
+        self.reply(b':server 221 me +iw')
+
+        self.assertEqual(fut.result()[0].command.cmd, b'221')
+
+    def test_comma_targets(self):
+        self.assertRaises(ValueError, self.corr.query,
+                          self.query(b'NAMES', channel=b'#a,#b'))
+        self.assertRaises(ValueError, self.whois, b'a,b')
+        self.assertEqual(self.sent, [])
+
+    def test_bad_command(self):
+        self.assertRaises(ValueError, self.corr.query,
+                          self.query(b'PING', token=b'x'))
+
+    def test_timeout(self):
+        corr = correlate.Correlator(self.loop, self.sent.append,
+                                    timeout=0.001)
+        fut = corr.query(self.query(b'WHOIS', nick=b'alice'))
+
+        self.assertRaises(asyncio.TimeoutError,
+                          self.loop.run_until_complete, fut)
+        self.assertEqual(corr._pending, {})
+
+    def test_cancel(self):
+        first = self.whois(b'alice')
+        second = self.whois(b'bob')
+        exc = IOError('lost')
+
+        self.corr.cancel()
+        self.assertTrue(first.cancelled())
+
+        third = self.whois(b'carol')
+        self.corr.cancel(exc)
+
+        self.assertTrue(second.cancelled())
+        self.assertIs(third.exception(), exc)
+        self.assertEqual(self.corr._pending, {})
+
+    def test_unrelated(self):
+        self.reply(b':server 001 me :Welcome')
+        self.reply(b':server 318 me alice :End of WHOIS')
+
+        self.assertEqual(self.corr._pending, {})
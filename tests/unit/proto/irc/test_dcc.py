@@ -0,0 +1,154 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import errno
+import os
+import socket
+import tempfile
+import unittest
+
+try:
+    import asyncio
+except ImportError:  # pragma: no cover
+    import trollius as asyncio
+
+import mock
+
+from pirch.proto.irc import dcc
+
+
+def tcp_pair():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    client = socket.create_connection(listener.getsockname())
+    server, _addr = listener.accept()
+    listener.close()
+    return server, client
+
+
+class TransferTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+        self.data = os.urandom(300000)
+        self.source = tempfile.TemporaryFile()
+        self.addCleanup(self.source.close)
+        self.source.write(self.data)
+        self.source.flush()
+        self.dest = tempfile.TemporaryFile()
+        self.addCleanup(self.dest.close)
+
+        self.send_sock, self.recv_sock = tcp_pair()
+        self.addCleanup(self.send_sock.close)
+        self.addCleanup(self.recv_sock.close)
+
+    def run_transfer(self, sender, receiver):
+        sender.start()
+        receiver.start()
+        self.loop.run_until_complete(sender.done)
+        self.loop.run_until_complete(receiver.done)
+
+        self.dest.seek(0)
+        self.assertEqual(self.dest.read(), self.data)
+
+    def test_transfer(self):
+        sender = dcc.Sender(self.loop, self.send_sock, self.source,
+                            chunk_size=65536)
+        receiver = dcc.Receiver(self.loop, self.recv_sock, self.dest,
+                                len(self.data))
+
+        self.run_transfer(sender, receiver)
+
+        self.assertEqual(sender.done.result(), len(self.data))
+        self.assertEqual(sender.acked, len(self.data))
+        self.assertEqual(receiver.done.result(), len(self.data))
+
+    def test_transfer_mmap(self):
+        sender = dcc.Sender(self.loop, self.send_sock, self.source,
+                            sendfile=False)
+        receiver = dcc.Receiver(self.loop, self.recv_sock, self.dest,
+                                len(self.data))
+
+        self.run_transfer(sender, receiver)
+
+    def test_sendfile_unsupported(self):
+        sender = dcc.Sender(self.loop, self.send_sock, self.source)
+        sender._sendfile = mock.Mock(
+            side_effect=OSError(errno.EINVAL, 'unsupported'))
+        receiver = dcc.Receiver(self.loop, self.recv_sock, self.dest,
+                                len(self.data))
+
+        self.run_transfer(sender, receiver)
+
+        self.assertIsNone(sender._sendfile)
+
+    def test_resume(self):
+        self.dest.write(self.data[:1000])
+        self.dest.flush()
+        sender = dcc.Sender(self.loop, self.send_sock, self.source,
+                            offset=1000)
+        receiver = dcc.Receiver(self.loop, self.recv_sock, self.dest,
+                                len(self.data), offset=1000)
+
+        self.run_transfer(sender, receiver)
+
+    def test_no_ack(self):
+        sender = dcc.Sender(self.loop, self.send_sock, self.source)
+        receiver = dcc.Receiver(self.loop, self.recv_sock, self.dest,
+                                len(self.data), ack=False)
+
+        receiver.done.add_done_callback(lambda fut: self.recv_sock.close())
+        self.run_transfer(sender, receiver)
+
+        self.assertIsNone(sender.acked)
+
+    def test_empty(self):
+        sender = dcc.Sender(self.loop, self.send_sock, self.source, size=0)
+        receiver = dcc.Receiver(self.loop, self.recv_sock, self.dest, 0)
+
+        self.assertEqual(sender.start().result(), 0)
+        self.assertEqual(receiver.start().result(), 0)
+
+    def test_closed_early(self):
+        receiver = dcc.Receiver(self.loop, self.recv_sock, self.dest,
+                                len(self.data))
+        self.send_sock.sendall(self.data[:10])
+        self.send_sock.close()
+
+        self.assertRaises(EOFError, self.loop.run_until_complete,
+                          receiver.start())
+        self.assertEqual(receiver.received, 10)
+
+    def test_short_file(self):
+        sender = dcc.Sender(self.loop, self.send_sock, self.source,
+                            size=len(self.data) + 10)
+
+        self.assertRaises(EOFError, self.loop.run_until_complete,
+                          sender.start())
+
+    def test_cancel(self):
+        receiver = dcc.Receiver(self.loop, self.recv_sock, self.dest,
+                                len(self.data))
+        receiver.start()
+
+        receiver.cancel()
+        receiver.cancel()
+
+        self.assertTrue(receiver.done.cancelled())
+        self.assertIsNone(receiver._mmap)
+        self.assertFalse(receiver._reading)
@@ -0,0 +1,114 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import mock
+
+from pirch.proto.irc import decoding
+from pirch import util
+
+
+class IsAsciiTest(unittest.TestCase):
+    def test_ascii(self):
+        self.assertTrue(decoding.is_ascii(b'plain text\x01\x7f'))
+
+    def test_nonascii(self):
+        self.assertFalse(decoding.is_ascii(b'caf\xc3\xa9'))
+
+
+class DecoderTest(unittest.TestCase):
+    def test_init(self):
+        result = decoding.Decoder('UTF8', 'cp1252')
+
+        self.assertEqual(result.encoding, 'utf-8')
+        self.assertEqual(result.fallback, 'cp1252')
+        self.assertEqual(result._fallbacks, {})
+
+    def test_init_bad_encoding(self):
+        self.assertRaises(LookupError, decoding.Decoder, 'no-such-codec')
+
+    def test_set_fallback(self):
+        dec = decoding.Decoder()
+
+        dec.set_fallback(b'#Chan[1]', 'cp1252')
+        dec.set_fallback(b'#other', 'koi8-r')
+        dec.set_fallback(b'#OTHER', None)
+
+        self.assertEqual(dec._fallbacks, {b'#chan{1}': 'cp1252'})
+        self.assertEqual(dec.fallback_for(b'#CHAN{1}'), 'cp1252')
+        self.assertEqual(dec.fallback_for(b'#other'), 'iso8859-1')
+        self.assertEqual(dec.fallback_for(None), 'iso8859-1')
+
+    def test_decode_ascii(self):
+        dec = decoding.Decoder()
+
+        with mock.patch.object(decoding.Decoder, 'fallback_for') as mock_fb:
+            self.assertEqual(dec.decode(b'hello'), u'hello')
+
+        self.assertFalse(mock_fb.called)
+
+    def test_decode_utf8(self):
+        dec = decoding.Decoder()
+
+        self.assertEqual(dec.decode(b'caf\xc3\xa9'), u'caf\xe9')
+
+    def test_decode_fallback(self):
+        dec = decoding.Decoder()
+        dec.set_fallback(b'#ru', 'koi8-r')
+
+        self.assertEqual(dec.decode(b'caf\xe9'), u'caf\xe9')
+        self.assertEqual(dec.decode(b'caf\xe9', b'#chan'), u'caf\xe9')
+        self.assertEqual(dec.decode(b'\xd0\xd2', b'#RU'), u'\u043f\u0440')
+
+
+class DecodedArgumentsTest(unittest.TestCase):
+    def make_view(self, values):
+        decoder = mock.Mock(**{
+            'decode.side_effect': lambda v, t: v.decode('ascii').upper(),
+        })
+        return decoding.DecodedArguments(values, decoder, b'#chan')
+
+    def test_len(self):
+        self.assertEqual(len(self.make_view([b'a', b'b'])), 2)
+
+    def test_getitem_cached(self):
+        view = self.make_view([b'a', util.unset, b'c'])
+
+        self.assertEqual(view[0], u'A')
+        self.assertEqual(view[-3], u'A')
+        self.assertIs(view[1], util.unset)
+        self.assertEqual(view[-1], u'C')
+        self.assertEqual(view._cache, {0: u'A', 1: util.unset, 2: u'C'})
+        self.assertEqual(view._decoder.decode.call_count, 2)
+        view._decoder.decode.assert_any_call(b'a', b'#chan')
+
+    def test_getitem_range(self):
+        view = self.make_view([b'a', b'b'])
+
+        self.assertRaises(IndexError, lambda: view[2])
+        self.assertRaises(IndexError, lambda: view[-3])
+
+    def test_getitem_slice(self):
+        view = self.make_view([b'a', b'b', b'c'])
+
+        self.assertEqual(view[1:], [u'B', u'C'])
+        self.assertEqual(view[::2], [u'A', u'C'])
+
+    def test_getitem_other(self):
+        view = self.make_view([b'a'])
+
+        self.assertRaises(TypeError, lambda: view['spam'])
@@ -0,0 +1,188 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import mock
+
+from pirch.proto.irc import dedupe
+
+
+class FingerprintTest(unittest.TestCase):
+    def test_msgid(self):
+        result = dedupe.fingerprint(
+            b'@time=2015-01-01T00:00:00Z;msgid=abc :n!u@h PRIVMSG #c :hi')
+
+        self.assertEqual(result, dedupe.fingerprint(
+            b'@msgid=abc;time=2016-01-01T00:00:00Z :x!y@z NOTICE #d :yo'))
+        self.assertNotEqual(result, dedupe.fingerprint(
+            b'@msgid=abd :n!u@h PRIVMSG #c :hi'))
+
+    def test_volatile_fields(self):
+        result = dedupe.fingerprint(b':nick!user@host PRIVMSG #c :hi')
+
+        self.assertEqual(result, dedupe.fingerprint(
+            b'@time=2015-01-01T00:00:00Z :nick!other@relay PRIVMSG #c :hi'))
+        self.assertEqual(result, dedupe.fingerprint(b':nick PRIVMSG #c :hi'))
+        self.assertEqual(result, dedupe.fingerprint(
+            b'PRIVMSG #c :hi', b'nick'))
+        self.assertNotEqual(result, dedupe.fingerprint(
+            b':other!user@host PRIVMSG #c :hi'))
+        self.assertNotEqual(result, dedupe.fingerprint(
+            b':nick!user@host PRIVMSG #c :ho'))
+
+    def test_excluded(self):
+        for line in (b'PING :irc.example.net', b':srv PONG srv :x',
+                     b':srv 353 me = #c :a b', b':n!u@h JOIN #c',
+                     b':n!u@h MODE #c +o x'):
+            self.assertIsNone(dedupe.fingerprint(line))
+
+        self.assertIsNotNone(dedupe.fingerprint(b'@msgid=a PING :x'))
+        self.assertIsNotNone(dedupe.fingerprint(b':n!u@h TAGMSG #c'))
+
+
+def msgid(ident):
+    return b'@msgid=' + ident + b' :n!u@h PRIVMSG #c :hi'
+
+
+class DeduperTest(unittest.TestCase):
+    def test_echo(self):
+        dedup = dedupe.Deduper()
+        dedup.sent(b'PRIVMSG #c :hi', b'me', now=1.0)
+        dedup.sent(b'PING :x', b'me', now=1.0)
+
+        self.assertTrue(dedup.seen(b':me!u@h PRIVMSG #c :hi', now=2.0))
+        self.assertFalse(dedup.seen(b':me!u@h PRIVMSG #c :hi', now=3.0))
+        self.assertFalse(dedup.seen(b':me!u@h PRIVMSG #c :ho', now=3.0))
+
+    def test_echo_msgid(self):
+        dedup = dedupe.Deduper()
+        dedup.sent(b'PRIVMSG #c :hi', b'me', now=1.0)
+
+        self.assertTrue(dedup.seen(b'@msgid=x :me!u@h PRIVMSG #c :hi',
+                                   now=2.0))
+
+    def test_echo_rotated(self):
+        dedup = dedupe.Deduper(window=10.0)
+        dedup.sent(b'PRIVMSG #c :hi', b'me', now=0.0)
+
+        self.assertTrue(dedup.seen(b':me PRIVMSG #c :hi', now=15.0))
+
+        dedup.sent(b'PRIVMSG #c :hi', b'me', now=15.0)
+
+        self.assertFalse(dedup.seen(b':me PRIVMSG #c :hi', now=40.0))
+
+    def test_repeated_content(self):
+        dedup = dedupe.Deduper()
+
+        self.assertFalse(dedup.seen(b':n!u@h PRIVMSG #c :lol', now=1.0))
+        self.assertFalse(dedup.seen(b':n!u@h PRIVMSG #c :lol', now=2.0))
+
+    def test_replay(self):
+        dedup = dedupe.Deduper(window=10.0)
+        dedup.seen(b':n!u@h PRIVMSG #c :lol', now=1.0)
+        dedup.replay(now=5.0)
+
+        self.assertTrue(dedup.replaying(now=5.0))
+        self.assertTrue(dedup.seen(b':n!x@y PRIVMSG #c :lol', now=6.0))
+        self.assertFalse(dedup.seen(b':n!u@h PRIVMSG #c :new', now=6.0))
+        self.assertTrue(dedup.seen(b':n!u@h PRIVMSG #c :new', now=7.0))
+        self.assertFalse(dedup.seen(b':n!u@h JOIN #c', now=7.0))
+        self.assertFalse(dedup.seen(b':n!u@h JOIN #c', now=7.0))
+
+        dedup.replay(0, now=8.0)
+
+        self.assertFalse(dedup.replaying(now=8.0))
+        self.assertFalse(dedup.seen(b':n!u@h PRIVMSG #c :lol', now=9.0))
+
+    @mock.patch('time.time', return_value=10.0)
+    def test_replay_default_time(self, mock_time):
+        dedup = dedupe.Deduper(window=5.0)
+
+        dedup.replay()
+
+        self.assertEqual(dedup._replay_until, 15.0)
+        self.assertTrue(dedup.replaying())
+
+    def test_never_duplicates(self):
+        dedup = dedupe.Deduper()
+        dedup.replay(now=0.0)
+
+        for line in (b'PING :irc.example.net', b':srv PONG srv :x',
+                     b':srv 353 me = #c :a b', b':srv 366 me #c :End',
+                     b':n!u@h NICK m', b':n!u@h MODE #c +o x'):
+            self.assertFalse(dedup.seen(line, now=1.0))
+            self.assertFalse(dedup.seen(line, now=2.0))
+        self.assertEqual(len(dedup), 0)
+
+    def test_msgid(self):
+        dedup = dedupe.Deduper()
+
+        self.assertFalse(dedup.seen(msgid(b'a'), now=1.0))
+        self.assertTrue(dedup.seen(msgid(b'a'), now=2.0))
+        self.assertFalse(dedup.seen(msgid(b'b'), now=3.0))
+        self.assertFalse(dedup.seen(b'@msgid=p PING :x', now=3.0))
+        self.assertTrue(dedup.seen(b'@msgid=p PING :x', now=3.0))
+        self.assertEqual(len(dedup), 3)
+
+    @mock.patch('time.time', return_value=10.0)
+    def test_seen_default_time(self, mock_time):
+        dedup = dedupe.Deduper()
+
+        dedup.seen(msgid(b'x'))
+
+        self.assertEqual(dedup._rotated, 10.0)
+
+    def test_window(self):
+        dedup = dedupe.Deduper(window=10.0)
+        dedup.seen(msgid(b'a'), now=0.0)
+
+        # Rotated into the previous set, but still remembered
+        self.assertTrue(dedup.seen(msgid(b'a'), now=15.0))
+        self.assertEqual(dedup._previous, set([dedupe.fingerprint(
+            msgid(b'a'))]))
+
+        # Rotated out entirely
+        dedup.seen(msgid(b'b'), now=26.0)
+        self.assertFalse(dedup.seen(msgid(b'a'), now=27.0))
+
+    def test_window_expired(self):
+        dedup = dedupe.Deduper(window=10.0)
+        dedup.seen(msgid(b'a'), now=0.0)
+        dedup.seen(msgid(b'b'), now=11.0)
+
+        self.assertFalse(dedup.seen(msgid(b'b'), now=40.0))
+        self.assertEqual(len(dedup), 1)
+
+    def test_max_entries(self):
+        dedup = dedupe.Deduper(max_entries=4)
+
+        for i in range(10):
+            dedup.seen(msgid(str(i).encode('ascii')), now=0.0)
+
+        self.assertTrue(len(dedup) <= 4)
+        self.assertTrue(dedup.seen(msgid(b'9'), now=0.0))
+        self.assertFalse(dedup.seen(msgid(b'0'), now=0.0))
+
+    def test_call(self):
+        dedup = dedupe.Deduper()
+        msg = mock.Mock(msg=msgid(b'a'))
+        ping = mock.Mock(msg=b'PING :irc.example.net')
+
+        self.assertFalse(dedup(msg))
+        self.assertTrue(dedup(msg))
+        self.assertFalse(dedup(ping))
+        self.assertFalse(dedup(ping))
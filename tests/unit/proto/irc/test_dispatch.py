@@ -0,0 +1,85 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import mock
+
+from pirch.proto.irc import dispatch
+
+
+class DispatcherTest(unittest.TestCase):
+    def test_register(self):
+        disp = dispatch.Dispatcher()
+
+        disp.register(b'PING', 'handler1')
+        disp.register(b'PING', 'handler2')
+        disp.register(None, 'handler3')
+
+        self.assertEqual(disp._handlers, {
+            b'PING': ['handler1', 'handler2'],
+            None: ['handler3'],
+        })
+
+    def test_unregister(self):
+        disp = dispatch.Dispatcher()
+        disp._handlers = {b'PING': ['handler1', 'handler2']}
+
+        disp.unregister(b'PING', 'handler1')
+        disp.unregister(b'PING', 'missing')
+        disp.unregister(b'PONG', 'handler2')
+
+        self.assertEqual(disp._handlers, {b'PING': ['handler2']})
+
+    def test_dispatch(self):
+        calls = []
+        disp = dispatch.Dispatcher()
+        disp._handlers = {
+            b'PING': [lambda m: calls.append(('ping', m))],
+            b'PONG': [lambda m: calls.append(('pong', m))],
+            None: [lambda m: calls.append(('all', m))],
+        }
+        msg = mock.Mock()
+        msg.command.cmd = b'PING'
+
+        disp.dispatch(msg)
+
+        self.assertEqual(calls, [('ping', msg), ('all', msg)])
+
+    def test_filters(self):
+        disp = dispatch.Dispatcher()
+
+        disp.add_filter('filter1')
+        disp.add_filter('filter2')
+        disp.remove_filter('filter1')
+        disp.remove_filter('missing')
+
+        self.assertEqual(disp._filters, ['filter2'])
+
+    def test_dispatch_filtered(self):
+        calls = []
+        disp = dispatch.Dispatcher()
+        disp._handlers = {None: [lambda m: calls.append(('all', m))]}
+        disp._filters = [lambda m: m.command.cmd == b'PING']
+        ping = mock.Mock()
+        ping.command.cmd = b'PING'
+        pong = mock.Mock()
+        pong.command.cmd = b'PONG'
+
+        disp.dispatch(ping)
+        disp.dispatch(pong)
+
+        self.assertEqual(calls, [('all', pong)])
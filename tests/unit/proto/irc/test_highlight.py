@@ -0,0 +1,143 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import mock
+
+from pirch import util
+from pirch.proto.irc import highlight
+from pirch.proto.irc import isupport
+
+
+class MatcherTest(unittest.TestCase):
+    def test_overlapping(self):
+        matcher = highlight.Matcher()
+        for pattern in (b'he', b'she', b'his', b'hers'):
+            matcher.add(pattern, pattern.upper())
+
+        result = matcher.search(b'ushers')
+
+        self.assertEqual(result, [
+            highlight.Match(1, 4, b'she', b'SHE'),
+            highlight.Match(2, 4, b'he', b'HE'),
+            highlight.Match(2, 6, b'hers', b'HERS'),
+        ])
+
+    def test_casemapped(self):
+        matcher = highlight.Matcher()
+        matcher.add(b'Nick[away]')
+
+        self.assertTrue(b'NICK{AWAY}' in matcher)
+        self.assertEqual(matcher.search(b'hi nick{Away}!'),
+                         [highlight.Match(3, 13, b'Nick[away]', None)])
+
+    def test_isupport(self):
+        isup = isupport.ISupport()
+        isup.feed([b'CASEMAPPING=ascii'])
+        matcher = highlight.Matcher(isup)
+        matcher.add(b'nick[a]')
+        matcher.add(b'NICK{A}')
+
+        self.assertEqual(len(matcher), 2)
+        self.assertEqual([m.pattern for m in matcher.search(b'NICK[A]')],
+                         [b'nick[a]'])
+
+        # The patterns are rekeyed when the casemapping changes
+        isup.feed([b'CASEMAPPING=rfc1459'])
+
+        self.assertEqual(len(matcher), 1)
+        self.assertEqual(len(matcher.search(b'nick[a]')), 1)
+        self.assertTrue(b'Nick{a}' in matcher)
+
+    def test_word(self):
+        matcher = highlight.Matcher()
+        matcher.add(b'bob', word=True)
+        matcher.add(b'cat')
+
+        result = matcher.search(b'bob: bobby bob_ the cat concatenated bob')
+
+        self.assertEqual([(m.start, m.pattern) for m in result], [
+            (0, b'bob'), (20, b'cat'), (27, b'cat'), (37, b'bob')])
+
+    def test_incremental(self):
+        matcher = highlight.Matcher()
+        matcher.add(b'abc')
+        self.assertEqual(len(matcher.search(b'xabcdx')), 1)
+
+        matcher.add(b'bcd', 2)
+        matcher.add(b'ABC', 1)
+        result = matcher.search(b'xabcdx')
+
+        self.assertEqual(len(matcher), 2)
+        self.assertEqual([(m.pattern, m.value) for m in result],
+                         [(b'ABC', 1), (b'bcd', 2)])
+
+        matcher.remove(b'abc')
+        matcher.remove(b'missing')
+
+        self.assertEqual([m.pattern for m in matcher.search(b'xabcdx')],
+                         [b'bcd'])
+
+        matcher.remove(b'bcd')
+
+        self.assertEqual(matcher.search(b'xabcdx'), [])
+        self.assertEqual(len(matcher._goto), 1)
+
+    def test_empty(self):
+        matcher = highlight.Matcher()
+
+        self.assertRaises(ValueError, matcher.add, b'')
+        self.assertEqual(matcher.search(b'anything'), [])
+
+    def test_against_find(self):
+        words = [('w%d' % i).encode('ascii') for i in range(0, 300, 7)]
+        words += [b'w1', b'1w']
+        text = b' '.join(('w%d' % i).encode('ascii') for i in range(300))
+        matcher = highlight.Matcher()
+        for word in words:
+            matcher.add(word)
+
+        expected = []
+        for word in words:
+            start = text.find(word)
+            while start >= 0:
+                expected.append((start + len(word), start))
+                start = text.find(word, start + 1)
+        expected.sort()
+
+        self.assertEqual(sorted((m.end, m.start)
+                                for m in matcher.search(text)), expected)
+
+    def test_search_message(self):
+        matcher = highlight.Matcher()
+        matcher.add(b'hello')
+        privmsg = mock.Mock(args=[b'#chan', b'hello world'])
+        privmsg.command.cmd = b'NOTICE'
+        ping = mock.Mock(args=[b'hello'])
+        ping.command.cmd = b'PING'
+        empty = mock.Mock(args=[util.unset, util.unset])
+        empty.command.cmd = b'PRIVMSG'
+        target = mock.Mock(args=[b'hello'])
+        target.command.cmd = b'PRIVMSG'
+        extra = mock.Mock(args=[b'#chan', b'hi', b'hello'])
+        extra.command.cmd = b'PRIVMSG'
+
+        self.assertEqual(len(matcher.search_message(privmsg)), 1)
+        self.assertEqual(matcher.search_message(ping), [])
+        self.assertEqual(matcher.search_message(empty), [])
+        self.assertEqual(matcher.search_message(target), [])
+        self.assertEqual(matcher.search_message(extra), [])
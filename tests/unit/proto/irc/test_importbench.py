@@ -0,0 +1,61 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import mock
+
+from pirch.proto.irc import importbench
+
+
+class MeasureTest(unittest.TestCase):
+    @mock.patch('subprocess.check_output',
+                side_effect=[b'0.3\n', b'0.1\n', b'0.2\n'])
+    def test_measure(self, mock_check_output):
+        result = importbench.measure('some.module', 3, python='python')
+
+        self.assertEqual(result, [0.1, 0.2, 0.3])
+        self.assertEqual(mock_check_output.call_count, 3)
+        mock_check_output.assert_called_with(
+            ['python', '-c', importbench._timer % 'some.module'])
+
+
+class BreakdownTest(unittest.TestCase):
+    @mock.patch('subprocess.Popen')
+    def test_breakdown(self, mock_Popen):
+        mock_Popen.return_value.communicate.return_value = (b'', (
+            b'import time: self [us] | cumulative | imported package\n'
+            b'import time:       100 |        100 |   fast\n'
+            b'import time:       200 |        900 | slow\n'
+            b'something else\n'
+        ))
+
+        result = importbench.breakdown('slow', python='python')
+
+        self.assertEqual(result, [(900, 'slow'), (100, 'fast')])
+        self.assertEqual(mock_Popen.call_args[0][0],
+                         ['python', '-X', 'importtime', '-c', 'import slow'])
+
+
+class MainTest(unittest.TestCase):
+    @mock.patch.object(importbench, 'breakdown', return_value=[])
+    @mock.patch.object(importbench, 'measure', return_value=[0.1, 0.2, 0.3])
+    def test_main(self, mock_measure, mock_breakdown):
+        result = importbench.main(['a.b', '--repeat', '3', '--top', '0'])
+
+        self.assertEqual(result, 0)
+        mock_measure.assert_called_once_with('a.b', 3)
+        self.assertFalse(mock_breakdown.called)
@@ -0,0 +1,164 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import mock
+
+from pirch.proto.irc import casemap
+from pirch.proto.irc import isupport
+from pirch import util
+
+
+class UnescapeTest(unittest.TestCase):
+    def test_plain(self):
+        self.assertEqual(isupport._unescape(b'plain'), b'plain')
+
+    def test_escaped(self):
+        self.assertEqual(isupport._unescape(b'a\\x20b\\x3Dc'), b'a b=c')
+
+
+class ISupportTest(unittest.TestCase):
+    def test_defaults(self):
+        result = isupport.ISupport()
+
+        self.assertEqual(result.casemapping, b'rfc1459')
+        self.assertIs(result.casemap, casemap.bytes_mappers['rfc1459'])
+        self.assertEqual(result.chantypes, frozenset([b'#', b'&']))
+        self.assertEqual(result.prefix, {b'o': b'@', b'v': b'+'})
+        self.assertEqual(result.symbols, {b'@': b'o', b'+': b'v'})
+        self.assertEqual(result.prefix_order, {b'o': 0, b'v': 1})
+        self.assertEqual(result.chanmodes[0], frozenset([b'b']))
+        self.assertEqual(result.modetypes[b'k'], 'B')
+        self.assertEqual(result.modetypes[b'o'], 'P')
+        self.assertEqual(result.nicklen, 9)
+        self.assertEqual(result.modes, 3)
+        self.assertIsNone(result.maxtargets)
+        self.assertEqual(result.linelen, 512)
+        self.assertEqual(result.targmax, {})
+        self.assertFalse(b'NICKLEN' in result)
+
+    def test_feed(self):
+        result = isupport.ISupport()
+
+        result.feed([
+            b'CASEMAPPING=ascii',
+            b'CHANTYPES=#',
+            b'PREFIX=(qaohv)~&@%+',
+            b'CHANMODES=beI,k,l,imnpst',
+            b'NICKLEN=30',
+            b'MODES',
+            b'TARGMAX=PRIVMSG:4,notice:3,JOIN:,BAD:x',
+            b'NETWORK=Example\\x20Net',
+            b'MONITOR=100',
+        ])
+
+        self.assertEqual(result.casemapping, b'ascii')
+        self.assertEqual(result.casemap(b'[A]'), b'[a]')
+        self.assertTrue(result.is_channel(b'#chan'))
+        self.assertFalse(result.is_channel(b'&chan'))
+        self.assertFalse(result.is_channel(b''))
+        self.assertEqual(result.prefix[b'q'], b'~')
+        self.assertEqual(result.symbols[b'%'], b'h')
+        self.assertEqual(result.prefix_order[b'v'], 4)
+        self.assertEqual(result.chanmodes[0], frozenset([b'b', b'e', b'I']))
+        self.assertEqual(result.modetypes[b'I'], 'A')
+        self.assertEqual(result.modetypes[b'h'], 'P')
+        self.assertEqual(result.nicklen, 30)
+        self.assertIsNone(result.modes)
+        self.assertEqual(result.targmax, {
+            b'PRIVMSG': 4,
+            b'NOTICE': 3,
+            b'JOIN': None,
+        })
+        self.assertEqual(result.max_targets(b'privmsg'), 4)
+        self.assertIsNone(result.max_targets(b'JOIN'))
+        self.assertEqual(result[b'NETWORK'], b'Example Net')
+        self.assertEqual(result[b'MODES'], b'')
+        self.assertEqual(result.monitor, 100)
+        self.assertTrue(b'MONITOR' in result)
+
+    def test_feed_negate(self):
+        result = isupport.ISupport()
+        result.feed([b'NICKLEN=30', b'CHANTYPES=#', b'PREFIX=(o)@',
+                     b'TARGMAX=PRIVMSG:4'])
+
+        result.feed([b'-NICKLEN', b'-CHANTYPES', b'-PREFIX', b'-TARGMAX'])
+
+        self.assertEqual(result.nicklen, 9)
+        self.assertEqual(result.chantypes, frozenset([b'#', b'&']))
+        self.assertEqual(result.prefix, {b'o': b'@', b'v': b'+'})
+        self.assertEqual(result.targmax, {})
+        self.assertFalse(b'NICKLEN' in result)
+
+    def test_feed_empty_values(self):
+        result = isupport.ISupport()
+
+        result.feed([b'CHANTYPES=', b'PREFIX=', b'NICKLEN=bogus',
+                     b'CASEMAPPING=unknown'])
+
+        self.assertEqual(result.chantypes, frozenset())
+        self.assertEqual(result.prefix, {})
+        self.assertEqual(result.nicklen, 9)
+        self.assertEqual(result.casemapping, b'rfc1459')
+
+    def test_linelen(self):
+        result = isupport.ISupport()
+
+        result.feed([b'LINELEN=1024'])
+        self.assertEqual(result.linelen, 1024)
+        result.feed([b'LINELEN='])
+        self.assertEqual(result.linelen, 512)
+        result.feed([b'LINELEN=2048', b'-LINELEN'])
+        self.assertEqual(result.linelen, 512)
+        result.feed([b'LINELEN'])
+        self.assertEqual(result.linelen, 512)
+
+    def test_tokens(self):
+        orig = isupport.ISupport()
+        orig.feed([b'NICKLEN=30', b'PREFIX=(qo)~@', b'EXCEPTS'])
+
+        result = isupport.ISupport()
+        result.feed(orig.tokens())
+
+        self.assertEqual(sorted(orig.tokens()),
+                         [b'EXCEPTS', b'NICKLEN=30', b'PREFIX=(qo)~@'])
+        self.assertEqual(result.nicklen, 30)
+        self.assertEqual(result.prefix, {b'q': b'~', b'o': b'@'})
+        self.assertTrue(b'EXCEPTS' in result)
+
+    def test_tokens_escaped(self):
+        orig = isupport.ISupport()
+        orig.feed([b'NETWORK=Example\\x20Net', b'X=a\\x5Cx20\\x3Db'])
+
+        result = isupport.ISupport()
+        result.feed(orig.tokens())
+
+        self.assertEqual(sorted(orig.tokens()),
+                         [b'NETWORK=Example\\x20Net', b'X=a\\x5Cx20\\x3Db'])
+        self.assertEqual(result[b'NETWORK'], b'Example Net')
+        self.assertEqual(result[b'X'], b'a\\x20=b')
+
+    def test_update(self):
+        result = isupport.ISupport()
+        msg = mock.Mock(args=[b'nick', b'NICKLEN=16', b'CHANTYPES=#',
+                              util.unset, b'are supported by this server'])
+
+        result.update(msg)
+
+        self.assertEqual(result.nicklen, 16)
+        self.assertEqual(result.chantypes, frozenset([b'#']))
+        self.assertFalse(b'are supported by this server' in result)
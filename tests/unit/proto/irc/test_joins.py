@@ -0,0 +1,131 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import mock
+
+from pirch.proto.irc import isupport
+from pirch.proto.irc import joins
+from pirch.proto.irc import splitter
+
+
+class JoinLinesTest(unittest.TestCase):
+    def test_base(self):
+        result = joins.join_lines([b'#a', b'#b', b'#c'])
+
+        self.assertEqual(result, [b'JOIN #a,#b,#c'])
+
+    def test_empty(self):
+        self.assertEqual(joins.join_lines([]), [])
+
+    def test_keys(self):
+        result = joins.join_lines([b'#a', b'#b', b'#c', b'#d'],
+                                  keys={b'#b': b'kb', b'#d': b'kd'})
+
+        self.assertEqual(result, [b'JOIN #b,#d,#a,#c kb,kd'])
+
+    def test_max_targets(self):
+        result = joins.join_lines([b'#a', b'#b', b'#c'], max_targets=2)
+
+        self.assertEqual(result, [b'JOIN #a,#b', b'JOIN #c'])
+
+    def test_linelen(self):
+        channels = [('#chan%03d' % i).encode('ascii') for i in range(200)]
+
+        result = joins.join_lines(channels)
+
+        for line in result:
+            self.assertTrue(len(line) + 2 <= 512)
+        self.assertTrue(len(result[0]) + 2 > 512 - 9)
+        self.assertEqual(b','.join(line[5:] for line in result),
+                         b','.join(channels))
+
+    def test_linelen_keys(self):
+        channels = [('#c%d' % i).encode('ascii') for i in range(4)]
+        keys = {name: b'k' * 4 for name in channels[:3]}
+
+        # Room for two keyed channels, at 3 bytes plus 4 for the key
+        # and 2 for separators each, less one comma
+        result = joins.join_lines(channels, keys,
+                                  linelen=len(b'JOIN \r\n') + 9 + 9 - 1)
+
+        self.assertEqual(result, [
+            b'JOIN #c0,#c1 kkkk,kkkk',
+            b'JOIN #c2,#c3 kkkk',
+        ])
+
+    def test_oversized(self):
+        result = joins.join_lines([b'#' + b'x' * 600, b'#a'])
+
+        self.assertEqual(result, [b'JOIN #' + b'x' * 600, b'JOIN #a'])
+
+
+class PartLinesTest(unittest.TestCase):
+    def test_base(self):
+        result = joins.part_lines([b'#a', b'#b'], reason=b'bye now')
+
+        self.assertEqual(result, [b'PART #a,#b :bye now'])
+
+    def test_reason_reserved(self):
+        result = joins.part_lines([b'#a', b'#b'], reason=b'bye',
+                                  linelen=len(b'PART #a,#b :bye\r\n') - 1)
+
+        self.assertEqual(result, [b'PART #a :bye', b'PART #b :bye'])
+
+
+class MessagesTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = mock.Mock(isupport=isupport.ISupport())
+        self.conn.isupport.feed([b'TARGMAX=JOIN:2,PART:'])
+
+    def test_join(self):
+        result = joins.join_messages('ctxt', self.conn,
+                                     [b'#a', b'#b', b'#c'],
+                                     keys={b'#c': b'key'})
+
+        self.assertEqual([msg.msg for msg in result],
+                         [b'JOIN #c,#a key', b'JOIN #b'])
+        self.assertEqual(result[0].args.channels, b'#c,#a')
+        self.assertEqual(result[0].args.keys, b'key')
+        self.assertIs(result[0].origin, self.conn.me)
+
+    def test_part(self):
+        result = joins.part_messages('ctxt', self.conn,
+                                     [b'#a', b'#b', b'#c'], reason=b'bye')
+
+        self.assertEqual([msg.msg for msg in result],
+                         [b'PART #a,#b,#c :bye'])
+        self.assertEqual(result[0].args.reason, b'bye')
+
+    def test_no_isupport(self):
+        conn = mock.Mock(spec=['me'])
+
+        result = joins.part_messages('ctxt', conn, [b'#a', b'#b'])
+
+        self.assertEqual([msg.msg for msg in result], [b'PART #a,#b'])
+
+    def test_empty_linelen(self):
+        self.conn.isupport.feed([b'LINELEN='])
+        channels = [('#%d' % i).encode('ascii') for i in range(200)]
+
+        result = joins.part_messages('ctxt', self.conn, channels)
+
+        self.assertEqual(b','.join(msg.msg[5:] for msg in result),
+                         b','.join(channels))
+        self.assertTrue(all(len(msg.msg) + 2 <= splitter.LINELEN
+                            for msg in result))
+        self.assertTrue(len(result) > 1)
@@ -18,6 +18,7 @@ import unittest
 
 import mock
 
+from pirch.proto.irc import decoding
 from pirch.proto.irc import messages
 from pirch import util
 
@@ -164,6 +165,31 @@ class ArgumentsTest(unittest.TestCase):
                 cmd.to_bytes.assert_called_once_with(
                     'ctxt', 'conn', cmd.default)
 
+    @mock.patch.object(messages.Arguments, '__init__', return_value=None)
+    def test_from_dict_variadic(self, mock_init):
+        command = FakeCommand(zero=0, rest=(slice(1, None), []), last=-1)
+        value = {
+            'zero': 'v0',
+            'rest': ['v1', 'v2'],
+            'last': 'v3',
+        }
+
+        result = messages.Arguments.from_dict('ctxt', 'conn', command, value)
+
+        self.assertIsInstance(result, messages.Arguments)
+        mock_init.assert_called_once_with(
+            'ctxt', 'conn', ['v0', 'v1', 'v2', 'v3'], command)
+
+    @mock.patch.object(messages.Arguments, '__init__', return_value=None)
+    def test_from_dict_variadic_defaults(self, mock_init):
+        command = FakeCommand(zero=0, rest=(slice(1, None), ['d1', 'd2']))
+
+        result = messages.Arguments.from_dict('ctxt', 'conn', command, {})
+
+        self.assertIsInstance(result, messages.Arguments)
+        mock_init.assert_called_once_with(
+            'ctxt', 'conn', ['def0', 'd1', 'd2'], command)
+
     def test_init(self):
         result = messages.Arguments('ctxt', 'conn', 'value', 'command')
 
@@ -173,6 +199,7 @@ class ArgumentsTest(unittest.TestCase):
         self.assertEqual(result._command, 'command')
         self.assertEqual(result._attr_cache, {})
         self.assertIsNone(result._seq_len)
+        self.assertIsNone(result._decoded)
 
     def test_len_cached(self):
         args = messages.Arguments('ctxt', 'conn', ['zero', 'one'], 'command')
@@ -243,6 +270,30 @@ class ArgumentsTest(unittest.TestCase):
 
         self.assertRaises(TypeError, lambda: args['spam'])
 
+    def test_decoded(self):
+        conn = mock.Mock(decoder=mock.Mock(**{
+            'decode.side_effect': lambda v, t: v.decode('ascii'),
+        }))
+        args = messages.Arguments('ctxt', conn, [b'#chan', b'text'],
+                                  'command')
+
+        result = args.decoded
+
+        self.assertIsInstance(result, decoding.DecodedArguments)
+        self.assertIs(args.decoded, result)
+        self.assertIs(result._decoder, conn.decoder)
+        self.assertEqual(result._target, b'#chan')
+        self.assertEqual(list(result), [u'#chan', u'text'])
+
+    def test_decoded_default(self):
+        args = messages.Arguments('ctxt', object(), [util.unset, b'text'],
+                                  'command')
+
+        result = args.decoded
+
+        self.assertIs(result._decoder, decoding.default_decoder)
+        self.assertIsNone(result._target)
+
     def test_getattr_unknown(self):
         args = messages.Arguments('ctxt', 'conn', ['zero', 'one', 'two'], {})
         args._attr_cache['spam'] = 'cached'
@@ -281,6 +332,34 @@ class ArgumentsTest(unittest.TestCase):
         desc.from_bytes.assert_called_once_with('ctxt', 'conn', 'one')
         self.assertEqual(args._attr_cache, {'spam': 'bytes'})
 
+    def test_getattr_uncached_variadic(self):
+        desc = mock.Mock(**{
+            'idx': slice(1, None),
+            'default': 'default',
+            'from_bytes.return_value': 'bytes',
+        })
+        args = messages.Arguments('ctxt', 'conn', ['zero', 'one', 'two'],
+                                  {'spam': desc})
+
+        self.assertEqual(args.spam, 'bytes')
+        desc.from_bytes.assert_called_once_with('ctxt', 'conn',
+                                                ['one', 'two'])
+
+    def test_getattr_uncached_variadic_empty(self):
+        desc = mock.Mock(idx=slice(3, None), default='default')
+        args = messages.Arguments('ctxt', 'conn', ['zero', 'one', 'two'],
+                                  {'spam': desc})
+
+        self.assertEqual(args.spam, 'default')
+        self.assertFalse(desc.from_bytes.called)
+
+
+class RawEntityTest(unittest.TestCase):
+    def test_to_bytes(self):
+        ent = messages.RawEntity(b'nick!user@host')
+
+        self.assertEqual(ent.to_bytes(), b'nick!user@host')
+
 
 class MessageTest(unittest.TestCase):
     @mock.patch('pirch.proto.irc.commands.get_command', return_value='command')
@@ -0,0 +1,200 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from pirch.proto.irc import isupport
+from pirch.proto.irc import modes
+
+
+def make_isupport():
+    result = isupport.ISupport()
+    result.feed([b'PREFIX=(qov)~@+', b'CHANMODES=beI,k,l,imnpst'])
+    return result
+
+
+class ParseModesTest(unittest.TestCase):
+    def test_base(self):
+        result = modes.parse_modes(
+            make_isupport(), b'+ovbl-kv+m',
+            [b'alice', b'bob', b'*!*@bad', b'10', b'key', b'carol'])
+
+        self.assertEqual(result, [
+            modes.ModeChange(True, b'o', b'alice'),
+            modes.ModeChange(True, b'v', b'bob'),
+            modes.ModeChange(True, b'b', b'*!*@bad'),
+            modes.ModeChange(True, b'l', b'10'),
+            modes.ModeChange(False, b'k', b'key'),
+            modes.ModeChange(False, b'v', b'carol'),
+            modes.ModeChange(True, b'm', None),
+        ])
+
+    def test_unset_c(self):
+        result = modes.parse_modes(make_isupport(), b'-l+n', [])
+
+        self.assertEqual(result, [
+            modes.ModeChange(False, b'l', None),
+            modes.ModeChange(True, b'n', None),
+        ])
+
+    def test_missing_params(self):
+        result = modes.parse_modes(make_isupport(), b'+bZ', [])
+
+        self.assertEqual(result, [
+            modes.ModeChange(True, b'b', None),
+            modes.ModeChange(True, b'Z', None),
+        ])
+
+
+class FormatModesTest(unittest.TestCase):
+    def test_base(self):
+        result = modes.format_modes([
+            modes.ModeChange(True, b'o', b'alice'),
+            modes.ModeChange(True, b'm', None),
+            modes.ModeChange(False, b'k', b'key'),
+            modes.ModeChange(False, b'l', None),
+            modes.ModeChange(True, b'v', b'bob'),
+        ])
+
+        self.assertEqual(result, [b'+om-kl+v', b'alice', b'key', b'bob'])
+
+    def test_empty(self):
+        self.assertEqual(modes.format_modes([]), [b''])
+
+
+class ParseNamesTest(unittest.TestCase):
+    def test_base(self):
+        result = modes.parse_names(make_isupport(), b'~@alice +bob carol ')
+
+        self.assertEqual(result, [
+            (b'alice', 0b011),
+            (b'bob', 0b100),
+            (b'carol', 0),
+        ])
+
+
+class ChannelModesTest(unittest.TestCase):
+    def test_init(self):
+        result = modes.ChannelModes()
+
+        self.assertEqual(result.flags, 0)
+        self.assertIsNone(result.params)
+        self.assertIsNone(result.lists)
+        self.assertEqual(result.members, {})
+        self.assertFalse(hasattr(result, '__dict__'))
+
+    def test_apply_flags(self):
+        isup = make_isupport()
+        chan = modes.ChannelModes()
+
+        chan.apply(isup, modes.parse_modes(isup, b'+ntlk', [b'10', b'key']))
+
+        self.assertTrue(b'n' in chan)
+        self.assertTrue(b't' in chan)
+        self.assertFalse(b'm' in chan)
+        self.assertFalse(b'!' in chan)
+        self.assertEqual(chan.param(b'l'), b'10')
+        self.assertEqual(chan.param(b'k'), b'key')
+        self.assertEqual(chan.modestring(),
+                         [b'+klnt', b'key', b'10'])
+
+        chan.apply(isup, modes.parse_modes(isup, b'-lkt', [b'key']))
+
+        self.assertFalse(b'l' in chan)
+        self.assertIsNone(chan.param(b'l'))
+        self.assertIsNone(chan.param(b'k'))
+        self.assertEqual(chan.modestring(), [b'+n'])
+
+    def test_modestring_empty(self):
+        self.assertEqual(modes.ChannelModes().modestring(), [b'+'])
+
+    def test_apply_lists(self):
+        isup = make_isupport()
+        chan = modes.ChannelModes()
+
+        chan.apply(isup, modes.parse_modes(
+            isup, b'+bbe', [b'a!*@*', b'b!*@*', b'c!*@*']))
+
+        self.assertEqual(chan.entries(b'b'), frozenset([b'a!*@*', b'b!*@*']))
+        self.assertEqual(chan.entries(b'I'), frozenset())
+
+        chan.apply(isup, modes.parse_modes(
+            isup, b'-bbe+b', [b'a!*@*', b'b!*@*', b'c!*@*']))
+
+        self.assertEqual(chan.lists, {})
+        self.assertEqual(chan.entries(b'b'), frozenset())
+
+    def test_members(self):
+        isup = make_isupport()
+        chan = modes.ChannelModes()
+
+        chan.names(isup, b'~Alice @bob')
+        chan.join(isup, b'Carol')
+        chan.apply(isup, modes.parse_modes(
+            isup, b'+vo-q', [b'CAROL', b'dave', b'alice']))
+
+        self.assertEqual(chan.members, {
+            b'alice': 0b000,
+            b'bob': 0b010,
+            b'carol': 0b100,
+        })
+        self.assertEqual(chan.prefix(isup, b'ALICE'), b'')
+        self.assertEqual(chan.prefix(isup, b'bob'), b'@')
+        self.assertEqual(chan.prefix(isup, b'carol'), b'+')
+        self.assertEqual(chan.prefix(isup, b'dave'), b'')
+
+        chan.apply(isup, modes.parse_modes(isup, b'+o', [b'carol']))
+        chan.rename(isup, b'carol', b'Eve')
+        chan.rename(isup, b'nobody', b'other')
+        chan.part(isup, b'bob')
+        chan.part(isup, b'nobody')
+
+        self.assertEqual(chan.members, {b'alice': 0, b'eve': 0b110})
+        self.assertEqual(chan.prefix(isup, b'eve'), b'@')
+
+    def test_copy(self):
+        isup = make_isupport()
+        chan = modes.ChannelModes()
+        chan.apply(isup, modes.parse_modes(isup, b'+nkb', [b'key', b'a!*@*']))
+        chan.join(isup, b'alice')
+
+        result = chan.copy()
+        result.apply(isup, modes.parse_modes(isup, b'+b-k', [b'b!*@*', b'x']))
+        result.part(isup, b'alice')
+
+        self.assertEqual(chan.param(b'k'), b'key')
+        self.assertEqual(chan.entries(b'b'), frozenset([b'a!*@*']))
+        self.assertEqual(chan.members, {b'alice': 0})
+        self.assertTrue(b'n' in result)
+        self.assertIsNone(result.param(b'k'))
+
+    def test_diff(self):
+        isup = make_isupport()
+        old = modes.ChannelModes()
+        old.apply(isup, modes.parse_modes(isup, b'+ntkl', [b'key', b'10']))
+        new = modes.ChannelModes()
+        new.apply(isup, modes.parse_modes(isup, b'+nml', [b'20']))
+
+        result = old.diff(new)
+
+        self.assertEqual(result, [
+            modes.ModeChange(False, b'k', None),
+            modes.ModeChange(True, b'l', b'20'),
+            modes.ModeChange(True, b'm', None),
+            modes.ModeChange(False, b't', None),
+        ])
+        old.apply(isup, result)
+        self.assertEqual(old.modestring(), new.modestring())
@@ -0,0 +1,163 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import mock
+
+from pirch.proto.irc import isupport
+from pirch.proto.irc import modes
+from pirch.proto.irc import netsplit
+
+
+SERVERS = (b'hub.example.net', b'leaf.example.net')
+
+
+class SplitServersTest(unittest.TestCase):
+    def test_split(self):
+        self.assertEqual(netsplit.split_servers(
+            b'hub.example.net leaf.example.net'), SERVERS)
+        self.assertEqual(netsplit.split_servers(b'*.net *.split'),
+                         (b'*.net', b'*.split'))
+
+    def test_not_split(self):
+        for reason in (b'Quit: bye', b'hub.example.net',
+                       b'hub.example.net hub.example.net',
+                       b'see http://example.net example.net',
+                       b'hub.example.net  leaf.example.net',
+                       b'hub leaf', b''):
+            self.assertIsNone(netsplit.split_servers(reason))
+
+
+class BurstCollapserTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 100.0
+        self.loop = mock.Mock(time=lambda: self.now)
+        self.events = []
+        self.collapser = netsplit.BurstCollapser(self.loop,
+                                                 self.events.append)
+
+    def quit(self, nick, reason=b':hub.example.net leaf.example.net'):
+        return self.collapser.feed(b':' + nick + b'!u@h QUIT ' + reason)
+
+    def test_netsplit(self):
+        self.assertTrue(self.quit(b'alice'))
+        self.now += 0.5
+        self.assertTrue(self.quit(b'bob'))
+        self.assertFalse(self.quit(b'carol', b':Quit: bye'))
+
+        self.loop.call_later.assert_called_once_with(
+            1.0, self.collapser._expire)
+        self.now = 101.2
+        self.collapser._expire()
+
+        self.assertEqual(self.events, [])
+        delay, func = self.loop.call_later.call_args[0]
+        self.assertAlmostEqual(delay, 0.3)
+        self.assertEqual(func, self.collapser._expire)
+
+        self.now = 101.6
+        self.collapser._expire()
+
+        self.assertEqual(self.events, [
+            netsplit.Netsplit(SERVERS, set([b'alice', b'bob']))])
+        self.assertEqual(self.collapser.absorbed, 2)
+        self.assertIsNone(self.collapser._handle)
+
+    def test_netjoin(self):
+        self.quit(b'Alice')
+        self.collapser.flush()
+        self.now += 30
+
+        feed = self.collapser.feed
+        self.assertTrue(feed(b'@time=x :alice!u@h JOIN #a'))
+        self.assertTrue(feed(b':alice!u@h JOIN :#b,#c'))
+        self.assertTrue(feed(b':ALICE!u@h JOIN #a acct :Real Name'))
+        self.assertFalse(feed(b':bob!u@h JOIN #a'))
+        self.assertFalse(feed(b'PING :x'))
+        self.collapser.flush()
+
+        self.assertEqual(self.events[1], netsplit.Netjoin(SERVERS, {
+            b'#a': set([b'alice', b'ALICE']),
+            b'#b': set([b'alice']),
+            b'#c': set([b'alice']),
+        }))
+        self.assertEqual(self.collapser._split_nicks, {})
+
+        self.now += 30
+        self.assertFalse(feed(b':alice!u@h JOIN #other'))
+
+    def test_rejoin_window(self):
+        self.quit(b'alice')
+        self.quit(b'bob')
+        self.collapser.flush()
+
+        self.now += 601
+        self.assertFalse(self.collapser.feed(b':alice!u@h JOIN #a'))
+        self.assertFalse(b'alice' in self.collapser._split_nicks)
+        self.collapser._expire()
+
+        self.assertEqual(self.collapser._split_nicks, {})
+
+    def test_casemapping(self):
+        isup = isupport.ISupport()
+        isup.feed([b'CASEMAPPING=ascii'])
+        self.collapser = netsplit.BurstCollapser(self.loop,
+                                                 self.events.append, isup)
+        self.quit(b'nick[a]')
+
+        self.assertFalse(self.collapser.feed(b':nick{a}!u@h JOIN #a'))
+        self.assertTrue(self.collapser.feed(b':NICK[A]!u@h JOIN #a'))
+
+    def test_filter(self):
+        msg = mock.Mock(msg=b':alice!u@h QUIT :a.example b.example')
+
+        self.assertTrue(self.collapser(msg))
+
+
+class ApplyTest(unittest.TestCase):
+    def setUp(self):
+        self.chan = modes.ChannelModes()
+        self.chan.members = {b'alice': 1, b'bob': 0, b'carol{}': 2}
+        self.other = modes.ChannelModes()
+        self.other.members = {b'bob': 0}
+        self.channels = {b'#Test': self.chan, b'#other': self.other}
+
+    def test_netsplit(self):
+        netsplit.apply(netsplit.Netsplit(SERVERS, set([
+            b'Alice', b'CAROL{}', b'dave', b'eve'])), self.channels)
+
+        self.assertEqual(self.chan.members, {b'bob': 0})
+        self.assertEqual(self.other.members, {b'bob': 0})
+
+    def test_netjoin(self):
+        netsplit.apply(netsplit.Netjoin(SERVERS, {
+            b'#TEST': set([b'Alice', b'Dave']),
+            b'#gone': set([b'alice']),
+        }), self.channels)
+
+        self.assertEqual(self.chan.members, {
+            b'alice': 1, b'bob': 0, b'carol{}': 2, b'dave': 0})
+
+    def test_casemapping(self):
+        isup = isupport.ISupport()
+        isup.feed([b'CASEMAPPING=ascii'])
+
+        netsplit.apply(netsplit.Netsplit(SERVERS, set([b'CAROL[]'])),
+                       self.channels, isup)
+
+        self.assertEqual(self.chan.members, {
+            b'alice': 1, b'bob': 0, b'carol{}': 2})
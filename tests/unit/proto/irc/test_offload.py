@@ -0,0 +1,290 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+from concurrent import futures
+import threading
+import unittest
+
+try:
+    import asyncio
+except ImportError:  # pragma: no cover
+    import trollius as asyncio
+
+import mock
+
+from pirch.proto.irc import isupport
+from pirch.proto.irc import messages
+from pirch.proto.irc import offload
+
+
+def echo(msg):
+    return [b'NOTICE ' + msg.origin.to_bytes() + b' :' + msg.args[-1]]
+
+
+def echo_message(msg):
+    return [messages.Message(None, msg.conn, msg.conn.me, msg.command,
+                             messages.Arguments(None, msg.conn, [b'x'],
+                                                msg.command))]
+
+
+def nothing(msg):
+    return None
+
+
+def fail(msg):
+    raise ValueError('failed')
+
+
+class FakeConn(object):
+    def __init__(self):
+        self.me = messages.RawEntity(b'me')
+        self.peer = messages.RawEntity(b'server')
+        self.isupport = isupport.ISupport()
+        self.isupport.feed([b'NICKLEN=30'])
+
+    def get_entity(self, raw):
+        return messages.RawEntity(raw)
+
+
+class WorkerConnectionTest(unittest.TestCase):
+    def test_metadata(self):
+        meta = offload.metadata(FakeConn())
+
+        self.assertEqual(meta, {
+            'me': b'me',
+            'peer': b'server',
+            'isupport': (b'NICKLEN=30',),
+        })
+
+    def test_metadata_no_isupport(self):
+        conn = mock.Mock(spec=['me', 'peer'])
+        conn.me.to_bytes.return_value = b'me'
+        conn.peer.to_bytes.return_value = b'server'
+
+        self.assertEqual(offload.metadata(conn)['isupport'], ())
+
+    def test_connection(self):
+        conn = offload.WorkerConnection(offload.metadata(FakeConn()))
+
+        self.assertEqual(conn.me.to_bytes(), b'me')
+        self.assertEqual(conn.peer.to_bytes(), b'server')
+        self.assertEqual(conn.isupport.nicklen, 30)
+        self.assertEqual(conn.get_entity(b'n!u@h').to_bytes(), b'n!u@h')
+
+    @mock.patch.object(offload, '_last_conn', (None, None))
+    def test_connection_reused(self):
+        fake = FakeConn()
+        meta = offload.metadata(fake)
+
+        first = offload._connection(meta)
+        second = offload._connection(dict(meta))
+        fake.isupport.feed([b'NICKLEN=31'])
+        third = offload._connection(offload.metadata(fake))
+
+        self.assertIs(second, first)
+        self.assertIsNot(third, first)
+        self.assertEqual(third.isupport.nicklen, 31)
+
+
+class RunTest(unittest.TestCase):
+    def setUp(self):
+        self.meta = offload.metadata(FakeConn())
+
+    def test_bytes(self):
+        result = offload._run(echo, b':n!u@h PRIVMSG me :hi', self.meta)
+
+        self.assertEqual(result, [b'NOTICE n!u@h :hi'])
+
+    def test_messages(self):
+        result = offload._run(echo_message, b':n!u@h PING', self.meta)
+
+        self.assertEqual(result, [b'PING x'])
+
+    def test_none(self):
+        self.assertEqual(offload._run(nothing, b'PING x', self.meta), [])
+
+    def test_empty(self):
+        self.assertEqual(offload._run(echo, b'', self.meta), [])
+
+
+class WorkerPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.executor = futures.ThreadPoolExecutor(2)
+        self.addCleanup(self.executor.shutdown)
+        self.conn = FakeConn()
+
+    def message(self, text):
+        return messages.Message.from_bytes(
+            'ctxt', self.conn, b':n!u@h PRIVMSG me :' + text)
+
+    def wait(self, handler):
+        fut = asyncio.Future(loop=self.loop)
+
+        def check():
+            if handler.running or handler._queue:
+                self.loop.call_later(0.001, check)
+            else:
+                fut.set_result(None)
+
+        check()
+        self.loop.run_until_complete(fut)
+
+    def test_offload(self):
+        pool = offload.WorkerPool(self.loop, self.executor)
+        replies = []
+
+        handler = pool.offload(echo, replies.extend, concurrency=2)
+        handler(self.message(b'one'))
+        handler(self.message(b'two'))
+        self.wait(handler)
+
+        self.assertEqual(sorted(replies), [b'NOTICE n!u@h :one',
+                                           b'NOTICE n!u@h :two'])
+        self.assertEqual(pool.pending, 0)
+
+    def test_concurrency(self):
+        gate = threading.Event()
+        seen = []
+
+        def blocked(func, raw, meta):
+            gate.wait()
+            seen.append(raw)
+            return []
+
+        pool = offload.WorkerPool(self.loop, self.executor)
+        handler = pool.offload(echo, mock.Mock(), concurrency=1, backlog=4)
+
+        with mock.patch.object(offload, '_run', blocked):
+            for text in (b'one', b'two', b'three'):
+                handler(self.message(text))
+
+            self.assertEqual(handler.running, 1)
+            self.assertEqual(len(handler._queue), 2)
+            self.assertEqual(pool.pending, 3)
+
+            gate.set()
+            self.wait(handler)
+
+        self.assertEqual(seen, [b':n!u@h PRIVMSG me :one',
+                                b':n!u@h PRIVMSG me :two',
+                                b':n!u@h PRIVMSG me :three'])
+        self.assertEqual(pool.pending, 0)
+        self.assertFalse(handler.sink.called)
+
+    def test_backlog(self):
+        gate = threading.Event()
+        seen = []
+
+        def blocked(func, raw, meta):
+            gate.wait()
+            seen.append(raw)
+            return []
+
+        pause = mock.Mock()
+        resume = mock.Mock()
+        pool = offload.WorkerPool(self.loop, self.executor, pause=pause,
+                                  resume=resume)
+        handler = pool.offload(echo, mock.Mock(), concurrency=1, backlog=2)
+
+        with mock.patch.object(offload, '_run', blocked):
+            handler(self.message(b'one'))
+            handler(self.message(b'two'))
+            self.assertFalse(pool.paused)
+            handler(self.message(b'three'))
+            self.assertTrue(pool.paused)
+            self.assertTrue(handler.congested)
+            handler(self.message(b'four'))
+            pause.assert_called_once_with()
+
+            gate.set()
+            self.wait(handler)
+
+        self.assertEqual(len(seen), 4)
+        self.assertFalse(pool.paused)
+        self.assertFalse(handler.congested)
+        resume.assert_called_once_with()
+
+    def test_backpressure(self):
+        gate = threading.Event()
+
+        def blocked(func, raw, meta):
+            gate.wait()
+            return []
+
+        pause = mock.Mock()
+        resume = mock.Mock()
+        pool = offload.WorkerPool(self.loop, self.executor, max_pending=2,
+                                  pause=pause, resume=resume)
+        handler = pool.offload(echo, mock.Mock(), concurrency=1)
+
+        with mock.patch.object(offload, '_run', blocked):
+            handler(self.message(b'one'))
+            self.assertFalse(pool.paused)
+            handler(self.message(b'two'))
+            self.assertTrue(pool.paused)
+            pause.assert_called_once_with()
+
+            gate.set()
+            self.wait(handler)
+
+        self.assertFalse(pool.paused)
+        resume.assert_called_once_with()
+
+    def test_metadata_cached(self):
+        pool = offload.WorkerPool(self.loop, self.executor)
+
+        first = pool._metadata(self.conn)
+        second = pool._metadata(self.conn)
+        self.conn.isupport.feed([b'NETWORK=Test'])
+        third = pool._metadata(self.conn)
+        self.conn.me = messages.RawEntity(b'me2')
+        fourth = pool._metadata(self.conn)
+
+        self.assertIs(second, first)
+        self.assertIsNot(third, first)
+        self.assertTrue(b'NETWORK=Test' in third['isupport'])
+        self.assertEqual(fourth['me'], b'me2')
+
+    def test_failure(self):
+        handler_calls = []
+        self.loop.set_exception_handler(
+            lambda loop, ctxt: handler_calls.append(ctxt))
+        pool = offload.WorkerPool(self.loop, self.executor)
+        sink = mock.Mock()
+
+        handler = pool.offload(fail, sink)
+        handler(self.message(b'one'))
+        self.wait(handler)
+
+        self.assertFalse(sink.called)
+        self.assertEqual(len(handler_calls), 1)
+        self.assertIsInstance(handler_calls[0]['exception'], ValueError)
+
+    def test_cancelled(self):
+        pool = offload.WorkerPool(self.loop, self.executor)
+        sink = mock.Mock()
+        handler = pool.offload(echo, sink)
+        fut = asyncio.Future(loop=self.loop)
+        fut.cancel()
+        handler.running = 1
+        pool.pending = 1
+
+        handler._done(fut)
+
+        self.assertEqual(handler.running, 0)
+        self.assertFalse(sink.called)
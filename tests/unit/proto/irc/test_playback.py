@@ -0,0 +1,127 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import unittest
+
+try:
+    import asyncio
+except ImportError:  # pragma: no cover
+    import trollius as asyncio
+
+from pirch.proto.irc import playback
+
+
+class FakeTransport(object):
+    def __init__(self):
+        self.writes = []
+
+    def writelines(self, chunks):
+        self.writes.append(b''.join(chunks))
+
+
+class TagTest(unittest.TestCase):
+    def test_untagged(self):
+        self.assertEqual(playback._tag(b':n PRIVMSG #c :hi', b'ref'),
+                         b'@batch=ref :n PRIVMSG #c :hi')
+
+    def test_tagged(self):
+        self.assertEqual(playback._tag(b'@time=x :n PRIVMSG #c :hi', b'ref'),
+                         b'@batch=ref;time=x :n PRIVMSG #c :hi')
+
+
+class PlaybackTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.transport = FakeTransport()
+
+    def tick(self):
+        # Run the callbacks already scheduled
+        fut = asyncio.Future(loop=self.loop)
+        self.loop.call_soon(self.loop.call_soon, fut.set_result, None)
+        return fut
+
+    def test_chunks(self):
+        lines = [('line%d' % i).encode('ascii') for i in range(10)]
+        pb = playback.Playback(self.loop, self.transport, lines,
+                               chunk_size=20)
+
+        result = self.loop.run_until_complete(pb.start())
+
+        self.assertEqual(result, 10)
+        self.assertEqual(self.transport.writes, [
+            b'line0\r\nline1\r\nline2\r\n',
+            b'line3\r\nline4\r\nline5\r\n',
+            b'line6\r\nline7\r\nline8\r\n',
+            b'line9\r\n',
+        ])
+
+    def test_empty(self):
+        pb = playback.Playback(self.loop, self.transport, [])
+
+        self.assertEqual(self.loop.run_until_complete(pb.start()), 0)
+        self.assertEqual(self.transport.writes, [])
+
+    def test_batch(self):
+        pb = playback.Playback(self.loop, self.transport,
+                               [b':n PRIVMSG #c :a', b'@x=y :n PRIVMSG #c :b'],
+                               batch=True, source=b'bnc', target=b'#c')
+
+        self.loop.run_until_complete(pb.start())
+
+        ref = pb._ref
+        self.assertEqual(self.transport.writes, [
+            b':bnc BATCH +' + ref + b' chathistory #c\r\n'
+            b'@batch=' + ref + b' :n PRIVMSG #c :a\r\n'
+            b'@batch=' + ref + b';x=y :n PRIVMSG #c :b\r\n'
+            b':bnc BATCH -' + ref + b'\r\n',
+        ])
+
+    def test_backpressure(self):
+        lines = [('line%d' % i).encode('ascii') for i in range(4)]
+        pb = playback.Playback(self.loop, self.transport, lines,
+                               chunk_size=1)
+        pb.start()
+        pb.pause_writing()
+
+        # Let the scheduled step run while paused
+        self.loop.run_until_complete(self.tick())
+
+        self.assertEqual(self.transport.writes, [])
+        self.assertFalse(pb.done.done())
+
+        pb.resume_writing()
+        pb.resume_writing()
+        self.loop.run_until_complete(pb.done)
+
+        self.assertEqual(len(self.transport.writes), 4)
+
+    def test_cancel(self):
+        lines = [('line%d' % i).encode('ascii') for i in range(4)]
+        pb = playback.Playback(self.loop, self.transport, lines,
+                               chunk_size=1, batch=True)
+        pb.start()
+        self.loop.run_until_complete(self.tick())
+
+        pb.cancel()
+        pb.cancel()
+
+        self.assertTrue(pb.done.cancelled())
+        self.assertEqual(self.transport.writes[-1],
+                         b':pirch BATCH -' + pb._ref + b'\r\n')
+        count = len(self.transport.writes)
+        self.loop.run_until_complete(self.tick())
+        self.assertEqual(len(self.transport.writes), count)
@@ -0,0 +1,200 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import mock
+
+from pirch.proto.irc import isupport
+from pirch.proto.irc import messages
+from pirch.proto.irc import presence
+
+
+class PackTest(unittest.TestCase):
+    def test_pack(self):
+        result = presence._pack(b'X ', b',', [b'aa', b'bb', b'cc'], 7)
+
+        self.assertEqual(result, [b'X aa,bb', b'X cc'])
+
+    def test_oversized(self):
+        result = presence._pack(b'X ', b',', [b'aaaaaaaa', b'b'], 4)
+
+        self.assertEqual(result, [b'X aaaaaaaa', b'X b'])
+
+
+class PresenceTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = mock.Mock()
+        self.sent = []
+        self.changes = []
+        self.conn = mock.Mock()
+        self.conn.get_entity.side_effect = lambda raw: raw
+
+    def make_presence(self, **kwargs):
+        return presence.Presence(self.loop, self.sent.extend,
+                                 lambda up, down: self.changes.append(
+                                     (up, down)),
+                                 **kwargs)
+
+    def make_isupport(self, *tokens):
+        result = isupport.ISupport()
+        result.feed(tokens)
+        return result
+
+    def reply(self, pres, line):
+        pres(messages.Message.from_bytes(None, self.conn, line))
+
+    def test_ison(self):
+        linelen = 'LINELEN=%d' % (presence._reply_overhead + 18)
+        pres = self.make_presence()
+        pres.watch(b'Alice', b'bob', b'carol')
+        self.assertEqual(self.sent, [])
+
+        pres.start(self.make_isupport(linelen.encode('ascii')))
+        self.loop.call_soon.assert_called_once_with(pres._tick)
+        pres._tick()
+
+        self.assertEqual(self.sent, [b'ISON Alice bob'])
+        self.loop.call_later.assert_called_with(10.0, pres._tick)
+
+        self.reply(pres, b':server 303 me :ALICE')
+        self.assertEqual(self.changes, [(set([b'Alice']), set())])
+
+        pres._tick()
+        self.assertEqual(self.sent[-1], b'ISON carol')
+        self.reply(pres, b':server 303 me :')
+        self.assertEqual(len(self.changes), 1)
+
+        # The rotation starts over
+        pres._tick()
+        self.assertEqual(self.sent[-1], b'ISON Alice bob')
+        self.reply(pres, b':server 303 me :bob')
+
+        self.assertEqual(self.changes[-1], (set([b'bob']), set([b'Alice'])))
+        self.assertEqual(pres.online, set([b'bob']))
+
+    def test_ison_unsolicited(self):
+        pres = self.make_presence()
+        pres.watch(b'alice')
+
+        self.reply(pres, b':server 303 me :alice')
+
+        self.assertEqual(self.changes, [])
+
+    def test_unwatch_polled(self):
+        pres = self.make_presence()
+        pres.start(self.make_isupport())
+        pres.watch(b'alice', b'bob')
+        pres._tick()
+        self.reply(pres, b':server 303 me :alice')
+
+        pres.unwatch(b'ALICE', b'nobody')
+        pres.watch(b'bob')
+        pres._tick()
+        pres._tick()
+
+        self.assertEqual(pres.online, set())
+        self.assertEqual(pres._poll, [b'bob'])
+        self.assertEqual(self.sent[-1], b'ISON bob')
+
+    def test_nothing_to_poll(self):
+        pres = self.make_presence()
+        pres.start(self.make_isupport())
+        pres.watch(b'alice')
+        pres.unwatch(b'alice')
+        self.loop.reset_mock()
+
+        pres._tick()
+
+        self.assertEqual(self.sent, [])
+        self.assertFalse(self.loop.call_later.called)
+
+    def test_monitor(self):
+        pres = self.make_presence()
+        pres.watch(b'Alice', b'bob')
+
+        pres.start(self.make_isupport(b'MONITOR'))
+
+        self.assertEqual(self.sent, [b'MONITOR C', b'MONITOR + Alice,bob'])
+        self.assertFalse(self.loop.call_soon.called)
+
+        self.reply(pres, b':server 730 me :alice!a@h,bob!b@h')
+        self.reply(pres, b':server 731 me :BOB')
+
+        self.assertEqual(self.changes, [
+            (set([b'Alice', b'bob']), set()),
+            (set(), set([b'bob'])),
+        ])
+
+        pres.unwatch(b'alice')
+        self.assertEqual(self.sent[-1], b'MONITOR - alice')
+
+    def test_monitor_limit(self):
+        pres = self.make_presence()
+        pres.start(self.make_isupport(b'MONITOR=2'))
+
+        pres.watch(b'alice', b'bob', b'carol')
+
+        self.assertEqual(self.sent, [b'MONITOR C', b'MONITOR + alice,bob'])
+        self.assertEqual(pres._poll, [b'carol'])
+        self.loop.call_soon.assert_called_once_with(pres._tick)
+
+    def test_monitor_full(self):
+        pres = self.make_presence()
+        pres.start(self.make_isupport(b'MONITOR'))
+        pres.watch(b'alice', b'bob')
+
+        self.reply(pres, b':server 734 me 1 bob,other :Monitor list is full')
+
+        self.assertEqual(pres.limit, 1)
+        self.assertEqual(pres._poll, [b'bob'])
+        pres._tick()
+        self.assertEqual(self.sent[-1], b'ISON bob')
+
+    def test_casemapping(self):
+        pres = self.make_presence(
+            isup=self.make_isupport(b'CASEMAPPING=ascii'))
+        pres.watch(b'nick[a]', b'NICK{A}')
+
+        self.assertEqual(pres.watched, {
+            b'nick[a]': b'nick[a]',
+            b'nick{a}': b'NICK{A}',
+        })
+
+    def test_start_rekeys(self):
+        pres = self.make_presence(
+            isup=self.make_isupport(b'CASEMAPPING=ascii'))
+        pres.watch(b'Nick[a]')
+        pres.online.add(b'nick[a]')
+
+        pres.start(self.make_isupport(b'CASEMAPPING=rfc1459'))
+
+        self.assertEqual(pres.watched, {b'nick{a}': b'Nick[a]'})
+        self.assertEqual(pres.online, set([b'nick{a}']))
+
+    def test_stop(self):
+        pres = self.make_presence()
+        pres.start(self.make_isupport())
+        pres.watch(b'alice')
+        pres._tick()
+        handle = pres._handle
+
+        pres.stop()
+
+        handle.cancel.assert_called_once_with()
+        self.assertEqual(len(pres._queries), 0)
+        pres.watch(b'bob')
+        self.assertIsNone(pres._handle)
@@ -0,0 +1,235 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import unittest
+
+try:
+    import asyncio
+except ImportError:  # pragma: no cover
+    import trollius as asyncio
+
+import mock
+
+from pirch.proto.irc import isupport
+from pirch.proto.irc import modes
+from pirch.proto.irc import reconnect
+
+
+def make_isupport():
+    result = isupport.ISupport()
+    result.feed([b'PREFIX=(ov)@+', b'CHANMODES=b,k,l,imnpst',
+                 b'NICKLEN=30'])
+    return result
+
+
+class BackoffTest(unittest.TestCase):
+    def test_delay(self):
+        backoff = reconnect.Backoff(base=1.0, cap=6.0, rand=lambda: 0.5)
+
+        result = [backoff.delay() for _i in range(5)]
+
+        self.assertEqual(result, [0.75, 1.5, 3.0, 4.5, 4.5])
+
+    def test_many_attempts(self):
+        backoff = reconnect.Backoff(base=1.0, cap=300.0, rand=lambda: 1.0)
+
+        result = [backoff.delay() for _i in range(2000)]
+
+        self.assertEqual(result[-1], 300.0)
+        self.assertEqual(backoff.attempts, 9)
+
+    def test_jitter(self):
+        low = reconnect.Backoff(base=4.0, rand=lambda: 0.0)
+        high = reconnect.Backoff(base=4.0, rand=lambda: 0.999)
+
+        self.assertEqual(low.delay(), 2.0)
+        self.assertTrue(3.99 < high.delay() < 4.0)
+
+    def test_reset(self):
+        backoff = reconnect.Backoff(rand=lambda: 0.0)
+        backoff.delay()
+        backoff.delay()
+
+        backoff.reset()
+
+        self.assertEqual(backoff.delay(), 0.5)
+
+
+class RegistrationTest(unittest.TestCase):
+    def test_base(self):
+        result = reconnect.registration(b'nick', b'user', b'Real Name')
+
+        self.assertEqual(result, [
+            b'CAP LS 302',
+            b'NICK nick',
+            b'USER user 0 * :Real Name',
+        ])
+
+    def test_password_no_caps(self):
+        result = reconnect.registration(b'nick', b'user', b'Real Name',
+                                        password=b'secret', caps=False)
+
+        self.assertEqual(result, [
+            b'PASS secret',
+            b'NICK nick',
+            b'USER user 0 * :Real Name',
+        ])
+
+    def test_register(self):
+        transport = mock.Mock()
+
+        reconnect.register(transport, b'nick', b'user', b'Real Name')
+
+        transport.writelines.assert_called_once_with([
+            b'CAP LS 302', b'\r\n',
+            b'NICK nick', b'\r\n',
+            b'USER user 0 * :Real Name', b'\r\n',
+        ])
+
+
+class ReconnectorTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.attempts = []
+
+    def connect(self):
+        fut = asyncio.Future(loop=self.loop)
+        self.attempts.append(fut)
+        return fut
+
+    def make_reconnector(self):
+        return reconnect.Reconnector(
+            self.loop, self.connect,
+            reconnect.Backoff(base=0.001, rand=lambda: 0.0))
+
+    def sleep(self, delay):
+        fut = asyncio.Future(loop=self.loop)
+        self.loop.call_later(delay, fut.set_result, None)
+        return fut
+
+    def test_retry(self):
+        recon = self.make_reconnector()
+
+        recon.start()
+        self.assertEqual(len(self.attempts), 1)
+        self.attempts[0].set_exception(OSError('refused'))
+        self.loop.run_until_complete(self.sleep(0.01))
+
+        self.assertEqual(len(self.attempts), 2)
+        self.assertEqual(recon.backoff.attempts, 1)
+
+        self.attempts[1].set_result(None)
+        recon.connected()
+        self.loop.run_until_complete(self.sleep(0.01))
+
+        self.assertEqual(len(self.attempts), 2)
+        self.assertEqual(recon.backoff.attempts, 0)
+
+    def test_connection_lost(self):
+        recon = self.make_reconnector()
+        recon.start()
+        self.attempts[0].set_result(None)
+        self.loop.run_until_complete(self.sleep(0.01))
+
+        recon.connection_lost()
+        recon.connection_lost()
+        self.loop.run_until_complete(self.sleep(0.01))
+
+        self.assertEqual(len(self.attempts), 2)
+
+    def test_stop(self):
+        recon = self.make_reconnector()
+        recon.start()
+        attempt = self.attempts[0]
+
+        recon.stop()
+        self.loop.run_until_complete(self.sleep(0.01))
+
+        self.assertTrue(attempt.cancelled())
+        recon.connection_lost()
+        self.loop.run_until_complete(self.sleep(0.01))
+        self.assertEqual(len(self.attempts), 1)
+
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.isup = make_isupport()
+        chan = modes.ChannelModes()
+        chan.apply(self.isup, modes.parse_modes(self.isup, b'+ntb',
+                                                [b'x!*@*']))
+        chan.names(self.isup, b'@alice bob carol')
+        self.chan = chan
+        self.snap = reconnect.Snapshot(self.isup, {b'#Chan': chan}, now=100)
+
+    def test_init(self):
+        self.assertEqual(self.snap.age(now=130), 30)
+        self.assertIsNot(self.snap.channel(b'#CHAN'), self.chan)
+        self.assertEqual(self.snap.channel(b'#chan').members,
+                         self.chan.members)
+        self.assertIsNone(self.snap.channel(b'#other'))
+
+    def test_isupport(self):
+        result = self.snap.isupport()
+
+        self.assertEqual(result.nicklen, 30)
+        self.assertEqual(result.prefix, {b'o': b'@', b'v': b'+'})
+
+    def test_isupport_diff(self):
+        result = self.snap.isupport_diff([
+            b'PREFIX=(ov)@+', b'NICKLEN=16', b'MONITOR=100'])
+
+        self.assertEqual(result, [b'NICKLEN=16', b'MONITOR=100',
+                                  b'-CHANMODES'])
+
+        isup = self.snap.isupport()
+        isup.feed(result)
+        self.assertEqual(sorted(isup.tokens()),
+                         [b'MONITOR=100', b'NICKLEN=16', b'PREFIX=(ov)@+'])
+
+    def test_reconcile(self):
+        fresh = modes.ChannelModes()
+        fresh.apply(self.isup, modes.parse_modes(self.isup, b'+nm', []))
+        fresh.names(self.isup, b'alice +bob dave')
+
+        chan, changes, diff = self.snap.reconcile(self.isup, b'#chan', fresh)
+
+        self.assertIs(chan, self.snap.channel(b'#chan'))
+        self.assertEqual(changes, [modes.ModeChange(True, b'm', None),
+                                   modes.ModeChange(False, b't', None)])
+        self.assertEqual(diff, reconnect.MemberDiff(
+            {b'dave': 0}, set([b'carol']), {b'alice': 0, b'bob': 0b10}))
+        self.assertEqual(chan.members, fresh.members)
+        self.assertEqual(chan.modestring(), [b'+mn'])
+        self.assertEqual(chan.entries(b'b'), frozenset([b'x!*@*']))
+
+    def test_reconcile_no_modes(self):
+        fresh = modes.ChannelModes()
+        fresh.names(self.isup, b'@alice bob carol')
+
+        chan, changes, diff = self.snap.reconcile(self.isup, b'#chan', fresh,
+                                                  modes=False)
+
+        self.assertEqual(changes, [])
+        self.assertEqual(diff, reconnect.MemberDiff({}, set(), {}))
+        self.assertEqual(chan.modestring(), [b'+nt'])
+
+    def test_reconcile_uncached(self):
+        fresh = modes.ChannelModes()
+
+        result = self.snap.reconcile(self.isup, b'#new', fresh)
+
+        self.assertEqual(result, (fresh, None, None))
@@ -0,0 +1,160 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from pirch.proto.irc import archive
+from pirch.proto.irc import dispatch
+from pirch.proto.irc import replay
+
+
+class ReadLogTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_text(self):
+        filename = os.path.join(self.directory, 'session.log')
+        with open(filename, 'wb') as f:
+            f.write(b'100.5 :nick!u@h PRIVMSG #chan :hi\r\n'
+                    b'\r\n'
+                    b'PING :token\n'
+                    b':server 001 me :Welcome\n'
+                    b'001 me :No prefix\n'
+                    b'1443902400. PING :x\n')
+
+        result = list(replay.read_log(filename))
+
+        self.assertEqual(result, [
+            (100.5, b':nick!u@h PRIVMSG #chan :hi'),
+            (None, b'PING :token'),
+            (None, b':server 001 me :Welcome'),
+            (None, b'001 me :No prefix'),
+            (1443902400.0, b'PING :x'),
+        ])
+
+    def test_archive(self):
+        arch = archive.Archive(self.directory)
+        arch.append(b'PING :a', 10.0)
+        arch.append(b'PING :b', 11.0)
+        arch.close()
+
+        result = list(replay.read_log(self.directory))
+
+        self.assertEqual(result, [(10.0, b'PING :a'), (11.0, b'PING :b')])
+
+
+class PercentileTest(unittest.TestCase):
+    def test_empty(self):
+        self.assertIsNone(replay.percentile([], 0.5))
+
+    def test_values(self):
+        values = list(range(101))
+
+        self.assertEqual(replay.percentile(values, 0.5), 50)
+        self.assertEqual(replay.percentile(values, 0.99), 99)
+        self.assertEqual(replay.percentile(values, 1.0), 100)
+
+
+class ReportTest(unittest.TestCase):
+    def test_init(self):
+        result = replay.Report(10, 9, 2.0, [0.001, 0.002, 0.003], 100,
+                               'KiB')
+
+        self.assertEqual(result.throughput, 5.0)
+        self.assertEqual(result.p50, 0.002)
+        self.assertEqual(result.p99, 0.003)
+        self.assertIn('throughput:     5.0 lines/s', str(result))
+        self.assertIn('memory growth:  100 KiB', str(result))
+
+    def test_unmeasured(self):
+        result = replay.Report(0, 0, 0.0, [], None, 'KiB')
+
+        self.assertEqual(result.throughput, 0.0)
+        self.assertIn('p50 latency:    n/a', str(result))
+        self.assertIn('memory growth:  n/a', str(result))
+
+
+class ReplayTest(unittest.TestCase):
+    def do_replay(self, lines, **kwargs):
+        received = []
+        disp = dispatch.Dispatcher()
+        disp.register(None, lambda m: received.append(
+            (m.origin.to_bytes(), m.command.cmd, list(m.args))))
+
+        rep = replay.Replay(lines, dispatcher=disp, **kwargs)
+        try:
+            report = rep.run()
+        finally:
+            rep.loop.close()
+
+        return report, received
+
+    def test_asap(self):
+        lines = [(None, b':nick!u@h PRIVMSG #chan :message ' +
+                  str(i).encode('ascii'))
+                 for i in range(500)]
+        lines.append((None, b''))
+
+        report, received = self.do_replay(lines)
+
+        self.assertEqual(report.lines, 501)
+        self.assertEqual(report.messages, 500)
+        self.assertEqual(len(received), 500)
+        self.assertEqual(received[7], (b'nick!u@h', b'PRIVMSG',
+                                       [b'#chan', b'message 7']))
+        self.assertIsNotNone(report.p99)
+
+    def test_paced(self):
+        lines = [(100.0, b'PING :a'), (100.1, b'PING :b')]
+
+        report, received = self.do_replay(lines, speed=10.0)
+
+        self.assertEqual(received, [
+            (b'replay.server', b'PING', [b'a']),
+            (b'replay.server', b'PING', [b'b']),
+        ])
+
+    @mock.patch.object(replay, 'tracemalloc')
+    def test_trace_memory(self, mock_tracemalloc):
+        mock_tracemalloc.get_traced_memory.side_effect = [(100, 100),
+                                                          (250, 300)]
+
+        report, received = self.do_replay([(None, b'PING :a')],
+                                          trace_memory=True)
+
+        self.assertEqual(report.memory_growth, 150)
+        self.assertEqual(report.memory_units, 'bytes traced')
+        mock_tracemalloc.start.assert_called_once_with()
+        mock_tracemalloc.stop.assert_called_once_with()
+
+    @mock.patch.object(replay, 'resource')
+    def test_max_rss(self, mock_resource):
+        mock_resource.getrusage.return_value.ru_maxrss = 100
+
+        rep = replay.Replay([], loop=mock.Mock())
+
+        with mock.patch.object(replay.sys, 'platform', 'linux'):
+            self.assertEqual(rep._memory(), 102400)
+        with mock.patch.object(replay.sys, 'platform', 'darwin'):
+            self.assertEqual(rep._memory(), 100)
@@ -0,0 +1,154 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import mock
+
+from pirch.proto.irc import scheduler
+
+
+class FakeConn(object):
+    def __init__(self, name):
+        self.name = name
+        self.peer = name
+
+    def get_entity(self, raw):
+        return raw
+
+
+class ReadSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = mock.Mock()
+        self.seen = []
+
+    def dispatch(self, msg):
+        self.seen.append((msg.conn.name, msg.args[0]))
+
+    def feed(self, queue, count, prefix=b''):
+        for i in range(count):
+            queue.feed(b'PING ' + prefix + str(i).encode('ascii'))
+
+    def test_round_robin(self):
+        sched = scheduler.ReadScheduler(self.loop, budget=2)
+        flood = sched.register(FakeConn('flood'), self.dispatch)
+        quiet = sched.register(FakeConn('quiet'), self.dispatch)
+
+        self.feed(flood, 5)
+        self.feed(quiet, 1)
+
+        self.loop.call_soon.assert_called_once_with(sched._run)
+        self.assertEqual(sched.backlog, 6)
+        self.assertEqual(sched.depths(), {flood.conn: 5, quiet.conn: 1})
+
+        sched._run()
+
+        self.assertEqual(self.seen, [('flood', b'0'), ('flood', b'1'),
+                                     ('quiet', b'0')])
+        self.assertEqual(self.loop.call_soon.call_count, 2)
+
+        sched._run()
+        sched._run()
+
+        self.assertEqual(len(self.seen), 6)
+        self.assertEqual(flood.processed, 5)
+        self.assertEqual(flood.high_water, 5)
+        self.assertEqual(sched.backlog, 0)
+        self.assertEqual(self.loop.call_soon.call_count, 3)
+
+    def test_weight(self):
+        sched = scheduler.ReadScheduler(self.loop, budget=1)
+        heavy = sched.register(FakeConn('heavy'), self.dispatch, weight=3)
+        light = sched.register(FakeConn('light'), self.dispatch)
+        self.feed(heavy, 4)
+        self.feed(light, 4)
+
+        sched._run()
+
+        self.assertEqual([name for name, _arg in self.seen],
+                         ['heavy', 'heavy', 'heavy', 'light'])
+
+    def test_budget_bytes(self):
+        sched = scheduler.ReadScheduler(self.loop, budget=10,
+                                        budget_bytes=10)
+        queue = sched.register(FakeConn('c'), self.dispatch)
+        self.feed(queue, 3)
+
+        sched._run()
+
+        self.assertEqual(queue.processed, 2)
+        self.assertEqual(queue.depth, 1)
+
+    def test_pause(self):
+        transport = mock.Mock()
+        sched = scheduler.ReadScheduler(self.loop, budget=2, max_queue=6,
+                                        pause_at=4)
+        queue = sched.register(FakeConn('c'), self.dispatch, transport)
+
+        self.feed(queue, 3)
+        self.assertFalse(transport.pause_reading.called)
+        self.feed(queue, 5, b'x')
+
+        transport.pause_reading.assert_called_once_with()
+        self.assertTrue(queue.paused)
+        self.assertEqual(queue.depth, 6)
+        self.assertEqual(queue.dropped, 2)
+
+        sched._run()
+        self.assertFalse(transport.resume_reading.called)
+        sched._run()
+
+        transport.resume_reading.assert_called_once_with()
+        self.assertFalse(queue.paused)
+
+    def test_error(self):
+        sched = scheduler.ReadScheduler(self.loop)
+        queue = sched.register(FakeConn('c'), mock.Mock(
+            side_effect=[ValueError('bad'), None]))
+        queue.feed(b'PING a')
+        queue.feed(b'')
+        queue.feed(b'PING b')
+
+        sched._run()
+
+        self.assertEqual(queue.processed, 3)
+        self.assertEqual(self.loop.call_exception_handler.call_count, 1)
+        self.assertEqual(queue.dispatch.call_count, 2)
+
+    def test_unregister(self):
+        sched = scheduler.ReadScheduler(self.loop)
+        queue = sched.register(FakeConn('c'), self.dispatch)
+        self.feed(queue, 2)
+
+        sched.unregister(queue)
+        sched.unregister(queue)
+        sched._run()
+
+        self.assertEqual(self.seen, [])
+        self.assertEqual(sched.depths(), {})
+
+    def test_prefilter(self):
+        sched = scheduler.ReadScheduler(self.loop)
+        queue = sched.register(FakeConn('c'), self.dispatch,
+                               prefilter=lambda frame: b'drop' in frame)
+        queue.feed(b'PING keep')
+        queue.feed(b'PING drop')
+
+        sched._run()
+
+        self.assertEqual(self.seen, [('c', b'keep')])
+        self.assertEqual(queue.processed, 2)
+        self.assertEqual(queue.absorbed, 1)
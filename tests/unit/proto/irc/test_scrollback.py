@@ -0,0 +1,159 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import mock
+
+from pirch.proto.irc import isupport
+from pirch.proto.irc import scrollback
+
+
+def contents(lines):
+    return [(line.timestamp, line.raw) for line in lines]
+
+
+class RingTest(unittest.TestCase):
+    def test_init(self):
+        ring = scrollback.Ring(100, 4)
+
+        self.assertEqual(len(ring), 0)
+        self.assertEqual(len(ring._data), 100)
+        self.assertEqual(ring.size, 100 + 4 * scrollback._slot_size)
+        self.assertEqual(ring.lines(), [])
+
+    def test_append(self):
+        ring = scrollback.Ring(100, 4)
+
+        ring.append(1.0, b'one')
+        ring.append(2.0, b'two')
+
+        self.assertEqual(len(ring), 2)
+        self.assertEqual(contents(ring.lines()), [(1.0, b'one'),
+                                                  (2.0, b'two')])
+        self.assertEqual(contents(ring.lines(1)), [(2.0, b'two')])
+        self.assertEqual(contents(ring.lines(5)), [(1.0, b'one'),
+                                                   (2.0, b'two')])
+
+    def test_max_lines(self):
+        ring = scrollback.Ring(100, 3)
+
+        for i in range(5):
+            ring.append(float(i), ('line%d' % i).encode('ascii'))
+
+        self.assertEqual(contents(ring.lines()), [
+            (2.0, b'line2'),
+            (3.0, b'line3'),
+            (4.0, b'line4'),
+        ])
+
+    def test_capacity_wraps(self):
+        ring = scrollback.Ring(10, 10)
+
+        ring.append(1.0, b'aaaa')
+        ring.append(2.0, b'bbbb')
+        ring.append(3.0, b'cccc')
+
+        self.assertEqual(contents(ring.lines()), [(2.0, b'bbbb'),
+                                                  (3.0, b'cccc')])
+        self.assertEqual(bytes(ring._data), b'ccaabbbbcc')
+
+    def test_truncated(self):
+        ring = scrollback.Ring(4, 2)
+        ring.append(1.0, b'ab')
+
+        ring.append(2.0, b'abcdef')
+
+        self.assertEqual(contents(ring.lines()), [(2.0, b'abcd')])
+
+    def test_message(self):
+        ring = scrollback.Ring(100, 4)
+        ring.append(1.0, b'PING :x')
+
+        with mock.patch('pirch.proto.irc.messages.Message.from_bytes',
+                        return_value='msg') as mock_from_bytes:
+            result = ring.lines()[0].message('ctxt', 'conn')
+
+        self.assertEqual(result, 'msg')
+        mock_from_bytes.assert_called_once_with('ctxt', 'conn', b'PING :x')
+
+
+class ScrollbackTest(unittest.TestCase):
+    def test_append(self):
+        sb = scrollback.Scrollback(capacity=100, max_lines=4)
+
+        sb.append(b'#Chan[a]', b'one', 1.0)
+        sb.append(b'#chan{A}', b'two', 2.0)
+
+        self.assertEqual(len(sb), 1)
+        self.assertTrue(b'#CHAN{a}' in sb)
+        self.assertFalse(b'#other' in sb)
+        self.assertEqual(sb.size, 100 + 4 * scrollback._slot_size)
+        self.assertEqual(contents(sb.lines(b'#chan[a]')),
+                         [(1.0, b'one'), (2.0, b'two')])
+        self.assertEqual(contents(sb.lines(b'#chan[a]', 1)),
+                         [(2.0, b'two')])
+        self.assertEqual(sb.lines(b'#other'), [])
+
+    def test_casemapping(self):
+        isup = isupport.ISupport()
+        isup.feed([b'CASEMAPPING=ascii'])
+        sb = scrollback.Scrollback(isup, capacity=100, max_lines=4)
+
+        sb.append(b'#Chan[a]', b'one', 1.0)
+        sb.append(b'#chan{A}', b'two', 2.0)
+
+        self.assertEqual(len(sb), 2)
+        self.assertEqual(contents(sb.lines(b'#CHAN[A]')), [(1.0, b'one')])
+
+    @mock.patch('time.time', return_value=42.0)
+    def test_append_timestamp(self, mock_time):
+        sb = scrollback.Scrollback()
+
+        sb.append(b'#chan', b'line')
+
+        self.assertEqual(contents(sb.lines(b'#chan')), [(42.0, b'line')])
+
+    def test_budget(self):
+        size = 100 + 4 * scrollback._slot_size
+        sb = scrollback.Scrollback(capacity=100, max_lines=4,
+                                   budget=size * 2)
+
+        sb.append(b'#a', b'a')
+        sb.append(b'#b', b'b')
+        sb.lines(b'#a')
+        sb.append(b'#c', b'c')
+
+        self.assertEqual(list(sb._rings), [b'#a', b'#c'])
+        self.assertEqual(sb.size, size * 2)
+
+    def test_budget_keeps_newest(self):
+        sb = scrollback.Scrollback(capacity=100, max_lines=4, budget=1)
+
+        sb.append(b'#a', b'a')
+        sb.append(b'#b', b'b')
+
+        self.assertEqual(list(sb._rings), [b'#b'])
+
+    def test_discard(self):
+        sb = scrollback.Scrollback(capacity=100, max_lines=4)
+        sb.append(b'#a', b'a')
+
+        sb.discard(b'#A')
+        sb.discard(b'#other')
+
+        self.assertEqual(len(sb), 0)
+        self.assertEqual(sb.size, 0)
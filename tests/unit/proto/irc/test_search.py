@@ -0,0 +1,181 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import mock
+
+from pirch.proto.irc import search
+from pirch import util
+
+
+DOCS = [
+    b'The quick brown fox',
+    b'jumps over the lazy dog',
+    b'quick thinking, brown bear',
+    b'A QUICK brown dog',
+    b'caf\xc3\xa9 au lait',
+]
+
+
+class TokenizeTest(unittest.TestCase):
+    def test_tokenize(self):
+        result = search.tokenize(b'Hello, WORLD!  caf\xc3\xa9-time')
+
+        self.assertEqual(result, [b'hello', b'world', b'caf\xc3\xa9', b'time'])
+
+
+class PostingsTest(unittest.TestCase):
+    def test_varint_roundtrip(self):
+        buf = bytearray()
+        values = [0, 1, 127, 128, 300, 2 ** 40]
+        for value in values:
+            search._encode_varint(value, buf)
+
+        self.assertEqual(list(search._decode_varints(buf)), values)
+        self.assertEqual(len(buf), 1 + 1 + 1 + 2 + 2 + 6)
+
+    def test_postings_roundtrip(self):
+        postings = [(3, [0, 4]), (10, [2]), (1000, [1, 2, 3])]
+
+        data = search._encode_postings(postings)
+
+        self.assertEqual(list(search._decode_postings(data)), postings)
+
+
+class SegmentTest(unittest.TestCase):
+    def test_expand(self):
+        seg = search.Segment({
+            b'apple': bytearray(),
+            b'apply': bytearray(),
+            b'banana': bytearray(),
+            b'ap': bytearray(),
+        }, 0)
+
+        self.assertEqual(seg.expand(b'app'), [b'apple', b'apply'])
+        self.assertEqual(seg.expand(b'c'), [])
+
+
+class SearchIndexTest(unittest.TestCase):
+    def make_index(self, **kwargs):
+        idx = search.SearchIndex(**kwargs)
+        for doc, text in enumerate(DOCS):
+            idx.add(doc, text)
+        return idx
+
+    def test_add_order(self):
+        idx = search.SearchIndex()
+        idx.add(5, b'text')
+
+        self.assertRaises(ValueError, idx.add, 5, b'more')
+
+    def test_search_words(self):
+        idx = self.make_index()
+
+        self.assertEqual(idx.search(b'quick'), [0, 2, 3])
+        self.assertEqual(idx.search(b'Quick Dog'), [3])
+        self.assertEqual(idx.search(b'missing'), [])
+        self.assertEqual(idx.search(b'caf\xc3\xa9'), [4])
+
+    def test_search_phrase(self):
+        idx = self.make_index()
+
+        self.assertEqual(idx.search(b'"quick brown"'), [0, 3])
+        self.assertEqual(idx.search(b'"brown quick"'), [])
+        self.assertEqual(idx.search(b'"brown dog" quick'), [3])
+
+    def test_search_prefix(self):
+        idx = self.make_index()
+
+        self.assertEqual(idx.search(b'b*'), [0, 2, 3])
+        self.assertEqual(idx.search(b'th* dog'), [1])
+
+    def test_segments_and_merge(self):
+        idx = self.make_index(buffer_docs=1, merge_factor=2)
+
+        # Five documents with a merge factor of two merge down to a
+        # segment of four plus a segment of one
+        self.assertEqual([seg.docs for seg in idx.segments], [4, 1])
+        self.assertEqual(idx.search(b'"quick brown"'), [0, 3])
+        self.assertEqual(idx.search(b'b*'), [0, 2, 3])
+
+    def test_search_mixed(self):
+        idx = self.make_index(buffer_docs=2)
+
+        self.assertEqual(len(idx.segments), 2)
+        self.assertEqual(idx.search(b'brown'), [0, 2, 3])
+
+    def test_index_message(self):
+        idx = search.SearchIndex()
+        privmsg = mock.Mock(args=[b'#chan', b'hello world'])
+        privmsg.command.cmd = b'PRIVMSG'
+        ping = mock.Mock(args=[b'hello'])
+        ping.command.cmd = b'PING'
+        empty = mock.Mock(args=[util.unset, util.unset])
+        empty.command.cmd = b'TOPIC'
+
+        query = mock.Mock(args=[b'#linux'])
+        query.command.cmd = b'TOPIC'
+        lower = mock.Mock(args=[b'#chan', b'lower case'])
+        lower.command.cmd = b'notice'
+
+        self.assertTrue(idx.index_message(1, privmsg))
+        self.assertFalse(idx.index_message(2, ping))
+        self.assertFalse(idx.index_message(3, empty))
+        self.assertFalse(idx.index_message(4, query))
+        self.assertTrue(idx.index_message(5, lower))
+        self.assertEqual(idx.search(b'hello'), [1])
+        self.assertEqual(idx.search(b'linux'), [])
+        self.assertEqual(idx.search(b'chan'), [])
+        self.assertEqual(idx.search(b'lower'), [5])
+
+    def test_index_line(self):
+        idx = search.SearchIndex()
+
+        self.assertTrue(idx.index_line(1, b':n!u@h PRIVMSG #c :hello world'))
+        self.assertTrue(idx.index_line(2, b'@time=x :n NOTICE #c hello'))
+        self.assertTrue(idx.index_line(3, b'TOPIC #c :linux hello'))
+        self.assertFalse(idx.index_line(4, b':n!u@h TOPIC #linux'))
+        self.assertFalse(idx.index_line(5, b'PING :hello'))
+        self.assertFalse(idx.index_line(6, b''))
+        self.assertEqual(idx.search(b'hello'), [1, 2, 3])
+        self.assertEqual(idx.search(b'linux'), [3])
+
+    def test_add_segment(self):
+        idx = search.SearchIndex()
+        idx.add(0, b'quick brown fox')
+        seg = search.build_segment([(2, b'brown dog'), (5, b'quick dog')])
+        idx.add_segment(seg)
+        idx.add_segment(search.build_segment([]))
+        idx.add(6, b'brown cow')
+
+        self.assertEqual((seg.docs, seg.last_doc), (2, 5))
+        self.assertEqual(len(idx.segments), 2)
+        self.assertEqual(idx.search(b'brown'), [0, 2, 6])
+        self.assertEqual(idx.search(b'"quick dog"'), [5])
+        self.assertRaises(ValueError, idx.add_segment, seg)
+
+
+class LineTextTest(unittest.TestCase):
+    def test_indexed(self):
+        self.assertEqual(search.line_text(b'@t=x :n PRIVMSG #c :hi there'),
+                         b'hi there')
+        self.assertEqual(search.line_text(b'topic #c :news'), b'news')
+
+    def test_not_indexed(self):
+        self.assertIsNone(search.line_text(b':n TOPIC #c'))
+        self.assertIsNone(search.line_text(b'PING :hello'))
+        self.assertIsNone(search.line_text(b''))
@@ -0,0 +1,236 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import unittest
+
+try:
+    import asyncio
+except ImportError:  # pragma: no cover
+    import trollius as asyncio
+
+from pirch.proto.irc import simserver
+
+
+class FakeClient(asyncio.Protocol):
+    def __init__(self, loop):
+        self.loop = loop
+        self.transport = None
+        self.buf = b''
+        self.lines = []
+        self.waiter = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.buf += data
+        while b'\r\n' in self.buf:
+            line, self.buf = self.buf.split(b'\r\n', 1)
+            self.lines.append(line)
+        self.check()
+
+    def check(self):
+        if self.waiter and not self.waiter[0].done():
+            if self.waiter[1](self.lines):
+                self.waiter[0].set_result(None)
+
+    def send(self, *lines):
+        self.transport.write(b''.join(line + b'\r\n' for line in lines))
+
+    def wait_for(self, pred, timeout=5.0):
+        fut = asyncio.Future(loop=self.loop)
+        self.waiter = (fut, pred)
+        self.check()
+        handle = self.loop.call_later(timeout, fut.cancel)
+        self.loop.run_until_complete(fut)
+        handle.cancel()
+
+    def wait_count(self, prefix, count=1, timeout=5.0):
+        def pred(lines):
+            return len([ln for ln in lines if prefix in ln]) >= count
+        self.wait_for(pred, timeout)
+
+
+class SourceTest(unittest.TestCase):
+    def test_server(self):
+        self.assertEqual(simserver.Source(b'srv').to_bytes(), b'srv')
+
+    def test_user(self):
+        result = simserver.Source(b'nick', b'user', b'host')
+
+        self.assertEqual(result.to_bytes(), b'nick!user@host')
+
+
+class SimServerTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.close_loop)
+
+    def close_loop(self):
+        # Let the closed transports finish up
+        fut = asyncio.Future(loop=self.loop)
+        self.loop.call_later(0.01, fut.set_result, None)
+        self.loop.run_until_complete(fut)
+        self.loop.close()
+
+    def make_server(self, **kwargs):
+        kwargs.setdefault('channels', 2)
+        kwargs.setdefault('users_per_channel', 4)
+        kwargs.setdefault('seed', 42)
+        server = simserver.SimServer(self.loop, **kwargs)
+        self.addCleanup(server.stop)
+        self.addr = server.start()
+        return server
+
+    def connect(self, nick=None):
+        transport, client = self.loop.run_until_complete(
+            self.loop.create_connection(lambda: FakeClient(self.loop),
+                                        *self.addr))
+        self.addCleanup(transport.close)
+        if nick is not None:
+            client.send(b'NICK ' + nick, b'USER u 0 * :Real Name')
+            client.wait_count(b' 376 ')
+        return client
+
+    def test_encode(self):
+        server = simserver.SimServer(self.loop)
+
+        result = server.encode(server.source, b'PRIVMSG', b'#chan',
+                               b'hello world')
+
+        self.assertEqual(result, b':sim.server PRIVMSG #chan :hello world\r\n')
+
+    def test_registration(self):
+        self.make_server()
+
+        client = self.connect(b'alice')
+
+        self.assertTrue(client.lines[0].startswith(b':sim.server 001 alice'))
+        isupport = [ln for ln in client.lines if b' 005 ' in ln][0]
+        self.assertIn(b'CASEMAPPING=rfc1459', isupport)
+
+    def test_nick_in_use(self):
+        self.make_server()
+        self.connect(b'alice')
+        client = self.connect()
+
+        client.send(b'NICK ALICE')
+        client.wait_count(b' 433 ')
+
+    def test_join_privmsg(self):
+        self.make_server()
+        alice = self.connect(b'alice')
+        bob = self.connect(b'bob')
+
+        alice.send(b'JOIN #Sim0')
+        alice.wait_count(b' 366 ')
+        bob.send(b'JOIN #sim0')
+        alice.wait_count(b':bob!u@127.0.0.1 JOIN #sim0')
+        bob.wait_count(b' 366 ')
+        names = [ln for ln in bob.lines if b' 353 ' in ln][0]
+        self.assertIn(b'alice', names)
+        self.assertIn(b'u0_0', names)
+
+        bob.send(b'PRIVMSG #sim0,Alice :hi there')
+        alice.wait_count(b'PRIVMSG', 2)
+        self.assertIn(b':bob!u@127.0.0.1 PRIVMSG #sim0 :hi there',
+                      alice.lines)
+        self.assertIn(b':bob!u@127.0.0.1 PRIVMSG Alice :hi there',
+                      alice.lines)
+
+        bob.send(b'PART #sim0', b'PING :tok')
+        alice.wait_count(b'PART #sim0')
+        bob.wait_count(b'PONG')
+
+    def test_unknown_target(self):
+        self.make_server()
+        alice = self.connect(b'alice')
+
+        alice.send(b'PRIVMSG nobody :hi', b'BOGUS')
+
+        alice.wait_count(b' 401 alice nobody ')
+        alice.wait_count(b' 421 alice BOGUS ')
+
+    def test_quit(self):
+        self.make_server()
+        alice = self.connect(b'alice')
+        bob = self.connect(b'bob')
+        alice.send(b'JOIN #sim1')
+        bob.send(b'JOIN #sim1')
+        alice.wait_count(b'bob!u@127.0.0.1 JOIN')
+
+        bob.send(b'QUIT :bye')
+
+        bob.wait_count(b'ERROR')
+        alice.wait_count(b':bob!u@127.0.0.1 QUIT')
+
+    def test_chatter(self):
+        server = self.make_server(channels=1)
+        alice = self.connect(b'alice')
+        alice.send(b'JOIN #sim0')
+        alice.wait_count(b' 366 ')
+
+        server.chatter(500)
+        alice.wait_count(b'PRIVMSG #sim0 :chatter', 5)
+        server.chatter(0)
+
+        self.assertIsNone(server._chatter)
+
+    def test_numeric_burst(self):
+        server = self.make_server()
+        alice = self.connect(b'alice')
+
+        server.numeric_burst(50)
+
+        alice.wait_count(b' 352 alice ', 50)
+
+    def test_netsplit_rejoin(self):
+        server = self.make_server(channels=1)
+        alice = self.connect(b'alice')
+        alice.send(b'JOIN #sim0')
+        alice.wait_count(b' 366 ')
+
+        self.assertEqual(server.netsplit(0.5), 2)
+        alice.wait_count(b'QUIT :hub.sim leaf.sim', 2)
+        self.assertEqual(len(server.simulated[b'#sim0']), 2)
+
+        self.assertEqual(server.rejoin(), 2)
+        alice.wait_count(b'@sim.host JOIN #sim0', 2)
+        self.assertEqual(len(server.simulated[b'#sim0']), 4)
+
+    def test_flood_penalty(self):
+        server = self.make_server(flood_penalty=0.01, flood_burst=0.05)
+        alice = self.connect(b'alice')
+
+        alice.send(*[b'PING :' + str(i).encode('ascii') for i in range(30)])
+
+        alice.wait_count(b'PONG', 30)
+        sim = [c for c in server.clients if c.source.nick == b'alice'][0]
+        self.assertTrue(sim.throttled > 0)
+
+    def test_many_connections(self):
+        server = self.make_server(flood_penalty=0)
+        clients = []
+        for i in range(100):
+            client = self.connect()
+            client.send(b'NICK n' + str(i).encode('ascii'),
+                        b'USER u 0 * :Real Name', b'JOIN #sim0')
+            clients.append(client)
+
+        for client in clients:
+            client.wait_count(b' 366 ')
+
+        self.assertEqual(len(server.members[b'#sim0']), 100)
@@ -0,0 +1,119 @@
+# Copyright (C) 2015 by Kevin L. Mitchell <klmitch@mit.edu>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import mock
+
+from pirch.proto.irc import splitter
+
+
+class SplitTextTest(unittest.TestCase):
+    def test_short(self):
+        self.assertEqual(splitter.split_text(b'hello', 10), [b'hello'])
+
+    def test_budget(self):
+        self.assertRaises(ValueError, splitter.split_text, b'hello', 0)
+
+    def test_words(self):
+        result = splitter.split_text(b'the quick brown fox jumps', 10)
+
+        self.assertEqual(result, [b'the quick', b'brown fox', b'jumps'])
+
+    def test_space_at_boundary(self):
+        result = splitter.split_text(b'0123456789 abc', 10)
+
+        self.assertEqual(result, [b'0123456789', b'abc'])
+
+    def test_long_word(self):
+        result = splitter.split_text(b'abcdefghijklmnop', 5)
+
+        self.assertEqual(result, [b'abcde', b'fghij', b'klmno', b'p'])
+
+    def test_utf8(self):
+        text = (u'\xe9' * 5).encode('utf-8')
+
+        result = splitter.split_text(text, 5)
+
+        self.assertEqual(result, [text[:4], text[4:8], text[8:]])
+        for chunk in result:
+            chunk.decode('utf-8')
+
+    def test_not_utf8(self):
+        result = splitter.split_text(b'\x80\x80\x80\x80', 3)
+
+        self.assertEqual(result, [b'\x80\x80\x80', b'\x80'])
+
+    def test_lines(self):
+        result = splitter.split_text(b'one two\r\n\nthree four\n', 7)
+
+        self.assertEqual(result, [b'one two', b'three', b'four'])
+
+
+class SplitterTest(unittest.TestCase):
+    def test_budget(self):
+        split = splitter.Splitter()
+
+        result = split.budget(b'nick!user@host', b'PRIVMSG', b'#chan')
+
+        self.assertEqual(result, 512 - len(
+            b':nick!user@host PRIVMSG #chan :\r\n'))
+        self.assertEqual(split._budgets, {
+            (b'nick!user@host', b'PRIVMSG', b'#chan'): result,
+        })
+
+    def test_budget_cached(self):
+        split = splitter.Splitter()
+        split._budgets[(b'src', b'CMD', b'tgt')] = 42
+
+        self.assertEqual(split.budget(b'src', b'CMD', b'tgt'), 42)
+
+    def test_budget_cache_full(self):
+        split = splitter.Splitter(cache_size=1)
+        split._budgets[(b'src', b'CMD', b'tgt')] = 42
+
+        split.budget(b'src', b'CMD', b'other')
+
+        self.assertEqual(list(split._budgets),
+                         [(b'src', b'CMD', b'other')])
+
+    def test_lines(self):
+        split = splitter.Splitter(linelen=36)
+
+        result = split.lines(b'n!u@h', b'PRIVMSG', b'#c',
+                             b'aaaa bbbb cccc dddd eeee ffff')
+
+        self.assertEqual(result, [
+            b'PRIVMSG #c :aaaa bbbb cccc',
+            b'PRIVMSG #c :dddd eeee ffff',
+        ])
+        for line in result:
+            self.assertTrue(len(b':n!u@h ' + line + b'\r\n') <= 36)
+
+    def test_messages(self):
+        split = splitter.Splitter(linelen=36)
+        conn = mock.Mock()
+        command = mock.Mock(cmd=b'PRIVMSG')
+
+        result = split.messages('ctxt', conn, b'n!u@h', command, b'#c',
+                                b'aaaa bbbb cccc dddd eeee ffff')
+
+        self.assertEqual(len(result), 2)
+        self.assertEqual(result[0].msg, b'PRIVMSG #c :aaaa bbbb cccc')
+        self.assertEqual(result[1].msg, b'PRIVMSG #c :dddd eeee ffff')
+        self.assertIs(result[0].origin, conn.me)
+        self.assertIs(result[0].command, command)
+        self.assertEqual(list(result[1].args), [b'#c', b'dddd eeee ffff'])